@@ -57,21 +57,14 @@ def get_announcements(person=None, custom_display=None):
 
     if person:
         # Avoid checking if the person belongs to a segment multiple times for the same segment
-        segment_ids = [
-            segment.id
-            for segment in (
-                Segment.objects.prefetch_related("add_segments", "exclude_segments")
-                .filter(
-                    pk__in=list(
-                        announcements.exclude(segment_id__isnull=True).values_list(
-                            "segment_id", flat=True
-                        )
-                    )
+        segment_ids = Segment.objects.subscribed_segment_ids(
+            person,
+            Segment.objects.filter(
+                pk__in=announcements.exclude(segment_id__isnull=True).values_list(
+                    "segment_id", flat=True
                 )
-                .distinct("pk")
-            )
-            if segment.is_subscriber(person)
-        ]
+            ),
+        )
 
         # Automatically create an activity for the person if none exists for the announcement
         announcements = announcements.filter(
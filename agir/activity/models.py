@@ -1,8 +1,10 @@
 import dynamic_filenames
 from django.conf import settings
 from django.core import validators
+from django.core.exceptions import EmptyResultSet
 from django.core.validators import FileExtensionValidator
-from django.db import models, transaction
+from django.db import models, transaction, connections
+from django.dispatch import Signal
 from django.utils import timezone
 from django.utils.functional import cached_property
 from push_notifications.models import GCMDevice, APNSDevice
@@ -22,16 +24,71 @@ def displayed(self):
         return self.filter(type__in=Activity.DISPLAYED_TYPES)
 
 
+# envoyé une seule fois pour toutes les activités créées par un `bulk_create`, à la place
+# d'un signal `post_save` par activité
+bulk_post_create = Signal()
+
+
 class ActivityManager(models.Manager.from_queryset(ActivityQuerySet)):
     def bulk_create(self, instances, send_post_save_signal=False, **kwargs):
         activities = super().bulk_create(instances, **kwargs)
         if send_post_save_signal:
-            for instance in instances:
-                models.signals.post_save.send(
-                    instance.__class__, instance=instance, created=True
-                )
+            bulk_post_create.send(
+                self.model,
+                instances=[activity for activity in activities if activity.pk],
+            )
         return activities
 
+    def bulk_fanout(self, recipient_ids, send_post_save_signal=False, **fields):
+        """Crée une même activité pour chacun des destinataires, en une seule requête
+
+        Les activités sont insérées directement en base par un ``INSERT ... SELECT`` : la liste
+        des destinataires ne transite pas par Python.
+
+        :param recipient_ids: un queryset renvoyant uniquement les identifiants des destinataires
+            (par exemple avec ``values_list("person_id", flat=True)``)
+        :param send_post_save_signal: envoyer le signal `bulk_post_create` pour les activités créées
+        :param fields: les valeurs des champs des activités à créer
+        :return: la liste des identifiants des activités créées
+        """
+        connection = connections[self.db]
+        quote_name = connection.ops.quote_name
+        template = self.model(**fields)
+
+        columns = []
+        values = []
+        for field in self.model._meta.concrete_fields:
+            if field.primary_key or field.name == "recipient":
+                continue
+            columns.append(quote_name(field.column))
+            values.append(
+                field.get_db_prep_save(field.pre_save(template, add=True), connection)
+            )
+
+        recipient_column = quote_name(self.model._meta.get_field("recipient").column)
+        try:
+            sql, params = recipient_ids.query.sql_with_params()
+        except EmptyResultSet:
+            return []
+
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"INSERT INTO {quote_name(self.model._meta.db_table)} ({', '.join(columns)}, {recipient_column}) "
+                f"SELECT {', '.join(['%s'] * len(values))}, recipients.id "
+                f"FROM ({sql}) AS recipients(id) "
+                f"RETURNING {quote_name(self.model._meta.pk.column)}",
+                (*values, *params),
+            )
+            activity_ids = [row[0] for row in cursor.fetchall()]
+
+        if send_post_save_signal and activity_ids:
+            bulk_post_create.send(
+                self.model,
+                instances=[self.model(pk=pk, **fields) for pk in activity_ids],
+            )
+
+        return activity_ids
+
 
 class Activity(TimeStampedModel):
     TYPE_PUSH_ANNOUNCEMENT = "push-announcement"
@@ -394,3 +394,42 @@ def test_authenticated_user_can_get_a_custom_announcement_if_activity_status_is_
         )
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(response.data["id"], str(self.custom_announcement.id))
+
+
+class ActivityBulkFanoutTestCase(TestCase):
+    def setUp(self):
+        self.author = Person.objects.create_person("author@agir.local")
+        self.recipients = [
+            Person.objects.create_person(f"recipient{i}@agir.local") for i in range(3)
+        ]
+
+    def test_bulk_fanout_creates_one_activity_per_recipient(self):
+        activity_ids = Activity.objects.bulk_fanout(
+            Person.objects.filter(pk__in=[r.pk for r in self.recipients]).values_list(
+                "pk", flat=True
+            ),
+            type=Activity.TYPE_NEW_MESSAGE,
+            individual=self.author,
+            meta={"message": "abc"},
+        )
+
+        self.assertEqual(len(activity_ids), 3)
+        activities = Activity.objects.filter(pk__in=activity_ids)
+        self.assertCountEqual(
+            [a.recipient_id for a in activities], [r.pk for r in self.recipients]
+        )
+        for activity in activities:
+            self.assertEqual(activity.type, Activity.TYPE_NEW_MESSAGE)
+            self.assertEqual(activity.individual, self.author)
+            self.assertEqual(activity.meta, {"message": "abc"})
+            self.assertEqual(activity.status, Activity.STATUS_UNDISPLAYED)
+            self.assertIsNotNone(activity.timestamp)
+
+    def test_bulk_fanout_with_no_recipients(self):
+        self.assertEqual(
+            Activity.objects.bulk_fanout(
+                Person.objects.none().values_list("pk", flat=True),
+                type=Activity.TYPE_NEW_MESSAGE,
+            ),
+            [],
+        )
@@ -1,7 +1,21 @@
 import logging
 import os
+import time
 
 from celery import Celery
+from celery.signals import (
+    before_task_publish,
+    task_prerun,
+    worker_init,
+    worker_process_shutdown,
+)
+from prometheus_client import (
+    REGISTRY,
+    CollectorRegistry,
+    Histogram,
+    multiprocess,
+    start_http_server,
+)
 
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "agir.api.settings")
 
@@ -18,6 +32,54 @@
 logger = logging.getLogger("agir.api.celery")
 
 
+queue_wait_time = Histogram(
+    "agir_celery_task_queue_wait_seconds",
+    "Temps d'attente des tâches avant leur exécution",
+    ["lane"],
+    buckets=(0.1, 0.5, 1, 5, 15, 60, 300, 900, 3600),
+)
+
+
+@before_task_publish.connect
+def add_publication_time(headers=None, **kwargs):
+    if headers is not None:
+        headers.setdefault("published_at", time.time())
+
+
+@task_prerun.connect
+def observe_queue_wait_time(task=None, **kwargs):
+    published_at = getattr(task.request, "published_at", None)
+    # les tâches relancées gardent l'en-tête de leur première publication
+    if published_at is None or task.request.retries:
+        return
+
+    lane = getattr(task, "lane", None) or "default"
+    queue_wait_time.labels(lane=lane).observe(max(time.time() - published_at, 0))
+
+
+@worker_init.connect
+def start_metrics_server(**kwargs):
+    from django.conf import settings
+
+    if not settings.TASK_METRICS_PORT:
+        return
+
+    # avec le pool prefork, les mesures sont faites dans les processus enfants : le processus
+    # parent doit agréger leurs fichiers plutôt que d'exposer son propre registre, vide
+    registry = REGISTRY
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+
+    start_http_server(int(settings.TASK_METRICS_PORT), registry=registry)
+
+
+@worker_process_shutdown.connect
+def mark_metrics_process_dead(pid=None, **kwargs):
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        multiprocess.mark_process_dead(pid or os.getpid())
+
+
 _memory_tracker = None
 
 
@@ -229,6 +229,7 @@ def env_separated_value(env_var, sep=","):
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
     "django.contrib.redirects.middleware.RedirectFallbackMiddleware",
     "agir.authentication.middleware.MailLinkMiddleware",
+    "agir.groups.middleware.MembershipIndexMiddleware",
     "social_django.middleware.SocialAuthExceptionMiddleware",
     "django_prometheus.middleware.PrometheusAfterMiddleware",
     "silk.middleware.SilkyMiddleware",
@@ -757,6 +758,24 @@ def sentry_traces_sampler(ctx):
 
 CELERY_RESULT_BACKEND = os.environ.get("CELERY_BROKER_URL", "redis://")
 
+# voies des tâches (cf. agir.lib.celery) : une fois activées, chaque voie a sa propre file,
+# à faire consommer par des workers dédiés dont la concurrence est adaptée à la voie :
+#   celery -A agir.api worker -Q interactive -c 4
+#   celery -A agir.api worker -Q notifications,celery -c 4
+#   celery -A agir.api worker -Q external_api -c 2
+#   celery -A agir.api worker -Q bulk -c 1
+TASK_LANES_ENABLED = os.environ.get("TASK_LANES_ENABLED", "false").lower() == "true"
+if TASK_LANES_ENABLED:
+    CELERY_BROKER_TRANSPORT_OPTIONS.update(
+        priority_steps=list(range(10)), sep=":", queue_order_strategy="priority"
+    )
+    # un worker ne réserve pas de tâches à l'avance, pour respecter les priorités
+    CELERY_WORKER_PREFETCH_MULTIPLIER = 1
+# port sur lequel les workers exposent leurs métriques Prometheus (temps d'attente par voie) ;
+# avec le pool prefork, PROMETHEUS_MULTIPROC_DIR doit aussi être défini (les mesures des
+# processus enfants sont alors agrégées par le processus parent)
+TASK_METRICS_PORT = os.environ.get("TASK_METRICS_PORT")
+
 DEFAULT_EVENT_IMAGE = "front/images/default_event_pic.jpg"
 
 PHONENUMBER_DEFAULT_REGION = "FR"
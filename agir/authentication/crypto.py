@@ -121,6 +121,17 @@ class ConnectionSignatureGenerator(SignatureGenerator):
     def make_token(self, user):
         return super().make_token(user=user)
 
+    def make_tokens(self, users):
+        """Génère les jetons de plusieurs utilisateurs d'un coup, avec un horodatage commun
+
+        Renvoie un dictionnaire associant à chaque identifiant d'utilisateur son jeton.
+        """
+        timestamp = self._num_seconds(self._now())
+        return {
+            user.pk: self._make_token_with_timestamp({"user": user}, timestamp)
+            for user in users
+        }
+
     def _make_hash_value(self, params, timestamp):
         # le hash n'est basé que sur l'ID de l'utilisateur et le timestamp
 
@@ -0,0 +1,9 @@
+from django.apps import AppConfig
+
+
+class CarteConfig(AppConfig):
+    name = "agir.carte"
+
+    def ready(self):
+        # noinspection PyUnresolvedReferences
+        from . import signals
@@ -0,0 +1,22 @@
+from agir.carte.models import StaticMapImage
+from agir.carte.static_maps import link_static_map_image
+from agir.lib.commands import BaseCommand
+
+
+class Command(BaseCommand):
+    help = (
+        "Lie chaque carte statique existante aux événements et groupes situés à son "
+        "emplacement"
+    )
+
+    def handle(self, *args, **options):
+        static_map_images = StaticMapImage.objects.all()
+        self.init_tqdm(total=static_map_images.count())
+
+        for static_map_image in static_map_images.iterator():
+            if not self.dry_run:
+                link_static_map_image(static_map_image)
+            self.tqdm.update(1)
+
+        self.tqdm.close()
+        self.success("Cartes statiques liées")
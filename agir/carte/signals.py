@@ -0,0 +1,48 @@
+from django.db.models.signals import pre_save, post_save, post_delete
+from django.dispatch import receiver
+
+from agir.events.models import Event
+from agir.groups.models import SupportGroup
+from .tiles import invalidate_tiles_for_point
+
+TILE_LAYERS = {Event: "events", SupportGroup: "groups"}
+
+
+@receiver(pre_save, sender=Event, dispatch_uid="carte_event_previous_coordinates")
+@receiver(
+    pre_save, sender=SupportGroup, dispatch_uid="carte_group_previous_coordinates"
+)
+def remember_previous_coordinates(sender, instance, raw=False, **kwargs):
+    if raw or instance._state.adding:
+        return
+
+    instance._carte_previous_coordinates = (
+        sender.objects.filter(pk=instance.pk)
+        .values_list("coordinates", flat=True)
+        .first()
+    )
+
+
+@receiver(post_save, sender=Event, dispatch_uid="carte_invalidate_event_tiles")
+@receiver(post_save, sender=SupportGroup, dispatch_uid="carte_invalidate_group_tiles")
+@receiver(
+    post_delete, sender=Event, dispatch_uid="carte_invalidate_deleted_event_tiles"
+)
+@receiver(
+    post_delete,
+    sender=SupportGroup,
+    dispatch_uid="carte_invalidate_deleted_group_tiles",
+)
+def invalidate_tiles(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+
+    layer = TILE_LAYERS[sender]
+    previous_coordinates = getattr(instance, "_carte_previous_coordinates", None)
+
+    invalidate_tiles_for_point(layer, instance.coordinates)
+    if (
+        previous_coordinates is not None
+        and previous_coordinates != instance.coordinates
+    ):
+        invalidate_tiles_for_point(layer, previous_coordinates)
@@ -0,0 +1,174 @@
+"""Résolution des cartes statiques associées à des coordonnées
+
+Les coordonnées sont arrondies à ``GRID_PRECISION`` décimales, soit une grille d'environ
+un mètre ; la clé de grille obtenue sert à mettre en cache l'URL de la carte, d'abord
+dans la mémoire du processus puis dans Redis.
+
+Lorsqu'une carte est créée, elle est directement liée (clé étrangère `static_map_image`)
+aux événements et groupes situés à son emplacement : les listes n'ont alors besoin que
+d'une jointure sur la clé primaire plutôt que d'une recherche spatiale par ligne. Ces
+objets peuvent se trouver dans des cellules voisines de celle du centre de la carte :
+l'URL est donc mise en cache sous la clé de chacun d'eux.
+Les objets créés avant l'ajout de ce lien sont rattachés par la commande
+``lier_cartes_statiques``.
+"""
+from collections import OrderedDict
+
+from django.apps import apps
+from django.core.cache import cache
+from django.db.models.fields.related_descriptors import ForwardManyToOneDescriptor
+
+from agir.carte.models import StaticMapImage
+
+# 5 décimales correspondent à un pas d'environ un mètre
+GRID_PRECISION = 5
+STATIC_MAP_URL_CACHE_TIMEOUT = 24 * 3600
+# délai pendant lequel une génération de carte en cours n'est pas relancée
+STATIC_MAP_PENDING_TIMEOUT = 10 * 60
+LOCAL_CACHE_MAX_SIZE = 10000
+
+LINKED_MODELS = (("events", "Event"), ("groups", "SupportGroup"))
+
+_local_cache = OrderedDict()
+
+
+def grid_key(coordinates):
+    """Renvoie la clé de la cellule de grille contenant ces coordonnées"""
+    # l'ajout de 0.0 évite de distinguer -0.0 et 0.0
+    lon = round(coordinates[0], GRID_PRECISION) + 0.0
+    lat = round(coordinates[1], GRID_PRECISION) + 0.0
+    return f"{lon:.{GRID_PRECISION}f}:{lat:.{GRID_PRECISION}f}"
+
+
+def _url_cache_key(key):
+    return f"static_map_url_{key}"
+
+
+def _pending_cache_key(key):
+    return f"static_map_pending_{key}"
+
+
+def _get_local(key):
+    url = _local_cache.get(key)
+    if url is not None:
+        try:
+            _local_cache.move_to_end(key)
+        except KeyError:
+            pass
+    return url
+
+
+def _set_local(key, url):
+    _local_cache[key] = url
+    while len(_local_cache) > LOCAL_CACHE_MAX_SIZE:
+        try:
+            _local_cache.popitem(last=False)
+        except KeyError:
+            break
+
+
+def remember_static_map_url(key, url):
+    _set_local(key, url)
+    cache.set(_url_cache_key(key), url, timeout=STATIC_MAP_URL_CACHE_TIMEOUT)
+
+
+def get_cached_static_map_url(key):
+    url = _get_local(key)
+    if url is None:
+        url = cache.get(_url_cache_key(key))
+        if url is not None:
+            _set_local(key, url)
+    return url
+
+
+def _is_linkable(obj):
+    return isinstance(
+        getattr(type(obj), "static_map_image", None), ForwardManyToOneDescriptor
+    )
+
+
+def _get_linked_image(obj):
+    """Renvoie la carte liée à l'objet, uniquement si elle a déjà été chargée"""
+    if _is_linkable(obj) and type(obj).static_map_image.is_cached(obj):
+        return obj.static_map_image
+    return None
+
+
+def find_static_map_image(coordinates):
+    return StaticMapImage.objects.filter(
+        center__dwithin=(coordinates, StaticMapImage.UNIQUE_CENTER_MAX_DISTANCE)
+    ).first()
+
+
+def link_static_map_image(static_map_image):
+    """Lie la carte aux événements et groupes situés à son emplacement et la met en cache
+
+    L'URL est mise en cache, et la demande de génération levée, pour la cellule du centre
+    de la carte comme pour celle de chaque objet lié.
+    """
+    keys = {grid_key(static_map_image.center)}
+
+    for app_label, model_name in LINKED_MODELS:
+        model = apps.get_model(app_label, model_name)
+        queryset = model.objects.filter(
+            coordinates__dwithin=(
+                static_map_image.center,
+                StaticMapImage.UNIQUE_CENTER_MAX_DISTANCE,
+            )
+        )
+        queryset.exclude(static_map_image=static_map_image).update(
+            static_map_image=static_map_image
+        )
+        keys.update(
+            grid_key(coordinates)
+            for coordinates in queryset.values_list("coordinates", flat=True).distinct()
+        )
+
+    url = static_map_image.image.url
+    for key in keys:
+        _set_local(key, url)
+    cache.set_many(
+        {_url_cache_key(key): url for key in keys},
+        timeout=STATIC_MAP_URL_CACHE_TIMEOUT,
+    )
+    cache.delete_many([_pending_cache_key(key) for key in keys])
+
+
+def request_static_map_image(coordinates):
+    """Demande la génération d'une carte, sauf si elle est déjà en cours pour cette cellule"""
+    from agir.lib.tasks import create_static_map_image_from_coordinates
+
+    if cache.add(
+        _pending_cache_key(grid_key(coordinates)),
+        True,
+        timeout=STATIC_MAP_PENDING_TIMEOUT,
+    ):
+        create_static_map_image_from_coordinates.delay([coordinates[0], coordinates[1]])
+
+
+def get_static_map_url(obj):
+    """Renvoie l'URL de la carte statique d'un objet localisé
+
+    Cette fonction est appelée lors de la sérialisation et n'écrit rien en base. Renvoie
+    une chaîne vide si l'objet n'est pas localisé, ou si sa carte n'est pas encore liée ni
+    en cache (la tâche de génération est alors demandée).
+    """
+    if obj.coordinates is None:
+        return ""
+
+    key = grid_key(obj.coordinates)
+
+    static_map_image = _get_linked_image(obj)
+    if static_map_image is not None and grid_key(static_map_image.center) == key:
+        url = static_map_image.image.url
+        _set_local(key, url)
+        return url
+
+    url = get_cached_static_map_url(key)
+    if url is not None:
+        return url
+
+    # pas de recherche spatiale ni d'écriture ici : la tâche réutilise une carte
+    # existante si possible, et la lie aux objets situés à son emplacement
+    request_static_map_image(obj.coordinates)
+    return ""
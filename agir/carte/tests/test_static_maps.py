@@ -0,0 +1,106 @@
+from datetime import timedelta
+from io import BytesIO
+from unittest.mock import patch
+
+from django.contrib.gis.geos import Point
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from PIL import Image
+
+from agir.carte import static_maps
+from agir.carte.models import StaticMapImage
+from agir.carte.static_maps import get_static_map_url, grid_key
+from agir.events.models import Event
+from agir.lib.tasks import create_static_map_image_from_coordinates
+
+
+def png_file():
+    content = BytesIO()
+    Image.new("RGB", (10, 10)).save(content, format="PNG")
+    return SimpleUploadedFile("carte.png", content.getvalue(), "image/png")
+
+
+@override_settings(
+    CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+)
+class StaticMapResolverTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        static_maps._local_cache.clear()
+        self.coordinates = Point(2.3522219, 48.856614)
+        self.event = Event.objects.create(
+            name="Événement",
+            start_time=timezone.now() + timedelta(days=1),
+            end_time=timezone.now() + timedelta(days=1, hours=2),
+            coordinates=self.coordinates,
+        )
+
+    def test_grid_key_snaps_close_coordinates(self):
+        self.assertEqual(
+            grid_key(Point(2.352221, 48.856614)), grid_key(Point(2.3522209, 48.8566141))
+        )
+        self.assertNotEqual(
+            grid_key(Point(2.35222, 48.856614)), grid_key(Point(2.35232, 48.856614))
+        )
+        self.assertEqual(grid_key(Point(-0.000001, 0)), grid_key(Point(0, 0)))
+
+    @patch("agir.lib.tasks.create_static_map_image_from_coordinates.delay")
+    def test_generation_is_requested_once(self, delay):
+        self.assertEqual(get_static_map_url(self.event), "")
+        self.assertEqual(get_static_map_url(self.event), "")
+        delay.assert_called_once()
+
+    @patch("agir.lib.tasks.create_static_map_image_from_coordinates.delay")
+    def test_existing_image_is_linked_by_task_and_cached(self, delay):
+        image = StaticMapImage.objects.create(center=self.coordinates, image=png_file())
+
+        # la sérialisation ne fait ni recherche spatiale ni écriture
+        with self.assertNumQueries(0):
+            self.assertEqual(get_static_map_url(self.event), "")
+        delay.assert_called_once()
+
+        create_static_map_image_from_coordinates(*delay.call_args[0])
+        self.event.refresh_from_db()
+        self.assertEqual(self.event.static_map_image_id, image.pk)
+        self.assertEqual(get_static_map_url(self.event), image.image.url)
+
+        static_maps._local_cache.clear()
+        cache.clear()
+        event = Event.objects.with_static_map_image().get(pk=self.event.pk)
+        with self.assertNumQueries(0):
+            self.assertEqual(get_static_map_url(event), image.image.url)
+
+    @patch("agir.lib.tasks.create_static_map_image_from_coordinates.delay")
+    def test_image_is_cached_for_linked_objects_in_neighbouring_cells(self, delay):
+        image = StaticMapImage.objects.create(center=self.coordinates, image=png_file())
+        # à moins d'un mètre du centre de la carte, mais dans une autre cellule
+        neighbour = Event.objects.create(
+            name="Événement voisin",
+            start_time=timezone.now() + timedelta(days=1),
+            end_time=timezone.now() + timedelta(days=1, hours=2),
+            coordinates=Point(2.352226, 48.856614),
+        )
+        self.assertNotEqual(grid_key(neighbour.coordinates), grid_key(image.center))
+
+        self.assertEqual(get_static_map_url(neighbour), "")
+        create_static_map_image_from_coordinates(*delay.call_args[0])
+        delay.reset_mock()
+
+        neighbour = Event.objects.with_static_map_image().get(pk=neighbour.pk)
+        self.assertEqual(neighbour.static_map_image_id, image.pk)
+        self.assertEqual(get_static_map_url(neighbour), image.image.url)
+
+        static_maps._local_cache.clear()
+        self.assertEqual(get_static_map_url(neighbour), image.image.url)
+        delay.assert_not_called()
+
+    def test_command_links_existing_images(self):
+        image = StaticMapImage.objects.create(center=self.coordinates, image=png_file())
+
+        call_command("lier_cartes_statiques", silent=True)
+
+        self.event.refresh_from_db()
+        self.assertEqual(self.event.static_map_image_id, image.pk)
@@ -1,3 +1,5 @@
+from unittest.mock import patch
+
 from django.test import TestCase
 from django.urls import reverse
 from django.utils import timezone
@@ -26,3 +28,38 @@ def test_can_see_individual_maps(self):
             reverse("carte:single_group_map", args=[self.groups["user1_group"].pk])
         )
         self.assertEqual(res.status_code, 200)
+
+
+@using_separate_redis_server
+class TileViewTestCase(FakeDataMixin, TestCase):
+    def test_can_get_tiles(self):
+        for layer in ["events", "groups"]:
+            for z, x, y in [(0, 0, 0), (5, 16, 11), (14, 8299, 5636)]:
+                res = self.client.get(
+                    reverse("carte:tiles", args=[layer, z, x, y]),
+                    {"include_past": "1"} if layer == "events" else {},
+                )
+                self.assertEqual(res.status_code, 200)
+                self.assertEqual(
+                    res["Content-Type"], "application/vnd.mapbox-vector-tile"
+                )
+
+    def test_event_tiles_are_cached_for_a_short_time(self):
+        with patch("agir.carte.tiles.cache.set") as cache_set:
+            self.client.get(reverse("carte:tiles", args=["events", 5, 16, 11]))
+        self.assertEqual(cache_set.call_args.kwargs["timeout"], 300)
+
+    def test_cannot_get_unknown_layer_or_invalid_tile(self):
+        res = self.client.get(reverse("carte:tiles", args=["people", 0, 0, 0]))
+        self.assertEqual(res.status_code, 404)
+        res = self.client.get(reverse("carte:tiles", args=["events", 2, 4, 0]))
+        self.assertEqual(res.status_code, 404)
+
+    def test_tile_for_point_matches_tile_bounds(self):
+        from agir.carte.tiles import tile_bounds, tile_for_point
+
+        for z in range(0, 17, 4):
+            x, y = tile_for_point(z, 2.3522, 48.8566)
+            lon1, lat1, lon2, lat2 = tile_bounds(z, x, y)
+            self.assertTrue(lon1 <= 2.3522 < lon2)
+            self.assertTrue(lat1 <= 48.8566 < lat2)
@@ -0,0 +1,169 @@
+"""Génération de tuiles vectorielles (Mapbox Vector Tiles) pour les cartes
+
+Les tuiles sont calculées directement par PostGIS (``ST_AsMVT``) à partir d'un queryset
+Django déjà filtré, et mises en cache tuile par tuile. Chaque tuile a un numéro de version
+en cache, incrémenté lorsqu'un objet situé dans cette tuile est modifié ou déplacé, ce qui
+permet d'invalider uniquement les tuiles concernées.
+"""
+import hashlib
+import math
+
+from django.contrib.gis.geos import Polygon
+from django.core.cache import cache
+from django.db import connection
+
+MAX_ZOOM = 20
+# en dessous de ce niveau de zoom, les points proches sont regroupés
+CLUSTER_MAX_ZOOM = 11
+# nombre de cellules de regroupement sur la largeur d'une tuile
+CLUSTER_GRID_CELLS = 64
+# au delà de ce niveau de zoom, les tuiles ne sont plus invalidées individuellement
+CACHED_MAX_ZOOM = 16
+
+TILE_EXTENT = 4096
+TILE_CACHE_TIMEOUT = 24 * 3600
+# durée de cache maximale des tuiles au delà de CACHED_MAX_ZOOM, qui ne sont pas invalidées
+UNVERSIONED_TILE_CACHE_TIMEOUT = 300
+WEB_MERCATOR_WIDTH = 2 * math.pi * 6378137
+
+
+def is_valid_tile(z, x, y):
+    return 0 <= z <= MAX_ZOOM and 0 <= x < 2**z and 0 <= y < 2**z
+
+
+def tile_bounds(z, x, y):
+    """Renvoie l'emprise (lon1, lat1, lon2, lat2) d'une tuile"""
+    n = 2**z
+
+    def lon(tx):
+        return tx / n * 360.0 - 180.0
+
+    def lat(ty):
+        return math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * ty / n))))
+
+    return lon(x), lat(y + 1), lon(x + 1), lat(y)
+
+
+def tile_for_point(z, lon, lat):
+    n = 2**z
+    lat = max(min(lat, 85.0511), -85.0511)
+    x = int((lon + 180.0) / 360.0 * n)
+    y = int((1.0 - math.asinh(math.tan(math.radians(lat))) / math.pi) / 2.0 * n)
+    return min(max(x, 0), n - 1), min(max(y, 0), n - 1)
+
+
+def _tile_version_key(layer, z, x, y):
+    return f"carte_tile_version_{layer}_{z}_{x}_{y}"
+
+
+def _tile_cache_key(layer, z, x, y, version, query_string):
+    query_hash = hashlib.md5(query_string.encode()).hexdigest()
+    return f"carte_tile_{layer}_{z}_{x}_{y}_{version}_{query_hash}"
+
+
+def invalidate_tiles_for_point(layer, point):
+    """Invalide, à chaque niveau de zoom, la tuile contenant ce point"""
+    if point is None:
+        return
+
+    for z in range(CACHED_MAX_ZOOM + 1):
+        key = _tile_version_key(layer, z, *tile_for_point(z, point.x, point.y))
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, 1, timeout=None)
+
+
+def render_tile(queryset, layer, z, x, y, properties):
+    """Calcule la tuile vectorielle pour les objets du queryset
+
+    :param queryset: le queryset déjà filtré des objets à afficher, avec un champ `coordinates`
+    :param layer: le nom de la couche dans la tuile
+    :param properties: les noms des champs ou annotations du queryset à inclure comme
+        propriétés de chaque point (ignorés lorsque les points sont regroupés)
+    """
+    queryset = queryset.filter(
+        coordinates__intersects=Polygon.from_bbox(tile_bounds(z, x, y))
+    )
+
+    # les coordonnées sont lues directement dans la table du modèle, pour éviter la
+    # conversion des champs géographiques opérée par Django dans les `values()`
+    table = queryset.model._meta.db_table
+
+    if z <= CLUSTER_MAX_ZOOM:
+        sql, params = queryset.values("id").query.sql_with_params()
+        tile_query = f"""
+            SELECT
+              ST_AsMVTGeom(ST_Centroid(ST_Collect(points.geom)), ST_TileEnvelope(%s, %s, %s), %s) AS geom,
+              COUNT(*) AS count,
+              CASE WHEN COUNT(*) = 1 THEN (ARRAY_AGG(points.id))[1]::text END AS id
+            FROM (
+              SELECT features.id, ST_Transform(located.coordinates::geometry, 3857) AS geom
+              FROM ({sql}) AS features
+              JOIN "{table}" AS located ON located.id = features.id
+            ) AS points
+            GROUP BY ST_SnapToGrid(points.geom, %s)
+        """
+        tile_params = (
+            z,
+            x,
+            y,
+            TILE_EXTENT,
+            *params,
+            WEB_MERCATOR_WIDTH / 2**z / CLUSTER_GRID_CELLS,
+        )
+    else:
+        sql, params = queryset.values("id", *properties).query.sql_with_params()
+        columns = "".join(f', features."{p}"' for p in properties)
+        tile_query = f"""
+            SELECT
+              ST_AsMVTGeom(ST_Transform(located.coordinates::geometry, 3857), ST_TileEnvelope(%s, %s, %s), %s) AS geom,
+              features.id::text AS id
+              {columns}
+            FROM ({sql}) AS features
+            JOIN "{table}" AS located ON located.id = features.id
+        """
+        tile_params = (z, x, y, TILE_EXTENT, *params)
+
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"SELECT ST_AsMVT(tile, %s, %s, 'geom') FROM ({tile_query}) AS tile",
+            (layer, TILE_EXTENT, *tile_params),
+        )
+        tile = cursor.fetchone()[0]
+
+    return bytes(tile) if tile is not None else b""
+
+
+def get_tile(
+    queryset,
+    layer,
+    z,
+    x,
+    y,
+    properties,
+    query_string="",
+    timeout=TILE_CACHE_TIMEOUT,
+):
+    """Renvoie la tuile depuis le cache, ou la calcule si elle n'y est pas
+
+    :param timeout: la durée de cache des tuiles, à réduire lorsque le contenu de la couche
+        dépend de l'heure (événements passés, groupes devenus inactifs) : aucune
+        modification d'objet n'invalide alors les tuiles
+    """
+    version_key = _tile_version_key(layer, z, x, y)
+    version = cache.get(version_key, 0) if z <= CACHED_MAX_ZOOM else 0
+    cache_key = _tile_cache_key(layer, z, x, y, version, query_string)
+
+    tile = cache.get(cache_key)
+    if tile is None:
+        tile = render_tile(queryset, layer, z, x, y, properties)
+        cache.set(
+            cache_key,
+            tile,
+            timeout=timeout
+            if z <= CACHED_MAX_ZOOM
+            else min(timeout, UNVERSIONED_TILE_CACHE_TIMEOUT),
+        )
+
+    return tile
@@ -6,6 +6,11 @@
 urlpatterns = [
     path("liste_evenements/", views.EventsView.as_view(), name="event_list"),
     path("liste_groupes/", views.GroupsView.as_view(), name="group_list"),
+    path(
+        "tiles/<str:layer>/<int:z>/<int:x>/<int:y>.pbf",
+        views.TileView.as_view(),
+        name="tiles",
+    ),
     path("evenements/", views.EventMapView.as_view(), name="events_map"),
     path(
         "evenements_commune/<str:departement>/<slug:nom>/",
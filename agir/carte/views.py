@@ -11,15 +11,16 @@
 )
 from django.contrib.gis.db.models import Extent, MultiPolygonField, Union
 from django.contrib.gis.geos import Polygon
-from django.db.models import Count, Q
+from django.db.models import Count, Q, Subquery, OuterRef, ExpressionWrapper
+from django.db.models import BooleanField
 from django.db.models.functions import Cast
-from django.http import QueryDict, Http404
+from django.http import QueryDict, Http404, HttpResponse, HttpResponseBadRequest
 from django.utils.decorators import method_decorator
 from django.utils.html import mark_safe
 from django.utils.translation import gettext as _
 from django.views.decorators import cache
 from django.views.decorators.clickjacking import xframe_options_exempt
-from django.views.generic import TemplateView, DetailView
+from django.views.generic import TemplateView, DetailView, View
 from django_filters.rest_framework.backends import DjangoFilterBackend
 from rest_framework.exceptions import ValidationError
 from rest_framework.generics import ListAPIView
@@ -27,6 +28,7 @@
 from agir.lib.export import dict_to_camelcase
 from agir.municipales.models import CommunePage
 from . import serializers
+from .tiles import get_tile, is_valid_tile
 from ..events.filters import EventFilter
 from ..events.models import Event, EventSubtype
 from ..groups.models import SupportGroup, SupportGroupSubtype, SupportGroupTag
@@ -177,6 +179,74 @@ def get_queryset(self):
         )
 
 
+class TileView(View):
+    """Tuiles vectorielles (format Mapbox Vector Tile) des événements et des groupes
+
+    Les filtres acceptés sont ceux des listes JSON équivalentes (`EventFilter` et `GroupFilterSet`).
+    """
+
+    layers = {
+        "events": {
+            "filterset_class": EventFilter,
+            "properties": ("name", "subtype_id", "start_time", "end_time"),
+            # les événements terminés disparaissent de la carte sans être modifiés
+            "cache_timeout": 300,
+        },
+        "groups": {
+            "filterset_class": GroupFilterSet,
+            "properties": ("name", "type", "subtype", "is_active", "is_certified"),
+            # l'activité d'un groupe dépend de la date de son dernier événement
+            "cache_timeout": 3600,
+        },
+    }
+
+    def get_queryset(self, layer):
+        if layer == "events":
+            return Event.objects.listed().filter(coordinates__isnull=False)
+
+        return (
+            SupportGroup.objects.active()
+            .filter(coordinates__isnull=False)
+            .annotate(
+                is_active=Count("id", filter=is_active_group_filter()),
+                is_certified=ExpressionWrapper(
+                    Q(certification_date__isnull=False), output_field=BooleanField()
+                ),
+                subtype=Subquery(
+                    SupportGroupSubtype.objects.active()
+                    .filter(supportgroups=OuterRef("pk"))
+                    .order_by("pk")
+                    .values("pk")[:1]
+                ),
+            )
+        )
+
+    @method_decorator(cache.cache_control(public=True, max_age=300))
+    def get(self, request, layer, z, x, y):
+        if layer not in self.layers or not is_valid_tile(z, x, y):
+            raise Http404()
+
+        config = self.layers[layer]
+        filterset = config["filterset_class"](
+            request.GET, queryset=self.get_queryset(layer)
+        )
+        if not filterset.is_valid():
+            return HttpResponseBadRequest(filterset.errors.as_json())
+
+        tile = get_tile(
+            filterset.qs,
+            layer,
+            z,
+            x,
+            y,
+            properties=config["properties"],
+            query_string=request.GET.urlencode(),
+            timeout=config["cache_timeout"],
+        )
+
+        return HttpResponse(tile, content_type="application/vnd.mapbox-vector-tile")
+
+
 class MapViewMixin:
     @xframe_options_exempt
     def get(self, request, *args, **kwargs):
@@ -12,7 +12,7 @@
     log_payment_event,
 )
 from ..apps import EventsConfig
-from ..models import RSVP, IdentifiedGuest, JitsiMeeting
+from ..models import Event, RSVP, IdentifiedGuest, JitsiMeeting
 from ..tasks import send_rsvp_notification, send_guest_confirmation
 
 logger = logging.getLogger(__name__)
@@ -66,6 +66,60 @@ def _ensure_can_rsvp(event, number=0):
             raise RSVPException(MESSAGES["full"])
 
 
+def get_registration_state(registration):
+    """Renvoie l'état d'une inscription (RSVP ou invité identifié) pris en compte par les compteurs"""
+    return registration.status, getattr(registration, "guests", 0)
+
+
+def _counted_attendees(event, registration, state):
+    if state is None:
+        return 0, 0
+
+    status, guests = state
+    if status not in (RSVP.STATUS_AWAITING_PAYMENT, RSVP.STATUS_CONFIRMED):
+        return 0, 0
+
+    # les invités sont comptés individuellement pour les événements avec formulaire
+    # d'inscription, et par le nombre indiqué sur l'inscription sinon
+    if isinstance(registration, IdentifiedGuest):
+        size = 1 if event.subscription_form_id is not None else 0
+    else:
+        size = 1 + (guests if event.subscription_form_id is None else 0)
+
+    return size, size if status == RSVP.STATUS_CONFIRMED else 0
+
+
+def update_participant_counts(event, registration, previous_state, current_state):
+    """Répercute sur les compteurs de l'événement le changement d'état d'une inscription
+
+    Les compteurs sont modifiés par incrément, dans la transaction qui enregistre
+    l'inscription : des inscriptions simultanées ne peuvent donc pas s'écraser.
+
+    :param event: l'événement concerné
+    :param registration: le RSVP ou l'invité identifié modifié
+    :param previous_state: l'état avant modification, ou `None` pour une nouvelle inscription
+    :param current_state: l'état après modification, ou `None` pour une inscription supprimée
+    """
+    previous_all, previous_confirmed = _counted_attendees(
+        event, registration, previous_state
+    )
+    current_all, current_confirmed = _counted_attendees(
+        event, registration, current_state
+    )
+    all_delta = current_all - previous_all
+    confirmed_delta = current_confirmed - previous_confirmed
+
+    if not all_delta and not confirmed_delta:
+        return
+
+    Event.objects.filter(pk=event.pk).update(
+        all_attendee_count=F("all_attendee_count") + all_delta,
+        confirmed_attendee_count=F("confirmed_attendee_count") + confirmed_delta,
+    )
+    event.all_attendee_count += all_delta
+    event.confirmed_attendee_count += confirmed_delta
+
+
 def _get_meta(event, form_submission, is_guest):
     return {
         "VERSION": "2",
@@ -297,6 +351,10 @@ def _add_identified_guest(event, person, submission, status, paying=True):
 
     guest.status = RSVP.STATUS_AWAITING_PAYMENT if paying else RSVP.STATUS_CONFIRMED
     RSVP.objects.filter(pk=rsvp.pk).update(guests=F("guests") + 1)
+    # la mise à jour par queryset n'envoie pas les signaux qui tiennent les compteurs à jour
+    previous_state = get_registration_state(rsvp)
+    rsvp.guests += 1
+    update_participant_counts(event, rsvp, previous_state, get_registration_state(rsvp))
 
     return guest
 
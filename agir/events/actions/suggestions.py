@@ -0,0 +1,198 @@
+from datetime import timedelta
+
+from django.contrib.gis.db.models import PointField
+from django.contrib.gis.db.models.functions import Distance
+from django.contrib.gis.measure import D
+from django.core.cache import cache
+from django.db.models import BooleanField, Case, F, Func, Value, When
+from django.utils import timezone
+
+from agir.events.models import Event
+from agir.people.models import Person
+
+__all__ = [
+    "compute_event_suggestions",
+    "get_event_suggestions",
+    "update_event_suggestions",
+    "invalidate_event_suggestions",
+    "invalidate_all_event_suggestions",
+    "invalidate_event_suggestions_near",
+]
+
+
+EVENT_SUGGESTIONS_COUNT = 20
+EVENT_SUGGESTIONS_CACHE_TIMEOUT = 6 * 3600
+EVENT_SUGGESTIONS_GENERATION_KEY = "event_suggestions_generation"
+
+# les calendriers dont les événements sont suggérés à tout le monde
+SUGGESTED_CALENDARS = ("national", "grands-evenements")
+# rayon d'action maximal d'une personne (cf. validateurs de `Person.action_radius`)
+MAX_ACTION_RADIUS = 500
+
+
+def _cache_key(person_pk):
+    return f"event_suggestions_{person_pk}"
+
+
+def compute_event_suggestions(person):
+    """Calcule les suggestions d'événements d'une personne
+
+    Renvoie un dictionnaire contenant les identifiants des événements suggérés (``ids``) et
+    parmi ceux-ci, ceux pour lesquels la distance à la personne doit être affichée
+    (``distance_ids``).
+    """
+    events = Event.objects.listed().upcoming()
+    national = events.national()
+    near = events.none()
+    national_pks = national.values_list("pk", flat=True)
+
+    from_groups_attendees = list(
+        Event.objects.public()
+        .upcoming()
+        .filter(groups_attendees__in=person.supportgroups.all())
+        .exclude(pk__in=national_pks)
+        .distinct()
+        .order_by("start_time")
+        .values_list("pk", flat=True)[:10]
+    )
+
+    if person.coordinates is not None:
+        national = national.near(coordinates=person.coordinates, radius=100)
+        near = (
+            events.exclude(pk__in=national_pks)
+            .exclude(pk__in=from_groups_attendees)
+            .filter(start_time__lt=timezone.now() + timedelta(days=30))
+            .near(coordinates=person.coordinates, radius=person.action_radius)
+            .order_by("distance")
+        )[: (10 - len(from_groups_attendees))]
+
+    near = list(near.values_list("pk", flat=True))
+    national = list(national.values_list("pk", flat=True)[:10])
+
+    segmented = list(
+        events.exclude(pk__in=national_pks)
+        .exclude(pk__in=near)
+        .exclude(pk__in=from_groups_attendees)
+        .exclude(pk__in=events.grand().values_list("pk", flat=True))
+        .for_segment_subscriber(person)
+        .values_list("pk", flat=True)
+    )
+
+    ids = list(dict.fromkeys(segmented + national + from_groups_attendees + near))
+
+    return {
+        "ids": [str(pk) for pk in ids[:EVENT_SUGGESTIONS_COUNT]],
+        "distance_ids": (
+            [str(pk) for pk in national + near]
+            if person.coordinates is not None
+            else []
+        ),
+    }
+
+
+def update_event_suggestions(person):
+    """Recalcule et met en cache les suggestions d'événements d'une personne"""
+    generation = cache.get_or_set(EVENT_SUGGESTIONS_GENERATION_KEY, 0, timeout=None)
+    suggestions = compute_event_suggestions(person)
+    cache.set(
+        _cache_key(person.pk),
+        {**suggestions, "generation": generation},
+        timeout=EVENT_SUGGESTIONS_CACHE_TIMEOUT,
+    )
+    return suggestions
+
+
+def get_event_suggestions(person, queryset=None):
+    """Renvoie le queryset des événements suggérés à la personne, trié par date de début
+
+    Les suggestions précalculées sont utilisées si elles sont disponibles et valides ; à
+    défaut elles sont recalculées et mises en cache.
+    """
+    if queryset is None:
+        queryset = Event.objects.all()
+
+    values = cache.get_many([EVENT_SUGGESTIONS_GENERATION_KEY, _cache_key(person.pk)])
+    suggestions = values.get(_cache_key(person.pk))
+
+    if suggestions is None or suggestions["generation"] != values.get(
+        EVENT_SUGGESTIONS_GENERATION_KEY, 0
+    ):
+        suggestions = update_event_suggestions(person)
+
+    queryset = queryset.upcoming().filter(pk__in=suggestions["ids"])
+
+    if suggestions["distance_ids"] and person.coordinates is not None:
+        queryset = queryset.annotate(
+            distance=Case(
+                When(
+                    pk__in=suggestions["distance_ids"],
+                    then=Distance("coordinates", person.coordinates),
+                ),
+                default=None,
+            )
+        )
+
+    return queryset.order_by("start_time")
+
+
+def invalidate_event_suggestions(*person_pks):
+    cache.delete_many([_cache_key(person_pk) for person_pk in person_pks])
+
+
+def invalidate_all_event_suggestions():
+    """Invalide les suggestions de tout le monde (pour les événements nationaux ou segmentés)"""
+    try:
+        cache.incr(EVENT_SUGGESTIONS_GENERATION_KEY)
+    except ValueError:
+        cache.set(EVENT_SUGGESTIONS_GENERATION_KEY, 1, timeout=None)
+
+
+def invalidate_event_suggestions_near(event, previous_coordinates=None):
+    """Invalide les suggestions des personnes concernées par la modification de l'événement
+
+    :param previous_coordinates: la position de l'événement avant son déplacement, le cas
+        échéant : les personnes proches de l'ancienne position sont aussi concernées
+    """
+    if (
+        event.suggestion_segment_id is not None
+        or event.calendars.filter(slug__in=SUGGESTED_CALENDARS).exists()
+    ):
+        invalidate_all_event_suggestions()
+        return
+
+    if event.coordinates is not None:
+        invalidate_event_suggestions_near_point(event.coordinates)
+
+    if previous_coordinates is not None and previous_coordinates != event.coordinates:
+        invalidate_event_suggestions_near_point(previous_coordinates)
+
+
+def invalidate_event_suggestions_near_point(coordinates):
+    # seules les personnes dans le rayon d'action desquelles se trouve ce point sont
+    # concernées ; le filtre sur le rayon maximal permet d'utiliser l'index spatial
+    person_pks = (
+        Person.objects.exclude(coordinates__isnull=True)
+        .filter(coordinates__dwithin=(coordinates, D(km=MAX_ACTION_RADIUS)))
+        .alias(
+            in_action_radius=Func(
+                F("coordinates"),
+                Value(coordinates, output_field=PointField(geography=True)),
+                F("action_radius") * 1000,
+                function="ST_DWithin",
+                output_field=BooleanField(),
+            )
+        )
+        .filter(in_action_radius=True)
+        .values_list("pk", flat=True)
+        .iterator()
+    )
+
+    batch = []
+    for person_pk in person_pks:
+        batch.append(person_pk)
+        if len(batch) >= 1000:
+            invalidate_event_suggestions(*batch)
+            batch = []
+
+    if batch:
+        invalidate_event_suggestions(*batch)
@@ -0,0 +1,34 @@
+from django.utils import timezone
+
+from agir.events.actions.suggestions import update_event_suggestions
+from agir.lib.commands import BaseCommand
+from agir.people.models import Person
+
+
+class Command(BaseCommand):
+    help = "Précalcule les suggestions d'événements des personnes s'étant connectées récemment"
+
+    def add_arguments(self, parser):
+        super().add_arguments(parser)
+        parser.add_argument(
+            "-d",
+            "--days",
+            dest="days",
+            type=int,
+            default=30,
+            help="Nombre de jours depuis la dernière connexion",
+        )
+
+    def handle(self, *args, days, **options):
+        people = Person.objects.with_active_role().filter(
+            role__last_login__gt=timezone.now() - timezone.timedelta(days=days)
+        )
+
+        self.init_tqdm(total=people.count())
+        for person in people.iterator():
+            self.log_current_item(person.pk)
+            if not self.dry_run:
+                update_event_suggestions(person)
+            self.tqdm.update(1)
+
+        self.tqdm.close()
@@ -0,0 +1,49 @@
+from django.db.models import F, Q
+
+from agir.events.models import Event
+from agir.lib.commands import BaseCommand
+from agir.lib.utils import grouper
+
+
+class Command(BaseCommand):
+    help = (
+        "Vérifie les compteurs de participants des événements et corrige ceux qui ne "
+        "correspondent plus aux inscriptions"
+    )
+
+    def add_arguments(self, parser):
+        super().add_arguments(parser)
+        parser.add_argument(
+            "-b",
+            "--batch-size",
+            dest="batch_size",
+            type=int,
+            default=1000,
+            help="Nombre d'événements corrigés par requête",
+        )
+
+    def handle(self, *args, batch_size, **options):
+        drifted_pks = list(
+            Event.objects.with_participant_counts()
+            .filter(
+                ~Q(all_attendee_count=F("computed_all_attendee_count"))
+                | ~Q(confirmed_attendee_count=F("computed_confirmed_attendee_count"))
+            )
+            .values_list("pk", flat=True)
+        )
+
+        if not drifted_pks:
+            self.success("Tous les compteurs de participants sont à jour")
+            return
+
+        self.info(f"{len(drifted_pks)} événement(s) avec des compteurs erronés")
+        self.init_tqdm(total=len(drifted_pks))
+
+        for batch in grouper(drifted_pks, batch_size):
+            batch = list(batch)
+            if not self.dry_run:
+                Event.objects.filter(pk__in=batch).update_participant_counts()
+            self.tqdm.update(len(batch))
+
+        self.tqdm.close()
+        self.success(f"{len(drifted_pks)} événement(s) corrigé(s)")
@@ -0,0 +1,91 @@
+# Generated by Django 3.2.19 on 2023-07-10 10:12
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.db import migrations
+
+CREATE_SEARCH_VECTOR_TRIGGER = """
+CREATE FUNCTION get_event_tsvector(
+  name events_event.name%TYPE, location_name events_event.location_name%TYPE,
+  location_city events_event.location_city%TYPE, location_zip events_event.location_zip%TYPE,
+  description events_event.description%TYPE, report_content events_event.report_content%TYPE
+) RETURNS tsvector AS $$
+BEGIN
+  RETURN
+    setweight(to_tsvector('french_unaccented', COALESCE(name, '')), 'A') ||
+    setweight(to_tsvector('french_unaccented', COALESCE(location_name, '')), 'B') ||
+    setweight(to_tsvector('french_unaccented', COALESCE(location_city, '')), 'B') ||
+    setweight(to_tsvector('french_unaccented', COALESCE(location_zip, '')), 'B') ||
+    setweight(to_tsvector('french_unaccented', COALESCE(description, '')), 'C') ||
+    setweight(to_tsvector('french_unaccented', COALESCE(report_content, '')), 'C');
+END;
+$$ LANGUAGE plpgsql STABLE;
+
+CREATE FUNCTION process_update_event_search_vector() RETURNS TRIGGER AS $$
+BEGIN
+  --
+  -- Trigger function to update the search vector of an event when it is created or updated
+  --
+  NEW.search_vector := get_event_tsvector(
+    NEW.name, NEW.location_name, NEW.location_city, NEW.location_zip, NEW.description, NEW.report_content
+  );
+  RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER update_event_search_vector_when_modified
+BEFORE INSERT OR UPDATE OF name, location_name, location_city, location_zip, description, report_content
+ON events_event
+  FOR EACH ROW EXECUTE PROCEDURE process_update_event_search_vector();
+"""
+
+DROP_SEARCH_VECTOR_TRIGGER = """
+DROP TRIGGER IF EXISTS update_event_search_vector_when_modified ON events_event;
+DROP FUNCTION IF EXISTS process_update_event_search_vector();
+DROP FUNCTION IF EXISTS get_event_tsvector(
+  events_event.name%TYPE, events_event.location_name%TYPE, events_event.location_city%TYPE,
+  events_event.location_zip%TYPE, events_event.description%TYPE, events_event.report_content%TYPE
+);
+"""
+
+# l'index d'expression utilisé par l'ancienne recherche simple est remplacé par l'index
+# sur le champ search_vector
+DROP_SIMPLE_SEARCH_INDEX = """
+DROP INDEX IF EXISTS events_event_simple_search RESTRICT;
+"""
+
+CREATE_SIMPLE_SEARCH_INDEX = """
+CREATE INDEX events_event_simple_search ON events_event USING GIN ((
+setweight(to_tsvector('french_unaccented', COALESCE("name", '')), 'A')
+|| setweight(to_tsvector('french_unaccented', COALESCE("location_name", '')), 'B')
+|| setweight(to_tsvector('french_unaccented', COALESCE("location_city", '')), 'C')
+));
+"""
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("events", "0034_eventsubtype_for_supportgroups"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="event",
+            name="search_vector",
+            field=django.contrib.postgres.search.SearchVectorField(
+                editable=False, null=True, verbose_name="Données de recherche"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="event",
+            index=django.contrib.postgres.indexes.GinIndex(
+                fields=["search_vector"], name="events_search_vector_index"
+            ),
+        ),
+        migrations.RunSQL(
+            sql=CREATE_SEARCH_VECTOR_TRIGGER, reverse_sql=DROP_SEARCH_VECTOR_TRIGGER
+        ),
+        migrations.RunSQL(
+            sql=DROP_SIMPLE_SEARCH_INDEX, reverse_sql=CREATE_SIMPLE_SEARCH_INDEX
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 3.2.19 on 2023-07-11 09:30
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("carte", "0002_alter_staticmapimage_image"),
+        ("events", "0035_event_search_vector"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="event",
+            name="static_map_image",
+            field=models.ForeignKey(
+                blank=True,
+                editable=False,
+                null=True,
+                on_delete=django.db.models.deletion.SET_NULL,
+                related_name="+",
+                to="carte.staticmapimage",
+                verbose_name="carte statique",
+            ),
+        ),
+    ]
@@ -0,0 +1,73 @@
+# Generated by Django 3.2.19 on 2023-07-12 14:05
+
+from django.db import migrations, models
+
+COMPUTE_ATTENDEE_COUNTS = """
+UPDATE events_event AS event SET
+  all_attendee_count = counts.all_count,
+  confirmed_attendee_count = counts.confirmed_count
+FROM (
+  SELECT
+    event.id,
+    COALESCE(rsvps.all_count, 0) + CASE
+      WHEN event.subscription_form_id IS NULL THEN COALESCE(rsvps.all_guests, 0)
+      ELSE COALESCE(guests.all_count, 0)
+    END AS all_count,
+    COALESCE(rsvps.confirmed_count, 0) + CASE
+      WHEN event.subscription_form_id IS NULL THEN COALESCE(rsvps.confirmed_guests, 0)
+      ELSE COALESCE(guests.confirmed_count, 0)
+    END AS confirmed_count
+  FROM events_event AS event
+  LEFT JOIN (
+    SELECT
+      event_id,
+      COUNT(*) AS all_count,
+      COUNT(*) FILTER (WHERE status = 'CO') AS confirmed_count,
+      COALESCE(SUM(guests), 0) AS all_guests,
+      COALESCE(SUM(guests) FILTER (WHERE status = 'CO'), 0) AS confirmed_guests
+    FROM events_rsvp
+    WHERE status IN ('AP', 'CO')
+    GROUP BY event_id
+  ) AS rsvps ON rsvps.event_id = event.id
+  LEFT JOIN (
+    SELECT
+      rsvp.event_id,
+      COUNT(*) AS all_count,
+      COUNT(*) FILTER (WHERE guest.status = 'CO') AS confirmed_count
+    FROM events_rsvp_guests_form_submissions AS guest
+    JOIN events_rsvp AS rsvp ON rsvp.id = guest.rsvp_id
+    WHERE guest.status IN ('AP', 'CO')
+    GROUP BY rsvp.event_id
+  ) AS guests ON guests.event_id = event.id
+  WHERE rsvps.event_id IS NOT NULL OR guests.event_id IS NOT NULL
+) AS counts
+WHERE event.id = counts.id;
+"""
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("events", "0036_event_static_map_image"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="event",
+            name="all_attendee_count",
+            field=models.PositiveIntegerField(
+                default=0, editable=False, verbose_name="Nombre de participants"
+            ),
+        ),
+        migrations.AddField(
+            model_name="event",
+            name="confirmed_attendee_count",
+            field=models.PositiveIntegerField(
+                default=0,
+                editable=False,
+                verbose_name="Nombre de participants confirmés",
+            ),
+        ),
+        migrations.RunSQL(
+            sql=COMPUTE_ATTENDEE_COUNTS, reverse_sql=migrations.RunSQL.noop
+        ),
+    ]
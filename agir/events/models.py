@@ -13,12 +13,13 @@
 from django.contrib.gis.db.models.functions import Distance
 from django.contrib.gis.measure import D
 from django.contrib.postgres.fields import ArrayField
-from django.contrib.postgres.search import SearchVector, SearchRank
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchRank, SearchVectorField
 from django.core.exceptions import ValidationError
 from django.core.validators import RegexValidator
 from django.db import models, transaction
 from django.db.models import JSONField, Prefetch
-from django.db.models import Sum, Count, Q, OuterRef, Subquery
+from django.db.models import Case, Count, OuterRef, Q, Subquery, Sum, When
 from django.db.models.functions import Coalesce
 from django.template.defaultfilters import floatformat
 from django.utils import formats, timezone
@@ -32,7 +33,6 @@
 from slugify import slugify
 from stdimage.models import StdImageField
 
-from agir.carte.models import StaticMapImage
 from agir.gestion.typologies import TypeProjet, TypeDocument
 from agir.groups.models import Membership, SupportGroup
 from agir.lib import html
@@ -68,6 +68,54 @@
 ]
 
 
+PARTICIPANT_COUNT_FIELDS = ("all_attendee_count", "confirmed_attendee_count")
+_NOT_LOADED = object()
+
+
+def _registration_count(queryset, group_by, expression):
+    return Coalesce(
+        Subquery(
+            queryset.order_by()
+            .values(group_by)
+            .annotate(value=expression)
+            .values("value")[:1]
+        ),
+        0,
+        output_field=models.IntegerField(),
+    )
+
+
+def _participant_count_expressions():
+    """Renvoie les expressions du nombre total et du nombre confirmé de participants
+
+    Les invités sont comptés individuellement pour les événements avec formulaire
+    d'inscription, et par le nombre d'invités indiqué sur l'inscription sinon.
+    """
+    expressions = []
+    for statuses in (
+        [RSVP.STATUS_AWAITING_PAYMENT, RSVP.STATUS_CONFIRMED],
+        [RSVP.STATUS_CONFIRMED],
+    ):
+        rsvps = RSVP.objects.filter(event_id=OuterRef("pk"), status__in=statuses)
+        identified_guests = IdentifiedGuest.objects.filter(
+            rsvp__event_id=OuterRef("pk"), status__in=statuses
+        )
+        expressions.append(
+            _registration_count(rsvps, "event_id", Count("id"))
+            + Case(
+                When(
+                    subscription_form__isnull=True,
+                    then=_registration_count(rsvps, "event_id", Sum("guests")),
+                ),
+                default=_registration_count(
+                    identified_guests, "rsvp__event_id", Count("id")
+                ),
+                output_field=models.IntegerField(),
+            )
+        )
+    return expressions
+
+
 class EventQuerySet(models.QuerySet):
     def public(self):
         return self.filter(visibility=Event.VISIBILITY_PUBLIC)
@@ -165,15 +213,25 @@ def with_person_rsvps(self, person):
         )
 
     def with_static_map_image(self):
+        return self.select_related("static_map_image")
+
+    def with_participant_counts(self):
+        """Annote le nombre de participants recalculé à partir des inscriptions
+
+        Les compteurs stockés sur l'événement suffisent à l'affichage : cette annotation sert
+        à les vérifier ou à les réparer (cf. commande `recompter_participants`).
+        """
+        all_count, confirmed_count = _participant_count_expressions()
         return self.annotate(
-            static_map_image=Subquery(
-                StaticMapImage.objects.filter(
-                    center__dwithin=(
-                        OuterRef("coordinates"),
-                        StaticMapImage.UNIQUE_CENTER_MAX_DISTANCE,
-                    ),
-                ).values("image")[:1],
-            )
+            computed_all_attendee_count=all_count,
+            computed_confirmed_attendee_count=confirmed_count,
+        )
+
+    def update_participant_counts(self):
+        """Recalcule en une requête les compteurs de participants des événements"""
+        all_count, confirmed_count = _participant_count_expressions()
+        return self.update(
+            all_attendee_count=all_count, confirmed_attendee_count=confirmed_count
         )
 
     def with_event_card_serializer_prefetch(self):
@@ -201,30 +259,11 @@ def with_serializer_prefetch(self, person):
 
     def search(self, query):
         """Recherche sur l'ensemble des champs texte de l'événement"""
-        vector = (
-            SearchVector(models.F("name"), config="french_unaccented", weight="A")
-            + SearchVector(
-                models.F("location_name"), config="french_unaccented", weight="B"
-            )
-            + SearchVector(
-                models.F("location_city"), config="french_unaccented", weight="B"
-            )
-            + SearchVector(
-                models.F("location_zip"), config="french_unaccented", weight="B"
-            )
-            + SearchVector(
-                models.F("description"), config="french_unaccented", weight="C"
-            )
-            + SearchVector(
-                models.F("report_content"), config="french_unaccented", weight="C"
-            )
-        )
         query = PrefixSearchQuery(query, config="french_unaccented")
 
         return (
-            self.annotate(search=vector)
-            .filter(search=query)
-            .annotate(rank=SearchRank(vector, query))
+            self.filter(search_vector=query)
+            .annotate(rank=SearchRank(models.F("search_vector"), query))
             .order_by("-rank")
         )
 
@@ -244,23 +283,12 @@ def near(self, coordinates=None, radius=None):
         )
 
     def simple_search(self, query):
-        """Cherche uniquement sur le nom de l'événement, le nom du lieu et le nom de la ville"""
-        vector = (
-            SearchVector(models.F("name"), config="french_unaccented", weight="A")
-            + SearchVector(
-                models.F("location_name"), config="french_unaccented", weight="B"
-            )
-            + SearchVector(
-                models.F("location_city"), config="french_unaccented", weight="C"
-            )
-        )
-
-        query = PrefixSearchQuery(query, config="french_unaccented")
+        """Cherche uniquement sur le nom de l'événement et les informations du lieu"""
+        query = PrefixSearchQuery(query, config="french_unaccented", weights="AB")
 
         return (
-            self.annotate(search=vector)
-            .filter(search=query)
-            .annotate(rank=SearchRank(vector, query))
+            self.filter(search_vector=query)
+            .annotate(rank=SearchRank(models.F("search_vector"), query))
             .order_by("-rank")
         )
 
@@ -276,11 +304,11 @@ def for_segment_subscriber(self, person):
         segmented_events = self.exclude(suggestion_segment_id__isnull=True)
         segments = Segment.objects.filter(
             pk__in=segmented_events.values_list("suggestion_segment_id", flat=True)
-        ).distinct("pk")
+        )
         return segmented_events.filter(
-            suggestion_segment_id__in=[
-                segment.id for segment in segments if segment.is_subscriber(person)
-            ]
+            suggestion_segment_id__in=Segment.objects.subscribed_segment_ids(
+                person, segments
+            )
         )
 
 
@@ -381,6 +409,9 @@ def create_event(
                     ],
                     ignore_conflicts=True,
                 )
+                # `bulk_create` n'envoie pas les signaux qui maintiennent les compteurs
+                self.filter(pk=event.pk).update_participant_counts()
+                event.refresh_from_db(fields=PARTICIPANT_COUNT_FIELDS)
 
             return event
 
@@ -630,6 +661,30 @@ class Event(
         on_delete=models.SET_NULL,
     )
 
+    # compteurs maintenus lors des changements d'état des inscriptions
+    # (cf. agir.events.actions.rsvps.update_participant_counts)
+    all_attendee_count = models.PositiveIntegerField(
+        "Nombre de participants", default=0, editable=False
+    )
+    confirmed_attendee_count = models.PositiveIntegerField(
+        "Nombre de participants confirmés", default=0, editable=False
+    )
+
+    # carte statique correspondant aux coordonnées, liée lors de sa génération
+    # (cf. agir.carte.static_maps)
+    static_map_image = models.ForeignKey(
+        "carte.StaticMapImage",
+        verbose_name=_("carte statique"),
+        on_delete=models.SET_NULL,
+        related_name="+",
+        null=True,
+        blank=True,
+        editable=False,
+    )
+
+    # maintenu par un trigger PostgreSQL (cf. migration 0035_event_search_vector)
+    search_vector = SearchVectorField("Données de recherche", editable=False, null=True)
+
     class Meta:
         verbose_name = _("événement")
         verbose_name_plural = _("événements")
@@ -649,6 +704,7 @@ class Meta:
             models.Index(
                 fields=["start_time", "end_time", "id"], name="events_datetime_id_index"
             ),
+            GinIndex(fields=["search_vector"], name="events_search_vector_index"),
         )
 
     def __str__(self):
@@ -682,32 +738,39 @@ def to_ics(self, text_only_description=False):
 
         return ics_event
 
-    def _get_participants_counts(self):
-        nb_rsvps = RSVP.objects.filter(
-            Q(event_id=self.id) & ~Q(status=RSVP.STATUS_CANCELED)
-        ).aggregate(
-            total=Count("id"),
-            confirmed=Count("id", filter=Q(status=RSVP.STATUS_CONFIRMED)),
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # permet de détecter un changement du mode de comptage des invités
+        instance._loaded_subscription_form_id = instance.__dict__.get(
+            "subscription_form_id", _NOT_LOADED
+        )
+        # permet d'invalider les suggestions autour de l'ancienne position (cf. signals)
+        instance._loaded_coordinates = instance.__dict__.get("coordinates")
+        return instance
+
+    def _do_update(self, base_qs, using, pk_val, values, update_fields, forced_update):
+        # les compteurs de participants de l'instance peuvent être périmés : ils ne sont
+        # enregistrés que s'ils sont explicitement désignés par `update_fields`
+        if update_fields is None:
+            values = [v for v in values if v[0].name not in PARTICIPANT_COUNT_FIELDS]
+        return super()._do_update(
+            base_qs, using, pk_val, values, update_fields, forced_update
         )
 
-        if self.subscription_form is not None:
-            nb_guests = IdentifiedGuest.objects.filter(
-                Q(rsvp__event_id=self.id) & ~Q(status=RSVP.STATUS_CANCELED)
-            ).aggregate(
-                total=Count("id"),
-                confirmed=Count("id", filter=Q(status=RSVP.STATUS_CONFIRMED)),
-            )
-        else:
-            nb_guests = RSVP.objects.filter(
-                Q(event_id=self.id) & ~Q(status=RSVP.STATUS_CANCELED)
-            ).aggregate(
-                total=Coalesce(Sum("guests"), 0),
-                confirmed=Coalesce(
-                    Sum("guests", filter=Q(status=RSVP.STATUS_CONFIRMED)), 0
-                ),
-            )
-        self.all_attendee_count = nb_rsvps["total"] + nb_guests["total"]
-        self.confirmed_attendee_count = nb_rsvps["confirmed"] + nb_guests["confirmed"]
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        self._loaded_coordinates = self.__dict__.get("coordinates")
+
+        loaded_subscription_form_id = getattr(
+            self, "_loaded_subscription_form_id", _NOT_LOADED
+        )
+        if loaded_subscription_form_id is not _NOT_LOADED and (
+            loaded_subscription_form_id != self.__dict__.get("subscription_form_id")
+        ):
+            Event.objects.filter(pk=self.pk).update_participant_counts()
+            self.refresh_from_db(fields=PARTICIPANT_COUNT_FIELDS)
+            self._loaded_subscription_form_id = self.subscription_form_id
 
     @property
     def event_speaker(self):
@@ -716,22 +779,26 @@ def event_speaker(self):
 
     @property
     def participants(self):
-        if not hasattr(self, "all_attendee_count"):
-            self._get_participants_counts()
-
         return self.all_attendee_count
 
     @property
     def participants_confirmes(self):
-        if not hasattr(self, "confirmed_attendee_count"):
-            self._get_participants_counts()
-
         return self.confirmed_attendee_count
 
     @property
     def confirmed_attendees(self):
         return self.attendees.filter(rsvps__in=self.rsvps.confirmed())
 
+    def get_organizer_group_ids(self):
+        """Renvoie les identifiants des groupes organisateurs, préchargés si possible"""
+        if hasattr(self, "_pf_organizer_groups"):
+            return [group.id for group in self._pf_organizer_groups]
+        if not hasattr(self, "_organizer_group_ids"):
+            self._organizer_group_ids = list(
+                self.organizers_groups.values_list("id", flat=True)
+            )
+        return self._organizer_group_ids
+
     def get_organizer_people(self):
         organizer_people = sum(
             [group.referents for group in self.organizers_groups.distinct()],
@@ -1320,7 +1387,31 @@ def __str__(self):
         )
 
 
-class RSVP(ExportModelOperationsMixin("rsvp"), TimeStampedModel):
+class RegistrationStateMixin:
+    """Garde l'état d'une inscription lors de son chargement
+
+    Cet état (statut et nombre d'invités) permet de mettre à jour les compteurs de
+    participants de l'événement lors de l'enregistrement, sans relire l'inscription
+    (cf. `agir.events.signals`).
+    """
+
+    COUNTED_FIELDS = ("status",)
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        loaded = instance.__dict__
+        if all(field in loaded for field in cls.COUNTED_FIELDS):
+            instance._loaded_participant_state = (
+                loaded["status"],
+                loaded.get("guests", 0),
+            )
+        return instance
+
+
+class RSVP(
+    ExportModelOperationsMixin("rsvp"), RegistrationStateMixin, TimeStampedModel
+):
     """
     Model that represents a RSVP for one person for an event.
 
@@ -1336,6 +1427,8 @@ class RSVP(ExportModelOperationsMixin("rsvp"), TimeStampedModel):
         (STATUS_CANCELED, _("Inscription annulée")),
     )
 
+    COUNTED_FIELDS = ("status", "guests")
+
     objects = RSVPQuerySet.as_manager()
 
     person = models.ForeignKey(
@@ -1407,7 +1500,11 @@ def __str__(self):
         return info
 
 
-class IdentifiedGuest(ExportModelOperationsMixin("identified_guest"), models.Model):
+class IdentifiedGuest(
+    ExportModelOperationsMixin("identified_guest"),
+    RegistrationStateMixin,
+    models.Model,
+):
     rsvp = models.ForeignKey(
         "RSVP", on_delete=models.CASCADE, null=False, related_name="identified_guests"
     )
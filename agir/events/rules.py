@@ -3,6 +3,7 @@
 from agir.events.models import Event
 from .actions.required_documents import get_is_blocking_project
 from ..gestion.models import Projet
+from ..groups.membership_index import has_membership
 from ..groups.models import Membership
 from ..lib.rules import is_authenticated_person
 
@@ -27,13 +28,11 @@ def is_organizer_of_event(role, event=None):
         return True
 
     # All the managers of the groups organizing the event:
-    if event.organizers_groups.filter(
-        memberships__person=role.person,
-        memberships__membership_type__gte=Membership.MEMBERSHIP_TYPE_REFERENT,
-    ).exists():
-        return True
-
-    return False
+    return has_membership(
+        role.person.id,
+        event.get_organizer_group_ids(),
+        Membership.MEMBERSHIP_TYPE_REFERENT,
+    )
 
 
 @rules.predicate
@@ -47,13 +46,11 @@ def is_at_least_manager_of_event(role, event=None):
         return True
 
     # All the managers of the groups organizing the event:
-    if event.organizers_groups.filter(
-        memberships__person=role.person,
-        memberships__membership_type__gte=Membership.MEMBERSHIP_TYPE_MANAGER,
-    ).exists():
-        return True
-
-    return False
+    return has_membership(
+        role.person.id,
+        event.get_organizer_group_ids(),
+        Membership.MEMBERSHIP_TYPE_MANAGER,
+    )
 
 
 @rules.predicate
@@ -59,6 +59,7 @@
 )
 from ..elections.utils import is_forbidden_during_treve_event
 from ..gestion.models import Projet, Document, VersionDocument
+from ..groups.membership_index import has_membership
 from ..groups.models import Membership, SupportGroup
 from ..groups.serializers import SupportGroupSerializer, SupportGroupDetailSerializer
 from ..groups.tasks import notify_new_group_event, send_new_group_event_email
@@ -288,13 +289,11 @@ def get_isOrganizer(self, obj):
         if bool(self.organizer_config):
             return True
 
-        if obj.organizers_groups.filter(
-            memberships__person=self.person,
-            memberships__membership_type__gte=Membership.MEMBERSHIP_TYPE_REFERENT,
-        ).exists():
-            return True
-
-        return False
+        return has_membership(
+            self.person.id,
+            obj.get_organizer_group_ids(),
+            Membership.MEMBERSHIP_TYPE_REFERENT,
+        )
 
     def get_isManager(self, obj):
         if not self.person:
@@ -303,13 +302,11 @@ def get_isManager(self, obj):
         if bool(self.organizer_config):
             return True
 
-        if obj.organizers_groups.filter(
-            memberships__person=self.person,
-            memberships__membership_type__gte=Membership.MEMBERSHIP_TYPE_MANAGER,
-        ).exists():
-            return True
-
-        return False
+        return has_membership(
+            self.person.id,
+            obj.get_organizer_group_ids(),
+            Membership.MEMBERSHIP_TYPE_MANAGER,
+        )
 
     def get_rsvp(self, obj):
         return self.rsvp and self.rsvp.status
@@ -1,13 +1,19 @@
 from functools import partial
 
 from django.db import transaction
-from django.db.models.signals import post_save
+from django.db.models.signals import post_save, post_delete, pre_save
 from django.dispatch import receiver
 
+from agir.groups.models import Membership
+from agir.people.models import Person
+from .actions.rsvps import get_registration_state, update_participant_counts
+from .actions.suggestions import invalidate_event_suggestions
 from .models import Event, RSVP, IdentifiedGuest
 from .tasks import (
     copier_rsvp_vers_feuille_externe,
     copier_identified_guest_vers_feuille_externe,
+    update_event_suggestions_for_person,
+    invalidate_event_suggestions_near_event,
 )
 
 
@@ -46,3 +52,118 @@ def signal_copier_identified_guest_feuille_externe(sender, instance, **kwargs):
     copier_participant_feuille_externe(
         instance, instance.rsvp.event.lien_feuille_externe
     )
+
+
+@receiver(post_save, sender=Event, dispatch_uid="invalidate_event_suggestions")
+def signal_invalidate_event_suggestions(sender, instance, **kwargs):
+    # position de l'événement lors de son chargement, si celui-ci a été déplacé depuis
+    previous_coordinates = getattr(instance, "_loaded_coordinates", None)
+    if (
+        previous_coordinates is not None
+        and previous_coordinates != instance.coordinates
+    ):
+        previous_coordinates = list(previous_coordinates.coords)
+    else:
+        previous_coordinates = None
+
+    transaction.on_commit(
+        partial(
+            invalidate_event_suggestions_near_event.delay,
+            instance.pk,
+            previous_coordinates,
+        )
+    )
+
+
+@receiver(post_save, sender=Person, dispatch_uid="invalidate_event_suggestions_on_move")
+def signal_invalidate_event_suggestions_for_person(
+    sender, instance, created, update_fields=None, **kwargs
+):
+    # les suggestions dépendent de la position et du rayon d'action de la personne
+    if created or (
+        update_fields is not None
+        and not {"coordinates", "action_radius"}.intersection(update_fields)
+    ):
+        return
+    invalidate_event_suggestions(instance.pk)
+
+
+@receiver(post_save, sender=Membership, dispatch_uid="update_event_suggestions_on_join")
+@receiver(
+    post_delete, sender=Membership, dispatch_uid="update_event_suggestions_on_leave"
+)
+def signal_update_event_suggestions_for_member(sender, instance, **kwargs):
+    invalidate_event_suggestions(instance.person_id)
+    transaction.on_commit(
+        partial(update_event_suggestions_for_person.delay, instance.person_id)
+    )
+
+
+def _registration_event(registration):
+    if isinstance(registration, IdentifiedGuest):
+        return registration.rsvp.event
+    return registration.event
+
+
+@receiver(pre_save, sender=RSVP, dispatch_uid="rsvp_previous_participant_state")
+@receiver(
+    pre_save,
+    sender=IdentifiedGuest,
+    dispatch_uid="identified_guest_previous_participant_state",
+)
+def signal_remember_previous_participant_state(
+    sender, instance, update_fields=None, **kwargs
+):
+    if update_fields is not None and not set(instance.COUNTED_FIELDS).intersection(
+        update_fields
+    ):
+        return
+
+    if instance._state.adding:
+        instance._loaded_participant_state = None
+    elif not hasattr(instance, "_loaded_participant_state"):
+        # l'état n'a pas été gardé lors du chargement (champs différés, instance
+        # construite à la main) : il est relu dans la base
+        previous = sender.objects.filter(pk=instance.pk).first()
+        instance._loaded_participant_state = (
+            get_registration_state(previous) if previous is not None else None
+        )
+
+
+@receiver(post_save, sender=RSVP, dispatch_uid="rsvp_update_participant_counts")
+@receiver(
+    post_save,
+    sender=IdentifiedGuest,
+    dispatch_uid="identified_guest_update_participant_counts",
+)
+def signal_update_participant_counts_on_save(
+    sender, instance, update_fields=None, **kwargs
+):
+    if update_fields is not None and not set(instance.COUNTED_FIELDS).intersection(
+        update_fields
+    ):
+        # les champs comptés ne sont pas modifiés : rien à mettre à jour
+        return
+
+    previous_state = instance._loaded_participant_state
+    current_state = get_registration_state(instance)
+    instance._loaded_participant_state = current_state
+
+    update_participant_counts(
+        _registration_event(instance), instance, previous_state, current_state
+    )
+
+
+@receiver(post_delete, sender=RSVP, dispatch_uid="rsvp_delete_participant_counts")
+@receiver(
+    post_delete,
+    sender=IdentifiedGuest,
+    dispatch_uid="identified_guest_delete_participant_counts",
+)
+def signal_update_participant_counts_on_delete(sender, instance, **kwargs):
+    try:
+        event = _registration_event(instance)
+    except (Event.DoesNotExist, RSVP.DoesNotExist):
+        return
+
+    update_participant_counts(event, instance, get_registration_state(instance), None)
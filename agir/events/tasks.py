@@ -5,6 +5,7 @@
 import ics
 import requests
 from django.conf import settings
+from django.contrib.gis.geos import Point
 from django.template.defaultfilters import date as _date
 from django.template.loader import render_to_string
 from django.utils.http import urlencode
@@ -23,7 +24,7 @@
 from agir.lib.google_sheet import (
     parse_sheet_link,
     copy_array_to_sheet,
-    add_row_to_sheet,
+    buffer_row_for_sheet,
     gspread_task,
 )
 from agir.lib.html import sanitize_html
@@ -31,6 +32,10 @@
 from agir.lib.utils import front_url
 from agir.notifications.models import Subscription
 from agir.people.models import Person
+from .actions.suggestions import (
+    update_event_suggestions,
+    invalidate_event_suggestions_near,
+)
 from .display import display_participants, display_rsvp, display_identified_guest
 from .models import (
     Event,
@@ -118,7 +123,7 @@ def send_event_creation_notification(organizer_config_pk):
     )
 
 
-@emailing_task(post_save=True)
+@emailing_task(post_save=True, coalesce=30, coalesce_merge=("changed_data",))
 def send_event_changed_notification(event_pk, changed_data):
     event = Event.objects.get(pk=event_pk)
 
@@ -503,7 +508,7 @@ def notify_on_event_report(event_pk):
     )
 
 
-@http_task(post_save=True)
+@http_task(post_save=True, coalesce=10)
 def geocode_event(event_pk):
     event = Event.objects.get(pk=event_pk)
     geocode_element(event)
@@ -840,7 +845,7 @@ def copier_participants_vers_feuille_externe(event_id):
     copy_array_to_sheet(sheet_id, values)
 
 
-@gspread_task
+@gspread_task(coalesce=10)
 def copier_rsvp_vers_feuille_externe(rsvp_id):
     try:
         rsvp = RSVP.objects.select_related(
@@ -859,7 +864,12 @@ def copier_rsvp_vers_feuille_externe(rsvp_id):
 
     values = display_rsvp(rsvp)
 
-    add_row_to_sheet(sheet_id, values, "id")
+    buffer_row_for_sheet(
+        sheet_id,
+        values,
+        "id",
+        resync=copier_participants_vers_feuille_externe.si(rsvp.event_id),
+    )
 
 
 @gspread_task
@@ -881,4 +891,23 @@ def copier_identified_guest_vers_feuille_externe(guest_id):
 
     values = display_identified_guest(ig)
 
-    add_row_to_sheet(sheet_id, values, "id")
+    buffer_row_for_sheet(
+        sheet_id,
+        values,
+        "id",
+        resync=copier_participants_vers_feuille_externe.si(ig.rsvp.event_id),
+    )
+
+
+@post_save_task()
+def update_event_suggestions_for_person(person_pk):
+    update_event_suggestions(Person.objects.get(pk=person_pk))
+
+
+@post_save_task()
+def invalidate_event_suggestions_near_event(event_pk, previous_coordinates=None):
+    if previous_coordinates is not None:
+        previous_coordinates = Point(*previous_coordinates, srid=4326)
+    invalidate_event_suggestions_near(
+        Event.objects.get(pk=event_pk), previous_coordinates=previous_coordinates
+    )
@@ -1,7 +1,9 @@
 import uuid
 
 from agir.people.person_forms.models import PersonForm, PersonFormSubmission
-from django.test import TestCase
+from django.contrib.gis.geos import Point
+from django.core.cache import cache
+from django.test import TestCase, override_settings
 from django.utils import timezone
 
 from agir.groups.models import SupportGroup
@@ -9,6 +11,13 @@
 from agir.people.models import Person
 from ..actions import notifications
 from ..actions.notifications import event_report_form_reminder_notification
+from ..actions.suggestions import (
+    compute_event_suggestions,
+    get_event_suggestions,
+    invalidate_event_suggestions,
+    invalidate_event_suggestions_near,
+    update_event_suggestions,
+)
 from ..models import Event, RSVP, OrganizerConfig, EventSubtype
 from ...activity.models import Activity
 
@@ -242,3 +251,79 @@ def test_reminder_activity_is_created_for_event(self):
         self.assertEqual(
             activity.meta.get("description"), self.published_form.meta_description
         )
+
+
+class EventSuggestionsActionsTestCase(TestCase):
+    def setUp(self):
+        now = timezone.now()
+        location = create_location()
+
+        self.person = Person.objects.create_insoumise(
+            "suggestions@event.ap", coordinates=location["coordinates"]
+        )
+        self.near_event = Event.objects.create(
+            name="Événement proche",
+            start_time=now + timezone.timedelta(days=2),
+            end_time=now + timezone.timedelta(days=2, hours=2),
+            **location,
+        )
+        self.past_event = Event.objects.create(
+            name="Événement passé",
+            start_time=now - timezone.timedelta(days=2),
+            end_time=now - timezone.timedelta(days=2, hours=-2),
+            **location,
+        )
+
+    def test_compute_event_suggestions_includes_near_events(self):
+        suggestions = compute_event_suggestions(self.person)
+        self.assertIn(str(self.near_event.pk), suggestions["ids"])
+        self.assertIn(str(self.near_event.pk), suggestions["distance_ids"])
+        self.assertNotIn(str(self.past_event.pk), suggestions["ids"])
+
+    def test_get_event_suggestions_annotates_distance(self):
+        invalidate_event_suggestions(self.person.pk)
+        events = list(get_event_suggestions(self.person))
+        self.assertEqual(events, [self.near_event])
+        self.assertIsNotNone(events[0].distance)
+
+    @override_settings(
+        CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+    )
+    def test_invalidation_near_event_respects_action_radius(self):
+        x, y = self.near_event.coordinates.coords
+        far_person = Person.objects.create_insoumise(
+            "loin@event.ap", coordinates=Point(x + 2, y), action_radius=20
+        )
+        update_event_suggestions(self.person)
+        update_event_suggestions(far_person)
+
+        invalidate_event_suggestions_near(self.near_event)
+
+        self.assertIsNone(cache.get(f"event_suggestions_{self.person.pk}"))
+        self.assertIsNotNone(cache.get(f"event_suggestions_{far_person.pk}"))
+
+        far_person.coordinates = self.near_event.coordinates
+        far_person.save()
+        self.assertIsNone(cache.get(f"event_suggestions_{far_person.pk}"))
+
+    @override_settings(
+        CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+    )
+    def test_moving_event_invalidates_suggestions_near_previous_position(self):
+        update_event_suggestions(self.person)
+
+        x, y = self.near_event.coordinates.coords
+        event = Event.objects.get(pk=self.near_event.pk)
+        event.coordinates = Point(x + 2, y)
+        with self.captureOnCommitCallbacks(execute=True):
+            event.save()
+
+        self.assertIsNone(cache.get(f"event_suggestions_{self.person.pk}"))
+
+    def test_get_event_suggestions_filters_out_cancelled_events(self):
+        invalidate_event_suggestions(self.person.pk)
+        self.assertIn(self.near_event, get_event_suggestions(self.person))
+
+        self.near_event.visibility = Event.VISIBILITY_ADMIN
+        self.near_event.save()
+        self.assertNotIn(self.near_event, get_event_suggestions(self.person))
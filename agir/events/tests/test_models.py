@@ -1,9 +1,12 @@
+from django.core.management import call_command
 from django.test import TestCase
-from django.db import IntegrityError, transaction
+from django.db import IntegrityError, connection, transaction
+from django.test.utils import CaptureQueriesContext
 from django.utils import timezone
 
 from agir.people.models import Person
 
+from ..actions.rsvps import add_free_identified_guest
 from ..models import Event, Calendar, RSVP
 
 
@@ -32,6 +35,30 @@ def test_cannot_create_without_dates(self):
                 Event.objects.create(name="Event test 2", end_time=self.end_time)
 
 
+class EventSearchTestCase(TestCase):
+    def setUp(self):
+        start_time = timezone.now()
+        self.event = Event.objects.create(
+            name="Réunion publique",
+            location_city="Marseille",
+            description="<p>Discussion sur la planification écologique</p>",
+            start_time=start_time,
+            end_time=start_time + timezone.timedelta(hours=2),
+        )
+
+    def test_search_vector_is_maintained_by_trigger(self):
+        self.assertIn(self.event, Event.objects.search("reunion"))
+        self.assertIn(self.event, Event.objects.search("planif"))
+        self.assertNotIn(self.event, Event.objects.search("lyon"))
+
+        Event.objects.filter(pk=self.event.pk).update(location_city="Lyon")
+        self.assertIn(self.event, Event.objects.search("lyon"))
+
+    def test_simple_search_ignores_description(self):
+        self.assertIn(self.event, Event.objects.simple_search("marseil"))
+        self.assertNotIn(self.event, Event.objects.simple_search("planification"))
+
+
 class RSVPTestCase(TestCase):
     def setUp(self):
         start_time = timezone.now()
@@ -76,3 +103,79 @@ def test_participants_count(self):
         del self.event.all_attendee_count
 
         self.assertEqual(self.event.participants, 12)
+
+    def test_participant_counters_follow_status_transitions(self):
+        rsvp = RSVP.objects.create(
+            person=self.person,
+            event=self.event,
+            guests=2,
+            status=RSVP.STATUS_AWAITING_PAYMENT,
+        )
+        self.event.refresh_from_db()
+        self.assertEqual(self.event.participants, 3)
+        self.assertEqual(self.event.participants_confirmes, 0)
+
+        rsvp.status = RSVP.STATUS_CONFIRMED
+        rsvp.save()
+        self.event.refresh_from_db()
+        self.assertEqual(self.event.participants_confirmes, 3)
+
+        rsvp.status = RSVP.STATUS_CANCELED
+        rsvp.save()
+        self.event.refresh_from_db()
+        self.assertEqual(self.event.participants, 0)
+        self.assertEqual(self.event.participants_confirmes, 0)
+
+    def test_loaded_registration_is_not_read_again_on_save(self):
+        RSVP.objects.create(person=self.person, event=self.event, guests=2)
+        rsvp = RSVP.objects.select_related("event").get(pk=self.person.rsvps.get().pk)
+
+        rsvp.guests = 4
+        with CaptureQueriesContext(connection) as context:
+            rsvp.save()
+
+        self.assertFalse(
+            any(
+                'FROM "events_rsvp"' in query["sql"]
+                for query in context.captured_queries
+            )
+        )
+        self.event.refresh_from_db()
+        self.assertEqual(self.event.participants, 5)
+
+    def test_stale_event_does_not_overwrite_counters(self):
+        stale_event = Event.objects.get(pk=self.event.pk)
+        RSVP.objects.create(person=self.person, event=self.event)
+
+        stale_event.name = "Nouveau nom"
+        stale_event.save()
+
+        self.event.refresh_from_db()
+        self.assertEqual(self.event.name, "Nouveau nom")
+        self.assertEqual(self.event.participants, 1)
+
+    def test_identified_guest_without_form_is_counted(self):
+        self.event.allow_guests = True
+        self.event.save()
+        RSVP.objects.create(person=self.person, event=self.event)
+
+        add_free_identified_guest(self.event, self.person, None)
+
+        self.event.refresh_from_db()
+        self.assertEqual(self.event.participants, 2)
+        self.assertEqual(self.event.participants_confirmes, 2)
+
+    def test_reconciliation_repairs_drifted_counters(self):
+        RSVP.objects.create(person=self.person, event=self.event, guests=1)
+        Event.objects.filter(pk=self.event.pk).update(
+            all_attendee_count=0, confirmed_attendee_count=5
+        )
+
+        event = Event.objects.with_participant_counts().get(pk=self.event.pk)
+        self.assertEqual(event.computed_all_attendee_count, 2)
+        self.assertEqual(event.computed_confirmed_attendee_count, 2)
+
+        call_command("recompter_participants", silent=True)
+        self.event.refresh_from_db()
+        self.assertEqual(self.event.participants, 2)
+        self.assertEqual(self.event.participants_confirmes, 2)
@@ -419,6 +419,7 @@ def test_can_view_rsvp(self):
         response = self.client.get(url)
         self.assertEqual(response.status_code, 200)
         self.assertEqual("CO", response.json()["rsvp"])
+        self.simple_event.refresh_from_db()
         self.assertEqual(1, self.simple_event.participants)
 
     def test_cannot_rsvp_if_max_participants_reached(self):
@@ -443,6 +444,7 @@ def test_cannot_rsvp_if_max_participants_reached(self):
         self.assertEqual(msgs[0].level, messages.ERROR)
         self.assertIn("complet.", msgs[0].message)
 
+        self.simple_event.refresh_from_db()
         self.assertEqual(1, self.simple_event.participants)
 
     @mock.patch("agir.events.actions.rsvps.send_guest_confirmation")
@@ -458,6 +460,7 @@ def test_can_add_guest_to_simple_event(self, guest_notification):
         self.assertRedirects(
             response, reverse("view_event", kwargs={"pk": self.simple_event.pk})
         )
+        self.simple_event.refresh_from_db()
         self.assertEqual(2, self.simple_event.participants)
 
         msgs = list(messages.get_messages(response.wsgi_request))
@@ -479,6 +482,7 @@ def test_cannot_add_guest_if_forbidden_for_event(self):
         self.assertRedirects(
             response, reverse("view_event", kwargs={"pk": self.simple_event.pk})
         )
+        self.simple_event.refresh_from_db()
         self.assertEqual(1, self.simple_event.participants)
 
         msgs = list(messages.get_messages(response.wsgi_request))
@@ -499,6 +503,7 @@ def test_cannot_add_guest_for_simple_event_if_max_participants_reached(self):
         self.assertRedirects(
             response, reverse("view_event", kwargs={"pk": self.simple_event.pk})
         )
+        self.simple_event.refresh_from_db()
         self.assertEqual(1, self.simple_event.participants)
 
         msgs = list(messages.get_messages(response.wsgi_request))
@@ -525,6 +530,7 @@ def test_can_rsvp_to_form_event(self, rsvp_notification, mock_partial):
         self.person.refresh_from_db()
         self.assertIn(self.person, self.form_event.confirmed_attendees)
         self.assertEqual(self.person.meta["custom-field"], "another custom value")
+        self.form_event.refresh_from_db()
         self.assertEqual(2, self.form_event.participants)
 
         mock_partial.assert_called_once()
@@ -570,6 +576,7 @@ def test_can_add_guest_to_form_event(self, guest_confirmation):
         msgs = list(messages.get_messages(response.wsgi_request))
         self.assertEqual(msgs[0].level, messages.SUCCESS)
 
+        self.form_event.refresh_from_db()
         self.assertEqual(2, self.form_event.participants)
 
         guest_confirmation.delay.assert_called_once()
@@ -593,6 +600,7 @@ def test_cannot_add_guest_to_form_event_if_forbidden(self):
         msgs = list(messages.get_messages(response.wsgi_request))
         self.assertEqual(msgs[0].level, messages.ERROR)
 
+        self.form_event.refresh_from_db()
         self.assertEqual(1, self.form_event.participants)
 
     @mock.patch("django.db.transaction.on_commit")
@@ -795,6 +803,7 @@ def test_can_add_guest_to_form_paying_event(self, on_commit):
         complete_payment(payment)
         event_notification_listener(payment)
 
+        self.form_paying_event.refresh_from_db()
         self.assertEqual(2, self.form_paying_event.participants)
 
         on_commit.assert_called_once()
@@ -882,6 +891,7 @@ def test_can_rsvp_if_authorized_for_form(self, rsvp_notification, mock_partial):
         self.person.refresh_from_db()
         self.assertIn(self.person, self.form_event.confirmed_attendees)
         self.assertEqual(self.person.meta["custom-field"], "another custom value")
+        self.form_event.refresh_from_db()
         self.assertEqual(2, self.form_event.participants)
 
         mock_partial.assert_called_once()
@@ -946,6 +956,7 @@ def test_not_billed_if_free_pricing_to_zero(self, rsvp_notification, mock_partia
         self.person.refresh_from_db()
         self.assertIn(self.person, self.form_event.confirmed_attendees)
         self.assertEqual(self.person.meta["custom-field"], "another custom value")
+        self.form_event.refresh_from_db()
         self.assertEqual(2, self.form_event.participants)
 
         mock_partial.assert_called_once()
@@ -29,6 +29,7 @@
     is_participant,
     cancel_rsvp,
 )
+from agir.events.actions.suggestions import get_event_suggestions
 from agir.events.models import Event, GroupAttendee, OrganizerConfig, Invitation
 from agir.events.models import RSVP
 from agir.events.serializers import (
@@ -216,52 +217,11 @@ class EventSuggestionsAPIView(EventListAPIView):
     def get_queryset(self):
         person = self.request.user.person
 
-        events = (
-            Event.objects.with_serializer_prefetch(person)
-            .select_related("subtype", "suggestion_segment")
-            .listed()
-            .upcoming()
-        )
-        national = events.national()
-        near = events.none()
-        national_pks = national.values_list("pk", flat=True)
-
-        supportgroups = person.supportgroups.all()
-        from_groups_attendees = (
-            Event.objects.public()
-            .upcoming()
-            .filter(groups_attendees__in=supportgroups)
-            .exclude(pk__in=national_pks)
-            .distinct()
-            .order_by("start_time")
-        )[:10]
-        from_groups_attendees_pks = from_groups_attendees.values_list("pk", flat=True)
-
-        if person.coordinates is not None:
-            national = national.near(coordinates=person.coordinates, radius=100)
-            near = (
-                events.exclude(pk__in=national_pks)
-                .exclude(pk__in=from_groups_attendees_pks)
-                .filter(start_time__lt=timezone.now() + timedelta(days=30))
-                .near(coordinates=person.coordinates, radius=person.action_radius)
-                .order_by("distance")
-            )[: (10 - len(from_groups_attendees_pks))]
-
-        near_pks = near.values_list("pk", flat=True)
-
-        national = national[:10]
-
-        segmented = (
-            events.exclude(pk__in=national_pks)
-            .exclude(pk__in=near_pks)
-            .exclude(pk__in=from_groups_attendees_pks)
-            .exclude(pk__in=events.grand().values_list("pk", flat=True))
-            .for_segment_subscriber(person)
-        )
-
-        return sorted(
-            list(segmented) + list(national) + list(from_groups_attendees) + list(near),
-            key=lambda event: event.start_time,
+        return get_event_suggestions(
+            person,
+            Event.objects.with_serializer_prefetch(person).select_related(
+                "subtype", "suggestion_segment"
+            ),
         )
 
 
@@ -42,7 +42,6 @@
     ChangeLocationBaseView,
     FilterView,
 )
-from agir.lib.tasks import create_static_map_image_from_coordinates
 from ..filters import EventFilter
 from ..forms import (
     EventGeocodingForm,
@@ -54,7 +53,7 @@
     send_event_report,
 )
 from ...api import settings
-from ...carte.models import StaticMapImage
+from ...carte.static_maps import find_static_map_image, request_static_map_image
 
 __all__ = [
     "ManageEventView",
@@ -107,17 +106,10 @@ def get_illustration(self):
         if self.event.coordinates is None:
             return self.get_image_from_file("Frame-193.png")
 
-        static_map_image = StaticMapImage.objects.filter(
-            center__dwithin=(
-                self.event.coordinates,
-                StaticMapImage.UNIQUE_CENTER_MAX_DISTANCE,
-            ),
-        ).first()
+        static_map_image = find_static_map_image(self.event.coordinates)
 
         if static_map_image is None:
-            create_static_map_image_from_coordinates.delay(
-                [self.event.coordinates[0], self.event.coordinates[1]]
-            )
+            request_static_map_image(self.event.coordinates)
             return self.get_image_from_file("Frame-193.png")
 
         static_map_image.image.open()
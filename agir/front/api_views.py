@@ -2,9 +2,12 @@
     ListAPIView,
 )
 from rest_framework.response import Response
+from rest_framework.views import APIView
 
 from agir.events.models import Event
 from agir.events.serializers import EventListSerializer
+from agir.front.autocomplete import autocomplete
+from agir.front.models import SearchSuggestion
 from agir.groups.models import SupportGroup
 from agir.groups.serializers import SupportGroupSearchResultSerializer
 from agir.groups.utils.supportgroup import is_active_group_filter
@@ -170,3 +173,33 @@ def list(self, request, *args, **kwargs):
             )
 
         return Response(results)
+
+
+class AutocompleteSupportGroupsAndEventsAPIView(APIView):
+    """Suggestions légères de groupes et d'événements pendant la saisie"""
+
+    permission_classes = (IsActionPopulaireClientPermission,)
+
+    RESULT_TYPES = {
+        SearchSupportGroupsAndEventsAPIView.RESULT_TYPE_GROUPS: SearchSuggestion.KIND_GROUP,
+        SearchSupportGroupsAndEventsAPIView.RESULT_TYPE_EVENTS: SearchSuggestion.KIND_EVENT,
+    }
+
+    def get(self, request, *args, **kwargs):
+        query = request.GET.get("q", "")[:100]
+        query_type = request.GET.get("type")
+        kind = self.RESULT_TYPES.get(query_type)
+
+        suggestions = autocomplete(query, kind=kind)
+
+        return Response(
+            {
+                "query": query,
+                "type": query_type if kind else None,
+                **{
+                    result_type: suggestions[result_kind]
+                    for result_type, result_kind in self.RESULT_TYPES.items()
+                    if result_kind in suggestions
+                },
+            }
+        )
@@ -0,0 +1,9 @@
+from django.apps import AppConfig
+
+
+class FrontConfig(AppConfig):
+    name = "agir.front"
+
+    def ready(self):
+        # noinspection PyUnresolvedReferences
+        from . import signals
@@ -0,0 +1,265 @@
+"""Autocomplétion de la recherche d'événements et de groupes
+
+Les suggestions sont cherchées dans la table de projection `SearchSuggestion`, par
+similarité de trigrammes (extension `pg_trgm`) entre la saisie et les mots du nom, de la
+ville et du code postal, ce qui tolère les fautes de frappe. Les résultats d'une même saisie
+sont gardés quelques instants en cache, les débuts de saisie étant très fréquents.
+
+L'activité d'un groupe dépend de la date du jour : la table enregistre donc la date jusqu'à
+laquelle le groupe reste actif (`active_until`), comparée à l'heure courante lors de la
+recherche, plutôt qu'un booléen qui deviendrait faux sans qu'aucun objet ne soit modifié.
+"""
+import hashlib
+import unicodedata
+from datetime import timedelta
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import (
+    BooleanField,
+    DateTimeField,
+    ExpressionWrapper,
+    F,
+    FloatField,
+    Func,
+    Max,
+    Q,
+    Value,
+)
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+from agir.events.models import Event
+from agir.front.models import SearchSuggestion
+from agir.groups.models import SupportGroup
+from agir.groups.utils.supportgroup import (
+    DAYS_SINCE_GROUP_CREATION_LIMIT,
+    DAYS_SINCE_LAST_EVENT_LIMIT,
+)
+from agir.lib.utils import grouper
+
+AUTOCOMPLETE_MIN_LENGTH = 2
+AUTOCOMPLETE_LIMIT = 5
+AUTOCOMPLETE_CACHE_TIMEOUT = 60
+REBUILD_BATCH_SIZE = 2000
+
+
+class TrigramWordSimilar(Func):
+    """Vrai si le premier texte ressemble à une partie du second (opérateur `<%`)"""
+
+    arg_joiner = " <%% "
+    template = "%(expressions)s"
+    output_field = BooleanField()
+
+
+class TrigramWordSimilarity(Func):
+    function = "word_similarity"
+    output_field = FloatField()
+
+
+def normalize_search_text(*parts):
+    text = " ".join(str(part) for part in parts if part)
+    text = unicodedata.normalize("NFKD", text)
+    return " ".join(
+        "".join(c for c in text if not unicodedata.combining(c)).lower().split()
+    )
+
+
+def _event_suggestion(event):
+    return SearchSuggestion(
+        kind=SearchSuggestion.KIND_EVENT,
+        object_id=event["id"],
+        name=event["name"],
+        city=event["location_city"],
+        zip=event["location_zip"],
+        country=event["location_country"] or "",
+        start_time=event["start_time"],
+        search_text=normalize_search_text(
+            event["name"], event["location_city"], event["location_zip"]
+        ),
+    )
+
+
+def _group_suggestion(group):
+    return SearchSuggestion(
+        kind=SearchSuggestion.KIND_GROUP,
+        object_id=group["id"],
+        name=group["name"],
+        city=group["location_city"],
+        zip=group["location_zip"],
+        country=group["location_country"] or "",
+        active_until=group["active_until"],
+        is_certified=group["certification_date"] is not None,
+        search_text=normalize_search_text(
+            group["name"], group["location_city"], group["location_zip"]
+        ),
+    )
+
+
+EVENT_FIELDS = (
+    "id",
+    "name",
+    "location_city",
+    "location_zip",
+    "location_country",
+    "start_time",
+)
+GROUP_FIELDS = (
+    "id",
+    "name",
+    "location_city",
+    "location_zip",
+    "location_country",
+    "certification_date",
+    "active_until",
+)
+
+
+def get_suggested_events():
+    return Event.objects.listed().values(*EVENT_FIELDS)
+
+
+def get_suggested_groups():
+    # même définition que `is_active_group_filter`, exprimée comme une date limite
+    return (
+        SupportGroup.objects.active()
+        .annotate(
+            active_until=ExpressionWrapper(
+                Greatest(
+                    F("created") + timedelta(days=DAYS_SINCE_GROUP_CREATION_LIMIT),
+                    Max(
+                        "organized_events__start_time",
+                        filter=Q(organized_events__visibility=Event.VISIBILITY_PUBLIC),
+                    )
+                    + timedelta(days=DAYS_SINCE_LAST_EVENT_LIMIT),
+                ),
+                output_field=DateTimeField(),
+            )
+        )
+        .values(*GROUP_FIELDS)
+    )
+
+
+def update_event_suggestion(event_pk):
+    event = get_suggested_events().filter(pk=event_pk).first()
+    _update_suggestion(SearchSuggestion.KIND_EVENT, event_pk, event, _event_suggestion)
+
+
+def update_group_suggestion(group_pk):
+    group = get_suggested_groups().filter(pk=group_pk).first()
+    _update_suggestion(SearchSuggestion.KIND_GROUP, group_pk, group, _group_suggestion)
+
+
+def update_organizer_group_suggestions(event_pk):
+    for group_pk in SupportGroup.objects.filter(
+        organized_events__pk=event_pk
+    ).values_list("pk", flat=True):
+        update_group_suggestion(group_pk)
+
+
+def _update_suggestion(kind, object_id, values, make_suggestion):
+    if values is None:
+        delete_suggestion(kind, object_id)
+        return
+
+    suggestion = make_suggestion(values)
+    SearchSuggestion.objects.update_or_create(
+        kind=kind,
+        object_id=object_id,
+        defaults={
+            field.attname: getattr(suggestion, field.attname)
+            for field in SearchSuggestion._meta.concrete_fields
+            if field.attname not in ("id", "kind", "object_id")
+        },
+    )
+
+
+def delete_suggestion(kind, object_id):
+    SearchSuggestion.objects.filter(kind=kind, object_id=object_id).delete()
+
+
+def rebuild_search_suggestions():
+    """Reconstruit entièrement la table des suggestions, par lots"""
+    with transaction.atomic():
+        SearchSuggestion.objects.all().delete()
+        count = 0
+        for queryset, make_suggestion in (
+            (get_suggested_events(), _event_suggestion),
+            (get_suggested_groups(), _group_suggestion),
+        ):
+            for batch in grouper(
+                queryset.iterator(chunk_size=REBUILD_BATCH_SIZE), REBUILD_BATCH_SIZE
+            ):
+                suggestions = [make_suggestion(values) for values in batch]
+                SearchSuggestion.objects.bulk_create(suggestions)
+                count += len(suggestions)
+
+    return count
+
+
+def _cache_key(query, kind, limit):
+    digest = hashlib.md5(f"{kind}:{limit}:{query}".encode()).hexdigest()
+    return f"search_autocomplete_{digest}"
+
+
+def serialize_suggestion(suggestion):
+    result = {
+        "id": str(suggestion.object_id),
+        "name": suggestion.name,
+        "city": suggestion.city,
+        "zip": suggestion.zip,
+    }
+    if suggestion.kind == SearchSuggestion.KIND_EVENT:
+        result["startTime"] = (
+            suggestion.start_time.isoformat() if suggestion.start_time else None
+        )
+    else:
+        result["isActive"] = (
+            suggestion.active_until is not None
+            and suggestion.active_until >= timezone.now()
+        )
+        result["isCertified"] = suggestion.is_certified
+    return result
+
+
+def autocomplete(query, kind=None, limit=AUTOCOMPLETE_LIMIT):
+    """Renvoie les suggestions de groupes et d'événements pour une saisie
+
+    :param kind: `SearchSuggestion.KIND_EVENT` ou `SearchSuggestion.KIND_GROUP` pour ne
+        chercher qu'un type d'objets
+    :return: un dictionnaire avec une liste de suggestions par type d'objets
+    """
+    query = normalize_search_text(query)
+    kinds = (
+        [kind] if kind else [SearchSuggestion.KIND_GROUP, SearchSuggestion.KIND_EVENT]
+    )
+    results = {k: [] for k in kinds}
+
+    if len(query) < AUTOCOMPLETE_MIN_LENGTH:
+        return results
+
+    cache_key = _cache_key(query, kind, limit)
+    cached = cache.get(cache_key)
+    if cached is not None:
+        return cached
+
+    similar = SearchSuggestion.objects.filter(
+        TrigramWordSimilar(Value(query), F("search_text"))
+    ).annotate(similarity=TrigramWordSimilarity(Value(query), F("search_text")))
+
+    for k in kinds:
+        suggestions = similar.filter(kind=k)
+        if k == SearchSuggestion.KIND_GROUP:
+            suggestions = suggestions.annotate(
+                is_active=ExpressionWrapper(
+                    Q(active_until__gte=timezone.now()), output_field=BooleanField()
+                )
+            ).order_by("-similarity", "-is_active", "-is_certified", "name")
+        else:
+            suggestions = suggestions.order_by(
+                "-similarity", F("start_time").desc(nulls_last=True)
+            )
+        results[k] = [serialize_suggestion(s) for s in suggestions[:limit]]
+
+    cache.set(cache_key, results, timeout=AUTOCOMPLETE_CACHE_TIMEOUT)
+    return results
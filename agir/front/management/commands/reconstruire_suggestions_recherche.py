@@ -0,0 +1,16 @@
+from agir.front.autocomplete import rebuild_search_suggestions
+from agir.lib.commands import BaseCommand
+
+
+class Command(BaseCommand):
+    help = (
+        "Reconstruit la table des suggestions de recherche (activité des groupes, "
+        "événements et groupes modifiés sans passer par l'ORM)"
+    )
+
+    def handle(self, *args, **options):
+        if self.dry_run:
+            return
+
+        count = rebuild_search_suggestions()
+        self.success(f"{count} suggestions de recherche enregistrées")
@@ -0,0 +1,89 @@
+# Generated by Django 3.2.19 on 2023-07-11 09:30
+
+import django.contrib.postgres.indexes
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    initial = True
+
+    dependencies = []
+
+    operations = [
+        migrations.RunSQL(
+            sql="CREATE EXTENSION IF NOT EXISTS pg_trgm;",
+            reverse_sql=migrations.RunSQL.noop,
+        ),
+        migrations.CreateModel(
+            name="SearchSuggestion",
+            fields=[
+                (
+                    "id",
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "kind",
+                    models.CharField(
+                        choices=[("event", "Événement"), ("group", "Groupe")],
+                        max_length=5,
+                        verbose_name="type",
+                    ),
+                ),
+                (
+                    "object_id",
+                    models.UUIDField(verbose_name="identifiant de l'objet"),
+                ),
+                ("name", models.CharField(max_length=255, verbose_name="nom")),
+                (
+                    "city",
+                    models.CharField(blank=True, max_length=100, verbose_name="ville"),
+                ),
+                (
+                    "zip",
+                    models.CharField(
+                        blank=True, max_length=20, verbose_name="code postal"
+                    ),
+                ),
+                (
+                    "country",
+                    models.CharField(blank=True, max_length=2, verbose_name="pays"),
+                ),
+                (
+                    "start_time",
+                    models.DateTimeField(null=True, verbose_name="date de début"),
+                ),
+                (
+                    "active_until",
+                    models.DateTimeField(null=True, verbose_name="actif jusqu'au"),
+                ),
+                (
+                    "is_certified",
+                    models.BooleanField(default=False, verbose_name="certifié"),
+                ),
+                ("search_text", models.TextField(verbose_name="texte de recherche")),
+            ],
+            options={
+                "verbose_name": "suggestion de recherche",
+                "verbose_name_plural": "suggestions de recherche",
+            },
+        ),
+        migrations.AddConstraint(
+            model_name="searchsuggestion",
+            constraint=models.UniqueConstraint(
+                fields=("kind", "object_id"), name="unique_search_suggestion"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="searchsuggestion",
+            index=django.contrib.postgres.indexes.GinIndex(
+                fields=["search_text"],
+                name="search_suggestion_trgm_index",
+                opclasses=["gin_trgm_ops"],
+            ),
+        ),
+    ]
@@ -0,0 +1,50 @@
+from django.contrib.postgres.indexes import GinIndex
+from django.db import models
+
+__all__ = ["SearchSuggestion"]
+
+
+class SearchSuggestion(models.Model):
+    """Projection minimale des événements et des groupes pour l'autocomplétion
+
+    Cette table est remplie par la commande `reconstruire_suggestions_recherche`, à lancer
+    après son déploiement, puis maintenue à jour par les signaux de `agir.front.signals`.
+    """
+
+    KIND_EVENT = "event"
+    KIND_GROUP = "group"
+    KIND_CHOICES = ((KIND_EVENT, "Événement"), (KIND_GROUP, "Groupe"))
+
+    kind = models.CharField("type", max_length=5, choices=KIND_CHOICES)
+    object_id = models.UUIDField("identifiant de l'objet")
+
+    name = models.CharField("nom", max_length=255)
+    city = models.CharField("ville", max_length=100, blank=True)
+    zip = models.CharField("code postal", max_length=20, blank=True)
+    country = models.CharField("pays", max_length=2, blank=True)
+    start_time = models.DateTimeField("date de début", null=True)
+    # date jusqu'à laquelle un groupe est considéré comme actif
+    active_until = models.DateTimeField("actif jusqu'au", null=True)
+    is_certified = models.BooleanField("certifié", default=False)
+
+    # nom, ville et code postal, en minuscules et sans accents
+    search_text = models.TextField("texte de recherche")
+
+    class Meta:
+        verbose_name = "suggestion de recherche"
+        verbose_name_plural = "suggestions de recherche"
+        constraints = (
+            models.UniqueConstraint(
+                fields=["kind", "object_id"], name="unique_search_suggestion"
+            ),
+        )
+        indexes = (
+            GinIndex(
+                fields=["search_text"],
+                name="search_suggestion_trgm_index",
+                opclasses=["gin_trgm_ops"],
+            ),
+        )
+
+    def __str__(self):
+        return f"{self.get_kind_display()} — {self.name}"
@@ -0,0 +1,57 @@
+from functools import partial
+
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from agir.events.models import Event, OrganizerConfig
+from agir.front.autocomplete import (
+    update_event_suggestion,
+    update_group_suggestion,
+    update_organizer_group_suggestions,
+    delete_suggestion,
+)
+from agir.front.models import SearchSuggestion
+from agir.groups.models import SupportGroup
+
+
+@receiver(post_save, sender=Event, dispatch_uid="front_update_event_suggestion")
+def update_event_search_suggestion(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    transaction.on_commit(partial(update_event_suggestion, instance.pk))
+    # la date et la visibilité de l'événement comptent dans l'activité de ses groupes
+    transaction.on_commit(partial(update_organizer_group_suggestions, instance.pk))
+
+
+@receiver(post_save, sender=SupportGroup, dispatch_uid="front_update_group_suggestion")
+def update_group_search_suggestion(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    transaction.on_commit(partial(update_group_suggestion, instance.pk))
+
+
+@receiver(post_delete, sender=Event, dispatch_uid="front_delete_event_suggestion")
+def delete_event_search_suggestion(sender, instance, **kwargs):
+    delete_suggestion(SearchSuggestion.KIND_EVENT, instance.pk)
+
+
+@receiver(
+    post_delete, sender=SupportGroup, dispatch_uid="front_delete_group_suggestion"
+)
+def delete_group_search_suggestion(sender, instance, **kwargs):
+    delete_suggestion(SearchSuggestion.KIND_GROUP, instance.pk)
+
+
+@receiver(
+    post_save, sender=OrganizerConfig, dispatch_uid="front_update_organizer_suggestion"
+)
+@receiver(
+    post_delete,
+    sender=OrganizerConfig,
+    dispatch_uid="front_delete_organizer_suggestion",
+)
+def update_organizer_group_search_suggestion(sender, instance, raw=False, **kwargs):
+    if raw or instance.as_group_id is None:
+        return
+    transaction.on_commit(partial(update_group_suggestion, instance.as_group_id))
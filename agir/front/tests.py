@@ -1,6 +1,8 @@
 from datetime import timedelta
 from unittest import mock
 
+from django.core.cache import cache
+from django.core.management import call_command
 from django.shortcuts import reverse
 from django.test import TestCase
 from django.utils import timezone
@@ -8,6 +10,7 @@
 from rest_framework.test import APITestCase
 
 from ..events.models import Event, OrganizerConfig, EventSubtype
+from ..front.models import SearchSuggestion
 from ..groups.models import SupportGroup, Membership
 from ..people.models import Person, PersonTag
 from ..polls.models import Poll, PollOption, PollChoice
@@ -214,3 +217,76 @@ def test_cannot_post_if_not_verified(self):
             },
         )
         self.assertEqual(res.status_code, 403)
+
+
+class AutocompleteAPITestCase(APITestCase):
+    def setUp(self):
+        now = timezone.now()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.group = SupportGroup.objects.create(
+                name="Groupe d'action de Montreuil", location_city="Montreuil"
+            )
+            self.event = Event.objects.create(
+                name="Réunion publique",
+                location_city="Montreuil",
+                start_time=now + timedelta(days=1),
+                end_time=now + timedelta(days=1, hours=2),
+            )
+
+    def test_suggestions_tolerate_typos_and_accents(self):
+        response = self.client.get(
+            reverse("api_search_autocomplete"), data={"q": "montreil"}
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [g["id"] for g in response.data["groups"]], [str(self.group.pk)]
+        )
+        self.assertEqual(
+            [e["id"] for e in response.data["events"]], [str(self.event.pk)]
+        )
+
+        response = self.client.get(
+            reverse("api_search_autocomplete"), data={"q": "reunion", "type": "events"}
+        )
+        self.assertNotIn("groups", response.data)
+        self.assertEqual(response.data["events"][0]["name"], "Réunion publique")
+
+    def test_deleted_objects_are_not_suggested(self):
+        self.group.delete()
+        response = self.client.get(
+            reverse("api_search_autocomplete"), data={"q": "montreuil groupe"}
+        )
+        self.assertEqual(response.data["groups"], [])
+
+    def test_group_activity_follows_organized_events(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.group.created = timezone.now() - timedelta(days=365)
+            self.group.save()
+
+        response = self.client.get(
+            reverse("api_search_autocomplete"), data={"q": "montreuil groupe"}
+        )
+        self.assertFalse(response.data["groups"][0]["isActive"])
+
+        cache.clear()
+        with self.captureOnCommitCallbacks(execute=True):
+            OrganizerConfig.objects.create(
+                event=self.event,
+                person=Person.objects.create_insoumise("organisateur@agir.test"),
+                as_group=self.group,
+            )
+
+        response = self.client.get(
+            reverse("api_search_autocomplete"), data={"q": "montreuil groupe"}
+        )
+        self.assertTrue(response.data["groups"][0]["isActive"])
+
+    def test_command_populates_empty_table(self):
+        SearchSuggestion.objects.all().delete()
+
+        call_command("reconstruire_suggestions_recherche", silent=True)
+
+        self.assertCountEqual(
+            SearchSuggestion.objects.values_list("object_id", flat=True),
+            [self.group.pk, self.event.pk],
+        )
@@ -326,6 +326,11 @@
         api_views.SearchSupportGroupsAndEventsAPIView.as_view(),
         name="api_search_supportgroup_and_events",
     ),
+    path(
+        "api/recherche/suggestions/",
+        api_views.AutocompleteSupportGroupsAndEventsAPIView.as_view(),
+        name="api_search_autocomplete",
+    ),
     path("mes-groupes/", views.UserSupportGroupsView.as_view(), name="list_my_groups"),
     path(
         "activite/",
@@ -1,6 +1,14 @@
 import reversion
+from django.contrib.contenttypes.models import ContentType
+from django.db import connection, transaction
+from django.db.models import IntegerField, OuterRef, Q, Subquery, Value
 
-from agir.gestion.models import Document, Reglement, VersionDocument
+from agir.gestion.models import (
+    Document,
+    InstanceCherchable,
+    Reglement,
+    VersionDocument,
+)
 
 
 def merge_document(d1: Document, d2: Document):
@@ -33,3 +41,81 @@ def merge_document(d1: Document, d2: Document):
         VersionDocument.objects.filter(document=d2).update(document=d1)
 
         d2.delete()
+
+
+def _inserer_dans_index(model, queryset):
+    """Insère dans l'index les instances du queryset par une seule requête INSERT … SELECT"""
+    content_type = ContentType.objects.get_for_model(model)
+    expressions = InstanceCherchable.expressions_index(model)
+
+    # les annotations sont sélectionnées après la clé primaire, dans l'ordre de leur définition
+    select = (
+        queryset.order_by()
+        .annotate(
+            index_content_type=Value(content_type.pk, output_field=IntegerField()),
+            **{
+                f"index_{field}": expression
+                for field, expression in expressions.items()
+            },
+        )
+        .values_list("pk", "index_content_type", *(f"index_{f}" for f in expressions))
+    )
+    sql, params = select.query.sql_with_params()
+
+    quote_name = connection.ops.quote_name
+    columns = ", ".join(
+        quote_name(InstanceCherchable._meta.get_field(field).column)
+        for field in ("object_id", "content_type", *expressions)
+    )
+
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"INSERT INTO {quote_name(InstanceCherchable._meta.db_table)} ({columns}) {sql}",
+            params,
+        )
+        return cursor.rowcount
+
+
+def reconstruire_index(model):
+    """Reconstruit entièrement l'index de recherche d'un modèle
+
+    La suppression et la réinsertion ont lieu dans une même transaction : jusqu'à sa
+    validation, les recherches continuent d'utiliser l'ancien index.
+    """
+    with transaction.atomic():
+        InstanceCherchable.objects.filter(
+            content_type=ContentType.objects.get_for_model(model)
+        ).delete()
+        return _inserer_dans_index(model, model.objects.all())
+
+
+def mettre_a_jour_index(model):
+    """Met à jour l'index de recherche d'un modèle pour les seules instances modifiées
+
+    :return: le nombre d'entrées supprimées, mises à jour et créées
+    """
+    index = InstanceCherchable.objects.filter(
+        content_type=ContentType.objects.get_for_model(model)
+    )
+    source = model.objects.filter(pk=OuterRef("object_id"))
+
+    with transaction.atomic():
+        supprimees, _ = index.exclude(object_id__in=model.objects.values("pk")).delete()
+
+        mises_a_jour = index.filter(
+            Q(modification_source__isnull=True)
+            | Q(modification_source__lt=Subquery(source.values("modified")))
+        ).update(
+            **{
+                field: Subquery(source.values(v=expression))
+                for field, expression in InstanceCherchable.expressions_index(
+                    model
+                ).items()
+            }
+        )
+
+        creees = _inserer_dans_index(
+            model, model.objects.exclude(pk__in=index.values("object_id"))
+        )
+
+    return supprimees, mises_a_jour, creees
@@ -1,28 +1,33 @@
-from django.contrib.admin.options import get_content_type_for_model
-from django.core.management import BaseCommand
-
-from agir.gestion.models import InstanceCherchable
+from agir.gestion.actions import mettre_a_jour_index, reconstruire_index
 from agir.gestion.models.common import SearchableModel
+from agir.lib.commands import BaseCommand
 
 
 class Command(BaseCommand):
-    def handle(self, *args, **options):
-        InstanceCherchable.objects.all().delete()
+    help = "Reconstruit l'index de recherche de l'application de gestion"
+
+    def add_arguments(self, parser):
+        super().add_arguments(parser)
+        parser.add_argument(
+            "-i",
+            "--incremental",
+            action="store_true",
+            default=False,
+            help="Ne met à jour que les instances modifiées depuis leur indexation",
+        )
 
-        for model in SearchableModel.__subclasses__():
-            ct = get_content_type_for_model(model)
-            search_vector = model.search_vector()
-            base_sv_qs = model.objects.values(v=search_vector)
-            base_num_qs = model.objects.values("numero")
+    def handle(self, *args, incremental=False, **options):
+        for model in SearchableModel.modeles_cherchables():
+            nom = model._meta.verbose_name_plural
 
-            all_pks = model.objects.values_list("pk", flat=True)
+            if self.dry_run:
+                self.info(f"{nom} : {model.objects.count()} instances à indexer")
+                continue
 
-            InstanceCherchable.objects.bulk_create(
-                InstanceCherchable(
-                    content_type=ct,
-                    object_id=pk,
-                    recherche=base_sv_qs.filter(pk=pk),
-                    numero=base_num_qs.filter(pk=pk),
+            if incremental:
+                supprimees, mises_a_jour, creees = mettre_a_jour_index(model)
+                self.success(
+                    f"{nom} : {creees} entrées créées, {mises_a_jour} mises à jour, {supprimees} supprimées"
                 )
-                for pk in all_pks
-            )
+            else:
+                self.success(f"{nom} : {reconstruire_index(model)} entrées créées")
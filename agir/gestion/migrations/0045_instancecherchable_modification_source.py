@@ -0,0 +1,42 @@
+import agir.lib.utils
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("contenttypes", "0002_remove_content_type_name"),
+        ("gestion", "0044_fournisseur_location_departement_id"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="instancecherchable",
+            name="numero",
+            field=models.CharField(
+                blank=True,
+                default=agir.lib.utils.numero_unique,
+                editable=False,
+                help_text="Numéro unique pour identifier chaque objet sur la plateforme.",
+                max_length=7,
+                null=True,
+                unique=True,
+                verbose_name="Numéro unique",
+            ),
+        ),
+        migrations.AddField(
+            model_name="instancecherchable",
+            name="modification_source",
+            field=models.DateTimeField(
+                editable=False,
+                null=True,
+                verbose_name="Dernière modification de l'instance indexée",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="instancecherchable",
+            index=models.Index(
+                fields=["content_type", "object_id"],
+                name="gestion_cherchable_objet",
+            ),
+        ),
+    ]
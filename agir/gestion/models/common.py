@@ -3,7 +3,6 @@
 
 import reversion
 from agir.lib.model_fields import IBANField, BICField
-from django.contrib.admin.options import get_content_type_for_model
 from django.contrib.contenttypes.fields import GenericForeignKey
 from django.contrib.contenttypes.models import ContentType
 from django.contrib.postgres.fields import ArrayField
@@ -63,6 +62,18 @@ def search_vector(cls):
             ),
         )
 
+    @classmethod
+    def modeles_cherchables(cls, proxies=False):
+        """Renvoie tous les modèles concrets qui héritent de ce modèle
+
+        Les modèles proxy partagent la table (et donc l'index) de leur modèle concret : ils
+        ne sont renvoyés que si `proxies` est vrai.
+        """
+        for subclass in cls.__subclasses__():
+            if not subclass._meta.abstract and (proxies or not subclass._meta.proxy):
+                yield subclass
+            yield from subclass.modeles_cherchables(proxies=proxies)
+
     class Meta:
         abstract = True
 
@@ -222,6 +233,7 @@ class InstanceCherchable(models.Model):
         max_length=7,
         editable=False,
         blank=True,
+        null=True,
         default=numero_unique,
         unique=True,
         help_text="Numéro unique pour identifier chaque objet sur la plateforme.",
@@ -230,18 +242,41 @@ class InstanceCherchable(models.Model):
     content_type = models.ForeignKey(ContentType, on_delete=models.CASCADE)
     object_id = models.PositiveIntegerField()
     instance = GenericForeignKey()
+    modification_source = models.DateTimeField(
+        verbose_name="Dernière modification de l'instance indexée",
+        null=True,
+        editable=False,
+    )
+
+    @classmethod
+    def expressions_index(cls, model):
+        """Renvoie les expressions permettant de calculer les champs de l'index d'un modèle"""
+        if issubclass(model, ModeleGestionMixin):
+            numero = models.F("numero")
+        else:
+            # seuls les modèles de gestion ont un numéro unique
+            numero = models.Value(None, output_field=models.CharField())
+
+        return {
+            "numero": numero,
+            "recherche": model.search_vector(),
+            "modification_source": models.F("modified"),
+        }
 
     @classmethod
     def mettre_a_jour(cls, instance):
-        model = instance._meta.model
-        content_type = get_content_type_for_model(instance)
+        # une instance d'un modèle proxy est indexée sous son modèle concret
+        model = instance._meta.concrete_model
+        content_type = ContentType.objects.get_for_model(model)
         instance_qs = model.objects.filter(pk=instance.pk)
 
         InstanceCherchable.objects.update_or_create(
-            numero=instance_qs.values("numero"),
             content_type=content_type,
             object_id=instance.pk,
-            defaults={"recherche": instance_qs.values(v=model.search_vector())},
+            defaults={
+                field: instance_qs.values(v=expression)
+                for field, expression in cls.expressions_index(model).items()
+            },
         )
 
     def lien_admin(self):
@@ -252,4 +287,10 @@ def lien_admin(self):
     class Meta:
         verbose_name = "Recherche"
         verbose_name_plural = "Recherche"
-        indexes = (GinIndex(fields=("recherche",)),)
+        indexes = (
+            GinIndex(fields=("recherche",)),
+            models.Index(
+                fields=("content_type", "object_id"),
+                name="gestion_cherchable_objet",
+            ),
+        )
@@ -1,5 +1,5 @@
-from django.contrib.admin.options import get_content_type_for_model
-from django.db.models.signals import pre_delete, post_save
+from django.contrib.contenttypes.models import ContentType
+from django.db.models.signals import post_delete, post_save
 
 from agir.gestion.models.common import InstanceCherchable, SearchableModel
 
@@ -8,19 +8,16 @@ def creer_ou_mettre_a_jour_recherche(sender, instance, raw, **kwargs):
     if raw:
         return
 
-    content_type = get_content_type_for_model(instance)
-    search_vector_def = instance.search_vector()
+    InstanceCherchable.mettre_a_jour(instance)
 
-    InstanceCherchable.objects.update_or_create(
-        content_type=content_type,
-        object_id=instance.pk,
-        defaults={
-            "recherche": sender.objects.values(v=search_vector_def).filter(
-                pk=instance.pk
-            )
-        },
-    )
 
+def supprimer_recherche(sender, instance, **kwargs):
+    InstanceCherchable.objects.filter(
+        content_type=ContentType.objects.get_for_model(instance), object_id=instance.pk
+    ).delete()
 
-for klass in SearchableModel.__subclasses__():
+
+# les modèles proxy envoient leurs propres signaux, avec leur classe comme `sender`
+for klass in SearchableModel.modeles_cherchables(proxies=True):
     post_save.connect(creer_ou_mettre_a_jour_recherche, sender=klass)
+    post_delete.connect(supprimer_recherche, sender=klass)
@@ -0,0 +1,81 @@
+from django.contrib.admin.options import get_content_type_for_model
+from django.contrib.postgres.search import SearchQuery
+from django.test import TestCase
+
+from agir.gestion.actions import mettre_a_jour_index, reconstruire_index
+from agir.gestion.models import InstanceCherchable, Projet, ProjetMilitant
+from agir.gestion.typologies import TypeProjet
+
+
+class IndexRechercheTestCase(TestCase):
+    def setUp(self):
+        self.projets = [
+            Projet.objects.create(
+                titre=titre,
+                type=TypeProjet.values[0],
+                origine=Projet.Origin.values[0],
+                etat=Projet.Etat.values[0],
+            )
+            for titre in ("Meeting à Lille", "Caravane d'été")
+        ]
+        self.index = InstanceCherchable.objects.filter(
+            content_type=get_content_type_for_model(Projet)
+        )
+
+    def rechercher(self, terme):
+        return set(
+            self.index.filter(
+                recherche=SearchQuery(terme, config="french_unaccented")
+            ).values_list("object_id", flat=True)
+        )
+
+    def test_reconstruction_complete(self):
+        self.index.delete()
+
+        self.assertEqual(reconstruire_index(Projet), 2)
+        self.assertEqual(self.rechercher("meeting"), {self.projets[0].pk})
+        self.assertEqual(
+            set(self.index.values_list("numero", flat=True)),
+            {p.numero for p in self.projets},
+        )
+
+    def test_mise_a_jour_incrementale(self):
+        reconstruire_index(Projet)
+        self.assertEqual(mettre_a_jour_index(Projet), (0, 0, 0))
+
+        # modifications sans signal : entrée manquante ou périmée
+        Projet.objects.filter(pk=self.projets[0].pk).update(titre="Réunion publique")
+        self.index.filter(object_id=self.projets[0].pk).delete()
+        self.projets[1].delete()
+        nouveau = Projet.objects.create(
+            titre="Meeting à Lyon",
+            type=TypeProjet.values[0],
+            origine=Projet.Origin.values[0],
+            etat=Projet.Etat.values[0],
+        )
+        self.index.filter(object_id=nouveau.pk).update(modification_source=None)
+
+        self.assertEqual(mettre_a_jour_index(Projet), (0, 1, 1))
+        self.assertEqual(self.rechercher("reunion"), {self.projets[0].pk})
+        self.assertEqual(self.rechercher("meeting"), {nouveau.pk})
+
+    def test_projets_militants_indexes_une_seule_fois(self):
+        militant = Projet.objects.create(
+            titre="Porte-à-porte",
+            type=TypeProjet.values[0],
+            origine=Projet.Origin.UTILISATEUR,
+            etat=Projet.Etat.values[0],
+        )
+        proxy = ProjetMilitant.objects.get(pk=militant.pk)
+        proxy.titre = "Porte-à-porte à Nantes"
+        proxy.save()
+
+        self.assertEqual(
+            InstanceCherchable.objects.filter(numero=militant.numero).count(), 1
+        )
+        self.assertEqual(self.rechercher("nantes"), {militant.pk})
+
+        self.assertEqual(reconstruire_index(Projet), 3)
+        self.assertEqual(
+            InstanceCherchable.objects.filter(object_id=militant.pk).count(), 1
+        )
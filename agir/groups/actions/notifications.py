@@ -11,8 +11,8 @@
     send_message_notification_email,
     send_comment_notification_email,
 )
+from agir.notifications.actions import get_group_recipient_ids
 from agir.notifications.models import Subscription
-from agir.people.models import Person
 
 
 @transaction.atomic()
@@ -91,28 +91,19 @@ def someone_joined_notification(membership, membership_count=1):
 
 @transaction.atomic()
 def new_message_notifications(message):
-    memberships = message.supportgroup.memberships.filter(
-        membership_type__gte=message.required_membership_type
-    )
-    recipients = Person.objects.filter(
-        id__in=memberships.values_list("person_id", flat=True)
-    )
-
-    Activity.objects.bulk_create(
-        [
-            Activity(
-                individual=message.author,
-                supportgroup=message.supportgroup,
-                type=Activity.TYPE_NEW_MESSAGE,
-                recipient=r,
-                status=Activity.STATUS_UNDISPLAYED,
-                meta={
-                    "message": str(message.pk),
-                },
-            )
-            for r in recipients
-            if r.pk != message.author.pk
-        ],
+    Activity.objects.bulk_fanout(
+        get_group_recipient_ids(
+            message.supportgroup_id,
+            membership_type=message.required_membership_type,
+            exclude=[message.author_id],
+        ),
+        individual=message.author,
+        supportgroup=message.supportgroup,
+        type=Activity.TYPE_NEW_MESSAGE,
+        status=Activity.STATUS_UNDISPLAYED,
+        meta={
+            "message": str(message.pk),
+        },
         send_post_save_signal=True,
     )
 
@@ -0,0 +1,83 @@
+"""Index des adhésions d'une personne, partagé par les vérifications de permissions
+
+Les règles de permission (groupes, événements, messages) ont toutes besoin de connaître le
+type d'adhésion de la personne connectée à un ou plusieurs groupes, et les sérialiseurs les
+vérifient souvent pour chaque objet d'une liste.
+
+Pendant une requête (cf. `agir.groups.middleware.MembershipIndexMiddleware`), toutes les
+adhésions d'une personne sont chargées une seule fois, dans un dictionnaire
+`supportgroup_id -> membership_type`. En dehors d'une requête (tâches, commandes), chaque
+vérification interroge directement la base.
+"""
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from agir.groups.models import Membership
+
+_current_scope = ContextVar("membership_index_scope", default=None)
+
+
+@contextmanager
+def membership_index_scope():
+    """Active l'index des adhésions pour la durée du bloc"""
+    token = _current_scope.set({})
+    try:
+        yield
+    finally:
+        _current_scope.reset(token)
+
+
+def get_membership_index(person_id):
+    """Renvoie le dictionnaire des types d'adhésion de la personne par groupe
+
+    Renvoie `None` si aucun index n'est actif.
+    """
+    scope = _current_scope.get()
+    if scope is None:
+        return None
+
+    if person_id not in scope:
+        scope[person_id] = dict(
+            Membership.objects.filter(person_id=person_id).values_list(
+                "supportgroup_id", "membership_type"
+            )
+        )
+
+    return scope[person_id]
+
+
+def invalidate_membership_index(*person_ids):
+    scope = _current_scope.get()
+    if scope is not None:
+        for person_id in person_ids:
+            scope.pop(person_id, None)
+
+
+def get_membership_type(person_id, supportgroup_id):
+    """Renvoie le type d'adhésion de la personne au groupe, ou `None` si elle n'en est pas membre"""
+    index = get_membership_index(person_id)
+    if index is not None:
+        return index.get(supportgroup_id)
+
+    return (
+        Membership.objects.filter(person_id=person_id, supportgroup_id=supportgroup_id)
+        .values_list("membership_type", flat=True)
+        .first()
+    )
+
+
+def has_membership(person_id, supportgroup_ids, min_membership_type=0):
+    """Indique si la personne a au moins ce type d'adhésion à l'un des groupes"""
+    supportgroup_ids = [pk for pk in supportgroup_ids if pk is not None]
+    if person_id is None or not supportgroup_ids:
+        return False
+
+    index = get_membership_index(person_id)
+    if index is not None:
+        return any(index.get(pk, -1) >= min_membership_type for pk in supportgroup_ids)
+
+    return Membership.objects.filter(
+        person_id=person_id,
+        supportgroup_id__in=supportgroup_ids,
+        membership_type__gte=min_membership_type,
+    ).exists()
@@ -0,0 +1,12 @@
+from agir.groups.membership_index import membership_index_scope
+
+
+class MembershipIndexMiddleware:
+    """Partage les adhésions de la personne connectée entre les vérifications de permissions d'une requête"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with membership_index_scope():
+            return self.get_response(request)
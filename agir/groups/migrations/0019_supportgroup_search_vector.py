@@ -0,0 +1,71 @@
+# Generated by Django 3.2.19 on 2023-07-10 10:12
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.db import migrations
+
+CREATE_SEARCH_VECTOR_TRIGGER = """
+CREATE FUNCTION get_supportgroup_tsvector(
+  name groups_supportgroup.name%TYPE, location_city groups_supportgroup.location_city%TYPE,
+  location_zip groups_supportgroup.location_zip%TYPE, description groups_supportgroup.description%TYPE
+) RETURNS tsvector AS $$
+BEGIN
+  RETURN
+    setweight(to_tsvector('french_unaccented', COALESCE(name, '')), 'A') ||
+    setweight(to_tsvector('french_unaccented', COALESCE(location_city, '')), 'B') ||
+    setweight(to_tsvector('french_unaccented', COALESCE(location_zip, '')), 'B') ||
+    setweight(to_tsvector('french_unaccented', COALESCE(description, '')), 'C');
+END;
+$$ LANGUAGE plpgsql STABLE;
+
+CREATE FUNCTION process_update_supportgroup_search_vector() RETURNS TRIGGER AS $$
+BEGIN
+  --
+  -- Trigger function to update the search vector of a group when it is created or updated
+  --
+  NEW.search_vector := get_supportgroup_tsvector(
+    NEW.name, NEW.location_city, NEW.location_zip, NEW.description
+  );
+  RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER update_supportgroup_search_vector_when_modified
+BEFORE INSERT OR UPDATE OF name, location_city, location_zip, description
+ON groups_supportgroup
+  FOR EACH ROW EXECUTE PROCEDURE process_update_supportgroup_search_vector();
+"""
+
+DROP_SEARCH_VECTOR_TRIGGER = """
+DROP TRIGGER IF EXISTS update_supportgroup_search_vector_when_modified ON groups_supportgroup;
+DROP FUNCTION IF EXISTS process_update_supportgroup_search_vector();
+DROP FUNCTION IF EXISTS get_supportgroup_tsvector(
+  groups_supportgroup.name%TYPE, groups_supportgroup.location_city%TYPE,
+  groups_supportgroup.location_zip%TYPE, groups_supportgroup.description%TYPE
+);
+"""
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("groups", "0018_membership_has_finance_managing_privilege"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="supportgroup",
+            name="search_vector",
+            field=django.contrib.postgres.search.SearchVectorField(
+                editable=False, null=True, verbose_name="Données de recherche"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="supportgroup",
+            index=django.contrib.postgres.indexes.GinIndex(
+                fields=["search_vector"], name="groups_search_vector_index"
+            ),
+        ),
+        migrations.RunSQL(
+            sql=CREATE_SEARCH_VECTOR_TRIGGER, reverse_sql=DROP_SEARCH_VECTOR_TRIGGER
+        ),
+    ]
@@ -6,7 +6,8 @@
 from django.conf import settings
 from django.contrib.gis.db.models.functions import Distance
 from django.contrib.gis.measure import D
-from django.contrib.postgres.search import SearchVector, SearchRank
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchRank, SearchVectorField
 from django.core.exceptions import ValidationError
 from django.db import models, transaction
 from django.db.models import Subquery, OuterRef, Count, Q, Exists, Max, F, Prefetch
@@ -17,7 +18,6 @@
 from django_prometheus.models import ExportModelOperationsMixin
 
 from agir.activity.models import Activity
-from agir.carte.models import StaticMapImage
 from agir.lib.admin.utils import admin_url
 from agir.lib.form_fields import CustomJSONEncoder
 from agir.lib.models import (
@@ -74,38 +74,16 @@ def financeable(self):
         )
 
     def search(self, query):
-        vector = (
-            SearchVector(models.F("name"), config="french_unaccented", weight="A")
-            + SearchVector(
-                models.F("location_city"), config="french_unaccented", weight="B"
-            )
-            + SearchVector(
-                models.F("location_zip"), config="french_unaccented", weight="B"
-            )
-            + SearchVector(
-                models.F("description"), config="french_unaccented", weight="C"
-            )
-        )
         query = PrefixSearchQuery(query, config="french_unaccented")
 
         return (
-            self.annotate(search=vector)
-            .filter(search=query)
-            .annotate(rank=SearchRank(vector, query))
+            self.filter(search_vector=query)
+            .annotate(rank=SearchRank(F("search_vector"), query))
             .order_by("-rank")
         )
 
     def with_static_map_image(self):
-        return self.annotate(
-            static_map_image=Subquery(
-                StaticMapImage.objects.filter(
-                    center__dwithin=(
-                        OuterRef("coordinates"),
-                        StaticMapImage.UNIQUE_CENTER_MAX_DISTANCE,
-                    ),
-                ).values("image")[:1],
-            )
-        )
+        return self.select_related("static_map_image")
 
     def with_organized_event_count(self):
         from agir.events.models import Event
@@ -247,8 +225,12 @@ def with_serializer_prefetch(self):
 
 class MembershipManager(models.Manager.from_queryset(MembershipQuerySet)):
     def bulk_create(self, instances, send_post_save_signal=False, **kwargs):
+        from agir.groups.membership_index import invalidate_membership_index
+
         with transaction.atomic():
             memberships = super().bulk_create(instances, **kwargs)
+            # les opérations groupées n'envoient pas les signaux qui invalident l'index
+            invalidate_membership_index(*(m.person_id for m in memberships))
 
             if not send_post_save_signal:
                 return memberships
@@ -263,6 +245,14 @@ def bulk_create(self, instances, send_post_save_signal=False, **kwargs):
 
             return memberships
 
+    def bulk_update(self, instances, fields, **kwargs):
+        from agir.groups.membership_index import invalidate_membership_index
+
+        instances = list(instances)
+        result = super().bulk_update(instances, fields, **kwargs)
+        invalidate_membership_index(*(m.person_id for m in instances))
+        return result
+
 
 @reversion.register(for_concrete_model=True, follow=("subtypes", "links"))
 class SupportGroup(
@@ -385,6 +375,21 @@ class SupportGroup(
         ),
     )
 
+    # carte statique correspondant aux coordonnées, liée lors de sa génération
+    # (cf. agir.carte.static_maps)
+    static_map_image = models.ForeignKey(
+        "carte.StaticMapImage",
+        verbose_name=_("carte statique"),
+        on_delete=models.SET_NULL,
+        related_name="+",
+        null=True,
+        blank=True,
+        editable=False,
+    )
+
+    # maintenu par un trigger PostgreSQL (cf. migration 0019_supportgroup_search_vector)
+    search_vector = SearchVectorField("Données de recherche", editable=False, null=True)
+
     @property
     def managers(self):
         return [
@@ -536,6 +541,9 @@ class Meta:
         permissions = (
             ("view_hidden_supportgroup", _("Peut afficher les groupes non publiés")),
         )
+        indexes = (
+            GinIndex(fields=["search_vector"], name="groups_search_vector_index"),
+        )
 
     def __str__(self):
         return self.name
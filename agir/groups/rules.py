@@ -2,6 +2,7 @@
 
 from agir.authentication.models import Role
 from agir.lib.rules import is_authenticated_person
+from .membership_index import get_membership_type, has_membership
 from .models import Membership, SupportGroup
 from ..msgs.models import SupportGroupMessage, SupportGroupMessageComment
 
@@ -32,29 +33,25 @@ def is_editable_group(_role, obj=None):
     return supportgroup.editable
 
 
+def _get_supportgroup_id(obj):
+    if isinstance(obj, SupportGroup):
+        return obj.id
+    if isinstance(obj, (SupportGroupMessage, Membership)):
+        return obj.supportgroup_id
+    if isinstance(obj, SupportGroupMessageComment):
+        return obj.message.supportgroup_id
+    return None
+
+
 @rules.predicate
 def is_at_least_manager_for_group(role, obj=None):
     if obj is None:
         return False
 
-    if isinstance(obj, SupportGroup):
-        supportgroup = obj
-    elif isinstance(obj, SupportGroupMessage):
-        supportgroup = obj.supportgroup
-    elif isinstance(obj, SupportGroupMessageComment):
-        supportgroup = obj.message.supportgroup
-    elif isinstance(obj, Membership):
-        supportgroup = obj.supportgroup
-    else:
-        return False
-
-    return (
-        supportgroup is not None
-        and Membership.objects.filter(
-            membership_type__gte=Membership.MEMBERSHIP_TYPE_MANAGER,
-            person=role.person,
-            supportgroup=supportgroup,
-        ).exists()
+    return has_membership(
+        role.person.id,
+        [_get_supportgroup_id(obj)],
+        Membership.MEMBERSHIP_TYPE_MANAGER,
     )
 
 
@@ -63,21 +60,10 @@ def is_at_least_referent_for_group(role, obj=None):
     if obj is None:
         return False
 
-    if isinstance(obj, SupportGroup):
-        supportgroup = obj
-    elif isinstance(obj, SupportGroupMessage):
-        supportgroup = obj.supportgroup
-    elif isinstance(obj, SupportGroupMessageComment):
-        supportgroup = obj.message.supportgroup
-    elif isinstance(obj, Membership):
-        supportgroup = obj.supportgroup
-    else:
-        return False
-
-    return Membership.objects.filter(
-        membership_type__gte=Membership.MEMBERSHIP_TYPE_REFERENT,
-        person=role.person,
-        supportgroup=supportgroup,
+    return has_membership(
+        role.person.id,
+        [_get_supportgroup_id(obj)],
+        Membership.MEMBERSHIP_TYPE_REFERENT,
     )
 
 
@@ -137,12 +123,15 @@ def is_own_membership(role, membership=None):
 
 @rules.predicate
 def own_membership_has_higher_rights(role, membership=None):
-    return membership is not None and (
-        Membership.objects.filter(
-            person=role.person,
-            supportgroup=membership.supportgroup,
-            membership_type__gt=membership.membership_type,
-        ).exists()
+    if membership is None:
+        return False
+
+    own_membership_type = get_membership_type(
+        role.person.id, membership.supportgroup_id
+    )
+    return (
+        own_membership_type is not None
+        and own_membership_type > membership.membership_type
     )
 
 
@@ -156,12 +145,7 @@ def is_group_member(role, obj=None):
         supportgroup_id = obj.supportgroup_id
     else:
         return False
-    return (
-        supportgroup_id is not None
-        and Membership.objects.filter(
-            supportgroup_id=supportgroup_id, person_id=role.person.pk
-        ).exists()
-    )
+    return has_membership(role.person.pk, [supportgroup_id])
 
 
 rules.add_perm(
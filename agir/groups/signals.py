@@ -0,0 +1,13 @@
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from .membership_index import invalidate_membership_index
+from .models import Membership
+
+
+@receiver(post_save, sender=Membership, dispatch_uid="invalidate_membership_index")
+@receiver(
+    post_delete, sender=Membership, dispatch_uid="invalidate_membership_index_delete"
+)
+def signal_invalidate_membership_index(sender, instance, **kwargs):
+    invalidate_membership_index(instance.person_id)
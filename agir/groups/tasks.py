@@ -15,6 +15,7 @@
 from agir.groups.display import genrer_membership
 from agir.groups.models import SupportGroup, Membership
 from agir.lib.celery import (
+    LANE_BULK,
     emailing_task,
     post_save_task,
     http_task,
@@ -25,6 +26,7 @@
 from agir.lib.utils import clean_subject_email
 from agir.lib.utils import front_url
 from agir.msgs.models import SupportGroupMessage, SupportGroupMessageComment
+from agir.notifications.actions import get_group_recipient_ids
 from agir.notifications.models import Subscription
 from agir.people.actions.subscription import make_subscription_token
 from agir.people.models import Person
@@ -104,7 +106,7 @@ def create_group_creation_confirmation_activity(membership_pk):
     )
 
 
-@emailing_task(post_save=True)
+@emailing_task(post_save=True, coalesce=30, coalesce_merge=("changed_data",))
 def send_support_group_changed_notification(support_group_pk, changed_data):
     group = SupportGroup.objects.get(pk=support_group_pk, published=True)
     changed_categories = {
@@ -283,18 +285,9 @@ def send_abuse_report_message(inviter_id):
     )
 
 
-@post_save_task()
-def notify_new_group_event(group_pk, event_pk):
-    if not OrganizerConfig.objects.filter(event_id=event_pk, as_group_id=group_pk):
-        return
-
-    recipients = Person.objects.filter(
-        notification_subscriptions__membership__supportgroup_id=group_pk,
-        notification_subscriptions__type=Subscription.SUBSCRIPTION_PUSH,
-        notification_subscriptions__activity_type=Activity.TYPE_NEW_EVENT_MYGROUPS,
-    )
+def get_other_organizing_group_member_ids(group_pk, event_pk):
     # Exclude other organizing group members from notification to avoid duplicates
-    other_organizing_group_members = (
+    return (
         Membership.objects.exclude(supportgroup_id=group_pk)
         .filter(
             supportgroup_id__in=(
@@ -306,55 +299,44 @@ def notify_new_group_event(group_pk, event_pk):
         .values_list("person_id", flat=True)
     )
 
-    if len(other_organizing_group_members) > 0:
-        recipients = recipients.exclude(id__in=other_organizing_group_members)
 
-    if len(recipients) == 0:
+@post_save_task()
+def notify_new_group_event(group_pk, event_pk):
+    if not OrganizerConfig.objects.filter(event_id=event_pk, as_group_id=group_pk):
         return
 
     group = SupportGroup.objects.get(pk=group_pk)
     event = Event.objects.get(pk=event_pk)
-    Activity.objects.bulk_create(
-        [
-            Activity(
-                type=Activity.TYPE_NEW_EVENT_MYGROUPS,
-                recipient=r,
-                supportgroup=group,
-                event=event,
-            )
-            for r in recipients
-        ],
+
+    Activity.objects.bulk_fanout(
+        get_group_recipient_ids(
+            group_pk,
+            activity_type=Activity.TYPE_NEW_EVENT_MYGROUPS,
+            subscription_type=Subscription.SUBSCRIPTION_PUSH,
+            exclude=get_other_organizing_group_member_ids(group_pk, event_pk),
+        ),
+        type=Activity.TYPE_NEW_EVENT_MYGROUPS,
+        supportgroup=group,
+        event=event,
         send_post_save_signal=True,
     )
 
 
-@emailing_task(post_save=True)
+@emailing_task(post_save=True, lane=LANE_BULK)
 def send_new_group_event_email(group_pk, event_pk):
     if not OrganizerConfig.objects.filter(event_id=event_pk, as_group_id=group_pk):
         return
 
     recipients = Person.objects.filter(
-        notification_subscriptions__membership__supportgroup_id=group_pk,
-        notification_subscriptions__type=Subscription.SUBSCRIPTION_EMAIL,
-        notification_subscriptions__activity_type=Activity.TYPE_NEW_EVENT_MYGROUPS,
-    )
-    # Exclude other organizing group members from notification to avoid duplicates
-    other_organizing_group_members = (
-        Membership.objects.exclude(supportgroup_id=group_pk)
-        .filter(
-            supportgroup_id__in=(
-                OrganizerConfig.objects.filter(
-                    event_id=event_pk, as_group_id__isnull=False
-                ).values_list("as_group_id", flat=True)
-            )
+        id__in=get_group_recipient_ids(
+            group_pk,
+            activity_type=Activity.TYPE_NEW_EVENT_MYGROUPS,
+            subscription_type=Subscription.SUBSCRIPTION_EMAIL,
+            exclude=get_other_organizing_group_member_ids(group_pk, event_pk),
         )
-        .values_list("person_id", flat=True)
     )
 
-    if len(other_organizing_group_members) > 0:
-        recipients = recipients.exclude(id__in=other_organizing_group_members)
-
-    if len(recipients) == 0:
+    if not recipients.exists():
         return
 
     group = SupportGroup.objects.get(pk=group_pk)
@@ -446,7 +428,7 @@ def send_membership_transfer_alert(bindings, recipient_pk):
     )
 
 
-@http_task(post_save=True)
+@http_task(post_save=True, coalesce=10)
 def geocode_support_group(supportgroup_pk):
     supportgroup = SupportGroup.objects.get(pk=supportgroup_pk)
 
@@ -502,22 +484,17 @@ def create_accepted_invitation_member_activity(new_membership_pk):
 def send_message_notification_email(message_pk):
     message = SupportGroupMessage.objects.get(pk=message_pk)
 
-    memberships = message.supportgroup.memberships.filter(
-        membership_type__gte=message.required_membership_type
-    )
     recipients = Person.objects.filter(
-        id__in=memberships.values_list("person_id", flat=True)
-    )
-    recipients_id = [recipient.id for recipient in recipients]
-
-    recipients = Person.objects.exclude(id=message.author.id).filter(
-        id__in=recipients_id,
-        notification_subscriptions__membership__supportgroup=message.supportgroup,
-        notification_subscriptions__type=Subscription.SUBSCRIPTION_EMAIL,
-        notification_subscriptions__activity_type=Activity.TYPE_NEW_MESSAGE,
+        id__in=get_group_recipient_ids(
+            message.supportgroup_id,
+            activity_type=Activity.TYPE_NEW_MESSAGE,
+            subscription_type=Subscription.SUBSCRIPTION_EMAIL,
+            membership_type=message.required_membership_type,
+            exclude=[message.author_id],
+        )
     )
 
-    if len(recipients) == 0:
+    if not recipients.exists():
         return
 
     # Get membership to display author status
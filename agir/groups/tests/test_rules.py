@@ -2,6 +2,7 @@
 from django.test import TestCase
 
 from agir.groups import rules
+from agir.groups.membership_index import membership_index_scope
 from agir.groups.models import SupportGroup, Membership
 from agir.people.models import Person
 
@@ -25,6 +26,35 @@ def setUp(self) -> None:
             membership_type=Membership.MEMBERSHIP_TYPE_MEMBER,
         )
 
+    def test_memberships_are_loaded_once_per_scope(self):
+        role = self.person.role
+        self.assertEqual(role.person, self.person)
+
+        with membership_index_scope():
+            with self.assertNumQueries(1):
+                self.assertFalse(rules.is_at_least_manager_for_group(role, self.group1))
+                self.assertFalse(rules.is_at_least_manager_for_group(role, self.group2))
+                self.assertTrue(rules.is_group_member(role, self.group1))
+                self.assertTrue(rules.is_group_member(role, self.group2))
+
+            self.membership2.membership_type = Membership.MEMBERSHIP_TYPE_MANAGER
+            self.membership2.save()
+
+            self.assertTrue(rules.is_at_least_manager_for_group(role, self.group2))
+
+    def test_bulk_created_memberships_invalidate_index(self):
+        role = self.person.role
+        group3 = SupportGroup.objects.create(name="Groupe 3")
+
+        with membership_index_scope():
+            self.assertFalse(rules.is_group_member(role, group3))
+
+            Membership.objects.bulk_create(
+                [Membership(person=self.person, supportgroup=group3)]
+            )
+
+            self.assertTrue(rules.is_group_member(role, group3))
+
     def test_is_published(self):
         self.group1.published = True
         self.group1.save()
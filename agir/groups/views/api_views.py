@@ -37,6 +37,7 @@
     someone_joined_notification,
 )
 from agir.groups.filters import GroupAPIFilterSet
+from agir.groups.membership_index import has_membership
 from agir.groups.models import (
     SupportGroup,
     SupportGroupSubtype,
@@ -216,9 +217,11 @@ class GroupDetailAPIView(RetrieveAPIView):
     queryset = SupportGroup.objects.active()
 
     def get_serializer(self, *args, **kwargs):
-        is_manager = (
-            hasattr(self.request.user, "person")
-            and self.request.user.person in self.get_object().managers
+        supportgroup = args[0] if args else self.get_object()
+        is_manager = hasattr(self.request.user, "person") and has_membership(
+            self.request.user.person.id,
+            [supportgroup.id],
+            Membership.MEMBERSHIP_TYPE_MANAGER,
         )
         if not is_manager:
             return super().get_serializer(
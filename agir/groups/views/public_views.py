@@ -26,13 +26,12 @@
     GlobalOrObjectPermissionRequiredMixin,
     HardLoginRequiredMixin,
 )
-from agir.carte.models import StaticMapImage
+from agir.carte.static_maps import find_static_map_image, request_static_map_image
 from agir.front.view_mixins import FilterView
 from agir.groups.actions.notifications import someone_joined_notification
 from agir.groups.filters import GroupFilterSet
 from agir.groups.models import SupportGroup, Membership, SupportGroupSubtype
 from agir.lib.geo import get_commune
-from agir.lib.tasks import create_static_map_image_from_coordinates
 from agir.lib.utils import front_url
 
 __all__ = [
@@ -222,17 +221,10 @@ def get_illustration(self):
         if self.object.coordinates is None:
             return self.get_image_from_file("Frame-193.png")
 
-        static_map_image = StaticMapImage.objects.filter(
-            center__dwithin=(
-                self.object.coordinates,
-                StaticMapImage.UNIQUE_CENTER_MAX_DISTANCE,
-            ),
-        ).first()
+        static_map_image = find_static_map_image(self.object.coordinates)
 
         if static_map_image is None:
-            create_static_map_image_from_coordinates.delay(
-                [self.object.coordinates[0], self.object.coordinates[1]]
-            )
+            request_static_map_image(self.object.coordinates)
             return self.get_image_from_file("Frame-193.png")
 
         static_map_image.image.open()
@@ -1,12 +1,43 @@
+import inspect
+import json
 import smtplib
 import socket
 from functools import wraps
 
 import requests
-from celery import shared_task
+from celery import Task, shared_task
+from django.conf import settings
 from django.core.exceptions import ObjectDoesNotExist
 from push_notifications.gcm import GCMError
 
+# Voies des tâches : les tâches qu'une personne attend (code de connexion, confirmation
+# d'inscription…) ne doivent pas être retardées par les envois en masse. Lorsque les voies
+# sont activées (`TASK_LANES_ENABLED`), chacune a sa propre file d'attente, consommée par
+# des workers dédiés.
+LANE_INTERACTIVE = "interactive"
+LANE_NOTIFICATIONS = "notifications"
+LANE_EXTERNAL_API = "external_api"
+LANE_BULK = "bulk"
+
+# avec le transport Redis, 0 est la priorité la plus haute
+LANE_PRIORITIES = {
+    LANE_INTERACTIVE: 0,
+    LANE_NOTIFICATIONS: 3,
+    LANE_EXTERNAL_API: 6,
+    LANE_BULK: 9,
+}
+
+
+def lane_options(lane):
+    """Renvoie les options de tâche Celery correspondant à la voie"""
+    if lane not in LANE_PRIORITIES:
+        raise ValueError(f"Voie de tâche inconnue : {lane}")
+
+    options = {"lane": lane}
+    if settings.TASK_LANES_ENABLED:
+        options.update(queue=lane, priority=LANE_PRIORITIES[lane])
+    return options
+
 
 def retry_strategy(
     start=None,
@@ -42,6 +73,107 @@ def inner(self, *args, **kwargs):
     return outer
 
 
+# durée de conservation des valeurs à fusionner, en attendant l'exécution de la tâche
+COALESCE_MERGE_TIMEOUT = 24 * 3600
+# marge ajoutée à la fenêtre de regroupement pour l'expiration de la clé de déduplication :
+# si la tâche n'a toujours pas démarré passé ce délai, un nouvel appel la reprogrammera
+COALESCE_KEY_MARGIN = 5 * 60
+
+
+class CoalescingTask(Task):
+    """Tâche dont les appels identiques rapprochés sont regroupés en une seule exécution
+
+    Le premier appel est programmé `coalesce_window` secondes plus tard ; les appels avec
+    les mêmes arguments faits d'ici à son exécution sont ignorés, puisque la tâche lira
+    de toute façon l'état le plus récent des objets concernés. Les valeurs des arguments
+    listés dans `coalesce_merge` (des listes, comme `changed_data`) ne font pas partie de la
+    clé : elles sont stockées dans Redis et réunies lors de l'exécution.
+    """
+
+    coalesce_window = None
+    coalesce_merge = ()
+    coalesce_signature = None
+
+    def _bind(self, args, kwargs):
+        return self.coalesce_signature.bind_partial(*(args or ()), **(kwargs or {}))
+
+    def _coalesce_key(self, bound):
+        key_args = {
+            name: value
+            for name, value in bound.arguments.items()
+            if name not in self.coalesce_merge
+        }
+        return f"CoalescedTask:{self.name}:{json.dumps(key_args, sort_keys=True, default=str)}"
+
+    def apply_async(self, args=None, kwargs=None, **options):
+        from agir.api.redis import get_auth_redis_client
+
+        # les relances et les tâches programmées explicitement ne sont pas regroupées
+        if (
+            not self.coalesce_window
+            or self.app.conf.task_always_eager
+            or {"countdown", "eta", "retries"}.intersection(options)
+        ):
+            return super().apply_async(args, kwargs, **options)
+
+        bound = self._bind(args, kwargs)
+        key = self._coalesce_key(bound)
+
+        pipeline = get_auth_redis_client().pipeline()
+        for name in self.coalesce_merge:
+            values = bound.arguments.get(name)
+            if values:
+                pipeline.sadd(f"{key}:{name}", *(json.dumps(v) for v in values))
+                pipeline.expire(f"{key}:{name}", COALESCE_MERGE_TIMEOUT)
+        pipeline.set(key, 1, nx=True, ex=self.coalesce_window + COALESCE_KEY_MARGIN)
+        *_, scheduled = pipeline.execute()
+
+        if not scheduled:
+            return None
+
+        try:
+            return super().apply_async(
+                args, kwargs, countdown=self.coalesce_window, **options
+            )
+        except Exception:
+            # sans cela, les appels suivants seraient ignorés alors que rien n'est programmé
+            get_auth_redis_client().delete(key)
+            raise
+
+    def __call__(self, *args, **kwargs):
+        if not self.coalesce_window or self.app.conf.task_always_eager:
+            return super().__call__(*args, **kwargs)
+
+        from agir.api.redis import get_auth_redis_client
+
+        bound = self._bind(args, kwargs)
+        key = self._coalesce_key(bound)
+
+        # les appels suivants programmeront une nouvelle exécution
+        pipeline = get_auth_redis_client().pipeline()
+        pipeline.delete(key)
+        for name in self.coalesce_merge:
+            pipeline.smembers(f"{key}:{name}")
+            pipeline.delete(f"{key}:{name}")
+        _, *results = pipeline.execute()
+
+        for name, members in zip(self.coalesce_merge, results[::2]):
+            if name in bound.arguments or members:
+                values = list(bound.arguments.get(name) or [])
+                values.extend(
+                    value
+                    for value in sorted(json.loads(m) for m in members)
+                    if value not in values
+                )
+                bound.arguments[name] = values
+
+        # les éventuelles relances utiliseront les valeurs fusionnées
+        self.request.args = list(bound.args)
+        self.request.kwargs = bound.kwargs
+
+        return super().__call__(*bound.args, **bound.kwargs)
+
+
 def retriable_task(
     *args,
     bind=False,
@@ -52,8 +184,21 @@ def retriable_task(
     min=0,
     exp_base=2,
     strategy=None,
+    lane=None,
+    coalesce=None,
+    coalesce_merge=(),
     **kwargs,
 ):
+    """Crée une tâche Celery relancée en cas d'erreur selon la stratégie indiquée
+
+    :param lane: la voie de la tâche (cf. `lane_options`)
+    :param coalesce: si indiqué, durée (en secondes) pendant laquelle les appels identiques
+        sont regroupés (cf. `CoalescingTask`)
+    :param coalesce_merge: noms des arguments de type liste à fusionner lors du regroupement
+    """
+    if lane is not None:
+        kwargs.update(lane_options(lane))
+
     if strategy is None:
         strategy = retry_strategy(
             forward_self=bind,
@@ -65,17 +210,30 @@ def retriable_task(
             exp_base=exp_base,
         )
 
-    taskifier = shared_task(bind=True, **kwargs)
-
     def decorate(f):
-        return taskifier(strategy(f))
+        task_kwargs = kwargs
+        if coalesce:
+            signature = inspect.signature(f)
+            if bind:
+                signature = signature.replace(
+                    parameters=list(signature.parameters.values())[1:]
+                )
+            task_kwargs = {
+                "base": CoalescingTask,
+                "coalesce_window": coalesce,
+                "coalesce_merge": tuple(coalesce_merge),
+                "coalesce_signature": signature,
+                **kwargs,
+            }
+
+        return shared_task(bind=True, **task_kwargs)(strategy(f))
 
     if len(args) == 1:
         return decorate(args[0])
     return decorate
 
 
-def http_task(post_save=False):
+def http_task(post_save=False, lane=LANE_EXTERNAL_API, **kwargs):
     retry_on = (
         requests.RequestException,
         requests.exceptions.Timeout,
@@ -83,10 +241,12 @@ def http_task(post_save=False):
     if post_save:
         retry_on = (*retry_on, ObjectDoesNotExist)
 
-    return retriable_task(strategy=retry_strategy(start=10, retry_on=retry_on))
+    return retriable_task(
+        strategy=retry_strategy(start=10, retry_on=retry_on), lane=lane, **kwargs
+    )
 
 
-def emailing_task(post_save=False):
+def emailing_task(post_save=False, lane=LANE_NOTIFICATIONS, **kwargs):
     retry_on = (
         smtplib.SMTPException,
         socket.error,
@@ -94,10 +254,12 @@ def emailing_task(post_save=False):
     if post_save:
         retry_on = (*retry_on, ObjectDoesNotExist)
 
-    return retriable_task(strategy=retry_strategy(start=10, retry_on=retry_on))
+    return retriable_task(
+        strategy=retry_strategy(start=10, retry_on=retry_on), lane=lane, **kwargs
+    )
 
 
-def gcm_push_task(post_save=False):
+def gcm_push_task(post_save=False, lane=LANE_NOTIFICATIONS, **kwargs):
     retry_on = (
         GCMError,
         requests.HTTPError,
@@ -107,10 +269,14 @@ def gcm_push_task(post_save=False):
     if post_save:
         retry_on = (*retry_on, ObjectDoesNotExist)
 
-    return retriable_task(strategy=retry_strategy(start=10, retry_on=retry_on))
+    return retriable_task(
+        strategy=retry_strategy(start=10, retry_on=retry_on), lane=lane, **kwargs
+    )
 
 
-def post_save_task():
+def post_save_task(lane=LANE_NOTIFICATIONS, **kwargs):
     return retriable_task(
-        strategy=retry_strategy(start=10, retry_on=(ObjectDoesNotExist,))
+        strategy=retry_strategy(start=10, retry_on=(ObjectDoesNotExist,)),
+        lane=lane,
+        **kwargs,
     )
@@ -1,24 +1,35 @@
 import dataclasses
+import json
 import re
 from functools import wraps
+from itertools import chain, islice
 from typing import Any, Optional
 
 import gspread
+from celery import signature
 from django.conf import settings
 from django.core.exceptions import ValidationError
 from gspread.utils import ValueInputOption, rowcol_to_a1, ValueRenderOption
 
-from agir.lib.celery import retriable_task
+from agir.api.redis import get_auth_redis_client
+from agir.lib.celery import retriable_task, LANE_EXTERNAL_API
 
 GOOGLE_SHEET_REGEX = r"^https://docs.google.com/spreadsheets/d/(?P<sid>[A-Za-z0-9_-]{40,})/.*[?#&]gid=(?P<gid>[0-9]+)"
 MAX_CHUNK_SIZE = 100_000
 
+# délai pendant lequel les lignes à ajouter à une feuille sont accumulées avant d'être écrites
+SHEET_BUFFER_FLUSH_DELAY = 10
+# au-delà, il est plus économe de recopier entièrement la feuille
+SHEET_BUFFER_MAX_ROWS = 500
+SHEET_BUFFER_TIMEOUT = 24 * 3600
+SHEET_FLUSH_LOCK_TIMEOUT = 3600
+
 
 class _TemporaryGspreadError(Exception):
     pass
 
 
-def gspread_task(task):
+def gspread_task(task=None, **kwargs):
     """Permet de retenter une tâche celery qui utilise gspread
 
     Nous avons constaté des problèmes de sérialisation des exceptions de gspread.
@@ -27,9 +38,13 @@ def gspread_task(task):
 
     Pour éviter le chaînage d'exception (l'exception d'origine serait quand même sérialisée dans ce cas !), on prend
     garde à utiliser la forme raise … from None.
+
+    Les paramètres supplémentaires sont transmis à `retriable_task`.
     :param task:
     :return:
     """
+    if task is None:
+        return lambda task: gspread_task(task, **kwargs)
 
     @wraps(task)
     def _wrapped(*args, **kwargs):
@@ -40,7 +55,9 @@ def _wrapped(*args, **kwargs):
                 *e.args,
             ) from None
 
-    return retriable_task(_wrapped, start=5, retry_on=(_TemporaryGspreadError,))
+    return retriable_task(start=5, retry_on=(_TemporaryGspreadError,), **kwargs)(
+        _wrapped
+    )
 
 
 @dataclasses.dataclass
@@ -49,9 +66,10 @@ class GoogleSheetId:
     gid: int
 
 
-def grouper(array: list, n: int):
-    for i in range(0, len(array), n):
-        yield array[i : i + n]
+def grouper(iterable, n: int):
+    it = iter(iterable)
+    while chunk := list(islice(it, n)):
+        yield chunk
 
 
 def parse_sheet_link(link: str) -> Optional[GoogleSheetId]:
@@ -103,22 +121,57 @@ def check_sheet_permissions(sheet: GoogleSheetId):
 
 
 def copy_array_to_sheet(sheet_id: GoogleSheetId, values):
-    num_rows = len(values)
-    num_cols = len(values[0])
+    copy_rows_to_sheet(sheet_id, values[0], values[1:], len(values) - 1)
+
+
+def copy_rows_to_sheet(sheet_id: GoogleSheetId, headers, rows, num_rows):
+    """Remplace le contenu de la feuille par les en-têtes et les lignes indiqués
+
+    Les lignes peuvent être fournies par un itérateur : elles sont envoyées par paquets,
+    sans jamais être toutes chargées en mémoire.
+
+    :param num_rows: le nombre de lignes attendu, pour dimensionner la feuille
+    """
+    num_cols = len(headers)
 
     sheet = open_sheet(sheet_id)
-    sheet.resize(rows=num_rows, cols=num_cols)
+    sheet_rows = num_rows + 1
+    sheet.resize(rows=sheet_rows, cols=num_cols)
 
     chunk_height = MAX_CHUNK_SIZE // num_cols
+    written_rows = 0
 
-    for i, rows in enumerate(grouper(values, chunk_height)):
-        first_cell = rowcol_to_a1(i * chunk_height + 1, 1)
-        last_cell = rowcol_to_a1((i + 1) * chunk_height, num_cols)
+    for chunk in grouper(chain([headers], rows), chunk_height):
+        # des lignes ont pu être ajoutées depuis le calcul de `num_rows`
+        if written_rows + len(chunk) > sheet_rows:
+            sheet.add_rows(written_rows + len(chunk) - sheet_rows)
+            sheet_rows = written_rows + len(chunk)
+
+        first_cell = rowcol_to_a1(written_rows + 1, 1)
+        last_cell = rowcol_to_a1(written_rows + len(chunk), num_cols)
         sheet.update(
             f"{first_cell}:{last_cell}",
-            rows,
+            chunk,
             value_input_option=ValueInputOption.raw,
         )
+        written_rows += len(chunk)
+
+    if written_rows < sheet_rows:
+        sheet.resize(rows=written_rows)
+
+
+def add_columns_to_sheet(sheet, sheet_headers, missing_columns):
+    """Ajoute les colonnes manquantes à la suite des en-têtes existants de la feuille"""
+    if sheet.col_count < len(sheet_headers) + len(missing_columns):
+        sheet.resize(
+            rows=sheet.row_count, cols=len(sheet_headers) + len(missing_columns)
+        )
+
+    first_new_col = len(sheet_headers) + 1
+    last_new_col = len(sheet_headers) + len(missing_columns)
+
+    header_range = f"{rowcol_to_a1(1, first_new_col)}:{rowcol_to_a1(1, last_new_col)}"
+    sheet.update(header_range, [missing_columns])
 
 
 def add_row_to_sheet(sheet_id: GoogleSheetId, values: dict[str, Any], id_column=None):
@@ -134,29 +187,20 @@ def add_row_to_sheet(sheet_id: GoogleSheetId, values: dict[str, Any], id_column=
     missing_columns = [h for h in values.keys() if h not in sheet_headers]
 
     if missing_columns:
-        if sheet.col_count < len(sheet_headers) + len(missing_columns):
-            sheet.resize(
-                rows=sheet.row_count, cols=len(sheet_headers) + len(missing_columns)
-            )
-
-        first_new_col = len(sheet_headers) + 1
-        last_new_col = len(sheet_headers) + len(missing_columns)
+        add_columns_to_sheet(sheet, sheet_headers, missing_columns)
 
         headers_map.update(
             {
                 i: h
                 for h, i in zip(
                     missing_columns,
-                    range(first_new_col - 1, last_new_col),
+                    range(
+                        len(sheet_headers), len(sheet_headers) + len(missing_columns)
+                    ),
                 )
             }
         )
 
-        header_range = (
-            f"{rowcol_to_a1(1, first_new_col)}:{rowcol_to_a1(1, last_new_col)}"
-        )
-        sheet.update(header_range, [missing_columns])
-
     # la valeur par défaut est une chaîne vide plutôt que None car sinon gspread
     # n'écrase pas une potentielle valeur existante.
     insert = [
@@ -186,3 +230,166 @@ def add_row_to_sheet(sheet_id: GoogleSheetId, values: dict[str, Any], id_column=
         insert_data_option="INSERT_ROWS",
         table_range="A1",
     )
+
+
+def _sheet_key(sheet_id: GoogleSheetId):
+    return f"{sheet_id.sid}:{sheet_id.gid}"
+
+
+def _buffer_key(sheet_id: GoogleSheetId):
+    return f"GoogleSheetBuffer:{_sheet_key(sheet_id)}"
+
+
+def _resync_key(sheet_id: GoogleSheetId):
+    return f"GoogleSheetResync:{_sheet_key(sheet_id)}"
+
+
+def _flush_lock_key(sheet_id: GoogleSheetId):
+    return f"GoogleSheetFlush:{_sheet_key(sheet_id)}"
+
+
+def buffer_row_for_sheet(
+    sheet_id: GoogleSheetId, values: dict[str, Any], id_column=None, resync=None
+):
+    """Programme l'ajout (ou la mise à jour) d'une ligne dans la feuille
+
+    Contrairement à `add_row_to_sheet`, la ligne n'est pas écrite immédiatement : les
+    lignes destinées à une même feuille sont accumulées dans Redis et écrites ensemble,
+    en quelques requêtes, par `flush_sheet_buffer`.
+
+    :param id_column: nom de la colonne identifiant la ligne ; une ligne existante avec le
+        même identifiant est alors mise à jour plutôt qu'ajoutée
+    :param resync: signature Celery d'une tâche qui recopie entièrement la feuille, utilisée
+        lorsque trop de lignes sont en attente
+    """
+    if id_column is not None:
+        assert id_column in values
+
+    pipeline = get_auth_redis_client().pipeline()
+    pipeline.rpush(
+        _buffer_key(sheet_id),
+        json.dumps({"values": values, "id_column": id_column}, default=str),
+    )
+    pipeline.expire(_buffer_key(sheet_id), SHEET_BUFFER_TIMEOUT)
+    if resync is not None:
+        pipeline.set(
+            _resync_key(sheet_id), json.dumps(dict(resync)), ex=SHEET_BUFFER_TIMEOUT
+        )
+    pipeline.set(_flush_lock_key(sheet_id), 1, nx=True, ex=SHEET_FLUSH_LOCK_TIMEOUT)
+    *_, scheduled = pipeline.execute()
+
+    # si une écriture est déjà programmée, elle emportera cette ligne
+    if scheduled:
+        flush_sheet_buffer.apply_async(
+            (sheet_id.sid, sheet_id.gid), countdown=SHEET_BUFFER_FLUSH_DELAY
+        )
+
+
+def write_rows_to_sheet(sheet_id: GoogleSheetId, rows):
+    """Écrit en une fois des lignes dans la feuille
+
+    Chaque ligne est un dictionnaire `{"values": …, "id_column": …}` comme ceux accumulés
+    par `buffer_row_for_sheet`. Les en-têtes sont relus à chaque écriture : ils peuvent
+    avoir été modifiés à la main dans la feuille.
+    """
+    sheet = open_sheet(sheet_id)
+    sheet_headers = sheet.row_values(1)
+
+    # itérer les lignes dans l'ordre pour préserver l'ordre des nouvelles colonnes
+    missing_columns = []
+    for row in rows:
+        missing_columns.extend(
+            h
+            for h in row["values"]
+            if h not in sheet_headers and h not in missing_columns
+        )
+
+    if missing_columns:
+        add_columns_to_sheet(sheet, sheet_headers, missing_columns)
+        sheet_headers = sheet_headers + missing_columns
+
+    id_columns = {row["id_column"] for row in rows if row["id_column"] is not None}
+    existing_rows = {}
+    for id_column in id_columns:
+        id_values = sheet.col_values(
+            sheet_headers.index(id_column) + 1,
+            value_render_option=ValueRenderOption.unformatted,
+        )[1:]
+        existing_rows[id_column] = {}
+        for i, value in enumerate(id_values, start=2):
+            existing_rows[id_column].setdefault(value, i)
+
+    updates = {}
+    new_rows = []
+    new_rows_by_id = {}
+    for row in rows:
+        # la valeur par défaut est une chaîne vide plutôt que None car sinon gspread
+        # n'écrase pas une potentielle valeur existante.
+        insert = [row["values"].get(h, "") for h in sheet_headers]
+        id_column = row["id_column"]
+
+        if id_column is None:
+            new_rows.append(insert)
+            continue
+
+        # seule la dernière version d'une même ligne est conservée
+        id_value = row["values"][id_column]
+        if id_value in existing_rows[id_column]:
+            updates[existing_rows[id_column][id_value]] = insert
+        elif (id_column, id_value) in new_rows_by_id:
+            new_rows[new_rows_by_id[id_column, id_value]] = insert
+        else:
+            new_rows_by_id[id_column, id_value] = len(new_rows)
+            new_rows.append(insert)
+
+    if updates:
+        sheet.batch_update(
+            [
+                {
+                    "range": f"{rowcol_to_a1(i, 1)}:{rowcol_to_a1(i, len(insert))}",
+                    "values": [insert],
+                }
+                for i, insert in updates.items()
+            ],
+            value_input_option=ValueInputOption.raw,
+        )
+
+    if new_rows:
+        sheet.append_rows(
+            new_rows,
+            value_input_option=ValueInputOption.raw,
+            insert_data_option="INSERT_ROWS",
+            table_range="A1",
+        )
+
+
+@gspread_task(lane=LANE_EXTERNAL_API)
+def flush_sheet_buffer(sid, gid):
+    """Écrit dans la feuille les lignes accumulées par `buffer_row_for_sheet`"""
+    sheet_id = GoogleSheetId(sid, gid)
+    redis_client = get_auth_redis_client()
+
+    rows = [
+        json.loads(row) for row in redis_client.lrange(_buffer_key(sheet_id), 0, -1)
+    ]
+    resync = redis_client.get(_resync_key(sheet_id))
+
+    if len(rows) > SHEET_BUFFER_MAX_ROWS and resync is not None:
+        # la tâche de recopie relit toutes les lignes depuis la base
+        signature(json.loads(resync)).delay()
+    elif rows:
+        write_rows_to_sheet(sheet_id, rows)
+
+    # les lignes ne sont retirées qu'une fois écrites : en cas d'erreur, la tâche relancée
+    # les reprendra
+    pipeline = redis_client.pipeline()
+    pipeline.ltrim(_buffer_key(sheet_id), len(rows), -1)
+    pipeline.delete(_flush_lock_key(sheet_id))
+    pipeline.llen(_buffer_key(sheet_id))
+    *_, remaining = pipeline.execute()
+
+    # lignes ajoutées pendant l'écriture, alors qu'aucune nouvelle écriture n'était programmée
+    if remaining and redis_client.set(
+        _flush_lock_key(sheet_id), 1, nx=True, ex=SHEET_FLUSH_LOCK_TIMEOUT
+    ):
+        flush_sheet_buffer.apply_async((sid, gid), countdown=SHEET_BUFFER_FLUSH_DELAY)
@@ -1,19 +1,35 @@
+import logging
 import re
+import secrets
+import time
 from email.mime.base import MIMEBase
+from functools import lru_cache
 from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
 
 import html2text
 import requests
 from django.conf import settings
 from django.core.mail import EmailMultiAlternatives, get_connection
+from django.db.models import prefetch_related_objects
 from django.http import QueryDict
-from django.template import loader, TemplateDoesNotExist
-from django.template.base import Template
+from django.template import Context, loader, TemplateDoesNotExist
+from django.template.base import Template, Lexer, TokenType, VariableNode, Variable
+from django.template.defaultfilters import safe
+from django.template.defaulttags import FilterNode
 from django.template.loader import get_template
+from django.template.loader_tags import BlockNode, ExtendsNode, IncludeNode
+from django.utils.html import conditional_escape
 from django.utils.safestring import mark_safe
 
 from agir.api.context_processors import basic_information
-from agir.lib.utils import generate_token_params, front_url, AutoLoginUrl
+from agir.lib.templatetags.htmltotext import html_to_text_filter
+from agir.lib.utils import (
+    generate_token_params,
+    generate_bulk_token_params,
+    front_url,
+    AutoLoginUrl,
+    grouper,
+)
 from agir.people.models import Person
 
 __all__ = [
@@ -23,7 +39,30 @@
     "fetch_mosaico_template",
 ]
 
+logger = logging.getLogger(__name__)
+
 MOSAICO_VAR_REGEX = re.compile(r"\[([-A-Z_]+)\]")
+# valeurs modifiées par le filtre `html_to_text`
+FILTERED_VALUE_REGEX = re.compile(r"[<>]|&#?\w+;|\s\s|\n")
+
+# nombre de messages rendus puis transmis ensemble au serveur d'envoi
+SEND_BATCH_SIZE = 100
+
+# variables du contexte dont la valeur change d'un destinataire à l'autre
+PERSONAL_BINDINGS = frozenset(
+    {
+        "email",
+        "EMAIL",
+        "greetings",
+        "formule_adresse",
+        "GREETINGS",
+        "greetings_insoumise",
+        "formule_adresse_insoumise",
+        "merge_login",
+        "MERGE_LOGIN",
+        "LINK_BROWSER",
+    }
+)
 
 _h = html2text.HTML2Text(bodywidth=0)
 _h.ignore_images = True
@@ -61,7 +100,7 @@ def add_params_to_urls(url, params):
     )
 
 
-def send_message(
+def make_message(
     from_email,
     recipient,
     subject,
@@ -89,16 +128,71 @@ def send_message(
                 email.attach(**attachment)
             else:
                 email.attach(*attachment)
-    email.send()
+    return email
+
+
+def send_message(
+    from_email,
+    recipient,
+    subject,
+    text,
+    html=None,
+    reply_to=None,
+    attachments=None,
+    connection=None,
+):
+    make_message(
+        from_email=from_email,
+        recipient=recipient,
+        subject=subject,
+        text=text,
+        html=html,
+        reply_to=reply_to,
+        attachments=attachments,
+        connection=connection,
+    ).send()
+
+
+def send_messages(connection, messages, label):
+    """Transmet un lot de messages par une connexion déjà ouverte, et journalise le débit"""
+    start = time.monotonic()
+    sent = connection.send_messages(messages) or 0
+    duration = time.monotonic() - start
+    logger.info(
+        f"{label} : {sent}/{len(messages)} messages envoyés en {duration:.2f}s "
+        f"({sent / duration if duration else sent:.1f} messages/s)"
+    )
+    return sent
+
+
+def get_recipients_connection_params(recipients):
+    """Prépare les rôles et les paramètres de connexion automatique d'un lot de destinataires
+
+    Les rôles des personnes sont récupérés en une seule requête. Renvoie un dictionnaire
+    associant à l'identifiant de chaque personne active ses paramètres de connexion.
+    """
+    people = [r for r in recipients if isinstance(r, Person)]
+    prefetch_related_objects(people, "role")
+    return generate_bulk_token_params(
+        [p for p in people if p.role is not None and p.role.is_active]
+    )
 
 
-def get_context_from_bindings(code, recipient, bindings):
-    """Finalizes the bindings and create a Context for templating"""
-    bindings = dict(bindings)
+def is_active_recipient(recipient):
+    return not (getattr(recipient, "role", None) and not recipient.role.is_active)
+
+
+def get_context_from_bindings(code, recipient, bindings, connection_params=None):
+    """Finalizes the bindings and create a Context for templating
+
+    :param connection_params: the login params of the recipient, if they have already been generated
+    """
+    bindings = dict(bindings or {})
 
     if isinstance(recipient, Person):
         if recipient.role is not None and recipient.role.is_active:
-            connection_params = generate_token_params(recipient)
+            if connection_params is None:
+                connection_params = generate_token_params(recipient)
             for key, value in bindings.items():
                 if isinstance(value, AutoLoginUrl):
                     bindings[key] = add_params_to_urls(value, connection_params)
@@ -134,27 +228,212 @@ def get_context_from_bindings(code, recipient, bindings):
     return bindings
 
 
-def render_email_template(template, context):
-    context = {
-        **context,
-        **basic_information(None),
-    }
-    subject = template.render(
-        {
-            **context,
-            "email_template": Template(
-                "{% autoescape off %}{% block subject %}{% endblock %}{% endautoescape %}"
-            ),
-        }
-    ).strip()
-    text_content = template.render(
-        {**context, "email_template": "mail_templates/layout.txt"}
-    ).strip()
-    html_content = template.render(
-        {**context, "email_template": "mail_templates/layout.html"}
+@lru_cache(maxsize=None)
+def get_subject_template():
+    return Template(
+        "{% autoescape off %}{% block subject %}{% endblock %}{% endautoescape %}"
+    )
+
+
+def get_email_layouts():
+    """Renvoie les gabarits étendus pour obtenir le sujet, le texte et le HTML d'un email"""
+    return (
+        get_subject_template(),
+        "mail_templates/layout.txt",
+        "mail_templates/layout.html",
     )
 
-    return subject, text_content, html_content
+
+def get_personal_keys(bindings):
+    """Renvoie les noms des variables dont la valeur change d'un destinataire à l'autre"""
+    return PERSONAL_BINDINGS.union(
+        key for key, value in bindings.items() if isinstance(value, AutoLoginUrl)
+    )
+
+
+def _uses_personal_key(filter_expression, personal_keys):
+    var = filter_expression.var
+    return isinstance(var, Variable) and var.lookups and var.lookups[0] in personal_keys
+
+
+def _get_personal_variable_nodes(nodelist, personal_keys):
+    return [
+        node
+        for node in nodelist.get_nodes_by_type(VariableNode)
+        if _uses_personal_key(node.filter_expression, personal_keys)
+    ]
+
+
+def _get_personal_filter_nodes(nodelist, personal_keys):
+    # un bloc peut être remplacé par un gabarit qui étend celui-ci et contient ces variables
+    return [
+        node
+        for node in nodelist.get_nodes_by_type(FilterNode)
+        if node.nodelist.get_nodes_by_type(BlockNode)
+        or _get_personal_variable_nodes(node.nodelist, personal_keys)
+    ]
+
+
+def get_template_tree(template, context, personal_keys):
+    """Renvoie les gabarits utilisés lors du rendu, en suivant les balises extends et include
+
+    Les gabarits étendus ou inclus sont déterminés à partir du contexte commun à tous les
+    destinataires ; renvoie None si l'un d'eux ne peut pas être déterminé ainsi.
+    """
+    template = getattr(template, "template", template)
+    if not isinstance(template, Template):
+        return None
+
+    templates = [template]
+    for node in template.nodelist.get_nodes_by_type((ExtendsNode, IncludeNode)):
+        filter_expression = (
+            node.parent_name if isinstance(node, ExtendsNode) else node.template
+        )
+        if _uses_personal_key(filter_expression, personal_keys):
+            return None
+
+        name = filter_expression.resolve(Context(context), ignore_failures=True)
+        if isinstance(name, str):
+            try:
+                name = template.engine.get_template(name)
+            except TemplateDoesNotExist:
+                return None
+
+        subtemplates = get_template_tree(name, context, personal_keys)
+        if subtemplates is None:
+            return None
+        templates.extend(subtemplates)
+
+    return templates
+
+
+def personal_bindings_are_substitutable(template, personal_keys, context=None):
+    """Indique si les variables propres à chaque destinataire peuvent être substituées après rendu
+
+    C'est le cas lorsque ces variables n'apparaissent dans le gabarit, ni dans ceux qu'il
+    étend ou inclut, que sous la forme ``{{ VARIABLE }}`` ou ``{{ VARIABLE|safe }}``, sans
+    autre filtre ni attribut, et jamais dans une balise (condition, boucle, etc.).
+
+    Seul le filtre `html_to_text` peut s'appliquer à un bloc qui contient ces variables
+    (balise ``{% filter %}``) : il laisse inchangées les valeurs sans balise HTML ni
+    espacement multiple.
+
+    :param context: le contexte commun à tous les destinataires, qui permet de déterminer les
+        gabarits étendus ou inclus
+    """
+    templates = get_template_tree(template, context or {}, personal_keys)
+    if templates is None:
+        return False
+
+    for template in templates:
+        for node in _get_personal_variable_nodes(template.nodelist, personal_keys):
+            filter_expression = node.filter_expression
+            if len(filter_expression.var.lookups) > 1 or any(
+                func is not safe for func, args in filter_expression.filters
+            ):
+                return False
+
+        for node in _get_personal_filter_nodes(template.nodelist, personal_keys):
+            if any(
+                func is not html_to_text_filter
+                for func, args in node.filter_expr.filters
+            ):
+                return False
+
+        for token in Lexer(template.source).tokenize():
+            if token.token_type == TokenType.BLOCK and personal_keys.intersection(
+                re.findall(r"\w+", token.contents)
+            ):
+                return False
+
+    return True
+
+
+def personal_bindings_are_filtered(template, personal_keys, context=None):
+    """Indique si des variables propres à chaque destinataire sont dans un bloc filtré"""
+    templates = get_template_tree(template, context or {}, personal_keys) or []
+    return any(
+        _get_personal_filter_nodes(template.nodelist, personal_keys)
+        for template in templates
+    )
+
+
+class PersonalizedTemplate:
+    """Gabarit rendu une seule fois pour l'ensemble des destinataires d'un envoi
+
+    Le gabarit est rendu avec des marqueurs à la place des variables propres à chaque
+    destinataire, et chaque message est ensuite obtenu en remplaçant ces marqueurs par les
+    valeurs du destinataire. Si le gabarit utilise ces variables autrement que pour les
+    afficher, il est rendu normalement pour chaque destinataire.
+
+    Chaque marqueur contient une apostrophe : selon qu'elle a été échappée ou non au rendu,
+    la valeur du destinataire est échappée ou insérée telle quelle. Lorsque ces variables
+    sont dans un bloc filtré par `html_to_text`, les destinataires dont une valeur contient
+    du HTML ou des espacements multiples ont leur message rendu normalement.
+    """
+
+    def __init__(self, template, bindings, personal_keys, text=False):
+        self.template = template
+        self.text = text
+        self.personal_keys = sorted(personal_keys)
+
+        marker = f"mailvar{secrets.token_hex(6)}x"
+        # un marqueur en début de lien peut avoir été mis en majuscule par `html_to_text`
+        self.marker_regex = re.compile(
+            f"{marker}(\\d+)('|&#x27;|&#39;){marker}", re.IGNORECASE
+        )
+        self.rendered = None
+        self.filtered = False
+
+        if personal_bindings_are_substitutable(
+            template, set(self.personal_keys), bindings
+        ):
+            self.filtered = personal_bindings_are_filtered(
+                template, set(self.personal_keys), bindings
+            )
+            self.rendered = self.render(
+                {
+                    **bindings,
+                    **{
+                        key: f"{marker}{i}'{marker}"
+                        for i, key in enumerate(self.personal_keys)
+                    },
+                }
+            )
+
+    def render(self, context):
+        if self.text:
+            context = {k: conditional_html_to_text(v) for k, v in context.items()}
+        return self.template.render(context=context)
+
+    def substitute(self, rendered, context, text=None):
+        """Remplace dans un texte déjà rendu les marqueurs par les valeurs du contexte"""
+        if text is None:
+            text = self.text
+
+        def format_value(match):
+            key = self.personal_keys[int(match.group(1))]
+            if key not in context:
+                return ""
+            if text:
+                return str(conditional_html_to_text(context[key]))
+            if match.group(2) != "'":
+                return str(conditional_escape(context[key]))
+            return str(context[key])
+
+        return self.marker_regex.sub(format_value, rendered)
+
+    def render_for(self, context):
+        if self.rendered is None or (
+            self.filtered
+            and any(
+                FILTERED_VALUE_REGEX.search(str(context[key]))
+                for key in self.personal_keys
+                if key in context
+            )
+        ):
+            return self.render(context)
+        return self.substitute(self.rendered, context)
 
 
 def send_template_email(
@@ -167,29 +446,74 @@ def send_template_email(
     reply_to=None,
     attachments=None,
 ):
+    """Envoie un email rendu à partir d'un gabarit Django qui étend `email_template`
+
+    Le sujet, la version texte et la version HTML sont rendus une seule fois pour
+    l'ensemble des destinataires lorsque c'est possible (cf. `PersonalizedTemplate`).
+    """
     template = get_template(template_name)
+    shared_context = basic_information(None)
+
+    if bindings is None:
+        bindings = {}
+
+    personal_keys = get_personal_keys(bindings)
+    shared_bindings = {
+        **get_context_from_bindings(None, "", bindings),
+        **shared_context,
+    }
+    parts = [
+        (
+            layout,
+            PersonalizedTemplate(
+                template, {**shared_bindings, "email_template": layout}, personal_keys
+            ),
+        )
+        for layout in get_email_layouts()
+    ]
 
     if connection is None:
         connection = get_connection(backend)
 
     with connection:
-        for recipient in recipients:
-            if getattr(recipient, "role", None) and not recipient.role.is_active:
-                continue
-
-            context = get_context_from_bindings(None, recipient, bindings)
-            subject, text, html = render_email_template(template, context)
-
-            send_message(
-                from_email=from_email,
-                recipient=recipient,
-                subject=subject,
-                text=text,
-                html=html,
-                reply_to=reply_to,
-                attachments=attachments,
-                connection=connection,
-            )
+        for batch in grouper(recipients, SEND_BATCH_SIZE):
+            batch = list(batch)
+            connection_params = get_recipients_connection_params(batch)
+            messages = []
+
+            for recipient in batch:
+                if not is_active_recipient(recipient):
+                    continue
+
+                context = get_context_from_bindings(
+                    None,
+                    recipient,
+                    bindings,
+                    connection_params=connection_params.get(
+                        getattr(recipient, "pk", None)
+                    ),
+                )
+                context.update(shared_context)
+                subject, text, html = (
+                    part.render_for({**context, "email_template": layout})
+                    for layout, part in parts
+                )
+
+                messages.append(
+                    make_message(
+                        from_email=from_email,
+                        recipient=recipient,
+                        subject=subject.strip(),
+                        text=text.strip(),
+                        html=html,
+                        reply_to=reply_to,
+                        attachments=attachments,
+                        connection=connection,
+                    )
+                )
+
+            if messages:
+                send_messages(connection, messages, template_name)
 
 
 def send_mosaico_email(
@@ -205,6 +529,9 @@ def send_mosaico_email(
 ):
     """Send an email from a Mosaico template
 
+    The templates are rendered only once for all recipients whenever possible, and the
+    messages are sent by batches of `SEND_BATCH_SIZE` through the same connection.
+
     :param code: the code identifying the Mosaico template
     :param subject: the subject line of the email
     :param from_email: the address from which the email is to be sent
@@ -212,8 +539,6 @@ def send_mosaico_email(
     :param bindings: a dictionary of replacements variables and their target values in the Mosaico template
     :param connection: an optional email server connection to use to send the emails
     :param backend: if no connection is given, an optional mail backend to use to send the emails
-    :param fail_silently: whether any error should be raised, or just be ignored; by default it will raise
-    :param gen_connection_params_function: a function that takes a recipient and generates connection params
     """
 
     if hasattr(recipients, "as_email_recipients"):
@@ -232,43 +557,78 @@ def send_mosaico_email(
     if connection is None:
         connection = get_connection(backend)
 
-    html_template = loader.get_template(f"mail_templates/{code}.html")
+    personal_keys = get_personal_keys(bindings)
+    shared_bindings = get_context_from_bindings(code, "", bindings)
+
+    html_template = PersonalizedTemplate(
+        loader.get_template(f"mail_templates/{code}.html"),
+        shared_bindings,
+        personal_keys,
+    )
     try:
-        text_template = loader.get_template(f"mail_templates/{code}.txt")
+        text_template = PersonalizedTemplate(
+            loader.get_template(f"mail_templates/{code}.txt"),
+            shared_bindings,
+            personal_keys,
+            text=True,
+        )
     except TemplateDoesNotExist:
         text_template = None
 
+    plain_text = None
+    if text_template is None and html_template.rendered is not None:
+        plain_text = generate_plain_text(html_template.rendered)
+
     with connection:
-        for recipient in recipients:
-            # recipient can be either a Person or an email address
-            if getattr(recipient, "role", None) and not recipient.role.is_active:
-                continue
-
-            context = get_context_from_bindings(code, recipient, bindings)
-            html_message = html_template.render(context=context)
-            text_message = (
-                text_template.render(
-                    context={k: conditional_html_to_text(v) for k, v in context.items()}
+        for batch in grouper(recipients, SEND_BATCH_SIZE):
+            batch = list(batch)
+            connection_params = get_recipients_connection_params(batch)
+            messages = []
+
+            for recipient in batch:
+                # recipient can be either a Person or an email address
+                if not is_active_recipient(recipient):
+                    continue
+
+                context = get_context_from_bindings(
+                    code,
+                    recipient,
+                    bindings,
+                    connection_params=connection_params.get(
+                        getattr(recipient, "pk", None)
+                    ),
+                )
+                html_message = html_template.render_for(context)
+
+                if text_template is not None:
+                    text_message = text_template.render_for(context)
+                elif plain_text is not None:
+                    text_message = html_template.substitute(
+                        plain_text, context, text=True
+                    )
+                else:
+                    text_message = generate_plain_text(html_message)
+
+                if hasattr(recipient, "email"):
+                    recipient_email = recipient.email
+                else:
+                    recipient_email = recipient
+
+                messages.append(
+                    make_message(
+                        from_email=from_email,
+                        recipient=recipient_email,
+                        subject=subject,
+                        text=text_message,
+                        html=html_message,
+                        reply_to=reply_to,
+                        connection=connection,
+                        attachments=attachments,
+                    )
                 )
-                if text_template
-                else generate_plain_text(html_message)
-            )
 
-            if hasattr(recipient, "email"):
-                recipient_email = recipient.email
-            else:
-                recipient_email = recipient
-
-            send_message(
-                from_email=from_email,
-                recipient=recipient_email,
-                subject=subject,
-                text=text_message,
-                html=html_message,
-                reply_to=reply_to,
-                connection=connection,
-                attachments=attachments,
-            )
+            if messages:
+                send_messages(connection, messages, code)
 
 
 def fetch_mosaico_template(url):
@@ -0,0 +1,78 @@
+from django.contrib.postgres.search import SearchVectorField
+from django.db.models import F, Func
+
+from agir.events.models import Event
+from agir.groups.models import SupportGroup
+from agir.lib.commands import BaseCommand
+from agir.lib.utils import grouper
+
+# fonctions SQL de calcul des vecteurs de recherche, également utilisées par les triggers
+# (cf. migrations events 0035_event_search_vector et groups 0019_supportgroup_search_vector)
+SEARCH_VECTOR_FUNCTIONS = {
+    Event: (
+        "get_event_tsvector",
+        (
+            "name",
+            "location_name",
+            "location_city",
+            "location_zip",
+            "description",
+            "report_content",
+        ),
+    ),
+    SupportGroup: (
+        "get_supportgroup_tsvector",
+        ("name", "location_city", "location_zip", "description"),
+    ),
+}
+
+
+class Command(BaseCommand):
+    help = "Calcule les vecteurs de recherche des événements et des groupes par lots"
+
+    def add_arguments(self, parser):
+        super().add_arguments(parser)
+        parser.add_argument(
+            "-a",
+            "--all",
+            dest="recompute_all",
+            action="store_true",
+            default=False,
+            help="Recalculer aussi les vecteurs déjà remplis",
+        )
+        parser.add_argument(
+            "-b",
+            "--batch-size",
+            dest="batch_size",
+            type=int,
+            default=1000,
+            help="Nombre de lignes mises à jour par requête",
+        )
+
+    def handle(self, *args, recompute_all, batch_size, **options):
+        for model, (function, fields) in SEARCH_VECTOR_FUNCTIONS.items():
+            queryset = model.objects.all()
+            if not recompute_all:
+                queryset = queryset.filter(search_vector__isnull=True)
+
+            pks = list(queryset.values_list("pk", flat=True))
+            self.info(f"{model._meta.verbose_name_plural} : {len(pks)} à mettre à jour")
+            self.init_tqdm(total=len(pks))
+
+            search_vector = Func(
+                *(F(field) for field in fields),
+                function=function,
+                output_field=SearchVectorField(),
+            )
+            for batch in grouper(pks, batch_size):
+                batch = list(batch)
+                if not self.dry_run:
+                    model.objects.filter(pk__in=batch).update(
+                        search_vector=search_vector
+                    )
+                self.tqdm.update(len(batch))
+
+            self.tqdm.close()
+            self.success(
+                f"{model._meta.verbose_name_plural} : vecteurs de recherche à jour"
+            )
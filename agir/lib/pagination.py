@@ -3,7 +3,7 @@
 from django.core.paginator import Paginator
 from django.utils.functional import cached_property
 from django.utils.translation import gettext_lazy as _
-from rest_framework.pagination import PageNumberPagination
+from rest_framework.pagination import CursorPagination, PageNumberPagination
 from rest_framework.response import Response
 
 
@@ -21,6 +21,18 @@ class APIPageNumberPagination(PageNumberPagination):
     django_paginator_class = CachedCountPaginator
 
 
+class APICursorPagination(CursorPagination):
+    """Pagination par curseur, sans décompte du nombre total de résultats
+
+    Chaque page est obtenue à partir de la position du dernier élément de la page
+    précédente, ce qui permet de parcourir de longues listes en utilisant un index.
+    """
+
+    page_size = 20
+    page_size_query_param = "page_size"
+    max_page_size = 100
+
+
 class LegacyPaginator(PageNumberPagination):
     """
     A legacy paginator that mocks the one from Eve Python
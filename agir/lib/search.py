@@ -12,25 +12,33 @@
 # https://github.com/etianen/django-watson/blob/2226de139b6e177bfbe2824b1749478dbcce3318/watson/backends.py#L186
 
 
-def escape_query(text, re_escape_chars):
+def escape_query(text, re_escape_chars, weights=""):
     """
     normalizes the query text to a format that can be consumed
     by the backend database
+
+    if weights are given (e.g. "AB"), only the lexemes with these weights will match
     """
     text = force_str(text)
     text = re_escape_chars.sub(" ", text)  # Replace harmful characters with space.
     words = text.split()
-    query = " & ".join("$${0}$$".format(word) for word in words)
-    if query:
-        # utiliser le dernier mot seulement comme un préfixe
-        query = f"{query}:*"
+    if not words:
+        return ""
+
+    # utiliser le dernier mot seulement comme un préfixe
+    query = " & ".join(
+        [f"$${word}$$:{weights}" if weights else f"$${word}$$" for word in words[:-1]]
+        + [f"$${words[-1]}$$:*{weights}"]
+    )
 
     return query
 
 
 class PrefixSearchQuery(SearchQuery):
-    def __init__(self, value, output_field=None, *, config=None, invert=False):
-        value = escape_query(value, RE_POSTGRES_ESCAPE_CHARS)
+    def __init__(
+        self, value, output_field=None, *, config=None, invert=False, weights=""
+    ):
+        value = escape_query(value, RE_POSTGRES_ESCAPE_CHARS, weights=weights)
         super().__init__(
             value, output_field, config=config, invert=invert, search_type="raw"
         )
@@ -7,13 +7,12 @@
 from rest_framework.serializers import BaseSerializer
 from rest_framework_gis.fields import GeometryField
 
-from agir.carte.models import StaticMapImage
+from agir.carte.static_maps import get_static_map_url
 from agir.lib.geo import get_commune
 from .data import code_postal_vers_code_departement
 from .export import dict_to_camelcase, dict_to_snakecase
 from .geo import FRENCH_COUNTRY_CODES
 from .iban import to_iban, to_bic
-from .tasks import create_static_map_image_from_coordinates
 from .validators import (
     IBANSerializerValidator,
     BICSerializerValidator,
@@ -144,26 +143,7 @@ class LocationSerializer(SimpleLocationSerializer):
     staticMapUrl = serializers.SerializerMethodField(read_only=True)
 
     def get_staticMapUrl(self, obj):
-        if hasattr(obj, "static_map_image") and obj.static_map_image:
-            return StaticMapImage(image=obj.static_map_image).image.url
-
-        if obj.coordinates is None:
-            return ""
-
-        static_map_image = StaticMapImage.objects.filter(
-            center__dwithin=(
-                obj.coordinates,
-                StaticMapImage.UNIQUE_CENTER_MAX_DISTANCE,
-            ),
-        ).first()
-
-        if static_map_image is None:
-            create_static_map_image_from_coordinates.delay(
-                [obj.coordinates[0], obj.coordinates[1]]
-            )
-            return ""
-
-        return static_map_image.image.url
+        return get_static_map_url(obj)
 
 
 class RelatedLabelField(serializers.SlugRelatedField):
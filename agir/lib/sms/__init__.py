@@ -1,4 +1,8 @@
 import logging
+import time
+from collections import namedtuple
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from threading import Lock
 
 from django.conf import settings
 from phonenumbers import number_type, PhoneNumberType
@@ -10,6 +14,7 @@
     to_phone_number,
     SMSException,
 )
+from agir.lib.token_bucket import TokenBucket
 from agir.lib.utils import grouper
 
 logger = logging.getLogger(__name__)
@@ -85,20 +90,95 @@ def send_sms(message, phone_number, force=False, at=None, sender=None):
         raise e
 
 
-def send_bulk_sms(message, phone_numbers, at=None, sender=None):
-    sent = set()
-    not_sent = set()
+ChunkReport = namedtuple("ChunkReport", ["sent", "invalid", "duration"])
+
+
+def get_provider_token_bucket():
+    """Renvoie le TokenBucket limitant le nombre de destinataires par seconde du fournisseur
+
+    Le compteur est stocké dans Redis : la limite est partagée entre tous les processus.
+    """
+    return TokenBucket(
+        f"SMSProvider{settings.SMS_PROVIDER}",
+        SMS_PROVIDER.RATE_LIMIT_MAX,
+        SMS_PROVIDER.RATE_LIMIT_INTERVAL,
+    )
+
+
+def _wait_for_tokens(bucket, amount):
+    while not bucket.has_tokens("bulk", amount):
+        time.sleep(min(amount * bucket.interval, 1))
+
+
+def send_bulk_sms(
+    message,
+    phone_numbers,
+    at=None,
+    sender=None,
+    checkpoint=None,
+    on_chunk_sent=None,
+    max_workers=None,
+):
+    """Envoie un SMS à une liste de numéros, par lots envoyés en parallèle
+
+    Le nombre de lots envoyés simultanément et le débit sont limités selon le fournisseur.
+
+    :param checkpoint: fichier dans lequel les numéros de chaque lot sont inscrits juste avant
+        son envoi ; il permet de reprendre un envoi interrompu sans envoyer deux fois un SMS
+    :param on_chunk_sent: fonction appelée avec un `ChunkReport` après l'envoi de chaque lot
+    :param max_workers: nombre maximal de lots envoyés simultanément
+    :return: les ensembles des numéros auxquels le SMS a été envoyé et des numéros invalides
+    """
+    if max_workers is None:
+        max_workers = SMS_PROVIDER.MAX_WORKERS
+
+    bucket = get_provider_token_bucket()
+    checkpoint_lock = Lock()
+
+    def send_chunk(recipients):
+        _wait_for_tokens(bucket, len(recipients))
+
+        if checkpoint is not None:
+            with checkpoint_lock:
+                checkpoint.write("".join(f"{r.as_e164}\n" for r in recipients))
+                checkpoint.flush()
 
-    for numbers in grouper(phone_numbers, SMS_PROVIDER.BULK_GROUP_SIZE):
-        recipients = [to_phone_number(number) for number in numbers]
+        start = time.monotonic()
         try:
             valid, invalid = SMS_PROVIDER.send_sms(
                 message, recipients, at=at, sender=sender
             )
-            sent.update(valid)
-            not_sent.update(invalid)
         except SMSSendException as e:
             logger.exception(str(e))
-            not_sent.update(recipients)
+            valid, invalid = [], recipients
+
+        return ChunkReport(valid, invalid, time.monotonic() - start)
+
+    sent = set()
+    not_sent = set()
+
+    def collect(futures):
+        for future in futures:
+            report = future.result()
+            sent.update(report.sent)
+            not_sent.update(report.invalid)
+            logger.debug(
+                f"Lot de {len(report.sent) + len(report.invalid)} SMS envoyé en {report.duration:.2f}s"
+            )
+            if on_chunk_sent is not None:
+                on_chunk_sent(report)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        pending = set()
+        for numbers in grouper(phone_numbers, SMS_PROVIDER.BULK_GROUP_SIZE):
+            recipients = [to_phone_number(number) for number in numbers]
+            pending.add(executor.submit(send_chunk, recipients))
+
+            # borne le nombre de lots préparés en avance
+            if len(pending) >= 2 * max_workers:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                collect(done)
+
+        collect(wait(pending).done)
 
     return sent, not_sent
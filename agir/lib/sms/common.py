@@ -1,6 +1,9 @@
 from collections import namedtuple
+from functools import lru_cache
 from math import ceil
 
+from django.db.models import TextField
+from django.db.models.functions import Cast
 from phonenumber_field.phonenumber import PhoneNumber
 from phonenumbers import number_type, PhoneNumberType
 from unidecode import unidecode
@@ -178,29 +181,49 @@ def compute_sms_length_information(message):
     return MESSAGE_LENGTH(encoding, byte_length, messages)
 
 
+MOBILE_NUMBER_TYPES = (PhoneNumberType.MOBILE, PhoneNumberType.FIXED_LINE_OR_MOBILE)
+
+
+@lru_cache(maxsize=200000)
+def to_mobile_phone_number(raw_number):
+    """Renvoie le numéro de mobile correspondant à la chaîne, ou None s'il est invalide ou fixe
+
+    Le résultat est mis en cache : un même numéro n'est analysé qu'une seule fois.
+    """
+    try:
+        number = PhoneNumber.from_string(raw_number, region="FR")
+    except Exception:
+        return None
+
+    if number.is_valid() and number_type(number) in MOBILE_NUMBER_TYPES:
+        return number
+    return None
+
+
+def raw_phone_numbers(qs: PersonQueryset, *fields):
+    """Renvoie les numéros du queryset sous forme de chaînes, sans les analyser
+
+    Les champs supplémentaires indiqués sont renvoyés à la suite du numéro.
+    """
+    return (
+        qs.exclude(contact_phone="")
+        .annotate(raw_contact_phone=Cast("contact_phone", output_field=TextField()))
+        .values_list("raw_contact_phone", *fields)
+    )
+
+
 def numeros_mobiles(qs: PersonQueryset):
     """Renvoie les numéros de mobile des personnes du queryset.
 
     Déduplique les numéros (tout en gardant l'ordre) et élimine les numéros invalides
-    et les numéros fixes.
+    et les numéros fixes. Les numéros sont dédupliqués sous leur forme brute avant
+    d'être analysés, pour n'analyser chacun qu'une seule fois.
     """
-    numeros = [
-        PhoneNumber.from_string(n)
-        for n in qs.exclude(contact_phone="").values_list("contact_phone", flat=True)
-    ]
-
-    # caster en set ferait perdre l'ordre initial. Cette astuce permet de le garder.
-    # (NB. seen.add renvoie toujours None)
-    seen = set()
-    numeros_uniques = [n for n in numeros if n not in seen and not seen.add(n)]
-
-    return [
-        n
-        for n in numeros_uniques
-        if n.is_valid()
-        and number_type(n)
-        in (PhoneNumberType.MOBILE, PhoneNumberType.FIXED_LINE_OR_MOBILE)
-    ]
+    numeros_bruts = dict.fromkeys(raw for raw, in raw_phone_numbers(qs).iterator())
+    numeros = dict.fromkeys(to_mobile_phone_number(raw) for raw in numeros_bruts)
+    numeros.pop(None, None)
+
+    return list(numeros)
 
 
 class SMSException(Exception):
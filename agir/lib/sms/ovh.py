@@ -14,6 +14,10 @@
 )
 
 BULK_GROUP_SIZE = 50
+# envois simultanés et débit maximal (en destinataires) lors des envois en masse
+MAX_WORKERS = 4
+RATE_LIMIT_MAX = 500
+RATE_LIMIT_INTERVAL = 0.01
 
 
 def send_sms(message, recipients, *, at=None, sender=None, **_):
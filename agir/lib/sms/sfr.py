@@ -12,6 +12,11 @@
 #         :https://www.dmc.sfr-sh.fr/ApiWorkshop/doc/DMCv1_SFD064-API-Declenchement_a_distance.pdf
 
 BULK_GROUP_SIZE = 100
+# envois simultanés et débit maximal (en destinataires) lors des envois en masse ;
+# l'API SFR nécessite une requête par destinataire
+MAX_WORKERS = 4
+RATE_LIMIT_MAX = 100
+RATE_LIMIT_INTERVAL = 0.05
 
 
 class DMCBufferWSMedia(Enum):
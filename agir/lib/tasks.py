@@ -2,14 +2,15 @@
 from django.db import IntegrityError
 
 from agir.carte.models import StaticMapImage
+from agir.carte.static_maps import find_static_map_image, link_static_map_image
 from agir.people.models import Person
-from .celery import http_task
+from .celery import http_task, LANE_INTERACTIVE
 from .geo import geocode_element
 
 __all__ = ["geocode_person", "create_static_map_image_from_coordinates"]
 
 
-@http_task(post_save=True)
+@http_task(post_save=True, lane=LANE_INTERACTIVE)
 def geocode_person(person_pk):
     person = Person.objects.get(pk=person_pk)
     geocode_element(person)
@@ -19,19 +20,14 @@ def geocode_person(person_pk):
 @http_task()
 def create_static_map_image_from_coordinates(coordinates):
     center = Point(*coordinates)
-    try:
-        # Do not create image if one exists for a close enough point
-        StaticMapImage.objects.get(
-            center__dwithin=(center, StaticMapImage.UNIQUE_CENTER_MAX_DISTANCE)
-        )
-        return
-    except StaticMapImage.MultipleObjectsReturned:
-        return
-    except StaticMapImage.DoesNotExist:
-        pass
-
-    try:
-        StaticMapImage.objects.create_from_jawg(center=center)
-    except IntegrityError:
-        # Ignore error if image already exists for the given coordinates
-        pass
+    # Do not create image if one exists for a close enough point
+    static_map_image = find_static_map_image(center)
+
+    if static_map_image is None:
+        try:
+            static_map_image = StaticMapImage.objects.create_from_jawg(center=center)
+        except IntegrityError:
+            # Ignore error if image already exists for the given coordinates
+            return
+
+    link_static_map_image(static_map_image)
@@ -0,0 +1,75 @@
+from unittest.mock import patch
+
+from celery import Task
+from django.test import SimpleTestCase, override_settings
+
+from agir.api.celery import app
+from agir.api.redis import using_separate_redis_server
+from agir.lib.celery import (
+    LANE_BULK,
+    LANE_INTERACTIVE,
+    lane_options,
+    retriable_task,
+)
+
+calls = []
+
+
+@retriable_task(coalesce=30, coalesce_merge=("changed_data",))
+def coalesced_task(pk, changed_data):
+    calls.append((pk, changed_data))
+
+
+class LaneOptionsTestCase(SimpleTestCase):
+    @override_settings(TASK_LANES_ENABLED=False)
+    def test_lanes_use_default_queue_when_disabled(self):
+        self.assertEqual(lane_options(LANE_BULK), {"lane": LANE_BULK})
+
+    @override_settings(TASK_LANES_ENABLED=True)
+    def test_lanes_have_their_own_queue_and_priority(self):
+        interactive = lane_options(LANE_INTERACTIVE)
+        bulk = lane_options(LANE_BULK)
+
+        self.assertEqual(interactive["queue"], LANE_INTERACTIVE)
+        self.assertEqual(bulk["queue"], LANE_BULK)
+        self.assertLess(interactive["priority"], bulk["priority"])
+
+    def test_unknown_lane_is_rejected(self):
+        with self.assertRaises(ValueError):
+            lane_options("inconnue")
+
+
+@using_separate_redis_server
+class CoalescingTaskTestCase(SimpleTestCase):
+    def setUp(self):
+        calls.clear()
+        app.conf.task_always_eager = False
+
+    def tearDown(self):
+        app.conf.task_always_eager = True
+
+    @patch.object(Task, "apply_async")
+    def test_duplicate_calls_are_coalesced_and_merged(self, apply_async):
+        coalesced_task.delay(1, ["name"])
+        coalesced_task.delay(1, ["description", "name"])
+        coalesced_task.delay(2, ["name"])
+
+        self.assertEqual(apply_async.call_count, 2)
+        self.assertEqual(apply_async.call_args_list[0].kwargs["countdown"], 30)
+
+        coalesced_task(1, ["name"])
+        self.assertEqual(calls, [(1, ["name", "description"])])
+
+        # une fois la tâche exécutée, un nouvel appel est de nouveau programmé
+        coalesced_task.delay(1, ["name"])
+        self.assertEqual(apply_async.call_count, 3)
+
+    @patch.object(Task, "apply_async")
+    def test_failed_publish_does_not_block_later_calls(self, apply_async):
+        apply_async.side_effect = ConnectionError
+        with self.assertRaises(ConnectionError):
+            coalesced_task.delay(3, [])
+
+        apply_async.side_effect = None
+        coalesced_task.delay(3, [])
+        self.assertEqual(apply_async.call_count, 2)
@@ -0,0 +1,92 @@
+import json
+from unittest.mock import MagicMock, patch
+
+from django.test import SimpleTestCase
+
+from agir.api.redis import get_auth_redis_client, using_separate_redis_server
+from agir.lib import google_sheet
+from agir.lib.google_sheet import GoogleSheetId, flush_sheet_buffer
+
+SHEET_ID = GoogleSheetId("a" * 40, 0)
+
+
+def mock_sheet(headers, ids):
+    sheet = MagicMock()
+    sheet.row_values.return_value = headers
+    sheet.col_values.return_value = ["id", *ids]
+    sheet.col_count = len(headers)
+    sheet.row_count = len(ids) + 1
+    return sheet
+
+
+@using_separate_redis_server
+class BufferedSheetWriterTestCase(SimpleTestCase):
+    def push_rows(self, *rows):
+        get_auth_redis_client().rpush(
+            google_sheet._buffer_key(SHEET_ID),
+            *(json.dumps({"values": row, "id_column": "id"}) for row in rows),
+        )
+
+    def test_rows_are_written_in_one_batch(self):
+        sheet = mock_sheet(["id", "nom"], [1])
+        self.push_rows(
+            {"id": 1, "nom": "Anne"},
+            {"id": 2, "nom": "Bruno"},
+            {"id": 3, "nom": "Chloé", "ville": "Lyon"},
+            {"id": 2, "nom": "Bruno M."},
+        )
+
+        with patch("agir.lib.google_sheet.open_sheet", return_value=sheet):
+            flush_sheet_buffer(SHEET_ID.sid, SHEET_ID.gid)
+
+        sheet.update.assert_called_once_with("C1:C1", [["ville"]])
+        sheet.batch_update.assert_called_once()
+        self.assertEqual(
+            sheet.batch_update.call_args[0][0],
+            [{"range": "A2:C2", "values": [[1, "Anne", ""]]}],
+        )
+        sheet.append_rows.assert_called_once()
+        self.assertEqual(
+            sheet.append_rows.call_args[0][0],
+            [[2, "Bruno M.", ""], [3, "Chloé", "Lyon"]],
+        )
+        self.assertEqual(
+            get_auth_redis_client().llen(google_sheet._buffer_key(SHEET_ID)), 0
+        )
+
+    def test_headers_are_read_again_on_each_flush(self):
+        sheet = mock_sheet(["id", "nom"], [1])
+        self.push_rows({"id": 2, "nom": "Bruno"})
+        with patch("agir.lib.google_sheet.open_sheet", return_value=sheet):
+            flush_sheet_buffer(SHEET_ID.sid, SHEET_ID.gid)
+
+        # une colonne a été ajoutée à la main dans la feuille entre deux écritures
+        sheet = mock_sheet(["id", "nom", "ville"], [1, 2])
+        self.push_rows({"id": 3, "nom": "Chloé", "commentaire": "ok"})
+        with patch("agir.lib.google_sheet.open_sheet", return_value=sheet):
+            flush_sheet_buffer(SHEET_ID.sid, SHEET_ID.gid)
+
+        sheet.row_values.assert_called_once_with(1)
+        sheet.update.assert_called_once_with("D1:D1", [["commentaire"]])
+        self.assertEqual(sheet.append_rows.call_args[0][0], [[3, "Chloé", "", "ok"]])
+
+    def test_large_backlog_triggers_full_resync(self):
+        resync = MagicMock()
+        get_auth_redis_client().set(
+            google_sheet._resync_key(SHEET_ID),
+            json.dumps({"task": "resync", "args": [], "kwargs": {}}),
+        )
+        self.push_rows(
+            *({"id": i} for i in range(google_sheet.SHEET_BUFFER_MAX_ROWS + 1))
+        )
+
+        with patch("agir.lib.google_sheet.open_sheet") as open_sheet, patch(
+            "agir.lib.google_sheet.signature", return_value=resync
+        ):
+            flush_sheet_buffer(SHEET_ID.sid, SHEET_ID.gid)
+
+        open_sheet.assert_not_called()
+        resync.delay.assert_called_once()
+        self.assertEqual(
+            get_auth_redis_client().llen(google_sheet._buffer_key(SHEET_ID)), 0
+        )
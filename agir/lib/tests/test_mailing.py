@@ -0,0 +1,118 @@
+from django.core import mail
+from django.template import engines
+from django.test import TestCase
+
+from agir.lib.mailing import (
+    PersonalizedTemplate,
+    get_email_layouts,
+    personal_bindings_are_substitutable,
+    send_mosaico_email,
+)
+from agir.lib.utils import AutoLoginUrl
+from agir.people.models import Person
+
+
+def from_string(source):
+    return engines["django"].from_string(source)
+
+
+class PersonalizedTemplateTestCase(TestCase):
+    def test_only_plain_variables_are_substitutable(self):
+        keys = {"EMAIL", "GREETINGS"}
+
+        for source in [
+            "{% if TITLE %}{{ TITLE|upper }}{% endif %}{{ EMAIL }}",
+            "{{ GREETINGS|safe }}",
+            "{% autoescape off %}{{ EMAIL }}{% endautoescape %}",
+        ]:
+            with self.subTest(source=source):
+                self.assertTrue(
+                    personal_bindings_are_substitutable(from_string(source), keys)
+                )
+        for source in [
+            "{{ EMAIL|upper }}",
+            "{{ EMAIL.domain }}",
+            "{% if GREETINGS %}{{ GREETINGS }}{% endif %}",
+            "{% include template_name %}",
+        ]:
+            with self.subTest(source=source):
+                self.assertFalse(
+                    personal_bindings_are_substitutable(from_string(source), keys)
+                )
+
+    def test_substitution_escapes_values_like_rendering(self):
+        template = from_string("<p>{{ GREETINGS }} — {{ TITLE }}</p>")
+        context = {"GREETINGS": "Cher <Jean> & co", "TITLE": "Titre"}
+
+        personalized = PersonalizedTemplate(template, context, {"GREETINGS"})
+        self.assertIsNotNone(personalized.rendered)
+        self.assertEqual(personalized.render_for(context), template.render(context))
+
+        text = PersonalizedTemplate(template, context, {"GREETINGS"}, text=True)
+        self.assertIn("Cher <Jean> & co", text.render_for(context))
+
+    def test_email_layouts_are_rendered_once(self):
+        template = from_string(
+            "{% extends email_template %}"
+            "{% block subject %}{{ greetings }} — {{ title }}{% endblock %}"
+            "{% block html_content %}"
+            '<p>{{ greetings|safe }} <a href="{{ link }}">{{ title }}</a></p>'
+            "{% endblock %}"
+        )
+        keys = {"greetings", "EMAIL", "link"}
+        bindings = {"title": "Titre <b> & co", "preferences_link": "/preferences/"}
+
+        for layout in get_email_layouts():
+            with self.subTest(layout=layout):
+                personalized = PersonalizedTemplate(
+                    template, {**bindings, "email_template": layout}, keys
+                )
+                self.assertIsNotNone(personalized.rendered)
+
+                for greetings, email in [
+                    ("Chère Anne d'Arc,", "anne@agir.local"),
+                    ("Cher <Jean> & co,", "jean@agir.local"),
+                ]:
+                    context = {
+                        **bindings,
+                        "email_template": layout,
+                        "greetings": greetings,
+                        "EMAIL": email,
+                        "link": f"https://agir.local/?code=1&email={email}",
+                    }
+                    self.assertEqual(
+                        personalized.render_for(context), template.render(context)
+                    )
+
+
+class SendMosaicoEmailTestCase(TestCase):
+    def setUp(self):
+        self.people = [
+            Person.objects.create_person(
+                f"personne{i}@agir.local", first_name=f"Prénom{i}", create_role=True
+            )
+            for i in range(3)
+        ]
+
+    def test_each_recipient_gets_personal_bindings(self):
+        send_mosaico_email(
+            code="GROUP_CHANGED",
+            subject="Sujet",
+            from_email="noreply@agir.local",
+            recipients=self.people + ["externe@agir.local"],
+            bindings={
+                "GROUP_NAME": "Groupe",
+                "GROUP_CHANGES": "<ul><li>nom</li></ul>",
+                "GROUP_LINK": AutoLoginUrl("https://agir.local/groupe/"),
+            },
+        )
+
+        self.assertEqual(len(mail.outbox), 4)
+        for person, message in zip(self.people, mail.outbox):
+            self.assertEqual(message.to, [person.email])
+            self.assertIn(person.email, message.body)
+            self.assertIn(f"p={person.pk}", message.body)
+            self.assertIn(person.email, message.alternatives[0][0])
+
+        self.assertEqual(mail.outbox[3].to, ["externe@agir.local"])
+        self.assertNotIn("code=", mail.outbox[3].body)
@@ -1,13 +1,18 @@
+from io import StringIO
+
 from django.test import TestCase
 from math import ceil
 
 import agir.lib.sms.ovh
+from agir.api.redis import using_separate_redis_server
 from agir.lib.sms.common import (
     compute_sms_length_information,
     MESSAGE_LENGTH,
     SMSSendException,
+    numeros_mobiles,
 )
 from agir.lib.sms import send_bulk_sms
+from agir.people.models import Person
 
 
 def _mock_send_sms(message, recipients, at=None, sender=None):
@@ -49,6 +54,22 @@ def test_can_identify_character_set(self):
         self.assertEqual(res, MESSAGE_LENGTH("UCS-2", 57 * 2, 1))
 
 
+class MobileNumbersTestCase(TestCase):
+    def test_numbers_are_deduplicated_and_filtered(self):
+        for i, phone in enumerate(
+            ["+33678956454", "+33678956454", "+33145789865", "", "+33678451252"]
+        ):
+            Person.objects.create_person(
+                email=f"personne{i}@example.com", contact_phone=phone
+            )
+
+        self.assertEqual(
+            [str(n) for n in numeros_mobiles(Person.objects.order_by("created"))],
+            ["+33678956454", "+33678451252"],
+        )
+
+
+@using_separate_redis_server
 class SMSSendingTestCase(TestCase):
     def setUp(self) -> None:
         from agir.lib import sms
@@ -74,3 +95,22 @@ def test_can_send_mass_sms(self):
 
         self.assertEqual(sent, {"+33678956454", "+33678451252"})
         self.assertEqual(invalid, {"+33754986598"})
+
+    def test_can_checkpoint_and_report_chunks(self):
+        checkpoint = StringIO()
+        reports = []
+
+        sent, invalid = send_bulk_sms(
+            "mon message",
+            ["+33678956454", "+33754986598", "+33678451252"],
+            checkpoint=checkpoint,
+            on_chunk_sent=reports.append,
+        )
+
+        self.assertEqual(
+            set(checkpoint.getvalue().splitlines()),
+            {"+33678956454", "+33754986598", "+33678451252"},
+        )
+        self.assertEqual(len(reports), 2)
+        self.assertEqual(sum(len(r.sent) for r in reports), len(sent))
+        self.assertTrue(all(r.duration >= 0 for r in reports))
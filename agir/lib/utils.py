@@ -61,6 +61,12 @@ def generate_token_params(person):
     return {"p": person.pk, "code": connection_token_generator.make_token(user=person)}
 
 
+def generate_bulk_token_params(people):
+    """Génère les paramètres de connexion de plusieurs personnes, indexés par identifiant"""
+    tokens = connection_token_generator.make_tokens(people)
+    return {pk: {"p": pk, "code": code} for pk, code in tokens.items()}
+
+
 def resize_and_autorotate(file_name, variations, storage=default_storage):
     """
     Function to be used as value for StdImageField render_variations argument.
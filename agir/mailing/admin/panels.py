@@ -135,7 +135,10 @@ class SegmentAdmin(CenterOnFranceMixin, OSMGeoAdmin):
             },
         ),
         ("Combiner des segments", {"fields": ("add_segments", "exclude_segments")}),
-        ("Abonnés", {"fields": ("subscribers_count",)}),
+        (
+            "Abonnés",
+            {"fields": ("is_materialized", "materialized_at", "subscribers_count")},
+        ),
     )
     map_template = "custom_fields/french_area_widget.html"
     autocomplete_fields = (
@@ -153,7 +156,7 @@ class SegmentAdmin(CenterOnFranceMixin, OSMGeoAdmin):
         "forms",
         "polls",
     )
-    readonly_fields = ("subscribers_count",)
+    readonly_fields = ("materialized_at", "subscribers_count")
     ordering = ("name",)
     search_fields = ("name",)
     list_filter = (
@@ -163,6 +166,7 @@ class SegmentAdmin(CenterOnFranceMixin, OSMGeoAdmin):
         list_filters.ExcludedTagListFilter,
         list_filters.QualificationListFilter,
         ("elu", admin.EmptyFieldListFilter),
+        "is_materialized",
     )
     list_display = (
         "name",
@@ -0,0 +1,34 @@
+from django.core.management import BaseCommand
+from django.utils.timezone import now
+
+from agir.mailing.models import Segment
+
+
+class Command(BaseCommand):
+    help = (
+        "Recalcule entièrement la liste des abonné·es des segments matérialisés, "
+        "au cas où la mise à jour incrémentale aurait manqué des modifications"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "segment_ids",
+            metavar="ID",
+            type=int,
+            nargs="*",
+            help="Limiter le recalcul à ces segments",
+        )
+
+    def handle(self, *args, segment_ids, **options):
+        segments = Segment.objects.filter(is_materialized=True)
+        if segment_ids:
+            segments = segments.filter(pk__in=segment_ids)
+
+        for segment in segments:
+            self.stdout.write(f"{segment.pk} — {segment.name}…", ending="")
+            start = now()
+            segment.rebuild_materialized_subscribers()
+            self.stdout.write(
+                f" {segment.get_subscribers_count()} abonné·es "
+                f"({(now() - start).total_seconds():.1f}s)"
+            )
@@ -0,0 +1,74 @@
+# Generated by Django 3.2.19 on 2026-10-18 10:12
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("people", "0031_remove_unused_options_for_newsletters"),
+        ("mailing", "0053_remove_unused_options_for_newsletters"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="segment",
+            name="is_materialized",
+            field=models.BooleanField(
+                default=False,
+                help_text="La liste des abonné·es est stockée et mise à jour au fil des modifications (adhésions aux groupes, participations aux événements, paiements, tags, mandats), et entièrement recalculée régulièrement. Recommandé pour les segments très utilisés (notifications, suggestions d'événements).",
+                verbose_name="Matérialiser le segment",
+            ),
+        ),
+        migrations.AddField(
+            model_name="segment",
+            name="materialized_at",
+            field=models.DateTimeField(
+                blank=True,
+                editable=False,
+                null=True,
+                verbose_name="Dernier calcul complet de la liste des abonné·es",
+            ),
+        ),
+        migrations.CreateModel(
+            name="MaterializedSegmentSubscriber",
+            fields=[
+                (
+                    "id",
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "person",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="+",
+                        to="people.person",
+                    ),
+                ),
+                (
+                    "segment",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="materialized_subscribers",
+                        related_query_name="materialized_subscriber",
+                        to="mailing.segment",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Abonné·e d'un segment matérialisé",
+                "verbose_name_plural": "Abonné·es d'un segment matérialisé",
+            },
+        ),
+        migrations.AddConstraint(
+            model_name="materializedsegmentsubscriber",
+            constraint=models.UniqueConstraint(
+                fields=("segment", "person"), name="unique_materialized_subscriber"
+            ),
+        ),
+    ]
@@ -2,8 +2,9 @@
 
 from django.contrib.gis.db.models import MultiPolygonField
 from django.contrib.postgres.fields import DateRangeField
-from django.db import models
-from django.db.models import Q, Sum
+from django.core.cache import cache
+from django.db import models, connection, transaction
+from django.db.models import Q, Sum, Exists, Case, When, Value, BooleanField
 from django.utils.timezone import now
 from django_countries.fields import CountryField
 from nuntius.models import BaseSegment, CampaignSentStatusType
@@ -20,7 +21,7 @@
     PersonQualification,
 )
 
-__all__ = ["Segment"]
+__all__ = ["Segment", "MaterializedSegmentSubscriber"]
 
 
 DATE_HELP_TEXT = (
@@ -37,7 +38,75 @@ def default_newsletters():
     return Person.MAIN_NEWSLETTER_CHOICES
 
 
+SUBSCRIBER_CACHE_TIMEOUT = 5 * 60
+
+
+def subscriber_cache_key(segment_pk, person_pk):
+    return f"mailing_segment_subscriber_{segment_pk}_{person_pk}"
+
+
+class SegmentQuerySet(models.QuerySet):
+    def subscribed_segment_ids(self, person, segments=None):
+        """Renvoie l'ensemble des identifiants des segments auxquels la personne est abonnée
+
+        Les segments à tester sont ceux du queryset, ou ceux passés en argument. L'appartenance
+        à tous les segments absents du cache est évaluée en une seule requête SQL, et le résultat
+        est conservé en cache quelques minutes.
+        """
+        if segments is None:
+            segments = self
+
+        if isinstance(segments, models.QuerySet):
+            segments = segments.prefetch_related("add_segments", "exclude_segments")
+        segments = {segment.pk: segment for segment in segments}
+
+        if not segments:
+            return set()
+
+        cache_keys = {
+            subscriber_cache_key(segment_pk, person.pk): segment_pk
+            for segment_pk in segments
+        }
+        cached = cache.get_many(cache_keys.keys())
+        results = {cache_keys[key]: value for key, value in cached.items()}
+
+        missing = [
+            segment
+            for segment_pk, segment in segments.items()
+            if segment_pk not in results
+        ]
+
+        if missing:
+            conditions = {
+                f"segment_{segment.pk}": Case(
+                    When(segment.get_subscriber_condition(person.pk), then=Value(True)),
+                    default=Value(False),
+                    output_field=BooleanField(),
+                )
+                for segment in missing
+            }
+            values = (
+                Person.objects.filter(pk=person.pk).values(**conditions).first() or {}
+            )
+            computed = {
+                segment.pk: values.get(f"segment_{segment.pk}", False)
+                for segment in missing
+            }
+            cache.set_many(
+                {
+                    subscriber_cache_key(segment_pk, person.pk): value
+                    for segment_pk, value in computed.items()
+                },
+                timeout=SUBSCRIBER_CACHE_TIMEOUT,
+            )
+            results.update(computed)
+
+        return {segment_pk for segment_pk, value in results.items() if value}
+
+
 class Segment(BaseSegment, models.Model):
+    objects = SegmentQuerySet.as_manager()
+
     GA_STATUS_NOT_MEMBER = "N"
     GA_STATUS_MEMBER = "m"
     GA_STATUS_MANAGER = "M"
@@ -349,6 +418,20 @@ class Segment(BaseSegment, models.Model):
         blank=True,
     )
 
+    is_materialized = models.BooleanField(
+        "Matérialiser le segment",
+        default=False,
+        help_text="La liste des abonné·es est stockée et mise à jour au fil des modifications (adhésions aux groupes, "
+        "participations aux événements, paiements, tags, mandats), et entièrement recalculée régulièrement. "
+        "Recommandé pour les segments très utilisés (notifications, suggestions d'événements).",
+    )
+    materialized_at = models.DateTimeField(
+        "Dernier calcul complet de la liste des abonné·es",
+        null=True,
+        blank=True,
+        editable=False,
+    )
+
     def apply_event_filters(self, query):
         filters = {}
         excludes = {}
@@ -702,27 +785,42 @@ def _get_own_filters_queryset(self):
 
         return qs.filter(self.get_subscribers_q()).filter(emails___bounced=False)
 
-    def get_subscribers_queryset(self):
+    @property
+    def uses_materialized_subscribers(self):
+        return self.is_materialized and self.materialized_at is not None
+
+    def get_subscribers_queryset(self, live=False):
+        if not live and self.uses_materialized_subscribers:
+            return Person.objects.filter(
+                pk__in=self.materialized_subscribers.values("person_id")
+            ).order_by("id")
+
         qs = self._get_own_filters_queryset()
 
         for s in self.add_segments.all():
             qs = Person.objects.filter(
-                Q(pk__in=qs) | Q(pk__in=s.get_subscribers_queryset())
+                Q(pk__in=qs) | Q(pk__in=s.get_subscribers_queryset(live=live))
             )
 
         for s in self.exclude_segments.all():
-            qs = qs.exclude(pk__in=s.get_subscribers_queryset())
+            qs = qs.exclude(pk__in=s.get_subscribers_queryset(live=live))
 
         return qs.order_by("id", "emails___order").distinct("id")
 
     def get_subscribers_count(self):
+        if self.uses_materialized_subscribers:
+            return self.materialized_subscribers.count()
+
         return (
             self._get_own_filters_queryset().order_by("id").distinct("id").count()
             + sum(s.get_subscribers_count() for s in self.add_segments.all())
             - sum(s.get_subscribers_count() for s in self.exclude_segments.all())
         )
 
-    def is_subscriber(self, person):
+    def is_subscriber(self, person, live=False):
+        if not live and self.uses_materialized_subscribers:
+            return self.materialized_subscribers.filter(person_id=person.pk).exists()
+
         qs = Person.objects.filter(pk=person.pk)
         if self.elu:
             qs = qs.annotate_elus()
@@ -732,20 +830,115 @@ def is_subscriber(self, person):
 
         if not is_subscriber:
             for segment in self.add_segments.all():
-                if segment.is_subscriber(person):
+                if segment.is_subscriber(person, live=live):
                     is_subscriber = True
                     break
 
         if is_subscriber:
             for segment in self.exclude_segments.all():
-                if segment.is_subscriber(person):
+                if segment.is_subscriber(person, live=live):
                     is_subscriber = False
                     break
 
         return is_subscriber
 
+    def get_subscriber_condition(self, person_pk):
+        """Renvoie une condition SQL vraie si la personne est abonnée au segment
+
+        Permet d'évaluer l'appartenance à plusieurs segments dans une même requête
+        (cf. ``SegmentQuerySet.subscribed_segment_ids``).
+        """
+        if self.uses_materialized_subscribers:
+            return Q(Exists(self.materialized_subscribers.filter(person_id=person_pk)))
+
+        qs = Person.objects.filter(pk=person_pk)
+        if self.elu:
+            qs = qs.annotate_elus()
+
+        condition = Q(Exists(qs.filter(self.get_subscribers_q())))
+
+        for segment in self.add_segments.all():
+            condition |= segment.get_subscriber_condition(person_pk)
+
+        for segment in self.exclude_segments.all():
+            condition &= ~segment.get_subscriber_condition(person_pk)
+
+        return condition
+
+    def rebuild_materialized_subscribers(self):
+        """Recalcule entièrement la liste stockée des abonné·es du segment
+
+        L'insertion se fait directement en base (``INSERT ... SELECT``) pour éviter
+        de faire transiter la liste des identifiants par Python.
+        """
+        sql, params = (
+            self.get_subscribers_queryset(live=True)
+            .values_list("id", flat=True)
+            .query.sql_with_params()
+        )
+
+        with transaction.atomic():
+            # verrouille le segment pour éviter deux recalculs concurrents
+            Segment.objects.select_for_update().filter(pk=self.pk).first()
+            self.materialized_subscribers.all().delete()
+
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    f"INSERT INTO {MaterializedSegmentSubscriber._meta.db_table} (segment_id, person_id) "
+                    f"SELECT %s, subscribers.id FROM ({sql}) AS subscribers",
+                    (self.pk, *params),
+                )
+
+            self.materialized_at = now()
+            Segment.objects.filter(pk=self.pk).update(
+                materialized_at=self.materialized_at
+            )
+
+    def clear_materialized_subscribers(self):
+        self.materialized_subscribers.all().delete()
+        self.materialized_at = None
+        Segment.objects.filter(pk=self.pk).update(materialized_at=None)
+
+    def update_materialized_subscriber(self, person):
+        """Met à jour l'appartenance d'une seule personne à la liste stockée des abonné·es
+
+        La requête est celle du recalcul complet (`rebuild_materialized_subscribers`), qui
+        exclut comme les envois les personnes dont les adresses sont en erreur.
+        """
+        if self.get_subscribers_queryset(live=True).filter(pk=person.pk).exists():
+            MaterializedSegmentSubscriber.objects.get_or_create(
+                segment=self, person=person
+            )
+        else:
+            self.materialized_subscribers.filter(person_id=person.pk).delete()
+
+        cache.delete(subscriber_cache_key(self.pk, person.pk))
+
     get_subscribers_count.short_description = "Personnes"
     get_subscribers_count.help_text = "Estimation du nombre d'inscrits"
 
     def __str__(self):
         return self.name
+
+
+class MaterializedSegmentSubscriber(models.Model):
+    segment = models.ForeignKey(
+        Segment,
+        on_delete=models.CASCADE,
+        related_name="materialized_subscribers",
+        related_query_name="materialized_subscriber",
+    )
+    person = models.ForeignKey(
+        "people.Person",
+        on_delete=models.CASCADE,
+        related_name="+",
+    )
+
+    class Meta:
+        verbose_name = "Abonné·e d'un segment matérialisé"
+        verbose_name_plural = "Abonné·es d'un segment matérialisé"
+        constraints = (
+            models.UniqueConstraint(
+                fields=("segment", "person"), name="unique_materialized_subscriber"
+            ),
+        )
@@ -1,9 +1,23 @@
 import json
 import logging
+from functools import partial
 
 from anymail.signals import tracking
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete, m2m_changed
 from django.dispatch import receiver
 
+from agir.authentication.models import Role
+from agir.elus.models import types_elus
+from agir.events.models import RSVP
+from agir.groups.models import Membership
+from agir.mailing.models import Segment
+from agir.mailing.tasks import (
+    update_materialized_segments_for_person,
+    rebuild_materialized_segment,
+)
+from agir.payments.models import Payment
+from agir.people.models import Person, PersonEmail
 
 logger = logging.getLogger(__name__)
 
@@ -24,3 +38,92 @@ def log_anymail_tracking_events(sender, event, esp_name, **kwargs):
             {"esp_name": esp_name, **{f: getattr(event, f, None) for f in event_fields}}
         )
     )
+
+
+def schedule_materialized_segments_update(*person_ids):
+    person_ids = {person_id for person_id in person_ids if person_id is not None}
+    if not person_ids:
+        return
+
+    if not Segment.objects.filter(
+        is_materialized=True, materialized_at__isnull=False
+    ).exists():
+        return
+
+    for person_id in person_ids:
+        transaction.on_commit(
+            partial(update_materialized_segments_for_person.delay, str(person_id))
+        )
+
+
+def update_materialized_segments_for_instance(sender, instance, **kwargs):
+    schedule_materialized_segments_update(instance.person_id)
+
+
+for model in (Membership, RSVP, Payment, *types_elus.values()):
+    post_save.connect(
+        update_materialized_segments_for_instance,
+        sender=model,
+        dispatch_uid=f"update_materialized_segments_save_{model._meta.label_lower}",
+    )
+    post_delete.connect(
+        update_materialized_segments_for_instance,
+        sender=model,
+        dispatch_uid=f"update_materialized_segments_delete_{model._meta.label_lower}",
+    )
+
+
+@receiver(post_save, sender=Person, dispatch_uid="update_materialized_segments_person")
+def update_materialized_segments_on_person_save(sender, instance, raw, **kwargs):
+    # désinscriptions, changement de position, etc.
+    if not raw:
+        schedule_materialized_segments_update(instance.pk)
+
+
+@receiver(
+    post_save, sender=PersonEmail, dispatch_uid="update_materialized_segments_email"
+)
+@receiver(
+    post_delete,
+    sender=PersonEmail,
+    dispatch_uid="update_materialized_segments_email_delete",
+)
+def update_materialized_segments_on_email_change(sender, instance, **kwargs):
+    # les personnes dont toutes les adresses sont en erreur ne sont pas ciblées
+    if not kwargs.get("raw"):
+        schedule_materialized_segments_update(instance.person_id)
+
+
+@receiver(post_save, sender=Role, dispatch_uid="update_materialized_segments_role")
+def update_materialized_segments_on_role_save(sender, instance, raw, **kwargs):
+    if raw:
+        return
+    schedule_materialized_segments_update(
+        *Person.objects.filter(role_id=instance.pk).values_list("pk", flat=True)
+    )
+
+
+@receiver(
+    m2m_changed,
+    sender=Person.tags.through,
+    dispatch_uid="update_materialized_segments_person_tags",
+)
+def update_materialized_segments_for_tags(
+    sender, instance, action, reverse, pk_set, **kwargs
+):
+    if action not in ("post_add", "post_remove", "post_clear"):
+        return
+
+    if not reverse:
+        schedule_materialized_segments_update(instance.pk)
+    elif pk_set:
+        # la liste des personnes n'est pas connue pour un post_clear depuis le tag :
+        # le recalcul complet périodique s'en chargera
+        schedule_materialized_segments_update(*pk_set)
+
+
+@receiver(post_save, sender=Segment, dispatch_uid="rebuild_materialized_segment")
+def rebuild_materialized_segment_on_save(sender, instance, **kwargs):
+    if instance.is_materialized or instance.materialized_at is not None:
+        # on_commit permet d'attendre l'enregistrement des champs many-to-many dans l'admin
+        transaction.on_commit(partial(rebuild_materialized_segment.delay, instance.pk))
@@ -0,0 +1,28 @@
+from celery import shared_task
+
+from agir.lib.celery import post_save_task
+from agir.mailing.models import Segment
+from agir.people.models import Person
+
+
+@post_save_task()
+def update_materialized_segments_for_person(person_pk):
+    person = Person.objects.get(pk=person_pk)
+
+    for segment in Segment.objects.filter(
+        is_materialized=True, materialized_at__isnull=False
+    ):
+        segment.update_materialized_subscriber(person)
+
+
+@shared_task
+def rebuild_materialized_segment(segment_pk):
+    try:
+        segment = Segment.objects.get(pk=segment_pk)
+    except Segment.DoesNotExist:
+        return
+
+    if segment.is_materialized:
+        segment.rebuild_materialized_subscribers()
+    else:
+        segment.clear_materialized_subscribers()
@@ -1058,3 +1058,114 @@ def test_elu_status_segment(self):
             self.assertIn(person, subs)
         for person in excludes:
             self.assertNotIn(person, subs)
+
+
+class MaterializedSegmentTestCase(TestCase):
+    def setUp(self):
+        self.tag = PersonTag.objects.create(label="tag")
+        self.tagged_person = Person.objects.create_insoumise(
+            email=fake.email(), create_role=True
+        )
+        self.tagged_person.tags.add(self.tag)
+        self.untagged_person = Person.objects.create_insoumise(
+            email=fake.email(), create_role=True
+        )
+        self.segment = Segment.objects.create(newsletters=[], is_materialized=True)
+        self.segment.tags.add(self.tag)
+
+    def test_not_materialized_before_first_rebuild(self):
+        self.assertFalse(self.segment.uses_materialized_subscribers)
+        self.assertIn(self.tagged_person, self.segment.get_subscribers_queryset())
+        self.assertNotIn(self.untagged_person, self.segment.get_subscribers_queryset())
+
+    def test_rebuild_materialized_subscribers(self):
+        self.segment.rebuild_materialized_subscribers()
+
+        self.assertTrue(self.segment.uses_materialized_subscribers)
+        self.assertEqual(self.segment.get_subscribers_count(), 1)
+        self.assertTrue(self.segment.is_subscriber(self.tagged_person))
+        self.assertFalse(self.segment.is_subscriber(self.untagged_person))
+        self.assertQuerysetEqual(
+            self.segment.get_subscribers_queryset(), [self.tagged_person]
+        )
+
+    def test_update_materialized_subscriber(self):
+        self.segment.rebuild_materialized_subscribers()
+
+        self.untagged_person.tags.add(self.tag)
+        self.tagged_person.tags.remove(self.tag)
+        self.assertTrue(self.segment.is_subscriber(self.tagged_person))
+        self.assertFalse(self.segment.is_subscriber(self.untagged_person))
+
+        self.segment.update_materialized_subscriber(self.tagged_person)
+        self.segment.update_materialized_subscriber(self.untagged_person)
+        self.assertFalse(self.segment.is_subscriber(self.tagged_person))
+        self.assertTrue(self.segment.is_subscriber(self.untagged_person))
+
+    def test_update_materialized_subscriber_excludes_bounced_emails(self):
+        self.segment.rebuild_materialized_subscribers()
+
+        email = self.tagged_person.primary_email
+        email.bounced = True
+        email.save()
+
+        self.segment.update_materialized_subscriber(self.tagged_person)
+        self.assertFalse(self.segment.is_subscriber(self.tagged_person))
+        # la vérification directe (sondages, formulaires) ignore les adresses en erreur
+        self.assertTrue(self.segment.is_subscriber(self.tagged_person, live=True))
+
+        self.segment.rebuild_materialized_subscribers()
+        self.assertEqual(self.segment.get_subscribers_count(), 0)
+
+    def test_clear_materialized_subscribers(self):
+        self.segment.rebuild_materialized_subscribers()
+        self.segment.clear_materialized_subscribers()
+
+        self.assertFalse(self.segment.uses_materialized_subscribers)
+        self.assertFalse(self.segment.materialized_subscribers.exists())
+        self.assertTrue(self.segment.is_subscriber(self.tagged_person))
+
+
+class SubscribedSegmentIdsTestCase(TestCase):
+    def setUp(self):
+        self.tag = PersonTag.objects.create(label="tag")
+        self.person = Person.objects.create_insoumise(
+            email=fake.email(), create_role=True
+        )
+        self.person.tags.add(self.tag)
+
+        self.everyone = Segment.objects.create(newsletters=[])
+        self.tagged = Segment.objects.create(newsletters=[])
+        self.tagged.tags.add(self.tag)
+        self.other_tag = Segment.objects.create(newsletters=[])
+        self.other_tag.tags.add(PersonTag.objects.create(label="autre tag"))
+        self.combined = Segment.objects.create(newsletters=[])
+        self.combined.tags.add(self.tag)
+        self.combined.exclude_segments.add(self.everyone)
+
+    def test_subscribed_segment_ids_matches_is_subscriber(self):
+        segments = [self.everyone, self.tagged, self.other_tag, self.combined]
+
+        self.assertEqual(
+            Segment.objects.subscribed_segment_ids(self.person, segments),
+            {s.pk for s in segments if s.is_subscriber(self.person)},
+        )
+        self.assertEqual(
+            Segment.objects.subscribed_segment_ids(self.person, segments),
+            {self.everyone.pk, self.tagged.pk},
+        )
+
+    def test_subscribed_segment_ids_with_materialized_segment(self):
+        self.other_tag.is_materialized = True
+        self.other_tag.save()
+        self.other_tag.rebuild_materialized_subscribers()
+
+        self.assertEqual(
+            Segment.objects.filter(
+                pk__in=[self.tagged.pk, self.other_tag.pk]
+            ).subscribed_segment_ids(self.person),
+            {self.tagged.pk},
+        )
+
+    def test_empty_segment_list(self):
+        self.assertEqual(Segment.objects.subscribed_segment_ids(self.person, []), set())
@@ -8,13 +8,14 @@
     F,
     Exists,
     Q,
-    Max,
-    DateTimeField,
     Prefetch,
+    FilteredRelation,
 )
 from django.db.models.functions import Greatest, Coalesce
 
+from agir.api.redis import get_auth_redis_client
 from agir.groups.models import SupportGroup, Membership
+from agir.lib.utils import grouper
 from agir.msgs.models import (
     SupportGroupMessageRecipient,
     SupportGroupMessage,
@@ -51,7 +52,137 @@ def get_viewable_messages_ids(person):
     return list(set(message_ids))
 
 
+# les compteurs stockés sont recalculés au moins une fois par heure
+UNREAD_MESSAGE_COUNT_TIMEOUT = 3600
+
+# KEYS alterne compteur et version de chaque personne. N'incrémente que les compteurs
+# déjà présents : un compteur absent sera recalculé. La version est incrémentée dans
+# tous les cas pour qu'un recalcul en cours ne stocke pas une valeur périmée.
+INCREMENT_EXISTING_COUNTERS_SCRIPT = """
+for i = 1, #KEYS, 2 do
+  if redis.call('EXISTS', KEYS[i]) == 1 then
+    redis.call('INCRBY', KEYS[i], ARGV[1])
+  end
+  redis.call('INCR', KEYS[i + 1])
+  redis.call('EXPIRE', KEYS[i + 1], ARGV[2])
+end
+"""
+
+# ne stocke le compteur recalculé que si aucune modification n'a eu lieu depuis la
+# lecture de la version, c'est-à-dire pendant la lecture en base
+STORE_IF_VERSION_UNCHANGED_SCRIPT = """
+if (redis.call('GET', KEYS[2]) or '') == ARGV[1] then
+  redis.call('SET', KEYS[1], ARGV[2], 'EX', ARGV[3], 'NX')
+end
+"""
+
+
+def unread_message_count_key(person_id):
+    return f"UnreadMessageCount:{person_id}"
+
+
+def unread_message_count_version_key(person_id):
+    return f"UnreadMessageCountVersion:{person_id}"
+
+
 def get_unread_message_count(person):
+    """Renvoie le nombre de messages et commentaires non lus de la personne
+
+    Le compteur est lu dans Redis ; s'il est absent, il est recalculé à partir de la base.
+    Le résultat n'est stocké que si la version du compteur n'a pas changé pendant le
+    recalcul.
+    """
+    if not isinstance(person, Person):
+        return 0
+
+    client = get_auth_redis_client()
+    key = unread_message_count_key(person.id)
+    version_key = unread_message_count_version_key(person.id)
+    raw_value, version = client.mget(key, version_key)
+
+    if raw_value is not None:
+        return int(raw_value)
+
+    count = compute_unread_message_count(person)
+    store = client.register_script(STORE_IF_VERSION_UNCHANGED_SCRIPT)
+    store(
+        keys=[key, version_key],
+        args=[version or "", count, UNREAD_MESSAGE_COUNT_TIMEOUT],
+    )
+    return count
+
+
+def increment_unread_message_counts(person_ids, amount=1):
+    increment = get_auth_redis_client().register_script(
+        INCREMENT_EXISTING_COUNTERS_SCRIPT
+    )
+    for batch in grouper(person_ids, 1000):
+        increment(
+            keys=[
+                key
+                for pk in batch
+                for key in (
+                    unread_message_count_key(pk),
+                    unread_message_count_version_key(pk),
+                )
+            ],
+            args=[amount, UNREAD_MESSAGE_COUNT_TIMEOUT],
+        )
+
+
+def invalidate_unread_message_counts(person_ids):
+    client = get_auth_redis_client()
+    for batch in grouper(person_ids, 1000):
+        with client.pipeline() as pipe:
+            for pk in batch:
+                version_key = unread_message_count_version_key(pk)
+                pipe.incr(version_key)
+                pipe.expire(version_key, UNREAD_MESSAGE_COUNT_TIMEOUT)
+                pipe.delete(unread_message_count_key(pk))
+            pipe.execute()
+
+
+def get_message_viewer_ids(message):
+    """Renvoie les identifiants des personnes pouvant voir le message"""
+    return set(
+        Membership.objects.filter(
+            supportgroup_id=message.supportgroup_id,
+            membership_type__gte=message.required_membership_type,
+        ).values_list("person_id", flat=True)
+    ) | {message.author_id}
+
+
+def update_unread_message_counts_for_new_message(message):
+    if not SupportGroupMessage.objects.active().filter(pk=message.pk).exists():
+        return
+
+    viewer_ids = get_message_viewer_ids(message)
+    viewer_ids.discard(message.author_id)
+    increment_unread_message_counts(viewer_ids)
+    # le message de l'auteur lui-même n'est pas toujours compté comme lu : son
+    # compteur est simplement recalculé
+    invalidate_unread_message_counts([message.author_id])
+
+
+def update_unread_message_counts_for_new_comment(comment):
+    if not SupportGroupMessageComment.objects.active().filter(pk=comment.pk).exists():
+        return
+
+    message = comment.message
+    viewer_ids = get_message_viewer_ids(message)
+    viewer_ids.difference_update(
+        message.recipient_mutedlist.values_list("pk", flat=True)
+    )
+    viewer_ids.discard(comment.author_id)
+    increment_unread_message_counts(viewer_ids)
+
+
+def invalidate_unread_message_counts_for_message(message):
+    invalidate_unread_message_counts(get_message_viewer_ids(message))
+
+
+def compute_unread_message_count(person):
+    """Calcule à partir de la base le nombre de messages et commentaires non lus"""
     if not isinstance(person, Person):
         return 0
 
@@ -158,8 +289,23 @@ def get_message_unread_comment_count(person_pk, message_pk):
 
 
 def get_user_messages(person):
+    """Renvoie les messages visibles par la personne, du plus récemment actif au plus ancien
+
+    La visibilité est vérifiée par une seule jointure sur l'adhésion de la personne au
+    groupe du message, sans passer par la liste des identifiants des messages visibles.
+    """
     return (
-        SupportGroupMessage.objects.filter(id__in=get_viewable_messages_ids(person))
+        SupportGroupMessage.objects.active()
+        .annotate(
+            person_membership=FilteredRelation(
+                "supportgroup__memberships",
+                condition=Q(supportgroup__memberships__person_id=person.pk),
+            )
+        )
+        .filter(
+            Q(author_id=person.pk)
+            | Q(person_membership__membership_type__gte=F("required_membership_type"))
+        )
         .select_related("supportgroup", "author")
         .prefetch_related(
             Prefetch(
@@ -177,12 +323,7 @@ def get_user_messages(person):
         .annotate(
             is_unread=Case(
                 When(
-                    created__lt=Subquery(
-                        Membership.objects.filter(
-                            supportgroup_id=OuterRef("supportgroup_id"),
-                            person_id=person.pk,
-                        ).values("created")[:1]
-                    ),
+                    created__lt=F("person_membership__created"),
                     then=False,
                 ),
                 default=~Exists(
@@ -192,11 +333,5 @@ def get_user_messages(person):
                 ),
             )
         )
-        .annotate(
-            last_update=Greatest(
-                Max("comments__created"), "created", output_field=DateTimeField()
-            )
-        )
-        .distinct()
-        .order_by("-last_update", "-created")
+        .order_by("-last_activity", "-created")
     )
@@ -4,3 +4,7 @@
 class MessagesConfig(AppConfig):
     name = "agir.msgs"
     verbose_name = "Messagerie"
+
+    def ready(self):
+        # noinspection PyUnresolvedReferences
+        from . import signals
@@ -56,7 +56,7 @@ const MessagePage = ({ messagePk }) => {
   const {
     user,
     messages,
-    messageCount,
+    hasMoreMessages,
     loadMore,
     isLoadingInitialData,
     isLoadingMore,
@@ -179,7 +179,7 @@ const MessagePage = ({ messagePk }) => {
                 writeNewMessage={writeNewMessage}
                 onComment={writeNewComment}
                 lastItemRef={lastItemRef}
-                messageCount={messageCount}
+                hasMoreMessages={hasMoreMessages}
               />
             ) : (
               <EmptyMessagePage />
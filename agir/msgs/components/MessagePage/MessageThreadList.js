@@ -121,7 +121,7 @@ const DesktopThreadList = (props) => {
     writeNewMessage,
     notificationSettingLink,
     lastItemRef,
-    messageCount,
+    hasMoreMessages,
   } = props;
 
   const [scrollableRef, bottomRef] = useAutoScrollToBottom(
@@ -153,7 +153,7 @@ const DesktopThreadList = (props) => {
         onSelect={onSelect}
         writeNewMessage={writeNewMessage}
         lastItemRef={lastItemRef}
-        messageCount={messageCount}
+        hasMoreMessages={hasMoreMessages}
       />
       <PageFadeIn ready={selectedMessagePk && selectedMessage}>
         {!!selectedMessage && (
@@ -199,7 +199,7 @@ const MobileThreadList = (props) => {
     writeNewMessage,
     notificationSettingLink,
     lastItemRef,
-    messageCount,
+    hasMoreMessages,
   } = props;
 
   const [scrollableRef, bottomRef] = useAutoScrollToBottom(
@@ -222,7 +222,7 @@ const MobileThreadList = (props) => {
         onSelect={onSelect}
         writeNewMessage={writeNewMessage}
         lastItemRef={lastItemRef}
-        messageCount={messageCount}
+        hasMoreMessages={hasMoreMessages}
       />
       <Panel
         style={{
@@ -283,7 +283,7 @@ DesktopThreadList.propTypes =
     {
       isLoading: PropTypes.bool,
       messages: PropTypes.arrayOf(PropTypes.object),
-      messageCount: PropTypes.number,
+      hasMoreMessages: PropTypes.bool,
       selectedMessagePk: PropTypes.string,
       selectedMessage: PropTypes.object,
       user: PropTypes.shape({
@@ -118,7 +118,7 @@ const MessageThreadMenu = (props) => {
     onSelect,
     writeNewMessage,
     lastItemRef,
-    messageCount,
+    hasMoreMessages,
     ...rest
   } = props;
 
@@ -154,7 +154,7 @@ const MessageThreadMenu = (props) => {
           disabled={isLoading}
         />
       ))}
-      {messageCount !== messages.length && (
+      {hasMoreMessages && (
         <StyledLoader aria-hidden="true" loading block />
       )}
       <div ref={lastItemRef} />
@@ -165,7 +165,7 @@ const MessageThreadMenu = (props) => {
 MessageThreadMenu.propTypes = {
   isLoading: PropTypes.bool,
   messages: PropTypes.arrayOf(PropTypes.object),
-  messageCount: PropTypes.number,
+  hasMoreMessages: PropTypes.bool,
   selectedMessageId: PropTypes.string,
   notificationSettingLink: PropTypes.string,
   onSelect: PropTypes.func,
@@ -113,9 +113,15 @@ export const useMessageSWR = (messagePk) => {
     size,
     setSize,
   } = useSWRInfinite(
-    (index) =>
-      user &&
-      `/api/user/messages/?page=${index + 1}&page_size=${MESSAGES_PAGE_SIZE}`,
+    (index, previousPageData) => {
+      if (!user) {
+        return null;
+      }
+      if (index === 0) {
+        return `/api/user/messages/?page_size=${MESSAGES_PAGE_SIZE}`;
+      }
+      return previousPageData?.next || null;
+    },
     {
       revalidateIfStale: false,
       revalidateOnFocus: false,
@@ -159,12 +165,9 @@ export const useMessageSWR = (messagePk) => {
     isLoadingInitialData ||
     (size > 0 && data && typeof data[size - 1] === "undefined");
 
-  const messageCount = (data && data[data.length - 1]?.count) || 0;
-  const isEmpty = messageCount === 0;
-  const isReachingEnd =
-    isEmpty ||
-    messages.length === messageCount ||
-    (data && data[data.length - 1]?.results?.length < MESSAGES_PAGE_SIZE);
+  const isEmpty = !!data && messages.length === 0;
+  const isReachingEnd = isEmpty || (!!data && !data[data.length - 1]?.next);
+  const hasMoreMessages = !isLoadingInitialData && !isReachingEnd;
   const isRefreshing = isValidatingMessages && data && data.length === size;
 
   const loadMore = useCallback(() => setSize(size + 1), [setSize, size]);
@@ -212,7 +215,7 @@ export const useMessageSWR = (messagePk) => {
   return {
     user,
     messages,
-    messageCount,
+    hasMoreMessages,
     errorMessages,
     isLoadingInitialData,
     isLoadingMore,
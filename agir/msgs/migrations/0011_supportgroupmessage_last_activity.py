@@ -0,0 +1,52 @@
+# Generated by Django 3.2.19 on 2023-07-13 10:20
+
+from django.db import migrations, models
+import django.utils.timezone
+
+SET_LAST_ACTIVITY = """
+UPDATE msgs_supportgroupmessage AS message
+SET last_activity = GREATEST(message.created, comments.last_created)
+FROM (
+  SELECT message_id, MAX(created) AS last_created
+  FROM msgs_supportgroupmessagecomment
+  GROUP BY message_id
+) AS comments
+WHERE comments.message_id = message.id;
+"""
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("msgs", "0010_supportgroupmessage_readonly"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="supportgroupmessage",
+            name="last_activity",
+            field=models.DateTimeField(
+                default=django.utils.timezone.now,
+                editable=False,
+                verbose_name="Dernière activité",
+            ),
+        ),
+        migrations.RunSQL(
+            sql="UPDATE msgs_supportgroupmessage SET last_activity = created;",
+            reverse_sql=migrations.RunSQL.noop,
+        ),
+        migrations.RunSQL(sql=SET_LAST_ACTIVITY, reverse_sql=migrations.RunSQL.noop),
+        migrations.AddIndex(
+            model_name="supportgroupmessage",
+            index=models.Index(
+                fields=["supportgroup", "-last_activity"],
+                name="msgs_message_last_activity",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="supportgroupmessage",
+            index=models.Index(
+                fields=["author", "-last_activity"],
+                name="msgs_author_last_activity",
+            ),
+        ),
+    ]
@@ -2,6 +2,7 @@
 from django.contrib.contenttypes.fields import GenericForeignKey, GenericRelation
 from django.contrib.contenttypes.models import ContentType
 from django.db import models
+from django.utils import timezone
 from stdimage import StdImageField
 
 from agir.groups.models import Membership
@@ -110,6 +111,10 @@ class SupportGroupMessage(AbstractMessage):
         default=False,
         help_text="Le message s'affichera mais il ne sera pas possible d'y répondre",
     )
+    # date du message ou de son dernier commentaire, mise à jour à chaque commentaire
+    last_activity = models.DateTimeField(
+        "Dernière activité", default=timezone.now, editable=False
+    )
 
     def __str__(self):
         return f"id: {self.pk} | {self.author} --> '{self.text}' | required_membership_type: {str(self.required_membership_type)} | supportgroup: {self.supportgroup}"
@@ -117,6 +122,16 @@ def __str__(self):
     class Meta:
         verbose_name = "Message de groupe"
         verbose_name_plural = "Messages de groupe"
+        indexes = [
+            models.Index(
+                fields=["supportgroup", "-last_activity"],
+                name="msgs_message_last_activity",
+            ),
+            models.Index(
+                fields=["author", "-last_activity"],
+                name="msgs_author_last_activity",
+            ),
+        ]
 
 
 @reversion.register()
@@ -1,7 +1,7 @@
 import rules
 
 from agir.msgs.models import SupportGroupMessage
-from agir.groups.models import Membership
+from agir.groups.membership_index import has_membership
 from ..groups.rules import is_at_least_manager_for_group, is_group_member
 
 
@@ -23,11 +23,9 @@ def can_view_message(role, message=None):
         return True
 
     # Is member and has the right membership_type
-    return Membership.objects.filter(
-        supportgroup_id=message.supportgroup_id,
-        person_id=role.person.id,
-        membership_type__gte=message.required_membership_type,
-    ).exists()
+    return has_membership(
+        role.person.id, [message.supportgroup_id], message.required_membership_type
+    )
 
 
 @rules.predicate
@@ -270,7 +270,7 @@ class UserMessagesSerializer(BaseMessageSerializer):
         read_only=True, method_name="get_is_author"
     )
     lastUpdate = serializers.DateTimeField(
-        source="last_update", default=None, read_only=True
+        source="last_activity", default=None, read_only=True
     )
     isUnread = serializers.BooleanField(
         source="is_unread", default=False, read_only=True
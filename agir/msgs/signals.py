@@ -0,0 +1,103 @@
+from functools import partial
+
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete, m2m_changed
+from django.dispatch import receiver
+
+from agir.groups.models import Membership
+from .actions import (
+    get_message_viewer_ids,
+    invalidate_unread_message_counts,
+    invalidate_unread_message_counts_for_message,
+    update_unread_message_counts_for_new_comment,
+    update_unread_message_counts_for_new_message,
+)
+from .models import (
+    SupportGroupMessage,
+    SupportGroupMessageComment,
+    SupportGroupMessageRecipient,
+)
+
+
+@receiver(
+    post_save, sender=SupportGroupMessage, dispatch_uid="unread_counts_on_message"
+)
+def signal_update_unread_counts_on_message(sender, instance, created, **kwargs):
+    if created:
+        transaction.on_commit(
+            partial(update_unread_message_counts_for_new_message, instance)
+        )
+    else:
+        # suppression, verrouillage, changement de destinataires...
+        transaction.on_commit(
+            partial(invalidate_unread_message_counts_for_message, instance)
+        )
+
+
+@receiver(
+    post_save,
+    sender=SupportGroupMessageComment,
+    dispatch_uid="unread_counts_on_comment",
+)
+def signal_update_message_on_comment(sender, instance, created, **kwargs):
+    if created:
+        SupportGroupMessage.objects.filter(
+            pk=instance.message_id, last_activity__lt=instance.created
+        ).update(last_activity=instance.created)
+        transaction.on_commit(
+            partial(update_unread_message_counts_for_new_comment, instance)
+        )
+    else:
+        transaction.on_commit(
+            partial(invalidate_unread_message_counts_for_message, instance.message)
+        )
+
+
+@receiver(
+    post_delete,
+    sender=SupportGroupMessage,
+    dispatch_uid="unread_counts_on_message_delete",
+)
+def signal_update_unread_counts_on_message_delete(sender, instance, **kwargs):
+    transaction.on_commit(
+        partial(invalidate_unread_message_counts_for_message, instance)
+    )
+
+
+@receiver(
+    post_save,
+    sender=SupportGroupMessageRecipient,
+    dispatch_uid="unread_counts_on_message_read",
+)
+@receiver(post_save, sender=Membership, dispatch_uid="unread_counts_on_membership")
+@receiver(
+    post_delete, sender=Membership, dispatch_uid="unread_counts_on_membership_delete"
+)
+def signal_invalidate_unread_counts_for_person(sender, instance, **kwargs):
+    person_id = (
+        instance.recipient_id
+        if isinstance(instance, SupportGroupMessageRecipient)
+        else instance.person_id
+    )
+    transaction.on_commit(partial(invalidate_unread_message_counts, [person_id]))
+
+
+@receiver(
+    m2m_changed,
+    sender=SupportGroupMessage.recipient_mutedlist.through,
+    dispatch_uid="unread_counts_on_mute",
+)
+def signal_invalidate_unread_counts_on_mute(
+    sender, instance, action, reverse, pk_set, **kwargs
+):
+    if action not in ("post_add", "post_remove", "post_clear"):
+        return
+
+    if reverse:
+        person_ids = [instance.pk]
+    elif pk_set:
+        person_ids = list(pk_set)
+    else:
+        person_ids = list(get_message_viewer_ids(instance))
+
+    transaction.on_commit(partial(invalidate_unread_message_counts, person_ids))
@@ -1,11 +1,16 @@
+from unittest.mock import patch
+
 from agir.activity.models import Activity
+from agir.api.redis import using_separate_redis_server
 from rest_framework.test import APITestCase
 
 from agir.groups.models import SupportGroup, Membership
 from agir.msgs.actions import (
     update_recipient_message,
+    compute_unread_message_count,
     get_unread_message_count,
     get_message_unread_comment_count,
+    invalidate_unread_message_counts,
 )
 from agir.msgs.models import (
     UserReport,
@@ -313,6 +318,32 @@ def test_authenticated_user_can_get_messages_unread_comment_counts(self):
         self.assertEqual(results[0]["unreadCommentCount"], 1)
         self.assertFalse(results[0]["isUnread"])
 
+    def test_messages_are_ordered_by_last_activity_with_cursor(self):
+        SupportGroupMessage.objects.all().delete()
+        older_message = SupportGroupMessage.objects.create(
+            author=self.user, supportgroup=self.group, text="Older"
+        )
+        newer_message = SupportGroupMessage.objects.create(
+            author=self.user, supportgroup=self.group, text="Newer"
+        )
+        SupportGroupMessageComment.objects.create(
+            author=self.user_manager, message=older_message, text="Comment"
+        )
+
+        self.client.force_login(self.user.role)
+        response = self.client.get("/api/user/messages/?page_size=1")
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn("count", response.data)
+        self.assertEqual(len(response.data["results"]), 1)
+        self.assertEqual(response.data["results"][0]["id"], str(older_message.id))
+        self.assertIsNotNone(response.data["next"])
+
+        response = self.client.get(response.data["next"])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data["results"]), 1)
+        self.assertEqual(response.data["results"][0]["id"], str(newer_message.id))
+        self.assertIsNone(response.data["next"])
+
     def test_cannot_get_messages_and_comments_from_inactive_people(self):
         message = SupportGroupMessage.objects.create(
             author=self.user_referent, supportgroup=self.group, text="Referent message"
@@ -471,26 +502,26 @@ def test_group_messages_before_membership_creation_are_not_counted(self):
         SupportGroupMessageComment.objects.create(
             author=writer, message=message, text="1.1"
         )
-        unread_message_count = get_unread_message_count(new_member.pk)
+        unread_message_count = compute_unread_message_count(new_member.pk)
         self.assertEqual(unread_message_count, 0)
 
         # The person joins the group
         Membership.objects.create(supportgroup=supportgroup, person=new_member)
-        unread_message_count = get_unread_message_count(new_member.pk)
+        unread_message_count = compute_unread_message_count(new_member.pk)
         self.assertEqual(unread_message_count, 0)
 
         # A second comment for the message is created after the person has joined the group
         SupportGroupMessageComment.objects.create(
             author=writer, message=message, text="1.2"
         )
-        unread_message_count = get_unread_message_count(new_member)
+        unread_message_count = compute_unread_message_count(new_member)
         self.assertEqual(unread_message_count, 1)
 
         # A second message is created after the person has joined the group
         SupportGroupMessage.objects.create(
             author=writer, supportgroup=supportgroup, text="2"
         )
-        unread_message_count = get_unread_message_count(new_member)
+        unread_message_count = compute_unread_message_count(new_member)
         self.assertEqual(unread_message_count, 2)
 
     def test_user_muted_message_dont_get_notification_neither_email(self):
@@ -526,14 +557,14 @@ def test_user_muted_message_dont_get_notification_neither_email(self):
 
     def test_get_unread_message_count(self):
         # No messages
-        unread_message_count = get_unread_message_count(self.reader)
+        unread_message_count = compute_unread_message_count(self.reader)
         self.assertEqual(unread_message_count, 0, msg="No messages")
 
         # One unread message
         message = SupportGroupMessage.objects.create(
             author=self.writer, supportgroup=self.supportgroup, text="1"
         )
-        unread_message_count = get_unread_message_count(self.reader)
+        unread_message_count = compute_unread_message_count(self.reader)
         self.assertEqual(unread_message_count, 1, msg="One unread message")
 
         # One private message
@@ -543,17 +574,17 @@ def test_get_unread_message_count(self):
             text="Private message",
             required_membership_type=Membership.MEMBERSHIP_TYPE_REFERENT,
         )
-        unread_message_count = get_unread_message_count(self.reader)
+        unread_message_count = compute_unread_message_count(self.reader)
         self.assertEqual(unread_message_count, 1, msg="One private message")
 
-        unread_message_count = get_unread_message_count(self.user_referent)
+        unread_message_count = compute_unread_message_count(self.user_referent)
         self.assertEqual(unread_message_count, 2, msg="One private message")
 
         # One unread message with one unread comment
         SupportGroupMessageComment.objects.create(
             author=self.writer, message=message, text="1.1"
         )
-        unread_message_count = get_unread_message_count(self.reader)
+        unread_message_count = compute_unread_message_count(self.reader)
         self.assertEqual(
             unread_message_count, 2, msg="One unread message with one unread comment"
         )
@@ -562,7 +593,7 @@ def test_get_unread_message_count(self):
         SupportGroupMessageComment.objects.create(
             author=self.reader, message=message, text="1.2"
         )
-        unread_message_count = get_unread_message_count(self.reader)
+        unread_message_count = compute_unread_message_count(self.reader)
         self.assertEqual(
             unread_message_count,
             2,
@@ -574,7 +605,7 @@ def test_get_unread_message_count(self):
         SupportGroupMessageComment.objects.update(
             author=self.writer, message=message, text="1.1", deleted=True
         )
-        unread_message_count = get_unread_message_count(self.reader)
+        unread_message_count = compute_unread_message_count(self.reader)
         self.assertEqual(
             unread_message_count,
             1,
@@ -585,7 +616,7 @@ def test_get_unread_message_count(self):
         SupportGroupMessageRecipient.objects.create(
             recipient=self.reader, message=message
         )
-        unread_message_count = get_unread_message_count(self.reader)
+        unread_message_count = compute_unread_message_count(self.reader)
         self.assertEqual(
             unread_message_count, 0, msg="One read message with no unread comments"
         )
@@ -594,7 +625,7 @@ def test_get_unread_message_count(self):
         SupportGroupMessageComment.objects.create(
             author=self.writer, message=message, text="1.3"
         )
-        unread_message_count = get_unread_message_count(self.reader)
+        unread_message_count = compute_unread_message_count(self.reader)
         self.assertEqual(
             unread_message_count, 1, msg="One read message with one unread comment"
         )
@@ -603,7 +634,7 @@ def test_get_unread_message_count(self):
         SupportGroupMessage.objects.create(
             author=self.writer, supportgroup=self.supportgroup, text="2"
         )
-        unread_message_count = get_unread_message_count(self.reader)
+        unread_message_count = compute_unread_message_count(self.reader)
         self.assertEqual(
             unread_message_count,
             2,
@@ -616,7 +647,7 @@ def test_get_unread_message_count(self):
         SupportGroupMessage.objects.create(
             author=self.writer, supportgroup=self.supportgroup, text="3", deleted=True
         )
-        unread_message_count = get_unread_message_count(self.reader)
+        unread_message_count = compute_unread_message_count(self.reader)
         self.assertEqual(
             unread_message_count,
             2,
@@ -631,7 +662,7 @@ def test_get_unread_message_count(self):
         SupportGroupMessage.objects.create(
             author=self.reader, supportgroup=self.supportgroup, text="3", deleted=True
         )
-        unread_message_count = get_unread_message_count(self.reader)
+        unread_message_count = compute_unread_message_count(self.reader)
         self.assertEqual(
             unread_message_count,
             2,
@@ -642,9 +673,101 @@ def test_get_unread_message_count(self):
         # Author of message goes inactive
         self.writer.role.is_active = False
         self.writer.role.save()
-        unread_message_count = get_unread_message_count(self.reader)
+        unread_message_count = compute_unread_message_count(self.reader)
         self.assertEqual(unread_message_count, 0, msg="Author of message goes inactive")
 
+    @using_separate_redis_server
+    def test_stored_unread_message_count_is_recomputed_after_invalidation(self):
+        message = SupportGroupMessage.objects.create(
+            author=self.writer, supportgroup=self.supportgroup, text="1"
+        )
+        comment = SupportGroupMessageComment.objects.create(
+            author=self.writer, message=message, text="1.1"
+        )
+        self.assertEqual(get_unread_message_count(self.reader), 2)
+
+        # les mises à jour en masse ne déclenchent aucun signal : le compteur stocké
+        # reste inchangé jusqu'à son invalidation
+        SupportGroupMessageComment.objects.filter(pk=comment.pk).update(deleted=True)
+        with self.assertNumQueries(0):
+            self.assertEqual(get_unread_message_count(self.reader), 2)
+
+        invalidate_unread_message_counts([self.reader.pk])
+        self.assertEqual(get_unread_message_count(self.reader), 1)
+
+        # l'auteur du message devient inactif
+        self.writer.role.is_active = False
+        self.writer.role.save()
+        self.assertEqual(get_unread_message_count(self.reader), 1)
+        invalidate_unread_message_counts([self.reader.pk])
+        self.assertEqual(get_unread_message_count(self.reader), 0)
+
+    @using_separate_redis_server
+    def test_count_computed_before_an_invalidation_is_not_stored(self):
+        SupportGroupMessage.objects.create(
+            author=self.writer, supportgroup=self.supportgroup, text="1"
+        )
+
+        def compute_then_invalidate(person):
+            count = compute_unread_message_count(person)
+            # une lecture est enregistrée pendant le recalcul
+            invalidate_unread_message_counts([person.pk])
+            return count
+
+        with patch(
+            "agir.msgs.actions.compute_unread_message_count",
+            side_effect=compute_then_invalidate,
+        ) as compute:
+            self.assertEqual(get_unread_message_count(self.reader), 1)
+            self.assertEqual(get_unread_message_count(self.reader), 1)
+
+        self.assertEqual(compute.call_count, 2)
+
+
+@using_separate_redis_server
+class StoredUnreadMessageCountTestCase(APITestCase):
+    def setUp(self):
+        self.supportgroup = SupportGroup.objects.create()
+        self.reader = Person.objects.create(email="reader@agir.msgs", create_role=True)
+        self.writer = Person.objects.create(email="writer@agir.msgs", create_role=True)
+        Membership.objects.create(supportgroup=self.supportgroup, person=self.reader)
+        Membership.objects.create(supportgroup=self.supportgroup, person=self.writer)
+
+    def test_counter_follows_new_messages_and_readings(self):
+        self.assertEqual(get_unread_message_count(self.reader), 0)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            message = SupportGroupMessage.objects.create(
+                author=self.writer, supportgroup=self.supportgroup, text="1"
+            )
+        with self.captureOnCommitCallbacks(execute=True):
+            SupportGroupMessageComment.objects.create(
+                author=self.writer, message=message, text="1.1"
+            )
+
+        with self.assertNumQueries(0):
+            self.assertEqual(get_unread_message_count(self.reader), 2)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            update_recipient_message(message, self.reader)
+
+        self.assertEqual(get_unread_message_count(self.reader), 0)
+
+    def test_muted_message_comments_are_not_counted(self):
+        message = SupportGroupMessage.objects.create(
+            author=self.writer, supportgroup=self.supportgroup, text="1"
+        )
+        update_recipient_message(message, self.reader)
+        message.recipient_mutedlist.add(self.reader)
+        self.assertEqual(get_unread_message_count(self.reader), 0)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            SupportGroupMessageComment.objects.create(
+                author=self.writer, message=message, text="1.1"
+            )
+
+        self.assertEqual(get_unread_message_count(self.reader), 0)
+
 
 class GetUnreadMessageCommentCountActionTestCase(APITestCase):
     def setUp(self):
@@ -1,3 +1,5 @@
+from functools import partial
+
 from django.db import transaction
 from django.utils import timezone
 from rest_framework.decorators import api_view, permission_classes
@@ -5,8 +7,12 @@
 from rest_framework.response import Response
 
 from agir.groups.models import Membership, SupportGroup
-from agir.lib.pagination import APIPageNumberPagination
-from agir.msgs.actions import get_unread_message_count, get_viewable_messages_ids
+from agir.lib.pagination import APICursorPagination
+from agir.msgs.actions import (
+    get_unread_message_count,
+    get_viewable_messages_ids,
+    invalidate_unread_message_counts,
+)
 from agir.msgs.models import (
     SupportGroupMessage,
     SupportGroupMessageRecipient,
@@ -75,14 +81,22 @@ def get(self, request, *args, **kwargs):
                 message_id__in=old_message_ids, recipient=person
             ).update(modified=timezone.now())
 
+            transaction.on_commit(
+                partial(invalidate_unread_message_counts, [person.id])
+            )
+
             return Response(True)
 
 
+class UserMessagesPagination(APICursorPagination):
+    ordering = ("-last_activity", "-created")
+
+
 class UserMessagesAPIView(ListAPIView):
     serializer_class = UserMessagesSerializer
     queryset = SupportGroupMessage.objects.active()
     permission_classes = (IsPersonPermission,)
-    pagination_class = APIPageNumberPagination
+    pagination_class = UserMessagesPagination
 
     def get_queryset(self):
         person = self.request.user.person
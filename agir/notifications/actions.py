@@ -2,6 +2,41 @@
 from agir.notifications.models import Subscription
 
 
+def get_group_recipient_ids(
+    supportgroup_id,
+    activity_type=None,
+    subscription_type=None,
+    membership_type=None,
+    exclude=None,
+):
+    """Renvoie le queryset des identifiants des destinataires d'une notification de groupe
+
+    Sans type d'abonnement, ce sont tous les membres du groupe ; sinon, uniquement ceux
+    abonnés à ce type d'activité pour ce groupe. Le queryset peut être utilisé directement
+    comme sous-requête (par exemple avec `Activity.objects.bulk_fanout`).
+
+    :param membership_type: limiter aux membres ayant au moins ce statut dans le groupe
+    :param exclude: identifiants (ou queryset d'identifiants) des personnes à exclure
+    """
+    if subscription_type is None:
+        qs = Membership.objects.filter(supportgroup_id=supportgroup_id)
+        if membership_type is not None:
+            qs = qs.filter(membership_type__gte=membership_type)
+    else:
+        qs = Subscription.objects.filter(
+            membership__supportgroup_id=supportgroup_id,
+            type=subscription_type,
+            activity_type=activity_type,
+        )
+        if membership_type is not None:
+            qs = qs.filter(membership__membership_type__gte=membership_type)
+
+    if exclude is not None:
+        qs = qs.exclude(person_id__in=exclude)
+
+    return qs.values_list("person_id", flat=True).distinct()
+
+
 def get_default_person_email_subscriptions(person):
     return [
         Subscription(
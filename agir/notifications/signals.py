@@ -5,7 +5,7 @@
 
 from push_notifications.models import APNSDevice, GCMDevice, WebPushDevice
 
-from agir.activity.models import Activity
+from agir.activity.models import Activity, bulk_post_create
 from agir.groups.models import Membership
 from agir.notifications.actions import (
     create_default_group_membership_subscriptions,
@@ -13,10 +13,7 @@
     create_default_person_email_subscriptions,
 )
 from agir.notifications.models import Subscription
-from agir.notifications.tasks import (
-    send_apns_activity,
-    send_fcm_activity,
-)
+from agir.notifications.tasks import push_activities
 from agir.people.models import Person
 
 
@@ -25,49 +22,17 @@ def push_new_activity(sender, instance, created=False, **kwargs):
     if instance is None or not created:
         return
 
-    if (
-        not instance.type in Subscription.MANDATORY_PUSH_TYPES
-        and not Subscription.objects.filter(
-            person=instance.recipient,
-            type=Subscription.SUBSCRIPTION_PUSH,
-            activity_type=instance.type,
-        ).exists()
-    ):
+    transaction.on_commit(partial(push_activities.delay, [instance.pk]))
+
+
+@receiver(bulk_post_create, sender=Activity, dispatch_uid="push_new_activities")
+def push_new_activities(sender, instances, **kwargs):
+    if not instances:
         return
 
-    # SEND APPLE PUSH NOTIFICATION SERVICE NOTIFICATIONS
-    apns_device_pks = [
-        apns_device.pk
-        for apns_device in APNSDevice.objects.filter(
-            user=instance.recipient.role, active=True
-        )
-    ]
-
-    for apns_device_pk in apns_device_pks:
-        transaction.on_commit(
-            partial(
-                send_apns_activity.delay,
-                instance.pk,
-                apns_device_pk,
-            )
-        )
-
-    # SEND FCM NOTIFICATIONS
-    fcm_device_pks = [
-        fcm_device.pk
-        for fcm_device in GCMDevice.objects.filter(
-            user=instance.recipient.role, active=True
-        )
-    ]
-
-    for fcm_device_pk in fcm_device_pks:
-        transaction.on_commit(
-            partial(
-                send_fcm_activity.delay,
-                instance.pk,
-                fcm_device_pk,
-            )
-        )
+    transaction.on_commit(
+        partial(push_activities.delay, [instance.pk for instance in instances])
+    )
 
 
 @receiver(
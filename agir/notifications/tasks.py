@@ -1,10 +1,26 @@
-from push_notifications.apns import APNSServerError
+import logging
+from collections import defaultdict
+
+from celery import shared_task
+from django.db.models import Exists, OuterRef, Q
+from push_notifications.apns import APNSServerError, apns_send_bulk_message
+from push_notifications.gcm import send_message as fcm_send_message
 from push_notifications.models import APNSDevice, GCMDevice
 
 from agir.activity.models import Activity
 from agir.lib.celery import http_task, gcm_push_task
+from agir.lib.utils import grouper
+from agir.notifications.models import Subscription
 from agir.notifications.serializers import ACTIVITY_NOTIFICATION_SERIALIZERS
 
+logger = logging.getLogger(__name__)
+
+PUSH_ACTIVITIES_CHUNK_SIZE = 500
+PUSH_ACTIVITIES_MAX_ATTEMPTS = 4
+# résultats d'envoi enregistrés par appareil (FCM n'en renvoie pas pour chaque appareil)
+APNS_SUCCESS = "Success"
+FCM_SENT = "Sent"
+
 
 @http_task(post_save=True)
 def send_apns_activity(activity_pk, apns_device_pk):
@@ -50,3 +66,169 @@ def send_fcm_activity(activity_pk, fcm_device_pk):
     data["image"] = data.pop("icon")
 
     return fcm_device.send_message(message=None, thread_id=activity.type, extra=data)
+
+
+def _get_pushable_activities(activity_pks):
+    return (
+        Activity.objects.filter(pk__in=activity_pks)
+        .filter(
+            Q(type__in=Subscription.MANDATORY_PUSH_TYPES)
+            | Exists(
+                Subscription.objects.filter(
+                    person_id=OuterRef("recipient_id"),
+                    type=Subscription.SUBSCRIPTION_PUSH,
+                    activity_type=OuterRef("type"),
+                )
+            )
+        )
+        .exclude(recipient__role_id__isnull=True)
+        .select_related(
+            "recipient",
+            "event",
+            "supportgroup",
+            "individual",
+            "announcement",
+            "push_announcement",
+        )
+    )
+
+
+def _get_apns_devices_by_role(role_ids):
+    devices = defaultdict(lambda: defaultdict(list))
+    for role_id, application_id, registration_id in APNSDevice.objects.filter(
+        user_id__in=role_ids, active=True
+    ).values_list("user_id", "application_id", "registration_id"):
+        devices[role_id][application_id].append(registration_id)
+    return devices
+
+
+def _get_fcm_devices_by_role(role_ids):
+    devices = defaultdict(lambda: defaultdict(list))
+    for (
+        role_id,
+        cloud_type,
+        application_id,
+        registration_id,
+    ) in GCMDevice.objects.filter(user_id__in=role_ids, active=True).values_list(
+        "user_id", "cloud_message_type", "application_id", "registration_id"
+    ):
+        devices[role_id][(cloud_type, application_id)].append(registration_id)
+    return devices
+
+
+def _push_activity(activity, apns_devices, fcm_devices, delivered):
+    """Envoie une activité aux appareils de son destinataire qui ne l'ont pas encore reçue
+
+    `delivered` associe à chaque appareil déjà traité le résultat de l'envoi ; il est
+    complété au fur et à mesure, y compris lorsqu'une erreur interrompt l'envoi, pour qu'une
+    nouvelle tentative ne renvoie pas la notification aux mêmes appareils.
+    """
+    serializer = ACTIVITY_NOTIFICATION_SERIALIZERS.get(activity.type, None)
+    if serializer is None:
+        return
+
+    data = serializer(instance=activity).data
+
+    for application_id, registration_ids in apns_devices.items():
+        registration_ids = [r for r in registration_ids if r not in delivered]
+        if not registration_ids:
+            continue
+
+        results = apns_send_bulk_message(
+            registration_ids=registration_ids,
+            alert=data,
+            application_id=application_id,
+            thread_id=activity.type,
+            extra={"url": data["url"]},
+        )
+        results = results or {}
+        delivered.update(
+            (registration_id, results.get(registration_id))
+            for registration_id in registration_ids
+        )
+
+    if fcm_devices:
+        fcm_data = dict(data)
+        fcm_data["image"] = fcm_data.pop("icon")
+        for (cloud_type, application_id), registration_ids in fcm_devices.items():
+            registration_ids = [r for r in registration_ids if r not in delivered]
+            if not registration_ids:
+                continue
+
+            fcm_send_message(
+                registration_ids,
+                fcm_data,
+                cloud_type,
+                application_id=application_id,
+                thread_id=activity.type,
+            )
+            delivered.update(
+                (registration_id, FCM_SENT) for registration_id in registration_ids
+            )
+
+
+@shared_task
+def push_activities(activity_pks, attempt=0, delivered=None):
+    """Envoie les notifications push d'un lot d'activités
+
+    Les abonnements et les appareils des destinataires sont récupérés en quelques requêtes
+    pour tout le lot, puis chaque notification est envoyée à tous les appareils de son
+    destinataire en une seule requête par plateforme (FCM multicast, connexion APNS unique).
+    Les activités dont l'envoi a échoué sont renvoyées dans une nouvelle tâche, avec les
+    appareils qui les ont déjà reçues.
+
+    Comme pour `send_apns_activity`, une notification est considérée comme affichée dès
+    qu'elle a pu être envoyée à un appareil iOS.
+
+    :param delivered: pour chaque activité (clé textuelle), les résultats des envois déjà
+        effectués lors des tentatives précédentes, par appareil
+    """
+    delivered = delivered or {}
+    failed = []
+
+    for chunk in grouper(activity_pks, PUSH_ACTIVITIES_CHUNK_SIZE):
+        activities = list(_get_pushable_activities(list(chunk)))
+        if not activities:
+            continue
+
+        role_ids = {activity.recipient.role_id for activity in activities}
+        apns_devices = _get_apns_devices_by_role(role_ids)
+        fcm_devices = _get_fcm_devices_by_role(role_ids)
+
+        displayed = []
+        for activity in activities:
+            role_id = activity.recipient.role_id
+            if role_id not in apns_devices and role_id not in fcm_devices:
+                continue
+
+            activity_delivered = delivered.setdefault(str(activity.pk), {})
+            try:
+                _push_activity(
+                    activity,
+                    apns_devices.get(role_id, {}),
+                    fcm_devices.get(role_id, {}),
+                    activity_delivered,
+                )
+            except Exception:
+                logger.warning(
+                    f"Échec de l'envoi de la notification push pour l'activité {activity.pk}",
+                    exc_info=True,
+                )
+                failed.append(activity.pk)
+
+            if APNS_SUCCESS in activity_delivered.values():
+                displayed.append(activity.pk)
+
+        Activity.objects.filter(
+            pk__in=displayed, push_status=Activity.STATUS_UNDISPLAYED
+        ).update(push_status=Activity.STATUS_DISPLAYED)
+
+    if failed and attempt + 1 < PUSH_ACTIVITIES_MAX_ATTEMPTS:
+        push_activities.apply_async(
+            (failed,),
+            {
+                "attempt": attempt + 1,
+                "delivered": {str(pk): delivered.get(str(pk), {}) for pk in failed},
+            },
+            countdown=10 * 2**attempt,
+        )
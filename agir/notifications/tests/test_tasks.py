@@ -0,0 +1,114 @@
+from unittest.mock import patch
+
+from django.test import TestCase
+from push_notifications.models import APNSDevice, GCMDevice
+
+from agir.activity.models import Activity
+from agir.groups.models import SupportGroup
+from agir.notifications.models import Subscription
+from agir.notifications.tasks import push_activities
+from agir.people.models import Person
+
+
+@patch("agir.notifications.tasks.fcm_send_message")
+@patch(
+    "agir.notifications.tasks.apns_send_bulk_message",
+    side_effect=lambda registration_ids, **kwargs: {
+        registration_id: "Success" for registration_id in registration_ids
+    },
+)
+class PushActivitiesTaskTestCase(TestCase):
+    def setUp(self):
+        self.supportgroup = SupportGroup.objects.create(name="Groupe")
+        self.subscribed = Person.objects.create_insoumise(
+            "subscribed@agir.test", create_role=True
+        )
+        self.unsubscribed = Person.objects.create_insoumise(
+            "unsubscribed@agir.test", create_role=True
+        )
+        Subscription.objects.filter(
+            person__in=[self.subscribed, self.unsubscribed]
+        ).delete()
+        Subscription.objects.create(
+            person=self.subscribed,
+            type=Subscription.SUBSCRIPTION_PUSH,
+            activity_type=Activity.TYPE_NEW_MEMBER,
+        )
+
+        for person in (self.subscribed, self.unsubscribed):
+            APNSDevice.objects.create(
+                user=person.role, registration_id=f"apns-{person.pk}", active=True
+            )
+            GCMDevice.objects.create(
+                user=person.role,
+                registration_id=f"fcm-{person.pk}",
+                cloud_message_type="FCM",
+                active=True,
+            )
+
+        self.activities = Activity.objects.bulk_create(
+            [
+                Activity(
+                    type=Activity.TYPE_NEW_MEMBER,
+                    recipient=person,
+                    supportgroup=self.supportgroup,
+                    individual=person,
+                )
+                for person in (self.subscribed, self.unsubscribed)
+            ]
+        )
+
+    def test_push_only_to_subscribed_recipients(self, apns_send, fcm_send):
+        push_activities([activity.pk for activity in self.activities])
+
+        apns_send.assert_called_once()
+        self.assertEqual(
+            apns_send.call_args[1]["registration_ids"], [f"apns-{self.subscribed.pk}"]
+        )
+        fcm_send.assert_called_once()
+        self.assertEqual(fcm_send.call_args[0][0], [f"fcm-{self.subscribed.pk}"])
+
+    def test_push_status_updated_in_bulk(self, apns_send, fcm_send):
+        push_activities([activity.pk for activity in self.activities])
+
+        self.assertEqual(
+            Activity.objects.get(recipient=self.subscribed).push_status,
+            Activity.STATUS_DISPLAYED,
+        )
+        self.assertEqual(
+            Activity.objects.get(recipient=self.unsubscribed).push_status,
+            Activity.STATUS_UNDISPLAYED,
+        )
+
+    @patch("agir.notifications.tasks.push_activities.apply_async")
+    def test_failed_activities_are_retried(self, apply_async, apns_send, fcm_send):
+        fcm_send.side_effect = ConnectionError()
+        push_activities([activity.pk for activity in self.activities])
+
+        apply_async.assert_called_once()
+        self.assertEqual(
+            apply_async.call_args[0][0],
+            ([a.pk for a in self.activities if a.recipient == self.subscribed],),
+        )
+
+    @patch("agir.notifications.tasks.push_activities.apply_async")
+    def test_retry_skips_devices_already_delivered(
+        self, apply_async, apns_send, fcm_send
+    ):
+        activity_pks = [activity.pk for activity in self.activities]
+        fcm_send.side_effect = ConnectionError()
+        push_activities(activity_pks)
+
+        self.assertEqual(
+            Activity.objects.get(recipient=self.subscribed).push_status,
+            Activity.STATUS_DISPLAYED,
+        )
+
+        apns_send.reset_mock()
+        fcm_send.reset_mock()
+        fcm_send.side_effect = None
+        push_activities(*apply_async.call_args[0][0], **apply_async.call_args[0][1])
+
+        apns_send.assert_not_called()
+        fcm_send.assert_called_once()
+        self.assertEqual(fcm_send.call_args[0][0], [f"fcm-{self.subscribed.pk}"])
@@ -1,6 +1,16 @@
-import statistics
 from datetime import timedelta
 
+from django.db.models import (
+    Aggregate,
+    Avg,
+    Count,
+    FloatField,
+    Func,
+    IntegerField,
+    Q,
+    Value,
+)
+from django.db.models.functions import ExtractYear
 from django.utils import timezone
 from push_notifications.models import GCMDevice, APNSDevice
 
@@ -10,151 +20,179 @@
 from agir.people.models import Person
 from agir.presidentielle2022.apps import Presidentielle2022Config
 
+# bornes de la pyramide des âges : une tranche avant 20 ans, puis par décennie jusqu'à 90 ans
+AGE_PYRAMID_MIN = 20
+AGE_PYRAMID_MAX = 90
+AGE_PYRAMID_STEP = 10
+
+
+class Median(Aggregate):
+    function = "percentile_cont"
+    name = "Median"
+    output_field = FloatField()
+    template = "%(function)s(0.5) WITHIN GROUP (ORDER BY %(expressions)s)"
+
+
+class WidthBucket(Func):
+    function = "width_bucket"
+    output_field = IntegerField()
+
 
 def get_statistics_for_queryset(original_queryset):
-    person_pks = original_queryset.values_list("pk", flat=True)
-    stats = {
-        "total": len(person_pks),
-        "is_political_support": 0,
-        "contacts": 0,
-        "known_phone_numbers": 0,
-        "newsletter_subscribers": 0,
-        "sms_subscribers": 0,
-        "last_week_connections": 0,
-        "ages": [],
-        "genders": {},
-        "zip_codes": {},
-        "departements": {},
-        "groups": 0,
-        "group_members": set(),
-        "group_referents": set(),
-        "certified_group_members": set(),
-        "person_groups": set(),
-    }
+    """Calcule les statistiques d'un ensemble de personnes
 
-    if stats["total"] == 0:
-        return stats
+    Tous les décomptes sont réalisés par des agrégats SQL, sans charger les personnes en
+    mémoire : seuls les résultats regroupés (par genre, tranche d'âge, code postal) sont lus.
+    """
+    person_pks = original_queryset.order_by().values("pk")
+    queryset = Person.objects.filter(pk__in=person_pks).order_by()
 
     current_year = timezone.now().year
     one_week_ago = (timezone.now() - timedelta(days=7)).date()
-    queryset = Person.objects.filter(pk__in=person_pks).select_related("role")
-    genders = {}
-    unknown_genders = 0
-    user_ids = []
-
-    for person in queryset:
-        if person.is_political_support:
-            stats["is_political_support"] += 1
-        if person.date_of_birth:
-            stats["ages"].append(current_year - person.date_of_birth.year)
-        if person.contact_phone:
-            stats["known_phone_numbers"] += 1
-        if len(person.newsletters) > 0:
-            stats["newsletter_subscribers"] += 1
-        if person.subscribed_sms:
-            stats["sms_subscribers"] += 1
-
-        if not person.gender:
-            unknown_genders += 1
-        elif person.gender in genders:
-            genders[person.gender] += 1
-        else:
-            genders[person.gender] = 1
-
-        if (
-            person.meta
-            and "subscriptions" in person.meta
-            and "AP" in person.meta["subscriptions"]
-            and "subscriber" in person.meta["subscriptions"]["AP"]
-        ):
-            stats["contacts"] += 1
-        if person.role:
-            user_ids.append(person.role_id)
-        if (
-            person.role
-            and person.role.last_login
-            and person.role.last_login.date() >= one_week_ago
-        ):
-            stats["last_week_connections"] += 1
-
-        if person.location_zip:
-            if person.location_zip not in stats["zip_codes"]:
-                stats["zip_codes"][person.location_zip] = 0
-            stats["zip_codes"][person.location_zip] += 1
-            code_departement = code_postal_vers_code_departement(person.location_zip)
-            if code_departement:
-                departement = departements_par_code[code_departement]
-                departement = f"{departement.id} - {departement.nom}"
-                if departement not in stats["departements"]:
-                    stats["departements"][departement] = 0
-                stats["departements"][departement] += 1
+    age = Value(current_year) - ExtractYear("date_of_birth")
+
+    stats = queryset.aggregate(
+        total=Count("id"),
+        is_political_support=Count("id", filter=Q(is_political_support=True)),
+        contacts=Count("id", filter=Q(meta__subscriptions__AP__has_key="subscriber")),
+        known_phone_numbers=Count(
+            "id", filter=Q(contact_phone__isnull=False) & ~Q(contact_phone="")
+        ),
+        newsletter_subscribers=Count("id", filter=Q(newsletters__len__gt=0)),
+        sms_subscribers=Count("id", filter=Q(subscribed_sms=True)),
+        last_week_connections=Count(
+            "id", filter=Q(role__last_login__date__gte=one_week_ago)
+        ),
+        known_ages=Count("id", filter=Q(date_of_birth__isnull=False)),
+        mean_age=Avg(age, output_field=FloatField()),
+        median_age=Median(age),
+    )
+    # avec Django 3.2, un agrégat sur un queryset vide renvoie None plutôt que 0
+    stats = {
+        key: 0 if value is None and key not in ("mean_age", "median_age") else value
+        for key, value in stats.items()
+    }
+    stats.update(
+        {
+            "genders": [],
+            "zip_codes": {},
+            "departements": {},
+            "groups": 0,
+            "group_members": 0,
+            "group_referents": 0,
+            "certified_group_members": 0,
+            "person_groups": 0,
+        }
+    )
 
-    stats["liaisons"] = queryset.liaisons().count()
+    if stats["total"] == 0:
+        return stats
 
+    if stats["known_ages"] > 0:
+        buckets = dict(
+            queryset.filter(date_of_birth__isnull=False)
+            .annotate(
+                age_bucket=WidthBucket(
+                    age,
+                    AGE_PYRAMID_MIN,
+                    AGE_PYRAMID_MAX,
+                    (AGE_PYRAMID_MAX - AGE_PYRAMID_MIN) // AGE_PYRAMID_STEP,
+                )
+            )
+            .values("age_bucket")
+            .annotate(count=Count("id"))
+            .values_list("age_bucket", "count")
+        )
+        stats["age_pyramid"] = (
+            [(f"0-{AGE_PYRAMID_MIN - 1}", buckets.get(0, 0))]
+            + [
+                (f"{key}-{key + AGE_PYRAMID_STEP - 1}", buckets.get(i, 0))
+                for i, key in enumerate(
+                    range(AGE_PYRAMID_MIN, AGE_PYRAMID_MAX, AGE_PYRAMID_STEP),
+                    start=1,
+                )
+            ]
+            + [
+                (
+                    f"{AGE_PYRAMID_MAX}+",
+                    buckets.get(
+                        (AGE_PYRAMID_MAX - AGE_PYRAMID_MIN) // AGE_PYRAMID_STEP + 1,
+                        0,
+                    ),
+                )
+            ]
+        )
+    else:
+        del stats["mean_age"]
+        del stats["median_age"]
+
+    genders = dict(
+        queryset.values("gender")
+        .annotate(count=Count("id"))
+        .values_list("gender", "count")
+    )
     stats["genders"] = [
-        (label, genders.get(key, 0)) for (key, label) in Person.GENDER_CHOICES
+        (label, genders.pop(key, 0)) for (key, label) in Person.GENDER_CHOICES
     ]
-    stats["genders"].append(("Non renseigné", unknown_genders))
+    stats["genders"].append(("Non renseigné", sum(genders.values())))
 
-    stats["groups"] = SupportGroup.objects.active().count()
-
-    memberships = Membership.objects.filter(
-        person_id__in=person_pks,
-        membership_type__gte=Membership.MEMBERSHIP_TYPE_MEMBER,
-        supportgroup__published=True,
-    ).select_related("supportgroup")
-
-    for membership in memberships:
-        stats["person_groups"].add(membership.supportgroup_id)
-        stats["group_members"].add(membership.person_id)
-        if membership.membership_type >= Membership.MEMBERSHIP_TYPE_REFERENT:
-            stats["group_referents"].add(membership.person_id)
-
-    stats["group_members"] = len(stats["group_members"])
-    stats["group_referents"] = len(stats["group_referents"])
-    stats["person_groups"] = len(stats["person_groups"])
-    stats["certified_group_members"] = (
-        memberships.filter(supportgroup__certification_date__isnull=False)
-        .values("person_id")
-        .distinct()
-        .count()
+    zip_codes = (
+        queryset.exclude(location_zip="")
+        .values("location_zip")
+        .annotate(count=Count("id"))
+        .values_list("location_zip", "count")
     )
+    for zip_code, count in zip_codes.iterator():
+        stats["zip_codes"][zip_code] = count
+        code_departement = code_postal_vers_code_departement(zip_code)
+        if code_departement:
+            departement = departements_par_code[code_departement]
+            departement = f"{departement.id} - {departement.nom}"
+            stats["departements"][departement] = (
+                stats["departements"].get(departement, 0) + count
+            )
+
+    stats["liaisons"] = queryset.liaisons().count()
 
-    donors = (
-        Payment.objects.filter(
+    stats["groups"] = SupportGroup.objects.active().count()
+
+    stats.update(
+        Membership.objects.filter(
             person_id__in=person_pks,
+            membership_type__gte=Membership.MEMBERSHIP_TYPE_MEMBER,
+            supportgroup__published=True,
+        ).aggregate(
+            group_members=Count("person_id", distinct=True),
+            group_referents=Count(
+                "person_id",
+                distinct=True,
+                filter=Q(membership_type__gte=Membership.MEMBERSHIP_TYPE_REFERENT),
+            ),
+            certified_group_members=Count(
+                "person_id",
+                distinct=True,
+                filter=Q(supportgroup__certification_date__isnull=False),
+            ),
+            person_groups=Count("supportgroup_id", distinct=True),
         )
-        .values("person_id")
-        .distinct()
     )
-    stats["is_2022_donors"] = donors.filter(
-        type__in=[
-            Presidentielle2022Config.DONATION_PAYMENT_TYPE,
-            Presidentielle2022Config.DONATION_SUBSCRIPTION_TYPE,
-        ],
-    ).count()
-    stats["is_insoumise_donors"] = donors.exclude(
-        type__in=[
-            Presidentielle2022Config.DONATION_PAYMENT_TYPE,
-            Presidentielle2022Config.DONATION_SUBSCRIPTION_TYPE,
-        ],
-    ).count()
-
-    if len(stats["ages"]) > 0:
-        stats["mean_age"] = statistics.mean(stats["ages"])
-        stats["median_age"] = statistics.median(stats["ages"])
-        stats["age_pyramid"] = (
-            [("0-19", len([age for age in stats["ages"] if age < 20]))]
-            + [
-                (
-                    f"{key}-{key + 9}",
-                    len([age for age in stats["ages"] if key <= age <= key + 9]),
-                )
-                for key in range(20, 90, 10)
-            ]
-            + [("90+", len([age for age in stats["ages"] if age >= 90]))]
+
+    donation_types = [
+        Presidentielle2022Config.DONATION_PAYMENT_TYPE,
+        Presidentielle2022Config.DONATION_SUBSCRIPTION_TYPE,
+    ]
+    stats.update(
+        Payment.objects.filter(person_id__in=person_pks).aggregate(
+            is_2022_donors=Count(
+                "person_id", distinct=True, filter=Q(type__in=donation_types)
+            ),
+            is_insoumise_donors=Count(
+                "person_id", distinct=True, filter=~Q(type__in=donation_types)
+            ),
         )
+    )
 
+    user_ids = queryset.filter(role_id__isnull=False).values("role_id")
     stats["android_users"] = (
         GCMDevice.objects.filter(active=True, user_id__in=user_ids)
         .values("user_id")
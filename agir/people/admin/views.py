@@ -1,4 +1,4 @@
-import csv
+from itertools import chain
 from uuid import uuid4
 
 import gspread
@@ -6,7 +6,12 @@
 from django.contrib import messages
 from django.core.exceptions import PermissionDenied
 from django.db import transaction
-from django.http import HttpResponse, HttpResponseRedirect, Http404, QueryDict
+from django.http import (
+    HttpResponseRedirect,
+    Http404,
+    QueryDict,
+    StreamingHttpResponse,
+)
 from django.shortcuts import get_object_or_404
 from django.template.response import TemplateResponse
 from django.urls import reverse
@@ -15,6 +20,7 @@
 
 from agir.lib.admin.panels import AdminViewMixin
 from agir.lib.admin.utils import admin_url
+from agir.lib.export import rows_to_csv_lines
 from agir.people.actions.management import merge_persons
 from agir.people.admin.forms import (
     AddPersonEmailForm,
@@ -74,18 +80,17 @@ def download_results(self, request, pk, filename=None):
 
         form = get_object_or_404(PersonForm, id=pk)
         filename = filename or form.slug
-        table = self.generate_result_table(form, html=False, fieldsets_titles=False)
+        headers, rows = self.person_form_display.iter_formatted_submissions(
+            self.get_submission_queryset(form), html=False
+        )
 
-        response = HttpResponse(content_type="text/csv")
+        response = StreamingHttpResponse(
+            rows_to_csv_lines(chain([headers], rows)), content_type="text/csv"
+        )
         response["Content-Disposition"] = 'attachment; filename="{0}.csv"'.format(
             filename
         )
 
-        writer = csv.writer(response)
-        writer.writerow(table["headers"])
-        for submission in table["submissions"]:
-            writer.writerow(submission)
-
         return response
 
     def create_result_url(self, request, pk, clear=False):
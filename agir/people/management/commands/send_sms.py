@@ -1,11 +1,11 @@
 import secrets
+import statistics
 from argparse import FileType
 from pathlib import Path
 
 from django.contrib.gis.db.models.functions import Distance as DistanceFunction
 from django.core.management.base import BaseCommand, CommandError
 from phonenumber_field.phonenumber import PhoneNumber
-from phonenumbers import number_type, PhoneNumberType
 from tqdm import tqdm
 
 from agir.lib.management_utils import (
@@ -17,7 +17,12 @@
     region_argument,
     segment_argument,
 )
-from agir.lib.sms import compute_sms_length_information, send_bulk_sms, SMSSendException
+from agir.lib.sms import compute_sms_length_information, send_bulk_sms
+from agir.lib.sms.common import (
+    numeros_mobiles,
+    raw_phone_numbers,
+    to_mobile_phone_number,
+)
 from agir.people.models import Person
 
 
@@ -59,24 +64,19 @@ def add_arguments(self, parser):
         parser.add_argument("-T", "--exclude-telegram", action="store_true")
         parser.add_argument("-s", "--sentfile", type=FileType(mode="r"))
         parser.add_argument("-E", "--export-file", type=FileType(mode="w"))
-
-    def can_send(self, phone):
-        return (
-            isinstance(phone, PhoneNumber)
-            and phone.is_valid()
-            and number_type(phone)
-            in [
-                PhoneNumberType.MOBILE,
-                PhoneNumberType.FIXED_LINE_OR_MOBILE,
-            ]
+        parser.add_argument(
+            "-w",
+            "--workers",
+            type=int,
+            help="Nombre maximal de lots de SMS envoyés simultanément",
         )
 
     def write_numbers(self, path, numbers):
         with open(path, "w") as f:
-            f.write("\n".join(numbers))
+            f.write("\n".join(str(n) for n in numbers))
 
     def read_numbers(self, file):
-        return set(PhoneNumber.from_string(n) for n in file.read().split("\n"))
+        return set(PhoneNumber.from_string(n) for n in file.read().splitlines() if n)
 
     def handle(
         self,
@@ -91,6 +91,7 @@ def handle(
         at,
         exclude_telegram,
         export_file,
+        workers,
         **options,
     ):
         if (
@@ -139,15 +140,20 @@ def handle(
             res = list(
                 drop_duplicate_numbers(
                     (
-                        (p.contact_phone, p.distance)
-                        for p in ps.iterator()
-                        if self.can_send(p.contact_phone)
+                        (phone, distance)
+                        for phone, distance in (
+                            (to_mobile_phone_number(raw), distance)
+                            for raw, distance in raw_phone_numbers(
+                                ps, "distance"
+                            ).iterator()
+                        )
+                        if phone is not None
                     ),
                     number,
                 )
             )
 
-            numbers = [n for n, _ in res]
+            numbers = set(n for n, _ in res)
             max_distance = res[-1][1]
             self.stdout.write(f"Distance maximale : {max_distance}")
         else:
@@ -166,9 +172,7 @@ def handle(
             if exclude_telegram:
                 ps = ps.exclude(meta__has_telegram=True)
 
-            numbers = set(
-                p.contact_phone for p in ps.iterator() if self.can_send(p.contact_phone)
-            )
+            numbers = set(numeros_mobiles(ps))
 
         self.stdout.write(f"Nombre de numéros : {len(numbers)}")
 
@@ -176,6 +180,7 @@ def handle(
             export_file.write("\n".join(str(number) for number in numbers))
             return
 
+        sent_numbers = set()
         if sentfile is not None:
             sent_numbers = self.read_numbers(sentfile)
             numbers.difference_update(sent_numbers)
@@ -219,28 +224,48 @@ def handle(
         sent_filename = Path(f"sent.{token}")
         invalid_filename = Path(f"invalid.{token}")
 
+        # les numéros de chaque lot sont inscrits dans ce fichier avant son envoi ; il reprend
+        # les numéros des envois précédents, pour qu'une nouvelle reprise ne les oublie pas
+        self.stdout.write(
+            f"En cas d'interruption, reprenez l'envoi avec l'option -s {sent_filename}"
+        )
+
+        progress = tqdm(total=len(numbers))
+        latencies = []
+
+        def on_chunk_sent(report):
+            latencies.append(report.duration)
+            progress.update(len(report.sent) + len(report.invalid))
+
         try:
-            sent, invalid = send_bulk_sms(message, tqdm(numbers), at=at)
-        except SMSSendException as e:
+            with sent_filename.open("w") as checkpoint:
+                checkpoint.write("".join(f"{n.as_e164}\n" for n in sent_numbers))
+                checkpoint.flush()
+                sent, invalid = send_bulk_sms(
+                    message,
+                    numbers,
+                    at=at,
+                    checkpoint=checkpoint,
+                    on_chunk_sent=on_chunk_sent,
+                    max_workers=workers,
+                )
+        except Exception:
             self.stderr.write("Erreur lors de l'envoi des SMS.")
             self.stderr.write(
-                f"{len(e.sent)} SMS ont déjà été envoyés ({len(e.invalid)} numéros invalides)."
+                f"Les numéros déjà traités sont inscrits dans {sent_filename}."
             )
-
-            try:
-                self.write_numbers(sent_filename, e.sent)
-                self.write_numbers(invalid_filename, e.invalid)
-            except OSError:
-                self.stderr.write(
-                    "Impossible d'écrire les fichiers avec les numéros testés."
-                )
-                raise
-
-            self.stderr.write(f"Fichiers {sent_filename} et {invalid_filename} écrits.")
-            return 1
+            raise
+        finally:
+            progress.close()
 
         self.stdout.write(f"{len(sent)} SMS envoyés")
 
+        if latencies:
+            self.stdout.write(
+                f"{len(latencies)} lots envoyés, durée médiane {statistics.median(latencies):.2f}s,"
+                f" durée maximale {max(latencies):.2f}s"
+            )
+
         if invalid:
             self.stdout.write(f"{len(invalid)} numéros invalides")
             self.write_numbers(invalid_filename, invalid)
@@ -1,12 +1,9 @@
 ﻿import collections
-from functools import reduce
-from itertools import chain
-from operator import or_
 
 import iso8601
 from django.conf import settings
 from django.core.exceptions import ValidationError
-from django.db.models import Subquery, OuterRef, QuerySet
+from django.db.models import CharField, F, Func, QuerySet
 from django.urls import reverse
 from django.utils.formats import localize
 from django.utils.html import format_html
@@ -17,13 +14,159 @@
 from phonenumbers import NumberParseException
 
 from agir.lib.html import textify
-from agir.people.models import Person, PersonForm, PersonEmail, PersonTag
+from agir.lib.utils import grouper
+from agir.people.models import Person, PersonForm, PersonTag
 from agir.people.person_forms.fields import (
     PREDEFINED_CHOICES,
     PREDEFINED_CHOICES_REVERSE,
+    PREDEFINED_CHOICES_REVERSE_BULK,
+    valid_uuids,
 )
 from agir.people.person_forms.models import PersonFormSubmission
 
+# nombre de réponses lues et mises en forme à la fois lors d'un export
+SUBMISSIONS_CHUNK_SIZE = 1000
+
+CHOICE_FIELD_TYPES = ("choice", "autocomplete_choice", "multiple_choice")
+
+
+def _persons_from_values(values):
+    return {
+        str(person.id): person
+        for person in Person.objects.filter(id__in=valid_uuids(values)).select_related(
+            "public_email"
+        )
+    }
+
+
+def _person_tags_from_values(values):
+    return {
+        str(tag.id): tag
+        for tag in PersonTag.objects.filter(
+            id__in=[value for value in values if value.isdigit()]
+        )
+    }
+
+
+class SubmissionValuesFormatter:
+    """Met en forme les valeurs de nombreuses réponses à un même formulaire
+
+    Produit les mêmes valeurs que `PersonFormDisplay._get_formatted_value`, mais les
+    libellés des choix ne sont calculés qu'une fois par champ, et les objets référencés par
+    les réponses (personnes, tags, événements…) sont chargés en une requête par paquet de
+    réponses (cf. `prefetch`) plutôt qu'une requête par valeur.
+    """
+
+    loaders = {
+        "person": _persons_from_values,
+        "person_tag": _person_tags_from_values,
+        **PREDEFINED_CHOICES_REVERSE_BULK,
+    }
+
+    def __init__(self, display, fields_dict, html=True):
+        self.display = display
+        self.fields_dict = fields_dict
+        self.html = html
+
+        self.choice_labels = {}
+        # champs dont les valeurs désignent des objets, avec le type de ces objets
+        self.reference_fields = {}
+        self.references = {}
+
+        for field_id, field in fields_dict.items():
+            field_type = field.get("type")
+
+            if field_type in ("person", "person_tag"):
+                self.reference_fields[field_id] = field_type
+                continue
+
+            if field_type not in CHOICE_FIELD_TYPES or "choices" not in field:
+                continue
+
+            choices = field["choices"]
+            if isinstance(choices, str):
+                if callable(PREDEFINED_CHOICES.get(choices)):
+                    if choices in PREDEFINED_CHOICES_REVERSE_BULK:
+                        self.reference_fields[field_id] = choices
+                    continue
+                choices = PREDEFINED_CHOICES.get(choices) or ()
+
+            labels = {}
+            for choice in choices:
+                if isinstance(choice, str):
+                    labels.setdefault(choice, choice)
+                else:
+                    labels.setdefault(choice[0], choice[1])
+            self.choice_labels[field_id] = labels
+
+    def prefetch(self, data_list):
+        """Charge les objets référencés par ce paquet de réponses"""
+        values = collections.defaultdict(set)
+        for data in data_list:
+            for field_id, kind in self.reference_fields.items():
+                value = data.get(field_id)
+                if value is None:
+                    continue
+                for v in value if isinstance(value, list) else [value]:
+                    values[kind].add(str(v))
+
+        self.references = {
+            (kind, key): obj
+            for kind, keys in values.items()
+            for key, obj in self.loaders[kind](keys).items()
+        }
+
+    def _get_choice_label(self, field_id, value):
+        if field_id in self.choice_labels:
+            try:
+                return self.choice_labels[field_id].get(value, value)
+            except TypeError:
+                return value
+
+        if field_id in self.reference_fields:
+            value = self.references.get(
+                (self.reference_fields[field_id], str(value)), value
+            )
+        if hasattr(value, "get_absolute_url") and self.html:
+            return format_html(
+                '<a href="{0}">{1}</a>', value.get_absolute_url(), str(value)
+            )
+        return str(value)
+
+    def format_value(self, field_id, value):
+        field = self.fields_dict[field_id]
+        field_type = field.get("type")
+
+        if value is None:
+            return self.display._get_formatted_value(field, value, self.html)
+
+        if field_type in CHOICE_FIELD_TYPES and "choices" in field:
+            if field_type != "multiple_choice":
+                return self._get_choice_label(field_id, value)
+            if isinstance(value, list):
+                return " // ".join(self._get_choice_label(field_id, v) for v in value)
+            return value
+
+        if field_type == "person":
+            person = self.references.get(("person", str(value)))
+            return value if person is None else str(person)
+
+        if field_type == "person_tag":
+            return ", ".join(
+                str(self.references.get(("person_tag", str(v))))
+                for v in (value if isinstance(value, list) else [value])
+            )
+
+        return self.display._get_formatted_value(field, value, self.html)
+
+    def format(self, data):
+        return {
+            field_id: self.format_value(field_id, value)
+            if field_id in self.fields_dict
+            else value
+            for field_id, value in data.items()
+        }
+
 
 class PersonFormDisplay:
     NA_HTML_PLACEHOLDER = mark_safe('<em style="color: #999;">N/A</em>')
@@ -54,13 +197,8 @@ def _get_form_and_submissions(self, submissions_or_form):
         else:
             raise TypeError("`submissions_or_form")
 
-        submissions = submissions.select_related("person").annotate(
-            email=Subquery(
-                PersonEmail.objects.filter(person_id=OuterRef("person__id"))
-                .order_by("_bounced", "_order")
-                .values("address")[:1]
-            )
-        )
+        # l'adresse email principale est déjà copiée sur la personne (champ `_email`)
+        submissions = submissions.select_related("person", "person__public_email")
 
         return form, submissions
 
@@ -174,11 +312,6 @@ def _get_formatted_value(self, field, value, html=True, na_placeholder=None):
     def _get_admin_fields(self, submissions, html=True):
         id_fields = [s.pk for s in submissions]
 
-        for s in submissions:
-            # copier l'email de façon à éviter une requête pour l'email PAR submission
-            if s.person:
-                s.person._email = s.email
-
         if html:
             dates = [
                 submission.created.astimezone(get_current_timezone())
@@ -298,7 +431,48 @@ def get_form_field_labels(self, form, fieldsets_titles=False, html=True):
 
         return field_information
 
-    def get_formatted_submissions(
+    def _get_labels(self, form, html, resolve_labels, fieldsets_titles, unique_labels):
+        if not resolve_labels:
+            return {}
+
+        fieldset_labels = self.get_form_field_labels(
+            form, fieldsets_titles=True, html=html
+        )
+        if fieldsets_titles:
+            return fieldset_labels
+
+        simple_labels = self.get_form_field_labels(
+            form, fieldsets_titles=False, html=html
+        )
+        if not unique_labels:
+            return simple_labels
+
+        simple_counter = collections.Counter(simple_labels.values())
+        fieldset_counter = collections.Counter(fieldset_labels.values())
+        return {
+            key: f"{fieldset_labels[key]} [{key}]"
+            if fieldset_counter[fieldset_labels[key]] > 1
+            else fieldset_labels[key]
+            if simple_counter[label] > 1
+            else label
+            for key, label in simple_labels.items()
+        }
+
+    def _get_additional_fields(self, submissions, fields_dict):
+        """Renvoie les clés des données des réponses qui ne sont pas des champs du formulaire"""
+        keys = (
+            submissions.order_by()
+            .annotate(
+                key=Func(
+                    F("data"), function="jsonb_object_keys", output_field=CharField()
+                )
+            )
+            .values_list("key", flat=True)
+            .distinct()
+        )
+        return sorted(set(keys).difference(fields_dict))
+
+    def iter_formatted_submissions(
         self,
         submissions_or_form,
         html=True,
@@ -307,94 +481,113 @@ def get_formatted_submissions(
         resolve_values=True,
         fieldsets_titles=False,
         unique_labels=False,
-        as_dicts=False,
+        chunk_size=SUBMISSIONS_CHUNK_SIZE,
     ):
+        """Renvoie les en-têtes et un itérateur sur les lignes des réponses mises en forme
+
+        Les réponses sont lues et mises en forme par paquets de `chunk_size` : contrairement
+        à `get_formatted_submissions`, la mémoire utilisée ne dépend pas du nombre de
+        réponses.
+        """
         if not submissions_or_form:
-            return [], []
+            return [], iter(())
 
         form, submissions = self._get_form_and_submissions(submissions_or_form)
 
-        if len(submissions) == 0:
-            return [], []
+        if not submissions.exists():
+            return [], iter(())
 
         fields_dict = form.fields_dict
+        labels = self._get_labels(
+            form, html, resolve_labels, fieldsets_titles, unique_labels
+        )
+        additional_fields = self._get_additional_fields(submissions, fields_dict)
 
-        simple_labels = self.get_form_field_labels(
-            form, fieldsets_titles=False, html=html
+        headers = [
+            labels.get(field_id, field_id) for field_id in fields_dict
+        ] + additional_fields
+        if include_admin_fields:
+            headers = self.get_admin_fields_label(form, html=html) + headers
+
+        rows = self._iter_formatted_rows(
+            submissions,
+            fields_dict,
+            additional_fields,
+            html=html,
+            include_admin_fields=include_admin_fields,
+            resolve_values=resolve_values,
+            chunk_size=chunk_size,
         )
-        fieldset_labels = self.get_form_field_labels(
-            form, fieldsets_titles=True, html=html
+
+        return headers, rows
+
+    def _iter_formatted_rows(
+        self,
+        submissions,
+        fields_dict,
+        additional_fields,
+        html,
+        include_admin_fields,
+        resolve_values,
+        chunk_size,
+    ):
+        field_ids = [*fields_dict, *additional_fields]
+        placeholder = (
+            self.NA_HTML_PLACEHOLDER
+            if html and resolve_values
+            else self.NA_TEXT_PLACEHOLDER
+            if resolve_values
+            else ""
+        )
+        formatter = (
+            SubmissionValuesFormatter(self, fields_dict, html)
+            if resolve_values
+            else None
         )
 
-        if not resolve_labels:
-            labels = {}
-        elif fieldsets_titles:
-            labels = fieldset_labels
-        elif unique_labels:
-            simple_counter = collections.Counter(simple_labels.values())
-            fieldset_counter = collections.Counter(fieldset_labels.values())
-            labels = {
-                key: f"{fieldset_labels[key]} [{key}]"
-                if fieldset_counter[fieldset_labels[key]] > 1
-                else fieldset_labels[key]
-                if simple_counter[label] > 1
-                else label
-                for key, label in simple_labels.items()
-            }
-        else:
-            labels = simple_labels
+        for chunk in grouper(submissions.iterator(chunk_size=chunk_size), chunk_size):
+            chunk = list(chunk)
+            values = [submission.data for submission in chunk]
 
-        full_data = [sub.data for sub in submissions]
-        if resolve_values:
-            full_values = [
-                {
-                    id: self._get_formatted_value(fields_dict[id], value, html)
-                    if id in fields_dict
-                    else value
-                    for id, value in d.items()
-                }
-                for d in full_data
-            ]
-        else:
-            full_values = full_data
+            if formatter is not None:
+                formatter.prefetch(values)
+                values = [formatter.format(data) for data in values]
 
-        declared_fields = set(fields_dict)
-        additional_fields = sorted(
-            reduce(or_, (set(d) for d in full_data)).difference(declared_fields)
-        )
+            if include_admin_fields:
+                admin_values = self._get_admin_fields(chunk, html)
+            else:
+                admin_values = [[] for _ in chunk]
 
-        headers = [
-            labels.get(field_id, field_id) for field_id in fields_dict
-        ] + additional_fields
+            for admin_row, data in zip(admin_values, values):
+                yield admin_row + [data.get(i, placeholder) for i in field_ids]
 
-        ordered_values = [
-            [
-                v.get(
-                    i,
-                    self.NA_HTML_PLACEHOLDER
-                    if html and resolve_values
-                    else self.NA_TEXT_PLACEHOLDER
-                    if resolve_values
-                    else "",
-                )
-                for i in chain(fields_dict, additional_fields)
-            ]
-            for v in full_values
-        ]
+    def get_formatted_submissions(
+        self,
+        submissions_or_form,
+        html=True,
+        include_admin_fields=True,
+        resolve_labels=True,
+        resolve_values=True,
+        fieldsets_titles=False,
+        unique_labels=False,
+        as_dicts=False,
+    ):
+        headers, rows = self.iter_formatted_submissions(
+            submissions_or_form,
+            html=html,
+            include_admin_fields=include_admin_fields,
+            resolve_labels=resolve_labels,
+            resolve_values=resolve_values,
+            fieldsets_titles=fieldsets_titles,
+            unique_labels=unique_labels,
+        )
+        ordered_values = list(rows)
 
-        if include_admin_fields:
-            admin_values = self._get_admin_fields(submissions, html)
-            headers = self.get_admin_fields_label(form, html=html) + headers
-            ordered_values = [
-                admin_values + values
-                for admin_values, values in zip(admin_values, ordered_values)
-            ]
+        if not ordered_values:
+            return [], []
 
         if as_dicts:
-            return [
-                {headers[i]: val for i, val in enumerate(item)}
-                for item in ordered_values
-            ]
+            return [dict(zip(headers, item)) for item in ordered_values]
 
         return headers, ordered_values
 
@@ -509,6 +509,36 @@ def event_from_value(uuid):
 }
 
 
+def valid_uuids(values):
+    """Renvoie les valeurs qui sont des UUID valides, dans leur ordre d'origine"""
+    uuids = []
+    for value in values:
+        try:
+            UUID(value)
+        except ValueError:
+            continue
+        uuids.append(value)
+    return uuids
+
+
+def events_from_values(values):
+    return {
+        str(event.id): event
+        for event in Event.objects.filter(id__in=valid_uuids(values))
+    }
+
+
+# équivalents de PREDEFINED_CHOICES_REVERSE pour un ensemble de valeurs (sous forme de
+# chaînes), qui renvoient un dictionnaire valeur -> objet en une seule requête
+PREDEFINED_CHOICES_REVERSE_BULK = {
+    "organized_events": events_from_values,
+    "commune_pages": lambda codes: {
+        commune.code: commune
+        for commune in CommunePage.objects.filter(code__in=codes).order_by("-pk")
+    },
+}
+
+
 def is_actual_model_field(field_descriptor):
     return (
         field_descriptor.get("person_field", False)
@@ -13,13 +13,13 @@
     add_email_confirmation_token_generator,
     merge_account_token_generator,
 )
-from agir.lib.celery import emailing_task, post_save_task
+from agir.lib.celery import emailing_task, post_save_task, LANE_INTERACTIVE
 from agir.lib.display import pretty_time_since
 from agir.lib.google_sheet import (
-    copy_array_to_sheet,
+    copy_rows_to_sheet,
     parse_sheet_link,
     gspread_task,
-    add_row_to_sheet,
+    buffer_row_for_sheet,
 )
 from agir.lib.mailing import send_mosaico_email, send_template_email
 from agir.lib.sms import send_sms
@@ -51,7 +51,7 @@ def send_welcome_mail(person_pk, type):
         )
 
 
-@emailing_task()
+@emailing_task(lane=LANE_INTERACTIVE)
 def send_confirmation_email(email, type=SUBSCRIPTION_TYPE_LFI, metadata=None, **kwargs):
     if PersonEmail.objects.filter(address__iexact=email).exists():
         p = Person.objects.get_by_natural_key(email)
@@ -101,7 +101,7 @@ def send_confirmation_email(email, type=SUBSCRIPTION_TYPE_LFI, metadata=None, **
     )
 
 
-@emailing_task()
+@emailing_task(lane=LANE_INTERACTIVE)
 def send_confirmation_merge_account(user_pk_requester, user_pk_merge, **kwargs):
     """Envoie une demande de fusion de compte.
 
@@ -144,7 +144,7 @@ def send_confirmation_merge_account(user_pk_requester, user_pk_merge, **kwargs):
     )
 
 
-@emailing_task(post_save=True)
+@emailing_task(post_save=True, lane=LANE_INTERACTIVE)
 def send_confirmation_change_email(new_email, user_pk, **kwargs):
     Person.objects.get(pk=user_pk)
 
@@ -239,7 +239,7 @@ def send_person_form_notification(submission_pk):
     )
 
 
-@post_save_task()
+@post_save_task(lane=LANE_INTERACTIVE)
 def send_validation_sms(sms_id):
     sms = PersonValidationSMS.objects.get(id=sms_id)
     formatted_code = sms.code[:3] + " " + sms.code[3:]
@@ -310,20 +310,18 @@ def copier_toutes_reponses_vers_feuille_externe(person_form_id):
         return
 
     display = PersonFormDisplay()
-    headers, values = display.get_formatted_submissions(
+    headers, rows = display.iter_formatted_submissions(
         form,
         html=False,
         unique_labels=True,
     )
 
-    headers = [str(s) for s in headers]
-
-    for row in values:
-        p = row[1]
-        if isinstance(p, Person):
-            row[1] = p.email
+    if not headers:
+        return
 
-    copy_array_to_sheet(sheet_id, [headers, *values])
+    copy_rows_to_sheet(
+        sheet_id, [str(s) for s in headers], rows, form.submissions.count()
+    )
 
 
 @gspread_task
@@ -351,4 +349,8 @@ def copier_reponse_vers_feuille_externe(person_form_submission_id):
         as_dicts=True,
     )
 
-    add_row_to_sheet(sheet_id, rows[0])
+    buffer_row_for_sheet(
+        sheet_id,
+        rows[0],
+        resync=copier_toutes_reponses_vers_feuille_externe.si(submission.form_id),
+    )
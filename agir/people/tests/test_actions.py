@@ -1,8 +1,11 @@
+from datetime import date
+
 from django.test import TestCase
 
 from agir.lib.tests.mixins import FakeDataMixin
 from agir.people.person_forms.display import default_person_form_display
 from ..actions.management import merge_persons
+from ..actions.stats import get_statistics_for_queryset
 from ..models import Person, PersonForm, PersonFormSubmission
 
 
@@ -157,3 +160,43 @@ def test_merging_people_correctly_update_search_value(self):
             u1.emails.values_list("address", flat=True),
             ["userno1@agir.test", "userno2@agir.test"],
         )
+
+
+class PersonStatisticsTestCase(TestCase):
+    def setUp(self):
+        year = date.today().year
+        self.people = [
+            Person.objects.create_insoumise(
+                "a@agir.local",
+                gender=Person.GENDER_FEMALE,
+                date_of_birth=date(year - 25, 1, 1),
+                location_zip="75010",
+            ),
+            Person.objects.create_insoumise(
+                "b@agir.local",
+                gender=Person.GENDER_MALE,
+                date_of_birth=date(year - 35, 1, 1),
+                location_zip="75010",
+            ),
+            Person.objects.create_insoumise("c@agir.local", location_zip="13001"),
+            Person.objects.create_person("d@agir.local"),
+        ]
+
+    def test_compute_statistics_with_aggregates(self):
+        stats = get_statistics_for_queryset(Person.objects.all())
+
+        self.assertEqual(stats["total"], 4)
+        self.assertEqual(stats["is_political_support"], 3)
+        self.assertEqual(stats["known_ages"], 2)
+        self.assertEqual(stats["mean_age"], 30)
+        self.assertEqual(stats["median_age"], 30)
+        self.assertIn(("20-29", 1), stats["age_pyramid"])
+        self.assertIn(("30-39", 1), stats["age_pyramid"])
+        self.assertIn(("Non renseigné", 2), stats["genders"])
+        self.assertEqual(stats["zip_codes"], {"75010": 2, "13001": 1})
+        self.assertEqual(sum(stats["departements"].values()), 3)
+        self.assertEqual(stats["group_members"], 0)
+
+    def test_empty_queryset(self):
+        stats = get_statistics_for_queryset(Person.objects.none())
+        self.assertEqual(stats["total"], 0)
@@ -593,6 +593,47 @@ def test_get_form_labels(self):
             },
         )
 
+    def test_iter_formatted_submissions_by_chunks(self):
+        tag = PersonTag.objects.create(label="Étiquette")
+        form = PersonForm.objects.create(
+            title="Formulaire avec choix",
+            slug="formulaire-choix",
+            custom_fields=[
+                {
+                    "title": "Une partie",
+                    "fields": [
+                        {
+                            "id": "couleur",
+                            "type": "choice",
+                            "label": "Couleur",
+                            "choices": [["r", "Rouge"], ["v", "Vert"]],
+                        },
+                        {"id": "tag", "type": "person_tag", "label": "Tag"},
+                    ],
+                }
+            ],
+        )
+        for i, couleur in enumerate(["r", "v", "b"]):
+            PersonFormSubmission.objects.create(
+                form=form,
+                person=self.person,
+                data={"couleur": couleur, "tag": tag.pk, f"extra_{i}": i},
+            )
+
+        headers, rows = default_person_form_display.iter_formatted_submissions(
+            form, html=False, include_admin_fields=False, chunk_size=2
+        )
+
+        self.assertEqual(headers, ["Couleur", "Tag", "extra_0", "extra_1", "extra_2"])
+        self.assertEqual(
+            list(rows),
+            [
+                ["Rouge", "Étiquette", 0, "N/A", "N/A"],
+                ["Vert", "Étiquette", "N/A", 1, "N/A"],
+                ["b", "Étiquette", "N/A", "N/A", 2],
+            ],
+        )
+
 
 class FieldsTestCase(TestCase):
     def setUp(self) -> None:
@@ -1,4 +1,4 @@
-import csv
+from itertools import chain
 from urllib.parse import urljoin
 
 from django.conf import settings
@@ -7,7 +7,11 @@
 from django.core.exceptions import PermissionDenied
 from django.core.files import File
 from django.http import Http404
-from django.http.response import HttpResponseRedirect, HttpResponse
+from django.http.response import (
+    HttpResponseRedirect,
+    HttpResponse,
+    StreamingHttpResponse,
+)
 from django.shortcuts import get_object_or_404, redirect
 from django.templatetags.static import static
 from django.urls import reverse
@@ -19,6 +23,7 @@
 
 from agir.events.models import Event
 from agir.front.view_mixins import ObjectOpengraphMixin
+from agir.lib.export import rows_to_csv_lines
 from agir.mailing.actions import create_campaign_from_submission
 from agir.people import tasks
 from agir.people.models import PersonForm, PersonFormSubmission
@@ -289,7 +294,7 @@ def get(self, request, *args, **kwargs):
     def get_csv(self, request):
         self.object = form = self.get_object()
 
-        headers, submissions = default_person_form_display.get_formatted_submissions(
+        headers, rows = default_person_form_display.iter_formatted_submissions(
             form,
             html=False,
             include_admin_fields=self.object.config.get("link_private_fields", False),
@@ -297,13 +302,11 @@ def get_csv(self, request):
             resolve_values=bool(request.GET.get("resolve_values")),
         )
 
-        response = HttpResponse(content_type="text/csv")
+        response = StreamingHttpResponse(
+            rows_to_csv_lines(chain([headers], rows)), content_type="text/csv"
+        )
         response[
             "Content-Disposition"
         ] = f'attachment; filename="{self.object.slug}.csv"'
 
-        writer = csv.writer(response)
-        writer.writerow(headers)
-        writer.writerows(submissions)
-
         return response
@@ -5,7 +5,10 @@
 from tqdm import tqdm
 
 from agir.statistics.models import AbsoluteStatistics, MaterielStatistics
-from agir.statistics.utils import get_absolute_statistics, get_materiel_statistics
+from agir.statistics.utils import (
+    get_absolute_statistics_for_period,
+    get_materiel_statistics,
+)
 
 
 def get_largest_campaign_statistics(start, end):
@@ -41,11 +44,16 @@ def create_statistics_from_date(date=None, silent=False):
         disable=silent,
     )
 
+    # toutes les statistiques absolues de la période sont calculées en une seule fois
+    absolute_statistics = get_absolute_statistics_for_period(
+        date, today - datetime.timedelta(days=1)
+    )
+
     while date < today:
         progress.set_description_str(str(date))
 
         # Create AbsoluteStatistics
-        abs_kwargs = get_absolute_statistics(date=date, as_kwargs=True)
+        abs_kwargs = absolute_statistics[date]
         AbsoluteStatistics.objects.update_or_create(
             date=abs_kwargs.pop("date"), defaults=abs_kwargs
         )
@@ -75,11 +83,16 @@ def update_statistics_from_date(date=None, silent=False, columns=None):
         disable=silent,
     )
 
+    # toutes les statistiques absolues de la période sont calculées en une seule fois
+    absolute_statistics = get_absolute_statistics_for_period(
+        date, today - datetime.timedelta(days=1), columns=columns
+    )
+
     while date < today:
         progress.set_description_str(str(date))
 
         # Update AbsoluteStatistics
-        abs_kwargs = get_absolute_statistics(date=date, as_kwargs=True, columns=columns)
+        abs_kwargs = absolute_statistics[date]
         if abs_kwargs:
             AbsoluteStatistics.objects.filter(date=date).update(**abs_kwargs)
 
@@ -0,0 +1,88 @@
+import datetime
+
+from django.test import TestCase
+from django.utils import timezone
+from nuntius.models import Campaign, CampaignSentEvent
+
+from agir.groups.models import SupportGroup, Membership
+from agir.people.models import Person
+from agir.statistics.utils import (
+    get_absolute_statistics,
+    get_absolute_statistics_for_period,
+)
+
+COLUMNS = (
+    "membership_person_count",
+    "sent_campaign_count",
+    "sent_campaign_email_count",
+)
+
+
+class AbsoluteStatisticsForPeriodTestCase(TestCase):
+    def setUp(self):
+        self.today = timezone.localdate()
+        self.groups = [
+            SupportGroup.objects.create(name=f"Groupe {i}") for i in range(2)
+        ]
+        self.campaigns = [
+            Campaign.objects.create(name=f"Campagne {i}") for i in range(2)
+        ]
+
+    def at(self, days_ago):
+        return timezone.make_aware(
+            datetime.datetime.combine(
+                self.today - datetime.timedelta(days=days_ago), datetime.time(12)
+            )
+        )
+
+    def add_membership(self, person, group, days_ago):
+        membership = Membership.objects.create(person=person, supportgroup=group)
+        Membership.objects.filter(pk=membership.pk).update(created=self.at(days_ago))
+
+    def add_sent_event(self, campaign, person, days_ago):
+        sent_event = CampaignSentEvent.objects.create(
+            campaign=campaign, subscriber=person, email=person.email
+        )
+        CampaignSentEvent.objects.filter(pk=sent_event.pk).update(
+            datetime=self.at(days_ago)
+        )
+
+    def test_period_statistics_match_daily_statistics(self):
+        people = [
+            Person.objects.create_insoumise(f"personne{i}@statistiques.fr")
+            for i in range(3)
+        ]
+
+        # avant la période
+        self.add_membership(people[0], self.groups[0], days_ago=10)
+        self.add_sent_event(self.campaigns[0], people[0], days_ago=10)
+        # pendant la période, avec des personnes et des campagnes déjà comptées
+        self.add_membership(people[0], self.groups[1], days_ago=4)
+        self.add_membership(people[1], self.groups[0], days_ago=4)
+        self.add_membership(people[2], self.groups[1], days_ago=2)
+        self.add_sent_event(self.campaigns[0], people[1], days_ago=3)
+        self.add_sent_event(self.campaigns[1], people[2], days_ago=3)
+        self.add_sent_event(self.campaigns[1], people[0], days_ago=1)
+        # après la période
+        self.add_membership(people[2], self.groups[0], days_ago=0)
+        self.add_sent_event(self.campaigns[1], people[1], days_ago=0)
+
+        start = self.today - datetime.timedelta(days=5)
+        end = self.today - datetime.timedelta(days=1)
+        statistics = get_absolute_statistics_for_period(start, end, columns=COLUMNS)
+
+        self.assertEqual(len(statistics), 5)
+        for day, values in statistics.items():
+            self.assertEqual(
+                values,
+                get_absolute_statistics(day, as_kwargs=True, columns=COLUMNS),
+            )
+        self.assertEqual(
+            statistics[end],
+            {
+                "date": end,
+                "membership_person_count": 3,
+                "sent_campaign_count": 2,
+                "sent_campaign_email_count": 4,
+            },
+        )
@@ -1,5 +1,8 @@
 import datetime
+from collections import Counter, namedtuple
 
+from django.db.models import Count, Min
+from django.db.models.functions import TruncDate
 from nuntius.models import CampaignSentEvent
 
 from agir.events.models import Event
@@ -8,68 +11,129 @@
 from agir.people.models import Person
 
 
-def get_absolute_statistics(date=None, as_kwargs=False, columns=None):
-    if date is None:
-        date = datetime.date.today() - datetime.timedelta(days=1)
+class AbsoluteStatisticsColumn(
+    namedtuple(
+        "AbsoluteStatisticsColumn",
+        ["get_base_queryset", "date_field", "distinct_field"],
+    )
+):
+    """Colonne des statistiques absolues : nombre cumulé d'éléments à une date donnée
+
+    Les éléments sont comptés à partir de leur champ de date `date_field` ; si
+    `distinct_field` est indiqué, seules les valeurs distinctes de ce champ sont comptées,
+    à partir de leur première apparition.
+    """
+
+    def get_queryset(self, date):
+        qs = self.get_base_queryset().filter(**{f"{self.date_field}__date__lte": date})
+        if self.distinct_field:
+            qs = qs.distinct(self.distinct_field).order_by(self.distinct_field)
+        return qs
+
+    def get_daily_counts(self, end):
+        """Renvoie le nombre de nouveaux éléments par jour, jusqu'à la date `end` incluse"""
+        qs = (
+            self.get_base_queryset()
+            .filter(**{f"{self.date_field}__date__lte": end})
+            .order_by()
+        )
 
-    querysets = {
-        # EVENTS
-        "event_count": Event.objects.public()
-        .listed()
-        .filter(start_time__date__lte=date),
-        # GROUPS
-        "local_supportgroup_count": (
-            SupportGroup.objects.active()
-            .filter(type=SupportGroup.TYPE_LOCAL_GROUP)
-            .filter(created__date__lte=date)
-        ),
-        "local_certified_supportgroup_count": (
-            SupportGroup.objects.active()
-            .filter(type=SupportGroup.TYPE_LOCAL_GROUP)
-            .certified()
-            .filter(certification_date__date__lte=date)
-        ),
-        "membership_person_count": (
-            Membership.objects.active()
-            .filter(created__date__lte=date)
-            .filter(supportgroup__type=SupportGroup.TYPE_LOCAL_GROUP)
-            .distinct("person_id")
-            .order_by("person_id")
-        ),
-        "boucle_departementale_membership_person_count": (
-            Membership.objects.active()
-            .filter(created__date__lte=date)
-            .filter(supportgroup__type=SupportGroup.TYPE_BOUCLE_DEPARTEMENTALE)
-            .distinct("person_id")
-            .order_by("person_id")
+        if not self.distinct_field:
+            return dict(
+                qs.annotate(day=TruncDate(self.date_field))
+                .values("day")
+                .annotate(count=Count("*"))
+                .values_list("day", "count")
+            )
+
+        # une valeur distincte est comptée à partir du jour de sa première apparition
+        first_days = (
+            qs.values(self.distinct_field)
+            .annotate(first_day=Min(TruncDate(self.date_field)))
+            .values_list("first_day", flat=True)
+        )
+        return Counter(first_days.iterator())
+
+
+ABSOLUTE_STATISTICS_COLUMNS = {
+    # EVENTS
+    "event_count": AbsoluteStatisticsColumn(
+        lambda: Event.objects.public().listed(), "start_time", None
+    ),
+    # GROUPS
+    "local_supportgroup_count": AbsoluteStatisticsColumn(
+        lambda: SupportGroup.objects.active().filter(
+            type=SupportGroup.TYPE_LOCAL_GROUP
         ),
-        # PEOPLE
-        "political_support_person_count": Person.objects.exclude(role__is_active=False)
-        .is_political_support()
-        .filter(created__date__lte=date),
-        "liaison_count": (
-            Person.objects.exclude(role__is_active=False)
-            .liaisons()
-            .filter(liaison_date__date__lte=date)
+        "created",
+        None,
+    ),
+    "local_certified_supportgroup_count": AbsoluteStatisticsColumn(
+        lambda: SupportGroup.objects.active()
+        .filter(type=SupportGroup.TYPE_LOCAL_GROUP)
+        .certified(),
+        "certification_date",
+        None,
+    ),
+    "membership_person_count": AbsoluteStatisticsColumn(
+        lambda: Membership.objects.active().filter(
+            supportgroup__type=SupportGroup.TYPE_LOCAL_GROUP
         ),
-        "lfi_newsletter_subscriber_count": (
-            Person.objects.exclude(role__is_active=False)
-            .filter(newsletters__contains=(Person.Newsletter.LFI_REGULIERE,))
-            .filter(created__date__lte=date)
+        "created",
+        "person_id",
+    ),
+    "boucle_departementale_membership_person_count": AbsoluteStatisticsColumn(
+        lambda: Membership.objects.active().filter(
+            supportgroup__type=SupportGroup.TYPE_BOUCLE_DEPARTEMENTALE
         ),
-        # MAILING
-        "sent_campaign_count": CampaignSentEvent.objects.filter(
-            datetime__date__lte=date
-        )
-        .distinct("campaign_id")
-        .order_by("campaign_id"),
-        "sent_campaign_email_count": CampaignSentEvent.objects.filter(
-            datetime__date__lte=date
+        "created",
+        "person_id",
+    ),
+    # PEOPLE
+    "political_support_person_count": AbsoluteStatisticsColumn(
+        lambda: Person.objects.exclude(role__is_active=False).is_political_support(),
+        "created",
+        None,
+    ),
+    "liaison_count": AbsoluteStatisticsColumn(
+        lambda: Person.objects.exclude(role__is_active=False).liaisons(),
+        "liaison_date",
+        None,
+    ),
+    "lfi_newsletter_subscriber_count": AbsoluteStatisticsColumn(
+        lambda: Person.objects.exclude(role__is_active=False).filter(
+            newsletters__contains=(Person.Newsletter.LFI_REGULIERE,)
         ),
+        "created",
+        None,
+    ),
+    # MAILING
+    "sent_campaign_count": AbsoluteStatisticsColumn(
+        lambda: CampaignSentEvent.objects.all(), "datetime", "campaign_id"
+    ),
+    "sent_campaign_email_count": AbsoluteStatisticsColumn(
+        lambda: CampaignSentEvent.objects.all(), "datetime", None
+    ),
+}
+
+
+def _get_columns(columns=None):
+    if not columns:
+        return ABSOLUTE_STATISTICS_COLUMNS
+    return {
+        key: column
+        for key, column in ABSOLUTE_STATISTICS_COLUMNS.items()
+        if key in columns
     }
 
-    if columns:
-        querysets = {key: qs for key, qs in querysets.items() if key in columns}
+
+def get_absolute_statistics(date=None, as_kwargs=False, columns=None):
+    if date is None:
+        date = datetime.date.today() - datetime.timedelta(days=1)
+
+    querysets = {
+        key: column.get_queryset(date) for key, column in _get_columns(columns).items()
+    }
 
     if not querysets:
         return querysets
@@ -81,6 +145,31 @@ def get_absolute_statistics(date=None, as_kwargs=False, columns=None):
     return querysets
 
 
+def get_absolute_statistics_for_period(start, end, columns=None):
+    """Calcule les statistiques absolues de chaque jour de la période, bornes incluses
+
+    Chaque colonne est calculée par une seule requête groupée par jour, dont les résultats
+    sont cumulés : le coût ne dépend pas du nombre de jours de la période.
+
+    :return: un dictionnaire associant à chaque date les valeurs de ses colonnes
+    """
+    days = [start + datetime.timedelta(days=i) for i in range((end - start).days + 1)]
+    columns = _get_columns(columns)
+    if not columns:
+        return {day: {} for day in days}
+
+    statistics = {day: {"date": day} for day in days}
+
+    for key, column in columns.items():
+        daily_counts = column.get_daily_counts(end)
+        total = sum(count for day, count in daily_counts.items() if day < start)
+        for day in days:
+            total += daily_counts.get(day, 0)
+            statistics[day][key] = total
+
+    return statistics
+
+
 MATERIEL_SALES_REPORT_FIELDS = (
     "total_orders",
     "total_items",
@@ -1,8 +1,19 @@
 from django.contrib import admin
 
+from agir.telegram import tasks
 from agir.telegram.models import TelegramSession, TelegramGroup
 
 
+def resynchronize_telegram_groups(modeladmin, request, queryset):
+    for pk in queryset.values_list("pk", flat=True):
+        tasks.update_telegram_groups.delay(pk, full=True)
+
+
+resynchronize_telegram_groups.short_description = (
+    "Resynchroniser entièrement avec les groupes Telegram"
+)
+
+
 @admin.register(TelegramSession)
 class TelegramSessionAdmin(admin.ModelAdmin):
     readonly_fields = ("phone_number", "session_string")
@@ -15,3 +26,4 @@ def has_add_permission(self, request):
 class TelegramGroupAdmin(admin.ModelAdmin):
     autocomplete_fields = ("segment",)
     readonly_fields = ("telegram_users", "telegram_ids")
+    actions = (resynchronize_telegram_groups,)
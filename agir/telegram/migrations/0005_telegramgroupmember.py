@@ -0,0 +1,63 @@
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("telegram", "0004_auto_20200701_1622"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="TelegramGroupMember",
+            fields=[
+                (
+                    "id",
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "phone_number",
+                    models.CharField(max_length=20, verbose_name="Numéro de téléphone"),
+                ),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[
+                            ("C", "Dans le groupe"),
+                            ("N", "Pas de compte Telegram"),
+                        ],
+                        max_length=1,
+                        verbose_name="Statut",
+                    ),
+                ),
+                (
+                    "chat_id",
+                    models.BigIntegerField(
+                        null=True, verbose_name="Identifiant du groupe Telegram"
+                    ),
+                ),
+                (
+                    "group",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="members",
+                        to="telegram.telegramgroup",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Membre de groupe Telegram",
+            },
+        ),
+        migrations.AddConstraint(
+            model_name="telegramgroupmember",
+            constraint=models.UniqueConstraint(
+                fields=("group", "phone_number"), name="telegram_member_unique"
+            ),
+        ),
+    ]
@@ -0,0 +1,18 @@
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("telegram", "0005_telegramgroupmember"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="telegramgroupmember",
+            name="checked_at",
+            field=models.DateTimeField(
+                default=django.utils.timezone.now, verbose_name="Date de vérification"
+            ),
+        ),
+    ]
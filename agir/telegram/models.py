@@ -1,6 +1,7 @@
 from django.conf import settings
 from django.contrib.postgres.fields import ArrayField
 from django.db import models
+from django.utils import timezone
 from phonenumber_field.modelfields import PhoneNumberField
 from pyrogram import Client
 
@@ -65,3 +66,35 @@ class TelegramGroup(TimeStampedModel, models.Model):
 
     def __str__(self):
         return self.name
+
+
+class TelegramGroupMember(models.Model):
+    """Numéro du segment déjà traité lors de la synchronisation d'un groupe Telegram
+
+    Ces lignes forment l'état connu de la synchronisation : seuls les numéros du segment
+    qui n'y figurent pas encore sont traités lors de la synchronisation suivante.
+    """
+
+    STATUS_IN_CHAT = "C"
+    STATUS_NOT_TELEGRAM_USER = "N"
+    STATUS_CHOICES = (
+        (STATUS_IN_CHAT, "Dans le groupe"),
+        (STATUS_NOT_TELEGRAM_USER, "Pas de compte Telegram"),
+    )
+
+    group = models.ForeignKey(
+        "TelegramGroup", related_name="members", on_delete=models.CASCADE
+    )
+    # numéro au format utilisé par Telegram : E.164 sans le +
+    phone_number = models.CharField("Numéro de téléphone", max_length=20)
+    status = models.CharField("Statut", max_length=1, choices=STATUS_CHOICES)
+    chat_id = models.BigIntegerField("Identifiant du groupe Telegram", null=True)
+    checked_at = models.DateTimeField("Date de vérification", default=timezone.now)
+
+    class Meta:
+        verbose_name = "Membre de groupe Telegram"
+        constraints = [
+            models.UniqueConstraint(
+                fields=["group", "phone_number"], name="telegram_member_unique"
+            )
+        ]
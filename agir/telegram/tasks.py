@@ -1,12 +1,18 @@
+from datetime import timedelta
 from time import sleep
+from uuid import uuid4
 
 from celery import shared_task
 from django.db import transaction
+from django.utils import timezone
 from pyrogram.types import ChatPermissions, InputPhoneContact
-from pyrogram.errors import PeerIdInvalid
 
-from agir.lib.phone_numbers import is_mobile_number
-from agir.telegram.models import TelegramGroup, TELEGRAM_META_KEY
+from agir.api.redis import get_auth_redis_client
+from agir.lib.celery import LANE_BULK, lane_options
+from agir.lib.sms.common import raw_phone_numbers, to_mobile_phone_number
+from agir.lib.utils import grouper
+from agir.people.models import Person
+from agir.telegram.models import TelegramGroup, TelegramGroupMember, TELEGRAM_META_KEY
 
 DEFAULT_GROUP_PERMISSIONS = ChatPermissions(
     can_send_messages=False,
@@ -15,107 +21,260 @@
     can_pin_messages=False,
 )
 
+# nombre de contacts importés (et donc vérifiés) à la fois
+IMPORT_BATCH_SIZE = 100
+# pause entre deux modifications des groupes Telegram, pour respecter leurs limites
+TELEGRAM_ACTION_DELAY = 5
+SYNC_LOCK_TIMEOUT = 3600
+# les numéros sans compte Telegram sont vérifiés à nouveau passé ce délai
+NOT_TELEGRAM_USER_RECHECK_DELAY = timedelta(days=30)
 
-def is_telegram_user(client, person):
-    try:
-        client.resolve_peer(str(person.contact_phone))
+# ne supprime le verrou que s'il appartient toujours à la synchronisation qui l'a pris
+RELEASE_LOCK_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+  return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
 
-        if not person.meta.get(TELEGRAM_META_KEY, False):
-            person.meta[TELEGRAM_META_KEY] = True
-            person.save(update_fields=("meta",))
 
-        return True
+def get_segment_numbers(segment):
+    """Renvoie les numéros de mobile du segment, au format Telegram, avec les noms associés"""
+    numbers = {}
+    for raw, first_name, last_name in raw_phone_numbers(
+        segment.get_subscribers_queryset(), "first_name", "last_name"
+    ).iterator():
+        phone_number = to_mobile_phone_number(raw)
+        if phone_number is not None:
+            numbers.setdefault(phone_number.as_e164[1:], (first_name, last_name))
+    return numbers
 
-    except PeerIdInvalid:
-        if person.meta.get(TELEGRAM_META_KEY, True):
-            person.meta[TELEGRAM_META_KEY] = False
-            person.save(update_fields=("meta",))
 
-        return False
+def update_telegram_meta(phone_numbers, telegram_numbers):
+    """Enregistre sur les personnes concernées si elles ont un compte Telegram"""
+    people = Person.objects.filter(
+        contact_phone__in=[f"+{phone_number}" for phone_number in phone_numbers]
+    ).only("id", "meta", "contact_phone")
 
+    changed = []
+    for person in people:
+        has_telegram = str(person.contact_phone)[1:] in telegram_numbers
+        if person.meta.get(TELEGRAM_META_KEY) != has_telegram:
+            person.meta[TELEGRAM_META_KEY] = has_telegram
+            changed.append(person)
 
-@shared_task(max_retries=2, bind=True)
-def update_telegram_groups(self, pk):
-    with transaction.atomic():
-        try:
-            instance = TelegramGroup.objects.select_for_update().get(pk=pk)
-        except TelegramGroup.DoesNotExist:
-            return
+    Person.objects.bulk_update(changed, ["meta"])
+
+
+class ChatSlots:
+    """Répartit les nouveaux membres entre les groupes Telegram, en en créant si nécessaire"""
+
+    def __init__(self, client, group):
+        self.client = client
+        self.group = group
+        self.empty_slots = {}
+
+    def _chat_ids(self):
+        for chat_id in self.group.telegram_ids:
+            if chat_id not in self.empty_slots:
+                self.empty_slots[chat_id] = 50 - self.client.get_chat_members_count(
+                    chat_id
+                )
+            yield chat_id
+
+        while True:
+            title = f"{self.group.name} {len(self.group.telegram_ids) + 1}"
+            if self.group.type == TelegramGroup.CHAT_TYPE_SUPERGROUP:
+                chat_id = self.client.create_supergroup(title=title).id
+                self.client.set_chat_permissions(chat_id, DEFAULT_GROUP_PERMISSIONS)
+            elif self.group.type == TelegramGroup.CHAT_TYPE_CHANNEL:
+                chat_id = self.client.create_channel(title=title).id
+            self.group.telegram_ids = self.group.telegram_ids + [chat_id]
+            self.empty_slots[chat_id] = 200
+            sleep(TELEGRAM_ACTION_DELAY)
+            yield chat_id
+
+    def allocate(self, phone_numbers):
+        """Génère des couples (chat_id, numéros) pour ajouter tous les numéros"""
+        remaining = list(phone_numbers)
+        chat_ids = self._chat_ids()
+        while remaining:
+            chat_id = next(chat_ids)
+            while remaining and self.empty_slots[chat_id] > 0:
+                slots = self.empty_slots[chat_id]
+                to_yield, remaining = remaining[:slots], remaining[slots:]
+                yield chat_id, to_yield
+
+    def refresh(self, chat_id):
+        self.empty_slots[chat_id] = 200 - self.client.get_chat_members_count(chat_id)
 
-        with instance.admin_session.create_client() as client:
-            in_chat_numbers = set(
-                member.user.phone_number
-                for chat_id in instance.telegram_ids
-                for member in client.iter_chat_members(chat_id)
+
+def seed_chat_members(client, group):
+    """Enregistre les membres actuels des groupes Telegram comme déjà synchronisés"""
+    TelegramGroupMember.objects.bulk_create(
+        [
+            TelegramGroupMember(
+                group=group,
+                phone_number=member.user.phone_number,
+                status=TelegramGroupMember.STATUS_IN_CHAT,
+                chat_id=chat_id,
             )
+            for chat_id in group.telegram_ids
+            for member in client.iter_chat_members(chat_id)
+            if member.user.phone_number
+        ],
+        ignore_conflicts=True,
+    )
 
-            chat_empty_slots = {
-                chat_id: 50 - client.get_chat_members_count(chat_id)
-                for chat_id in instance.telegram_ids
-            }
 
-            in_segment_and_chat_people = [
-                person
-                for person in instance.segment.get_subscribers_queryset()
-                if str(person.contact_phone)[1:] in in_chat_numbers
-            ]
-            in_segment_not_chat_people = [
-                person
-                for person in instance.segment.get_subscribers_queryset()
-                if person.contact_phone
-                and is_mobile_number(person.contact_phone)
-                and str(person.contact_phone)[1:] not in in_chat_numbers
-            ]
+def get_numbers_to_process(group, segment_numbers):
+    """Renvoie les numéros du segment qui ne figurent pas dans l'état connu du groupe
+
+    Les numéros sans compte Telegram sont oubliés (et donc vérifiés à nouveau) lorsqu'ils
+    sortent du segment, ou lorsque leur dernière vérification date de plus de
+    `NOT_TELEGRAM_USER_RECHECK_DELAY`.
+    """
+    not_telegram_users = group.members.filter(
+        status=TelegramGroupMember.STATUS_NOT_TELEGRAM_USER
+    )
+    not_telegram_users.filter(
+        checked_at__lt=timezone.now() - NOT_TELEGRAM_USER_RECHECK_DELAY
+    ).delete()
+
+    known = set(group.members.values_list("phone_number", flat=True))
+
+    left_segment = [
+        phone_number
+        for phone_number in not_telegram_users.values_list("phone_number", flat=True)
+        if phone_number not in segment_numbers
+    ]
+    for phone_numbers in grouper(left_segment, 1000):
+        not_telegram_users.filter(phone_number__in=list(phone_numbers)).delete()
+
+    return [
+        phone_number for phone_number in segment_numbers if phone_number not in known
+    ]
+
+
+def synchronize_telegram_group(group, full=False):
+    """Ajoute aux groupes Telegram les personnes du segment qui n'ont pas encore été traitées
+
+    Les membres traités sont enregistrés (avec leur statut) après chaque lot : une
+    synchronisation interrompue reprend là où elle s'était arrêtée, et les synchronisations
+    suivantes ne traitent que les nouveaux numéros du segment.
+
+    :param full: ignore l'état enregistré et repart des membres actuels des groupes Telegram
+    """
+    segment_numbers = get_segment_numbers(group.segment)
 
-            client.import_contacts(
+    with group.admin_session.create_client() as client:
+        if full:
+            group.members.all().delete()
+
+        if not group.members.exists():
+            seed_chat_members(client, group)
+
+        to_process = get_numbers_to_process(group, segment_numbers)
+        chat_slots = ChatSlots(client, group)
+
+        for batch in grouper(to_process, IMPORT_BATCH_SIZE):
+            batch = list(batch)
+            imported = client.import_contacts(
                 [
                     InputPhoneContact(
-                        phone=str(person.contact_phone),
-                        first_name=person.first_name,
-                        last_name=person.last_name,
+                        phone=f"+{phone_number}",
+                        first_name=segment_numbers[phone_number][0],
+                        last_name=segment_numbers[phone_number][1],
                     )
-                    for person in in_segment_not_chat_people
+                    for phone_number in batch
                 ]
             )
+            telegram_numbers = {user.phone for user in imported.users if user.phone}
 
-            new_chat_members = [
-                person
-                for person in in_segment_not_chat_people
-                if is_telegram_user(client, person)
+            members = [
+                TelegramGroupMember(
+                    group=group,
+                    phone_number=phone_number,
+                    status=TelegramGroupMember.STATUS_NOT_TELEGRAM_USER,
+                )
+                for phone_number in batch
+                if phone_number not in telegram_numbers
             ]
 
-            def chat_generator():
-                for chat_id in instance.telegram_ids:
-                    yield chat_id
-
-                while True:
-                    title = f"{instance.name} {len(instance.telegram_ids) + 1}"
-                    if instance.type == TelegramGroup.CHAT_TYPE_SUPERGROUP:
-                        chat_id = client.create_supergroup(title=title).id
-                        client.set_chat_permissions(chat_id, DEFAULT_GROUP_PERMISSIONS)
-                    elif instance.type == TelegramGroup.CHAT_TYPE_CHANNEL:
-                        chat_id = client.create_channel(title=title).id
-                    instance.telegram_ids = instance.telegram_ids + [chat_id]
-                    chat_empty_slots[chat_id] = 200
-                    sleep(5)
-                    yield chat_id
-
-            def new_chat_members_generator():
-                remaining = new_chat_members
-                chat_iterator = chat_generator()
-                while len(remaining) > 0:
-                    chat_id = next(chat_iterator)
-                    while len(remaining) > 0 and chat_empty_slots[chat_id] > 0:
-                        to_yield = remaining[: chat_empty_slots[chat_id]]
-                        remaining = remaining[chat_empty_slots[chat_id] :]
-                        yield chat_id, [str(p.contact_phone) for p in to_yield]
-
-            for chat_id, phones_to_add in new_chat_members_generator():
-                client.add_chat_members(chat_id, phones_to_add)
-                sleep(5)
-                chat_empty_slots[chat_id] = 200 - client.get_chat_members_count(chat_id)
-
-        TelegramGroup.objects.filter(pk=pk).update(
-            telegram_ids=instance.telegram_ids,
-            telegram_users=len(new_chat_members) + len(in_segment_and_chat_people),
-        )
+            for chat_id, phone_numbers in chat_slots.allocate(
+                p for p in batch if p in telegram_numbers
+            ):
+                client.add_chat_members(chat_id, [f"+{p}" for p in phone_numbers])
+                sleep(TELEGRAM_ACTION_DELAY)
+                chat_slots.refresh(chat_id)
+                members.extend(
+                    TelegramGroupMember(
+                        group=group,
+                        phone_number=phone_number,
+                        status=TelegramGroupMember.STATUS_IN_CHAT,
+                        chat_id=chat_id,
+                    )
+                    for phone_number in phone_numbers
+                )
+
+            with transaction.atomic():
+                TelegramGroupMember.objects.bulk_create(members, ignore_conflicts=True)
+                TelegramGroup.objects.filter(pk=group.pk).update(
+                    telegram_ids=group.telegram_ids
+                )
+                update_telegram_meta(batch, telegram_numbers)
+
+    in_chat = group.members.filter(
+        status=TelegramGroupMember.STATUS_IN_CHAT
+    ).values_list("phone_number", flat=True)
+    TelegramGroup.objects.filter(pk=group.pk).update(
+        telegram_ids=group.telegram_ids,
+        telegram_users=sum(
+            1 for phone_number in in_chat.iterator() if phone_number in segment_numbers
+        ),
+    )
+
+
+def sync_lock_key(pk):
+    return f"TelegramGroupSync:{pk}"
+
+
+def sync_pending_key(pk):
+    return f"TelegramGroupSync:{pk}:pending"
+
+
+@shared_task(**lane_options(LANE_BULK))
+def update_telegram_groups(pk, full=False):
+    # verrou Redis plutôt qu'un select_for_update maintenu pendant toute la synchronisation
+    redis_client = get_auth_redis_client()
+    lock_key = sync_lock_key(pk)
+    pending_key = sync_pending_key(pk)
+
+    # la demande est enregistrée avant de prendre le verrou : si une synchronisation est
+    # déjà en cours, c'est elle qui en programmera une nouvelle à la fin
+    redis_client.set(pending_key, int(full), nx=not full, ex=2 * SYNC_LOCK_TIMEOUT)
+
+    token = uuid4().hex
+    if not redis_client.set(lock_key, token, nx=True, ex=SYNC_LOCK_TIMEOUT):
+        return
+
+    try:
+        pipeline = redis_client.pipeline()
+        pipeline.get(pending_key)
+        pipeline.delete(pending_key)
+        pending, _ = pipeline.execute()
+        full = full or pending == b"1"
+
+        try:
+            instance = TelegramGroup.objects.select_related(
+                "segment", "admin_session"
+            ).get(pk=pk)
+        except TelegramGroup.DoesNotExist:
+            return
+
+        synchronize_telegram_group(instance, full=full)
+    finally:
+        redis_client.register_script(RELEASE_LOCK_SCRIPT)(keys=[lock_key], args=[token])
+
+    if redis_client.exists(pending_key):
+        update_telegram_groups.delay(pk)
@@ -0,0 +1,151 @@
+from unittest.mock import MagicMock, patch
+
+from django.test import TestCase
+from django.utils import timezone
+
+from agir.api.redis import get_auth_redis_client, using_separate_redis_server
+from agir.mailing.models import Segment
+from agir.telegram import tasks
+from agir.telegram.models import TelegramGroup, TelegramGroupMember, TelegramSession
+
+
+@using_separate_redis_server
+class TelegramGroupSyncTestCase(TestCase):
+    def setUp(self):
+        with patch("agir.telegram.signals.tasks.update_telegram_groups"):
+            self.group = TelegramGroup.objects.create(
+                name="Groupe",
+                type=TelegramGroup.CHAT_TYPE_SUPERGROUP,
+                telegram_ids=[1],
+                segment=Segment.objects.create(newsletters=[]),
+                admin_session=TelegramSession.objects.create(
+                    phone_number="+33612345678"
+                ),
+            )
+
+    def add_member(self, phone_number, status, checked_at=None):
+        return TelegramGroupMember.objects.create(
+            group=self.group,
+            phone_number=phone_number,
+            status=status,
+            checked_at=checked_at or timezone.now(),
+        )
+
+    def test_only_unknown_and_expired_numbers_are_processed(self):
+        self.add_member("33600000001", TelegramGroupMember.STATUS_IN_CHAT)
+        self.add_member("33600000002", TelegramGroupMember.STATUS_NOT_TELEGRAM_USER)
+        self.add_member(
+            "33600000003",
+            TelegramGroupMember.STATUS_NOT_TELEGRAM_USER,
+            checked_at=timezone.now()
+            - tasks.NOT_TELEGRAM_USER_RECHECK_DELAY
+            - timezone.timedelta(days=1),
+        )
+        self.add_member("33600000004", TelegramGroupMember.STATUS_NOT_TELEGRAM_USER)
+
+        segment_numbers = {
+            phone_number: ("Prénom", "Nom")
+            for phone_number in (
+                "33600000001",
+                "33600000002",
+                "33600000003",
+                "33600000005",
+            )
+        }
+
+        self.assertCountEqual(
+            tasks.get_numbers_to_process(self.group, segment_numbers),
+            ["33600000003", "33600000005"],
+        )
+        # le numéro sorti du segment est oublié
+        self.assertCountEqual(
+            self.group.members.values_list("phone_number", flat=True),
+            ["33600000001", "33600000002"],
+        )
+
+    @patch("agir.telegram.tasks.sleep")
+    @patch("agir.telegram.tasks.IMPORT_BATCH_SIZE", 2)
+    def test_numbers_are_imported_and_recorded_by_batch(self, _sleep):
+        segment_numbers = {
+            f"3360000000{i}": (f"Prénom {i}", "Nom") for i in range(1, 6)
+        }
+        telegram_numbers = {"33600000001", "33600000003", "33600000004"}
+
+        client = MagicMock()
+        client.iter_chat_members.return_value = []
+        client.get_chat_members_count.return_value = 0
+        client.import_contacts.side_effect = lambda contacts: MagicMock(
+            users=[
+                MagicMock(phone=c.phone[1:])
+                for c in contacts
+                if c.phone[1:] in telegram_numbers
+            ]
+        )
+
+        with patch(
+            "agir.telegram.tasks.get_segment_numbers", return_value=segment_numbers
+        ), patch.object(TelegramSession, "create_client") as create_client:
+            create_client.return_value.__enter__.return_value = client
+            tasks.synchronize_telegram_group(self.group)
+
+        self.assertEqual(client.import_contacts.call_count, 3)
+        self.assertEqual(
+            [c.args for c in client.add_chat_members.call_args_list],
+            [
+                (1, ["+33600000001"]),
+                (1, ["+33600000003", "+33600000004"]),
+            ],
+        )
+        self.assertEqual(
+            dict(self.group.members.values_list("phone_number", "status")),
+            {
+                "33600000001": TelegramGroupMember.STATUS_IN_CHAT,
+                "33600000002": TelegramGroupMember.STATUS_NOT_TELEGRAM_USER,
+                "33600000003": TelegramGroupMember.STATUS_IN_CHAT,
+                "33600000004": TelegramGroupMember.STATUS_IN_CHAT,
+                "33600000005": TelegramGroupMember.STATUS_NOT_TELEGRAM_USER,
+            },
+        )
+        self.group.refresh_from_db()
+        self.assertEqual(self.group.telegram_users, 3)
+
+        # une nouvelle synchronisation ne traite plus aucun numéro
+        client.reset_mock()
+        with patch(
+            "agir.telegram.tasks.get_segment_numbers", return_value=segment_numbers
+        ), patch.object(TelegramSession, "create_client") as create_client:
+            create_client.return_value.__enter__.return_value = client
+            tasks.synchronize_telegram_group(self.group)
+        client.import_contacts.assert_not_called()
+
+    @patch("agir.telegram.tasks.synchronize_telegram_group")
+    def test_sync_requested_during_another_sync_is_run_afterwards(self, synchronize):
+        redis_client = get_auth_redis_client()
+        lock_key = tasks.sync_lock_key(self.group.pk)
+
+        def request_full_sync(group, full):
+            # demande faite pendant la synchronisation, alors que le verrou est pris
+            if synchronize.call_count == 1:
+                tasks.update_telegram_groups(group.pk, full=True)
+
+        synchronize.side_effect = request_full_sync
+        tasks.update_telegram_groups(self.group.pk)
+
+        self.assertEqual(
+            [c.kwargs["full"] for c in synchronize.call_args_list], [False, True]
+        )
+        self.assertFalse(redis_client.exists(lock_key))
+        self.assertFalse(redis_client.exists(tasks.sync_pending_key(self.group.pk)))
+
+    @patch("agir.telegram.tasks.synchronize_telegram_group")
+    def test_lock_of_another_sync_is_not_released(self, synchronize):
+        redis_client = get_auth_redis_client()
+        lock_key = tasks.sync_lock_key(self.group.pk)
+
+        # le verrou a expiré pendant la synchronisation et a été pris par une autre
+        synchronize.side_effect = lambda group, full: redis_client.set(
+            lock_key, "autre"
+        )
+        tasks.update_telegram_groups(self.group.pk)
+
+        self.assertEqual(redis_client.get(lock_key), b"autre")
@@ -1,3 +1,4 @@
+import json
 from copy import deepcopy
 from datetime import timedelta
 from functools import partial
@@ -6,8 +7,8 @@
 from django.contrib.gis.db.models.functions import Distance
 from django.contrib.gis.measure import D
 from django.contrib.postgres.aggregates import ArrayAgg
-from django.db import transaction
-from django.db.models import Count, Q, Case, When, Value
+from django.db import transaction, connection
+from django.db.models import Count, Case, When, Value
 from django.db.models.functions import Coalesce
 from django.utils import timezone
 
@@ -31,6 +32,8 @@
 # TODO: Choose a proxy-to-request distance limit (in meters)
 PROXY_TO_REQUEST_DISTANCE_LIMIT = 30000  # 30 KM
 PER_VOTING_PROXY_REQUEST_INVITATION_LIMIT = 10
+# nombre de volontaires potentiel·les chargé·es par demande, rapporté à la limite d'invitations
+CANDIDATE_OVERFETCH_FACTOR = 2
 
 
 def create_or_update_voting_proxy_request(data):
@@ -262,42 +265,249 @@ def send_matching_requests_to_proxy(proxy, matching_request_ids):
     )
 
 
-def match_available_proxies_with_requests(
-    pending_requests, notify_proxy=send_matching_requests_to_proxy
-):
-    fulfilled_request_ids = []
-    pending_request_ids = list(pending_requests.values_list("id", flat=True))
-
-    # Retrieve all available proxy that has not been matched in the last two days
-    available_proxies = (
-        VotingProxy.objects.available()
-        .select_related("person")
-        .order_by(
+def send_matching_requests_to_proxies(matches):
+    """Enregistre et notifie en une fois plusieurs propositions de procuration
+
+    :param matches: une liste de couples (volontaire, identifiants des demandes proposées)
+    """
+    if not matches:
+        return
+
+    VotingProxy.objects.filter(id__in=[proxy.id for proxy, _ in matches]).update(
+        last_matched=timezone.now()
+    )
+    for proxy, matching_request_ids in matches:
+        transaction.on_commit(
+            partial(
+                tasks.send_matching_request_to_voting_proxy.delay,
+                proxy.id,
+                list(matching_request_ids),
+            )
+        )
+
+
+def get_voting_proxy_matching_candidates(pending_requests, available_proxies):
+    """Renvoie en une seule requête tous les couples (volontaire, demande) compatibles
+
+    Un couple est compatible si le ou la volontaire est disponible à la date de la demande,
+    n'en est pas l'auteur·ice, et vote dans la même circonscription consulaire, ou à défaut,
+    habite à moins de `PROXY_TO_REQUEST_DISTANCE_LIMIT` mètres de la mairie de la commune
+    de la demande ou vote dans cette même commune.
+
+    Chaque ligne renvoyée contient l'identifiant du ou de la volontaire, l'identifiant,
+    l'email et la date de la demande, la distance à la mairie et un booléen indiquant si le
+    bureau de vote est le même.
+    """
+    request_opts = VotingProxyRequest._meta
+    proxy_opts = VotingProxy._meta
+    requests_sql, requests_params = (
+        pending_requests.order_by().values("id").query.sql_with_params()
+    )
+    proxies_sql, proxies_params = (
+        available_proxies.order_by().values("id").query.sql_with_params()
+    )
+    commune_table = request_opts.get_field("commune").related_model._meta.db_table
+    person_table = proxy_opts.get_field("person").related_model._meta.db_table
+
+    near = """
+        person.coordinates IS NOT NULL
+        AND commune.mairie_localisation IS NOT NULL
+        AND ST_DWithin(commune.mairie_localisation::geography, person.coordinates::geography, %s)
+    """
+
+    query = f"""
+        SELECT
+          proxy.id,
+          request.id,
+          request.email,
+          request.voting_date,
+          CASE
+            WHEN proxy.consulate_id IS NOT NULL THEN 0
+            WHEN {near} THEN ST_Distance(commune.mairie_localisation::geography, person.coordinates::geography)
+            ELSE %s
+          END AS distance,
+          COALESCE(
+            request.commune_id = proxy.commune_id
+            AND UPPER(request.polling_station_number) = UPPER(proxy.polling_station_number),
+            FALSE
+          ) AS polling_station_match
+        FROM "{proxy_opts.db_table}" AS proxy
+        LEFT JOIN "{person_table}" AS person ON person.id = proxy.person_id
+        JOIN "{request_opts.db_table}" AS request
+          ON request.voting_date::text = ANY(proxy.voting_dates)
+          AND request.email <> proxy.email
+        LEFT JOIN "{commune_table}" AS commune ON commune.id = request.commune_id
+        WHERE proxy.id IN ({proxies_sql})
+          AND request.id IN ({requests_sql})
+          AND (
+            (proxy.consulate_id IS NOT NULL AND request.consulate_id = proxy.consulate_id)
+            OR (
+              proxy.consulate_id IS NULL
+              AND (request.commune_id = proxy.commune_id OR {near})
+            )
+          )
+    """
+    params = (
+        PROXY_TO_REQUEST_DISTANCE_LIMIT,
+        PROXY_TO_REQUEST_DISTANCE_LIMIT,
+        *proxies_params,
+        *requests_params,
+        PROXY_TO_REQUEST_DISTANCE_LIMIT,
+    )
+
+    with connection.cursor() as cursor:
+        cursor.execute(query, params)
+        return cursor.fetchall()
+
+
+def solve_voting_proxy_assignment(proxy_ids, candidates):
+    """Calcule une affectation des demandes aux volontaires
+
+    Chaque volontaire se voit proposer au plus les demandes d'une seule personne (toutes
+    celles compatibles avec ses disponibilités), et chaque demande n'est proposée qu'à un·e
+    seul·e volontaire.
+
+    Les volontaires sont traité·es dans l'ordre de priorité donné ; chacun·e essaie ses
+    demandeur·ses par ordre de préférence (distance, bureau de vote, nombre de dates
+    communes). Lorsque toutes les demandes compatibles sont déjà prises, on cherche à
+    réaffecter le ou la volontaire qui les détient à d'autres demandes (chemin augmentant),
+    de façon à maximiser le nombre de volontaires affecté·es.
+
+    :param proxy_ids: les identifiants des volontaires, par ordre de priorité décroissante
+    :param candidates: les couples compatibles (cf. `get_voting_proxy_matching_candidates`)
+    :return: un dictionnaire associant à chaque volontaire affecté·e la liste des
+        identifiants des demandes qui lui sont proposées
+    """
+    options = {}
+    for proxy_id, request_id, email, _, distance, polling_station_match in candidates:
+        option = options.setdefault(proxy_id, {}).setdefault(
+            email,
+            {"request_ids": set(), "distance": distance, "polling_station": False},
+        )
+        option["request_ids"].add(request_id)
+        option["distance"] = min(option["distance"], distance)
+        option["polling_station"] = option["polling_station"] or polling_station_match
+
+    preferences = {
+        proxy_id: sorted(
+            proxy_options.items(),
+            key=lambda item: (
+                item[1]["distance"],
+                not item[1]["polling_station"],
+                -len(item[1]["request_ids"]),
+            ),
+        )
+        for proxy_id, proxy_options in options.items()
+    }
+
+    request_holders = {}
+    assignment = {}
+
+    def assign(proxy_id, request_ids):
+        assignment[proxy_id] = request_ids
+        for request_id in request_ids:
+            request_holders[request_id] = proxy_id
+
+    def unassign(proxy_id):
+        request_ids = assignment.pop(proxy_id)
+        for request_id in request_ids:
+            del request_holders[request_id]
+        return request_ids
+
+    def try_assign(proxy_id, visited):
+        for email, option in preferences.get(proxy_id, []):
+            if email in visited:
+                continue
+            visited.add(email)
+
+            free = {r for r in option["request_ids"] if r not in request_holders}
+            if free:
+                assign(proxy_id, free)
+                return True
+
+            # toutes les demandes compatibles sont prises : on essaye de déplacer
+            # le ou la volontaire qui les détient, s'il n'y en a qu'un·e
+            holders = {request_holders[r] for r in option["request_ids"]}
+            if len(holders) != 1:
+                continue
+            (holder,) = holders
+            previous = unassign(holder)
+            if try_assign(holder, visited):
+                assign(
+                    proxy_id,
+                    {r for r in option["request_ids"] if r not in request_holders},
+                )
+                return True
+            assign(holder, previous)
+
+        return False
+
+    for proxy_id in proxy_ids:
+        if proxy_id in preferences:
+            try_assign(proxy_id, set())
+
+    return {
+        proxy_id: sorted(request_ids)
+        for proxy_id, request_ids in assignment.items()
+        if request_ids
+    }
+
+
+def get_voting_proxy_matching(pending_requests):
+    """Calcule les propositions à faire aux volontaires disponibles, sans rien modifier
+
+    Renvoie un dictionnaire associant l'identifiant de chaque volontaire retenu·e à la liste
+    des identifiants des demandes à lui proposer.
+    """
+    available_proxies = VotingProxy.objects.available()
+    proxy_ids = list(
+        available_proxies.order_by(
             "-voting_dates__len",
             Coalesce("last_matched", Value("2022-01-01 00:00:00")).asc(),
-        )
+        ).values_list("id", flat=True)
     )
+    if not proxy_ids:
+        return {}
+
+    # les dates pour lesquelles les volontaires ont déjà accepté une demande
+    unavailable = {
+        (proxy_id, voting_date)
+        for proxy_id, voting_date in VotingProxyRequest.objects.filter(
+            proxy_id__in=proxy_ids
+        ).values_list("proxy_id", "voting_date")
+    }
+    candidates = [
+        candidate
+        for candidate in get_voting_proxy_matching_candidates(
+            pending_requests, available_proxies
+        )
+        if (candidate[0], candidate[3]) not in unavailable
+    ]
 
-    # Try to match available voting proxies with pending requests
-    for proxy in available_proxies:
-        if len(pending_request_ids) == 0:
-            break
-        try:
-            matching_request_ids = get_voting_proxy_requests_for_proxy(
-                proxy, pending_request_ids
-            ).values_list("id", flat=True)
-        except VotingProxyRequest.DoesNotExist:
-            pass
-        else:
-            notify_proxy(proxy, matching_request_ids)
-            fulfilled_request_ids += matching_request_ids
-            pending_request_ids = [
-                pending_request_id
-                for pending_request_id in pending_request_ids
-                if pending_request_id not in fulfilled_request_ids
-            ]
+    return solve_voting_proxy_assignment(proxy_ids, candidates)
+
+
+def match_available_proxies_with_requests(pending_requests, notify_proxy=None):
+    """Propose les demandes en attente aux volontaires disponibles
+
+    :param notify_proxy: une fonction appelée pour chaque volontaire avec les identifiants
+        des demandes qui lui sont proposées ; par défaut, les propositions sont enregistrées
+        et envoyées en une fois par `send_matching_requests_to_proxies`
+    :return: la liste des identifiants des demandes proposées
+    """
+    matching = get_voting_proxy_matching(pending_requests)
+    proxies = VotingProxy.objects.select_related("person").in_bulk(matching.keys())
+    matches = [
+        (proxies[proxy_id], request_ids) for proxy_id, request_ids in matching.items()
+    ]
 
-    return fulfilled_request_ids
+    if notify_proxy is None:
+        send_matching_requests_to_proxies(matches)
+    else:
+        for proxy, request_ids in matches:
+            notify_proxy(proxy, request_ids)
+
+    return [request_id for _, request_ids in matches for request_id in request_ids]
 
 
 def invite_voting_proxy_candidates(candidates, request):
@@ -347,75 +557,186 @@ def get_voting_proxy_candidates_queryset(request, blacklist_ids):
     return candidates
 
 
+def get_ranked_voting_proxy_candidates_by_commune(pending_requests):
+    """Recherche en une seule requête les volontaires potentiel·les de chaque commune
+
+    Pour chaque commune ayant des demandes en attente, une jointure latérale sélectionne
+    les personnes habitant à proximité de la mairie (ou à défaut, dans la commune ou l'un
+    de ses codes postaux), classées par nombre de participations à des événements au cours
+    de l'année écoulée. On en garde davantage que nécessaire
+    (`CANDIDATE_OVERFETCH_FACTOR`), pour pouvoir éviter en mémoire d'inviter plusieurs fois
+    la même personne pour des demandes différentes.
+
+    Renvoie un dictionnaire associant à chaque identifiant de commune la liste ordonnée des
+    couples (identifiant de la personne, adresses email de la personne).
+    """
+    from agir.events.models import RSVP, Event
+    from agir.people.models import PersonEmail
+
+    requests = pending_requests.exclude(commune__isnull=True)
+    commune_ids = set(requests.values_list("commune_id", flat=True))
+    if not commune_ids:
+        return {}
+
+    zip_codes = {}
+    for commune_id, zip_code in Commune.objects.filter(
+        id__in=commune_ids, mairie_localisation__isnull=True
+    ).values_list("id", "codes_postaux__code"):
+        if zip_code:
+            zip_codes.setdefault(str(commune_id), []).append(zip_code)
+
+    requests_sql, requests_params = (
+        requests.order_by().values("id").query.sql_with_params()
+    )
+    candidates_sql, candidates_params = (
+        get_voting_proxy_candidates_queryset(None, None)
+        .order_by()
+        .values("id")
+        .query.sql_with_params()
+    )
+
+    query = f"""
+        WITH pending AS (
+          SELECT commune_id, COUNT(DISTINCT email) AS request_count
+          FROM "{VotingProxyRequest._meta.db_table}"
+          WHERE id IN ({requests_sql})
+          GROUP BY commune_id
+        )
+        SELECT pending.commune_id, candidate.id, candidate.emails
+        FROM pending
+        JOIN "{Commune._meta.db_table}" AS commune ON commune.id = pending.commune_id
+        CROSS JOIN LATERAL (
+          SELECT
+            person.id,
+            ARRAY(
+              SELECT email.address FROM "{PersonEmail._meta.db_table}" AS email
+              WHERE email.person_id = person.id
+            ) AS emails,
+            (
+              SELECT COUNT(DISTINCT rsvp.id)
+              FROM "{RSVP._meta.db_table}" AS rsvp
+              JOIN "{Event._meta.db_table}" AS event ON event.id = rsvp.event_id
+              WHERE rsvp.person_id = person.id AND event.end_time >= %s
+            ) AS rsvp_count
+          FROM "{Person._meta.db_table}" AS person
+          WHERE person.id IN ({candidates_sql})
+            AND CASE
+              WHEN commune.mairie_localisation IS NOT NULL THEN
+                person.coordinates IS NOT NULL
+                AND ST_DWithin(person.coordinates::geography, commune.mairie_localisation::geography, %s)
+              ELSE
+                person.location_citycode = commune.code
+                OR person.location_zip = ANY(
+                  ARRAY(SELECT jsonb_array_elements_text(%s::jsonb -> commune.id::text))
+                )
+            END
+          ORDER BY rsvp_count DESC, person.id
+          LIMIT pending.request_count * %s
+        ) AS candidate
+        ORDER BY pending.commune_id, candidate.rsvp_count DESC, candidate.id
+    """
+    params = (
+        *requests_params,
+        timezone.now() - timedelta(days=365),
+        *candidates_params,
+        PROXY_TO_REQUEST_DISTANCE_LIMIT,
+        json.dumps(zip_codes),
+        PER_VOTING_PROXY_REQUEST_INVITATION_LIMIT * CANDIDATE_OVERFETCH_FACTOR,
+    )
+
+    candidates = {}
+    with connection.cursor() as cursor:
+        cursor.execute(query, params)
+        for commune_id, person_id, emails in cursor.fetchall():
+            candidates.setdefault(commune_id, []).append((person_id, emails))
+
+    return candidates
+
+
+def get_ranked_voting_proxy_candidates_by_consulate(pending_requests):
+    """Recherche les volontaires potentiel·les de chaque circonscription consulaire
+
+    Une requête est faite par circonscription (et non plus par demande), et renvoie un
+    dictionnaire associant à chaque identifiant de circonscription la liste des couples
+    (identifiant de la personne, adresses email de la personne).
+    """
+    consulates = (
+        pending_requests.exclude(consulate__pays__isnull=True)
+        .values("consulate_id", "consulate__pays")
+        .annotate(request_count=Count("email", distinct=True))
+        .order_by()
+    )
+
+    candidates = {}
+    for consulate in consulates:
+        pays = consulate["consulate__pays"].split(",")
+        limit = (
+            consulate["request_count"]
+            * PER_VOTING_PROXY_REQUEST_INVITATION_LIMIT
+            * CANDIDATE_OVERFETCH_FACTOR
+        )
+        candidates[consulate["consulate_id"]] = list(
+            get_voting_proxy_candidates_queryset(None, None)
+            .filter(location_country__in=pays)
+            .annotate(addresses=ArrayAgg("emails__address", distinct=True))
+            .order_by("id")
+            .values_list("id", "addresses")[:limit]
+        )
+
+    return candidates
+
+
 def find_voting_proxy_candidates_for_requests(
     pending_requests, send_invitations=invite_voting_proxy_candidates
 ):
+    """Invite des personnes à devenir volontaires pour les demandes en attente
+
+    Les volontaires potentiel·les sont recherché·es en une fois pour toutes les communes et
+    circonscriptions consulaires concernées, puis réparti·es en mémoire entre les demandes,
+    sans jamais inviter deux fois la même personne ni l'auteur·ice de la demande.
+    """
     possibly_fulfilled_request_ids = []
     candidate_ids = []
+    invited_person_ids = set()
+
+    def invite(request, ranked_candidates):
+        chosen = []
+        for person_id, emails in ranked_candidates:
+            if len(chosen) >= PER_VOTING_PROXY_REQUEST_INVITATION_LIMIT:
+                break
+            if person_id in invited_person_ids or request["email"] in emails:
+                continue
+            chosen.append(person_id)
+
+        if not chosen:
+            return
+
+        invited_person_ids.update(chosen)
+        candidate_ids.extend(
+            send_invitations(Person.objects.filter(id__in=chosen), request)
+        )
+        possibly_fulfilled_request_ids.extend(request["ids"])
 
     # Find candidates for consulate requests
+    consulate_candidates = get_ranked_voting_proxy_candidates_by_consulate(
+        pending_requests
+    )
     for request in (
         pending_requests.exclude(consulate__pays__isnull=True)
-        .values("email", "consulate__pays")
+        .values("email", "consulate_id")
         .annotate(ids=ArrayAgg("id"))
+        .order_by()
     ):
-        pays = request["consulate__pays"].split(",")
-        candidates = get_voting_proxy_candidates_queryset(
-            request, candidate_ids
-        ).filter(location_country__in=pays)[:PER_VOTING_PROXY_REQUEST_INVITATION_LIMIT]
-
-        if candidates.exists():
-            invited_candidate_ids = send_invitations(candidates, request)
-            candidate_ids += invited_candidate_ids
-            possibly_fulfilled_request_ids += request["ids"]
+        invite(request, consulate_candidates.get(request["consulate_id"], []))
 
     # Find candidates for commune requests
+    commune_candidates = get_ranked_voting_proxy_candidates_by_commune(pending_requests)
     for request in (
         pending_requests.exclude(commune__isnull=True)
         .values("email", "commune_id")
         .annotate(ids=ArrayAgg("id"))
+        .order_by()
     ):
-        commune = Commune.objects.get(id=request["commune_id"])
-        candidates = get_voting_proxy_candidates_queryset(request, candidate_ids)
-        # Match by distance for geolocalised communes
-        if commune.mairie_localisation:
-            candidates = candidates.exclude(coordinates__isnull=True).filter(
-                coordinates__dwithin=(
-                    commune.mairie_localisation,
-                    D(m=PROXY_TO_REQUEST_DISTANCE_LIMIT),
-                )
-            )
-        # Try to match by city code / zip code for non-geolocalised communes
-        else:
-            candidates = (
-                candidates.exclude(
-                    location_citycode__isnull=True, location_zip__isnull=True
-                )
-                .filter(
-                    Q(location_citycode=commune.code)
-                    | Q(
-                        location_zip__in=commune.codes_postaux.values_list(
-                            "code", flat=True
-                        )
-                    )
-                )
-                .distinct()
-            )
-
-        if candidates.exists():
-            # Give priority with people with the most recent event rsvps
-            candidates = candidates.annotate(
-                rsvp_count=Count(
-                    "rsvps",
-                    filter=Q(
-                        rsvps__event__end_time__gte=timezone.now() - timedelta(days=365)
-                    ),
-                    distinct=True,
-                )
-            ).order_by("-rsvp_count")[:PER_VOTING_PROXY_REQUEST_INVITATION_LIMIT]
-
-            invited_candidate_ids = send_invitations(candidates, request)
-            candidate_ids += invited_candidate_ids
-            possibly_fulfilled_request_ids += request["ids"]
+        invite(request, commune_candidates.get(request["commune_id"], []))
 
     return possibly_fulfilled_request_ids, candidate_ids
@@ -3,7 +3,7 @@
 from tqdm import tqdm
 
 from agir.voting_proxies.actions import (
-    send_matching_requests_to_proxy,
+    send_matching_requests_to_proxies,
     match_available_proxies_with_requests,
     invite_voting_proxy_candidates,
     find_voting_proxy_candidates_for_requests,
@@ -27,11 +27,13 @@ def __init__(self, stdout=None, stderr=None, no_color=False, force_color=False):
         super().__init__(stdout, stderr, no_color, force_color)
         self.tqdm = None
         self.dry_run = None
+        self.matches = []
         self.report = {
             "datetime": timezone.now().isoformat(),
             "dry-run": False,
             "pending_request_count": 0,
             "matched_request_count": 0,
+            "coverage": 0,
             "pending_requests": {},
             "matched_proxies": [],
             "invitations": [],
@@ -110,11 +112,7 @@ def report_invitation(self, candidates, request):
 
     def send_matching_requests_to_proxy(self, proxy, matching_request_ids):
         self.report_matched_proxy(proxy, matching_request_ids)
-
-        if self.dry_run:
-            return
-
-        send_matching_requests_to_proxy(proxy, matching_request_ids)
+        self.matches.append((proxy, matching_request_ids))
 
     def invite_voting_proxy_candidates(self, candidates, request):
         self.report_invitation(candidates, request)
@@ -153,10 +151,17 @@ def handle(
             pending_requests, notify_proxy=self.send_matching_requests_to_proxy
         )
         self.report["matched_request_count"] = len(fulfilled_request_ids)
+        if initial_request_count > 0:
+            self.report["coverage"] = round(
+                len(fulfilled_request_ids) / initial_request_count, 4
+            )
+        if not self.dry_run:
+            send_matching_requests_to_proxies(self.matches)
         if len(fulfilled_request_ids) > 0:
             pending_requests = pending_requests.exclude(id__in=fulfilled_request_ids)
             self.log(
-                f" ☑ Available voting proxies found for {len(fulfilled_request_ids)} pending requests."
+                f" ☑ Available voting proxies found for {len(fulfilled_request_ids)} pending requests"
+                f" ({self.report['coverage']:.0%} coverage, {len(self.matches)} proxies)."
             )
         else:
             self.log(f" ☒ No available voting proxy found :-(")
@@ -9,7 +9,7 @@
 )
 from data_france.utils import TypeNom
 from django.contrib.gis.geos import Point
-from django.test import TestCase
+from django.test import TestCase, SimpleTestCase
 from faker import Faker
 
 from agir.people.models import Person
@@ -17,6 +17,8 @@
     get_voting_proxy_requests_for_proxy,
     match_available_proxies_with_requests,
     find_voting_proxy_candidates_for_requests,
+    get_voting_proxy_matching_candidates,
+    solve_voting_proxy_assignment,
     PER_VOTING_PROXY_REQUEST_INVITATION_LIMIT,
 )
 from agir.voting_proxies.models import (
@@ -304,6 +306,17 @@ def test_cannot_match_own_request(self, notify_proxy):
         notify_proxy.assert_not_called()
         self.assertEqual(len(fulfilled), 0)
 
+    def test_candidates_include_proxies_without_person(self):
+        proxy = self.create_proxy(email="a_proxy@proxy.com")
+        VotingProxy.objects.filter(pk=proxy.pk).update(person=None)
+        request = self.create_request()
+
+        candidates = get_voting_proxy_matching_candidates(
+            VotingProxyRequest.objects.filter(pk=request.pk),
+            VotingProxy.objects.filter(pk=proxy.pk),
+        )
+        self.assertEqual([c[:2] for c in candidates], [(proxy.pk, request.pk)])
+
     @patch("agir.voting_proxies.actions.send_matching_requests_to_proxy")
     def test_cannot_match_if_account_is_disabled(self, notify_proxy):
         proxy_person = Person.objects.create_person(
@@ -377,6 +390,29 @@ def test_matchings_takes_the_proxy_with_the_most_available_dates_first(
         self.assertEqual(notify_proxy.call_args[0][0].pk, the_right_proxy.pk)
 
 
+class SolveVotingProxyAssignmentTestCase(SimpleTestCase):
+    def test_proxy_is_reassigned_to_maximize_matches(self):
+        candidates = [
+            ("p1", "r1", "e1@agir.local", "2022-06-12", 0, True),
+            ("p1", "r2", "e2@agir.local", "2022-06-12", 1000, False),
+            ("p2", "r1", "e1@agir.local", "2022-06-12", 0, False),
+        ]
+        self.assertEqual(
+            solve_voting_proxy_assignment(["p1", "p2"], candidates),
+            {"p1": ["r2"], "p2": ["r1"]},
+        )
+
+    def test_proxy_gets_the_requests_of_the_closest_person(self):
+        candidates = [
+            ("p1", "r1", "e1@agir.local", "2022-06-12", 500, False),
+            ("p1", "r2", "e1@agir.local", "2022-06-19", 500, False),
+            ("p1", "r3", "e2@agir.local", "2022-06-12", 100, False),
+        ]
+        self.assertEqual(
+            solve_voting_proxy_assignment(["p1"], candidates), {"p1": ["r3"]}
+        )
+
+
 class FindVotingProxyCandidatesForRequestsTestCase(TestCase):
     def tearDown(self):
         self.patcher.stop()
@@ -655,3 +691,25 @@ def test_invitations_are_sent_for_all_requests(self, send_invitations):
             qs, send_invitations
         )
         self.assertEqual(len(fulfilled), 2)
+
+    @patch(
+        "agir.voting_proxies.actions.invite_voting_proxy_candidates",
+    )
+    def test_candidates_are_not_invited_twice(self, send_invitations):
+        candidate = self.create_proxy_candidate(location_zip=self.code_postal.code)
+        a_request = self.create_request(
+            email="a_voter@agir.test", consulate=None, commune=self.unloc_commune
+        )
+        another_request = self.create_request(
+            email="another_voter@agir.test", consulate=None, commune=self.unloc_commune
+        )
+        qs = VotingProxyRequest.objects.filter(
+            pk__in=[a_request.pk, another_request.pk]
+        )
+        send_invitations.return_value = [candidate.id]
+        (fulfilled, candidates) = find_voting_proxy_candidates_for_requests(
+            qs, send_invitations
+        )
+        send_invitations.assert_called_once()
+        self.assertEqual(len(fulfilled), 1)
+        self.assertEqual(candidates, [candidate.id])